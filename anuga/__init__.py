@@ -228,6 +228,7 @@ from anuga.shallow_water.sww_interrogate import get_flow_through_cross_section
 from anuga.operators.kinematic_viscosity_operator import Kinematic_viscosity_operator
 
 from anuga.operators.rate_operators import Rate_operator
+from anuga.operators.rate_operators import Combined_rate_operator
 from anuga.operators.set_friction_operators import Set_depth_friction_operator
 
 from anuga.operators.set_elevation_operator import Set_elevation_operator
@@ -264,6 +265,7 @@ else:
     from anuga.structures.internal_boundary_operator import Internal_boundary_operator
 
 from anuga.structures.internal_boundary_functions import pumping_station_function
+from anuga.structures.structure_bank import Structure_bank
 
 
 
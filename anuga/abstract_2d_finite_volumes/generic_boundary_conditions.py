@@ -23,8 +23,13 @@ class Boundary(object):
 
        A boundary object has one neighbour; the one it
        serves.
+
+       Subclasses with an equivalent native kernel set segment_kernel
+       to its name, see get_segment_kernel.
     """
 
+    segment_kernel = None
+
     def __init__(self):
         self.verbose = True
         self.default_boundary = None
@@ -90,6 +95,36 @@ class Boundary(object):
                 Q.boundary_values[i] = q_evol[j]
 
 
+    def get_segment_kernel(self, domain):
+        """Return the name of the native kernel which can replace
+        evaluate_segment on domain, or None.
+
+        The kernel is only used if evaluate_segment has not been
+        overridden in a subclass of the class which set segment_kernel,
+        and if domain provides it (see domain.segment_kernels).
+        """
+
+        for cls in type(self).__mro__:
+            if 'segment_kernel' in cls.__dict__:
+                kernel = cls.__dict__['segment_kernel']
+                break
+            if 'evaluate_segment' in cls.__dict__:
+                return None
+        else:
+            return None
+
+        if kernel not in domain.segment_kernels:
+            return None
+
+        return kernel
+
+    def get_segment_values(self):
+        """Return the (at most 3) outside values used by the native kernel,
+        evaluated at the current time.
+        """
+
+        return []
+
     def get_time(self):
 
         return self.domain.get_time()
@@ -218,6 +253,20 @@ class Dirichlet_boundary(Boundary):
     def evaluate(self, vol_id=None, edge_id=None):
         return self.dirichlet_values
 
+    segment_kernel = 'dirichlet'
+
+    def get_segment_kernel(self, domain):
+
+        # The kernel only sets the (3) evolved quantities
+        if len(self.dirichlet_values) != len(domain.evolved_quantities):
+            return None
+
+        return Boundary.get_segment_kernel(self, domain)
+
+    def get_segment_values(self):
+
+        return self.dirichlet_values
+
     def evaluate_segment(self, domain, segment_edges):
 
         if segment_edges is None:
@@ -641,6 +690,9 @@ class File_boundary(Boundary):
         msg += ' a list or an array of length %d' %d
         assert len(q) == d, msg
 
+        self.boundary_point_ids = _get_boundary_point_ids(domain,
+                                                          self.boundary_indices)
+
 
     def __repr__(self):
         return 'File boundary'
@@ -716,6 +768,48 @@ class File_boundary(Boundary):
             msg += 'vol_id=%s, edge_id=%s' %(str(vol_id), str(edge_id))
             raise Exception(msg)
 
+
+    def evaluate_segment(self, domain, segment_edges):
+        """Update boundary values for all edges in segment_edges at once.
+
+        The file function is interpolated to the midpoints of all the
+        segment edges in one array operation. Edges with NAN values and
+        the default_boundary fallback are dealt with edge by edge
+        through evaluate.
+        """
+
+        if segment_edges is None:
+            return
+        if domain is None:
+            return
+
+        if len(domain.conserved_quantities) != len(domain.evolved_quantities) \
+               or not hasattr(self.F, 'evaluate_points'):
+            # Need domain specific conversion for each edge
+            Boundary.evaluate_segment(self, domain, segment_edges)
+            return
+
+        ids = num.asarray(segment_edges, dtype=int)
+        point_ids = self.boundary_point_ids[ids]
+
+        t = self.domain.get_time()
+
+        try:
+            q_bdry = self.F.evaluate_points(t, point_ids)
+        except Modeltime_too_late:
+            # Let evaluate raise or pass control to the default boundary
+            Boundary.evaluate_segment(self, domain, ids)
+            return
+
+        for j, name in enumerate(domain.evolved_quantities):
+            Q = domain.quantities[name]
+            Q.boundary_values[ids] = q_bdry[:,j]
+
+        nan_edges = num.any(q_bdry == NAN, axis=1)
+        if num.any(nan_edges):
+            Boundary.evaluate_segment(self, domain, ids[nan_edges])
+
+
 class AWI_boundary(Boundary):
     """The AWI_boundary reads values for the conserved
     quantities (only STAGE) from an sww NetCDF file, and returns interpolated values
@@ -826,6 +920,9 @@ class AWI_boundary(Boundary):
         msg += 'a list or an array of length %d' % d
         assert len(q) == d, msg
 
+        self.boundary_point_ids = _get_boundary_point_ids(domain,
+                                                          self.boundary_indices)
+
 
     def __repr__(self):
         return 'File boundary'
@@ -874,4 +971,59 @@ class AWI_boundary(Boundary):
             return self.F(t)
 
 
+    def evaluate_segment(self, domain, segment_edges):
+        """Update boundary values for all edges in segment_edges at once.
+
+        Stage is interpolated from the file function at all segment
+        midpoints in one array operation, the remaining quantities are
+        taken from the interior edge values. Edges with NAN values are
+        dealt with edge by edge through evaluate.
+        """
+
+        if segment_edges is None:
+            return
+        if domain is None:
+            return
+
+        if len(domain.conserved_quantities) != len(domain.evolved_quantities) \
+               or not hasattr(self.F, 'evaluate_points'):
+            # Need domain specific conversion for each edge
+            Boundary.evaluate_segment(self, domain, segment_edges)
+            return
+
+        ids = num.asarray(segment_edges, dtype=int)
+        vol_ids  = domain.boundary_cells[ids]
+        edge_ids = domain.boundary_edges[ids]
+        point_ids = self.boundary_point_ids[ids]
+
+        t = self.domain.get_time()
+        q_bdry = self.F.evaluate_points(t, point_ids)
+
+        for j, name in enumerate(domain.evolved_quantities):
+            Q = domain.quantities[name]
+            Q.boundary_values[ids] = Q.edge_values[vol_ids,edge_ids]
+
+        # Take stage, leave momentum alone
+        Q = domain.quantities[domain.evolved_quantities[0]]
+        Q.boundary_values[ids] = q_bdry[:,0]
+
+        nan_edges = q_bdry[:,0] == NAN
+        if num.any(nan_edges):
+            Boundary.evaluate_segment(self, domain, ids[nan_edges])
+
+
+def _get_boundary_point_ids(domain, boundary_indices):
+    """Return array mapping the domain boundary enumeration
+    (domain.boundary_cells, domain.boundary_edges) to the indices
+    of the interpolation points registered in boundary_indices.
+    """
+
+    point_ids = num.zeros(len(domain.boundary_cells), int)
+    for i, (vol_id, edge_id) in enumerate(zip(domain.boundary_cells,
+                                              domain.boundary_edges)):
+        point_ids[i] = boundary_indices[(vol_id, edge_id)]
+
+    return point_ids
+
+
 
@@ -287,6 +287,11 @@ class Generic_Domain(object):
 
         self.number_of_full_triangles = int(num.sum(self.tri_full_flag))
 
+        # Partition of the triangles used to overlap the ghost exchange
+        # with computation (see get_halo_partition)
+        self.halo_partition = None
+        self.ghost_exchange_quantities = None
+
         # Identify full nodes as those that intersect a full triangle.
         Vol_ids = self.vertex_value_indices // 3
 
@@ -344,6 +349,11 @@ class Generic_Domain(object):
 
         self.boundary_map = None  # Will be populated by set_boundary
 
+        # Native boundary kernels (name: code) provided by subclasses and
+        # the batch of boundary segments they evaluate (see update_boundary)
+        self.segment_kernels = {}
+        self.boundary_segment_batch = None
+
         # Model time
         self.finaltime = None
         self.recorded_min_timestep = self.recorded_max_timestep = 0.0
@@ -389,6 +399,10 @@ class Generic_Domain(object):
         # This is used for diagnostics only (reset at every yieldstep)
         self.max_speed = num.zeros(N, float)
 
+        # Native (compiled) view of the domain arrays used by the
+        # openmp kernels, built on the first kernel call
+        self.native_domain = None
+
         if mesh_filename is not None:
             # If the mesh file passed any quantity values,
             # initialise with these values.
@@ -763,6 +777,13 @@ class Generic_Domain(object):
         2. cuda (in development)
         """
         return self.multiprocessor_mode 
+
+    def invalidate_native_domain(self):
+        """Drop the native view of the domain arrays used by the compiled
+        kernels. It is rebuilt on the next kernel call. Call this after
+        reallocating (rather than updating in place) any of those arrays.
+        """
+        self.native_domain = None
             
     def set_using_centroid_averaging(self, flag=True):
         """Set flag to use centroid averaging in output
@@ -1004,6 +1025,9 @@ class Generic_Domain(object):
                     raise Exception(msg)
         
 
+        # Rebuild the batch of native boundary segments on next update
+        self.boundary_segment_batch = None
+
         # Update self.boundary_map with values provided to this method        
         if self.boundary_map is None:
             # This the first call to set_boundary. Store
@@ -1558,6 +1582,23 @@ class Generic_Domain(object):
         msg = '%s is an incorrect timestepping type' % timestepping_method
         raise Exception(msg)
 
+    def get_deep_ghost_layer_width(self):
+        """Width of the ghost layer needed to compute all the stages of a
+        timestep without updating the ghost cells between the stages.
+
+        Each stage (extrapolation followed by the flux computation) reads
+        two layers of neighbours, so invalidates two layers of ghost cells.
+        """
+
+        return 2*self.timestep_fluxcalls
+
+    def has_deep_ghost_layer(self):
+        """True if the ghost layer is deep enough to skip the
+        update of the ghost cells between the stages of a timestep
+        """
+
+        return self.ghost_layer_width >= self.get_deep_ghost_layer_width()
+
     def get_name(self):
         return self.simulation_name
 
@@ -1837,15 +1878,20 @@ class Generic_Domain(object):
         while True:
             initial_relative_time = self.relative_time
 
-            # Apply fluid flow fractional step
-            if self.get_timestepping_method() == 'euler':
-                self.evolve_one_euler_step(yieldstep, self.finaltime)
+            # Apply fluid flow fractional step, repeat the step if the
+            # timestep used turns out to be unstable (see validate_timestep)
+            while True:
+                if self.get_timestepping_method() == 'euler':
+                    self.evolve_one_euler_step(yieldstep, self.finaltime)
+
+                elif self.get_timestepping_method() == 'rk2':
+                    self.evolve_one_rk2_step(yieldstep, self.finaltime)
 
-            elif self.get_timestepping_method() == 'rk2':
-                self.evolve_one_rk2_step(yieldstep, self.finaltime)
+                elif self.get_timestepping_method() == 'rk3':
+                    self.evolve_one_rk3_step(yieldstep, self.finaltime)
 
-            elif self.get_timestepping_method() == 'rk3':
-                self.evolve_one_rk3_step(yieldstep, self.finaltime)
+                if self.validate_timestep():
+                    break
 
             # Apply other fractional steps
             self.apply_fractional_steps()
@@ -1911,7 +1957,9 @@ class Generic_Domain(object):
                 self.recorded_max_timestep = self.evolve_min_timestep
                 self.number_of_steps = 0
                 self.number_of_first_order_steps = 0
-                self.max_speed = num.zeros(N, float)
+                # The domain may have been rebuilt at the yield (rebalancing)
+                self.max_speed = num.zeros(len(self), float)
+                self.invalidate_native_domain()
 
     def evolve_one_euler_step(self, yieldstep, finaltime):
         """One Euler Time Step
@@ -2013,7 +2061,7 @@ class Generic_Domain(object):
         self.set_relative_time(self.get_relative_time() + self.timestep)
 
         # Update ghosts
-        if self.ghost_layer_width < 4:
+        if not self.has_deep_ghost_layer():
             self.update_ghosts()
 
         # Update vertex and edge values
@@ -2095,7 +2143,8 @@ class Generic_Domain(object):
         self.set_relative_time(self.relative_time+ self.timestep)
 
         # Update ghosts
-        self.update_ghosts()
+        if not self.has_deep_ghost_layer():
+            self.update_ghosts()
 
         # Update vertex and edge values
         self.distribute_to_vertices_and_edges()
@@ -2134,7 +2183,8 @@ class Generic_Domain(object):
         self.set_relative_time(initial_time + self.timestep * 0.5)
 
         # Update ghosts
-        self.update_ghosts()
+        if not self.has_deep_ghost_layer():
+            self.update_ghosts()
 
         # Update vertex and edge values
         self.distribute_to_vertices_and_edges()
@@ -2296,16 +2346,102 @@ class Generic_Domain(object):
         quantity in domain.
         """
 
-        #import pdb; pdb.set_trace()
+        if self.boundary_segment_batch is None:
+            self.boundary_segment_batch = self.get_boundary_segment_batch()
+
+        batch = self.boundary_segment_batch
+
+        # Segments of all the boundaries with a native kernel are
+        # evaluated with one call
+        if len(batch['ids']) > 0:
+            self.update_boundary_segment_values(batch)
+            self.evaluate_boundary_segments(batch)
+
+        for tag in batch['fallback_tags']:
+            B = self.boundary_map[tag]
+
+            boundary_segment_edges = self.tag_boundary_cells[tag]
+
+            B.evaluate_segment(self, boundary_segment_edges)
+
+    def update_boundary_segment_values(self, batch):
+        """Set the outside values of each boundary object of a batch (see
+        get_boundary_segment_batch) at the current time.
+        """
+
+        values = batch['boundary_values']
+        for j, B in enumerate(batch['boundaries']):
+            q = B.get_segment_values()
+            values[j, :len(q)] = q
+
+    def get_boundary_segment_batch(self):
+        """Collect the boundary segments of all tags whose boundary object
+        has a native kernel (see Boundary.get_segment_kernel) into one batch.
+
+        Returns a dictionary with the segment ids, vol_ids, edge_ids and
+        outward normals, the index of the boundary object of each segment,
+        the kernel code and a (number of boundaries, 3) array of outside
+        values for each boundary object, and the tags of the remaining
+        boundaries which are evaluated with evaluate_segment.
+        """
+
+        boundaries = []
+        kernels = []
+        segment_ids = []
+        segment_boundary = []
+        fallback_tags = []
+
         for tag in self.tag_boundary_cells:
             B = self.boundary_map[tag]
 
             if B is None:
                 continue
 
-            boundary_segment_edges = self.tag_boundary_cells[tag]
+            kernel = B.get_segment_kernel(self)
+            if kernel is None:
+                fallback_tags.append(tag)
+                continue
 
-            B.evaluate_segment(self, boundary_segment_edges)
+            if B in boundaries:
+                j = boundaries.index(B)
+            else:
+                j = len(boundaries)
+                boundaries.append(B)
+                kernels.append(self.segment_kernels[kernel])
+
+            ids = num.asarray(self.tag_boundary_cells[tag], dtype=num.int64)
+            segment_ids.append(ids)
+            segment_boundary.append(num.full(len(ids), j, dtype=num.int64))
+
+        if len(segment_ids) > 0:
+            ids = num.concatenate(segment_ids)
+            segment_boundary = num.concatenate(segment_boundary)
+        else:
+            ids = num.zeros(0, dtype=num.int64)
+            segment_boundary = num.zeros(0, dtype=num.int64)
+
+        vol_ids = num.ascontiguousarray(self.boundary_cells[ids], dtype=num.int64)
+        edge_ids = num.ascontiguousarray(self.boundary_edges[ids], dtype=num.int64)
+
+        normals = num.zeros((len(ids), 2), float)
+        normals[:, 0] = self.normals[vol_ids, 2*edge_ids]
+        normals[:, 1] = self.normals[vol_ids, 2*edge_ids+1]
+
+        batch = {'ids': ids,
+                 'vol_ids': vol_ids,
+                 'edge_ids': edge_ids,
+                 'normals': normals,
+                 'segment_boundary': segment_boundary,
+                 'boundaries': boundaries,
+                 'boundary_kernel': num.array(kernels, dtype=num.int64),
+                 'boundary_values': num.zeros((len(boundaries), 3), float),
+                 'fallback_tags': fallback_tags}
+
+        return batch
+
+    def evaluate_boundary_segments(self, batch):
+        msg = 'Method evaluate_boundary_segments must be overridden by Domain subclass'
+        raise Exception(msg)
 
     def compute_fluxes(self):
         msg = 'Method compute_fluxes must be overridden by Domain subclass'
@@ -2416,6 +2552,17 @@ class Generic_Domain(object):
 
         self.timestep = timestep
 
+    def validate_timestep(self):
+        """Check the timestep used by the last fluid flow step was stable.
+
+        If not, the conserved quantities and time must be restored to
+        their values at the start of the step and False returned, in which
+        case the step is repeated. Sequential domains always compute a
+        stable timestep.
+        """
+
+        return True
+
     def compute_forcing_terms(self):
         """If there are any forcing functions driving the system
         they should be defined in Domain subclass and appended to
@@ -2470,6 +2617,50 @@ class Generic_Domain(object):
                 Q_cv = self.quantities[q].centroid_values
                 num.put(Q_cv, Idg, num.take(Q_cv, Idf, axis=0))
 
+    def start_ghost_exchange(self, quantities=None):
+        """Start updating the ghost cells.
+
+        Computation which does not read the centroid values of ghost
+        cells can be done before finish_ghost_exchange is called.
+        Sequential domains only have local ghosts, so the update is
+        done in finish_ghost_exchange.
+        """
+
+        self.ghost_exchange_quantities = quantities
+
+    def finish_ghost_exchange(self):
+        """Complete the ghost cell update started by start_ghost_exchange
+        """
+
+        quantities = self.ghost_exchange_quantities
+        self.ghost_exchange_quantities = None
+
+        self.update_ghosts(quantities)
+
+    def get_halo_partition(self):
+        """Partition the triangles by their dependence on ghost cells.
+
+        Returns the int64 arrays (interior_ids, halo_ids, full_ids, ghost_ids)
+        where interior_ids are the full triangles whose surrogate
+        neighbours are all full triangles, and halo_ids are the remaining
+        triangles (the ghost triangles and the full triangles next to them).
+        Interior triangles can be extrapolated before the ghost cells
+        have been updated.
+        """
+
+        if self.halo_partition is None:
+            full = self.tri_full_flag == 1
+            neighbours_full = num.all(full[self.surrogate_neighbours], axis=1)
+            interior = full & neighbours_full
+
+            self.halo_partition = \
+                (num.flatnonzero(interior).astype(num.int64),
+                 num.flatnonzero(~interior).astype(num.int64),
+                 num.flatnonzero(full).astype(num.int64),
+                 num.flatnonzero(~full).astype(num.int64))
+
+        return self.halo_partition
+
 #    def update_special_conditions(self):
 #        """There may be a need to change the values of the conserved
 #        quantities to satisfy special conditions at the very lowest level
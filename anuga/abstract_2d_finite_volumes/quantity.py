@@ -2155,7 +2155,8 @@ class Quantity(object):
     # Methods for outputting model results
     ############################################################################
 
-    def get_vertex_values(self, xy=True, smooth=None, centroid_averaging=None, precision=None):
+    def get_vertex_values(self, xy=True, smooth=None, centroid_averaging=None, precision=None,
+                          vertex_values=None, centroid_values=None):
         """Return vertex values like an OBJ format i.e. one value per node.
 
         The vertex values are returned as one sequence in the 1D float array A.
@@ -2177,6 +2178,9 @@ class Quantity(object):
         vertices 2.  This corresponds to the node coordinates obtained from the
         method general_mesh.get_vertex_coordinates()
 
+        If vertex_values or centroid_values are given (e.g. a copy taken
+        earlier) they are used in place of those of the quantity.
+
         Calling convention
         if xy is True:
            X, Y, A, V = get_vertex_values
@@ -2184,6 +2188,12 @@ class Quantity(object):
            A, V = get_vertex_values
         """
 
+        if vertex_values is None:
+            vertex_values = self.vertex_values
+
+        if centroid_values is None:
+            centroid_values = self.centroid_values
+
         if smooth is None:
             # Take default from domain
             try:
@@ -2211,12 +2221,12 @@ class Quantity(object):
             if centroid_averaging:
                 average_centroid_values(ensure_numeric(self.domain.vertex_value_indices),
                                     ensure_numeric(self.domain.number_of_triangles_per_node),
-                                    ensure_numeric(self.centroid_values),
+                                    ensure_numeric(centroid_values),
                                     A)
             else:
                 average_vertex_values(ensure_numeric(self.domain.vertex_value_indices),
                                     ensure_numeric(self.domain.number_of_triangles_per_node),
-                                    ensure_numeric(self.vertex_values),
+                                    ensure_numeric(vertex_values),
                                     A)
             A = A.astype(precision)
 
@@ -2224,7 +2234,7 @@ class Quantity(object):
             # Return disconnected internal vertex values
             V = self.domain.get_disconnected_triangles()
             points = self.domain.get_vertex_coordinates()
-            A = self.vertex_values.flatten().astype(precision)
+            A = vertex_values.flatten().astype(precision)
 
         # Return
         if xy is True:
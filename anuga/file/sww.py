@@ -1,6 +1,9 @@
 """ Classes to read an SWW file.
 """
 
+import threading
+import queue
+import copy
 import numpy
 import numpy as num
 from anuga.utilities.file_utils import create_filename
@@ -109,6 +112,35 @@ class SWW_file(Data_format):
         else:
             self.timezone = 'UTC'
 
+        # Number of frames to hold in memory before writing to file.
+        # If 0 the file is opened and closed for each timestep
+        if hasattr(domain, 'sww_buffer_frames'):
+            self.buffer_frames = domain.sww_buffer_frames
+        else:
+            self.buffer_frames = 0
+
+        # Write timesteps from a background thread, with at most
+        # queue_depth timesteps waiting to be written
+        if hasattr(domain, 'store_asynchronously'):
+            self.asynchronous = domain.store_asynchronously
+            self.queue_depth = domain.store_queue_depth
+        else:
+            self.asynchronous = False
+            self.queue_depth = 2
+
+        # State of persistent file handle used when buffer_frames > 0
+        # or when storing asynchronously
+        self.fid = None
+        self.frame_buffer = []
+        self.number_of_frames = 0
+        self.file_size = 0
+
+        # State of output thread
+        self.output_thread = None
+        self.output_queue = None
+        self.free_snapshots = None
+        self.output_error = None
+
 
         # Call parent constructor
         Data_format.__init__(self, domain, 'sww', mode)
@@ -137,17 +169,17 @@ class SWW_file(Data_format):
                 if self.store_centroids:
                     dynamic_c_quantities.append(q+'_c')
 
+        self.writer = Write_sww(static_quantities,
+                                dynamic_quantities,
+                                static_c_quantities,
+                                dynamic_c_quantities)
+
         # NetCDF file definition
         fid = NetCDFFile(self.filename, mode)
         if mode[0] == 'w':
             description = 'Output from anuga.file.sww ' \
                           'suitable for plotting'
 
-            self.writer = Write_sww(static_quantities,
-                                    dynamic_quantities,
-                                    static_c_quantities,
-                                    dynamic_c_quantities)
-
             self.writer.store_header(fid,
                                      domain.starttime,
                                      self.number_of_volumes,
@@ -261,6 +293,14 @@ class SWW_file(Data_format):
         """Store time and time dependent quantities
         """
 
+        if self.asynchronous:
+            self.store_timestep_asynchronously()
+            return
+
+        if self.buffer_frames > 0:
+            self.store_timestep_buffered()
+            return
+
         #import types
         from time import sleep
         from os import stat
@@ -295,142 +335,484 @@ class SWW_file(Data_format):
         file_size = stat(self.filename)[6]
         file_size_increase = file_size//i
         if file_size + file_size_increase > self.max_size * 2**self.recursion:
-            # In order to get the file name and start time correct,
-            # I change the domain.filename and domain.starttime.
-            # This is the only way to do this without changing
-            # other modules (I think).
-
-            # Write a filename addon that won't break the anuga viewers
-            # (10.sww is bad)
-            filename_ext = '_time_%s' % self.domain.relative_time
-            filename_ext = filename_ext.replace('.', '_')
-
-            # Remember the old filename, then give domain a
-            # name with the extension
-            old_domain_filename = self.domain.get_name()
-            if not self.recursion:
-                self.domain.set_name(old_domain_filename + filename_ext)
-
-            # Temporarily change the domain starttime to the current time
-            old_domain_starttime = self.domain.starttime
-            self.domain.starttime = self.domain.get_time()
-
-            # Build a new data_structure.
-            next_data_structure = SWW_file(self.domain, mode=self.mode,
-                                           max_size=self.max_size,
-                                           recursion=self.recursion+1)
-            if not self.recursion:
-                log.critical('    file_size = %s' % file_size)
-                log.critical('    saving file to %s'
-                             % next_data_structure.filename)
-
-            # Set up the new data_structure
-            self.domain.writer = next_data_structure
-
-            # Store connectivity and first timestep
-            next_data_structure.store_connectivity()
-            next_data_structure.store_timestep()
             fid.sync()
             fid.close()
-
-            # Restore the old starttime and filename
-            self.domain.starttime = old_domain_starttime
-            self.domain.set_name(old_domain_filename)
+            self.store_timestep_in_next_file(file_size)
         else:
             self.recursion = False
-            domain = self.domain
 
-            # Get the variables
-            time = fid.variables['time'][:]
-            i = len(time)
+            dynamic_quantities, dynamic_quantities_centroid = \
+                self.get_dynamic_quantities()
+
+            # Store dynamic quantities
+            slice_index = self.writer.store_quantities(fid,
+                                                       time=self.domain.relative_time,
+                                                       sww_precision=self.precision,
+                                                       **dynamic_quantities)
+
+            # Store dynamic quantities
+            if self.store_centroids:
+                self.writer.store_quantities_centroid(fid,
+                                                      slice_index=slice_index,
+                                                      sww_precision=self.precision,
+                                                      **dynamic_quantities_centroid)
+
+            self.store_extrema(fid)
 
-            if 'stage' in self.writer.dynamic_quantities:
-                # Select only those values for stage,
-                # xmomentum and ymomentum (if stored) where
-                # depth exceeds minimum_storable_height
-                #
-                # In this branch it is assumed that elevation
-                # is also available as a quantity
+            # Flush and close
+            # fid.sync()
+            fid.close()
 
-                # Smoothing for the get_vertex_values will be obtained
-                # from the smooth setting in domain
+    def store_timestep_buffered(self):
+        """Store time and time dependent quantities in the frame buffer.
 
-                Q = domain.quantities['stage']
-                w, _ = Q.get_vertex_values(xy=False)
+        The sww file is kept open between calls and the buffered frames
+        are written in one go once buffer_frames frames have been
+        collected, or when flush or close is called.
+        """
 
-                Q = domain.quantities['elevation']
-                z, _ = Q.get_vertex_values(xy=False)
+        if self.fid is None:
+            self.open_for_append()
 
-                storable_indices = num.array(
-                    w-z >= self.minimum_storable_height)
+        # Check to see if the file is about to become too big.
+        # The size is tracked in memory to avoid a stat per frame.
+        frame_size = self.file_size//(self.number_of_frames + 1)
+        if self.file_size + frame_size > self.max_size * 2**self.recursion:
+            file_size = self.file_size
+            self.close()
+            self.store_timestep_in_next_file(file_size)
+            return
 
-                # print numpy.sum(storable_indices), len(z), self.minimum_storable_height, numpy.min(w-z)
-            else:
-                # Very unlikely branch
-                storable_indices = None  # This means take all
+        self.recursion = False
 
-            # Now store dynamic quantities
-            dynamic_quantities = {}
-            dynamic_quantities_centroid = {}
+        dynamic_quantities, dynamic_quantities_centroid = \
+            self.get_dynamic_quantities(copy=True)
 
-            for name in self.writer.dynamic_quantities:
-                #netcdf_array = fid.variables[name]
+        self.frame_buffer.append((self.domain.relative_time,
+                                  dynamic_quantities,
+                                  dynamic_quantities_centroid))
 
-                Q = domain.quantities[name]
-                A, _ = Q.get_vertex_values(xy=False,
-                                           precision=self.precision)
+        self.number_of_frames += 1
+        self.file_size += frame_size
 
-                if storable_indices is not None:
-                    if name == 'stage':
-                        A = num.choose(storable_indices, (z, A))
+        if len(self.frame_buffer) >= self.buffer_frames:
+            self.write_frame_buffer()
 
-                    if name in ['xmomentum', 'ymomentum']:
-                        # Get xmomentum where depth exceeds
-                        # minimum_storable_height
+    def store_timestep_asynchronously(self):
+        """Copy the quantities needed for the current timestep into a
+        snapshot buffer and pass it on to the output thread.
 
-                        # Define a zero vector of same size and type as A
-                        # for use with momenta
-                        null = num.zeros(num.size(A), A.dtype.char)
-                        A = num.choose(storable_indices, (null, A))
+        Vertex values are gathered and written by the output thread while
+        the computation continues. If all queue_depth snapshot buffers are
+        in use this call blocks until the output thread releases one.
+        """
 
-                dynamic_quantities[name] = A
+        if self.output_thread is None:
+            self.start_output_thread()
 
-            for name in self.writer.dynamic_c_quantities:
-                Q = domain.quantities[name[:-2]]
-                dynamic_quantities_centroid[name] = Q.centroid_values
+        self.check_output_thread()
 
-            # Store dynamic quantities
-            slice_index = self.writer.store_quantities(fid,
-                                                       time=self.domain.relative_time,
+        frame_size = self.file_size//(self.number_of_frames + 1)
+        if self.file_size + frame_size > self.max_size * 2**self.recursion:
+            file_size = self.file_size
+            self.close()
+            self.store_timestep_in_next_file(file_size)
+            return
+
+        self.recursion = False
+
+        snapshot = self.free_snapshots.get()
+
+        snapshot['time'] = self.domain.relative_time
+        for name, (vertex_values, centroid_values) in snapshot['quantities'].items():
+            Q = self.domain.quantities[name]
+            vertex_values[:] = Q.vertex_values
+            centroid_values[:] = Q.centroid_values
+
+        if self.domain.quantities_to_be_monitored is not None:
+            snapshot['extrema'] = copy.deepcopy(self.domain.quantities_to_be_monitored)
+
+        self.output_queue.put(snapshot)
+
+        self.number_of_frames += 1
+        self.file_size += frame_size
+
+    def start_output_thread(self):
+        """Open the sww file, allocate the snapshot buffers and start
+        the thread writing them to file.
+        """
+
+        if self.fid is None:
+            self.open_for_append()
+
+        names = list(self.writer.dynamic_quantities)
+        names += [name[:-2] for name in self.writer.dynamic_c_quantities]
+        if 'stage' in self.writer.dynamic_quantities:
+            names += ['stage', 'elevation']
+
+        self.output_queue = queue.Queue()
+        self.free_snapshots = queue.Queue()
+        for i in range(self.queue_depth):
+            quantities = {}
+            for name in set(names):
+                Q = self.domain.quantities[name]
+                quantities[name] = (num.zeros_like(Q.vertex_values),
+                                    num.zeros_like(Q.centroid_values))
+            self.free_snapshots.put({'time': None,
+                                     'quantities': quantities,
+                                     'extrema': None})
+
+        self.output_error = None
+        self.output_thread = threading.Thread(target=self.output_thread_loop,
+                                              name='sww_output',
+                                              daemon=True)
+        self.output_thread.start()
+
+    def output_thread_loop(self):
+        """Write snapshots to file until None is received.
+        """
+
+        while True:
+            snapshot = self.output_queue.get()
+            if snapshot is None:
+                self.output_queue.task_done()
+                break
+
+            try:
+                # After a failure just release snapshots, the error
+                # is raised in the main thread
+                if self.output_error is None:
+                    self.write_snapshot(snapshot)
+            except BaseException as e:
+                self.output_error = e
+            finally:
+                self.free_snapshots.put(snapshot)
+                self.output_queue.task_done()
+
+    def write_snapshot(self, snapshot):
+        """Gather and write the dynamic quantities of one snapshot.
+        Called from the output thread.
+        """
+
+        t = snapshot['time']
+        dynamic_quantities, dynamic_quantities_centroid = \
+            self.get_dynamic_quantities(copy=True,
+                                        snapshot=snapshot['quantities'])
+
+        if self.buffer_frames > 0:
+            self.frame_buffer.append((t,
+                                      dynamic_quantities,
+                                      dynamic_quantities_centroid))
+            if len(self.frame_buffer) >= self.buffer_frames:
+                self.write_frame_buffer(snapshot['extrema'])
+        else:
+            slice_index = self.writer.store_quantities(self.fid,
+                                                       time=t,
                                                        sww_precision=self.precision,
                                                        **dynamic_quantities)
-
-            # Store dynamic quantities
             if self.store_centroids:
-                self.writer.store_quantities_centroid(fid,
+                self.writer.store_quantities_centroid(self.fid,
                                                       slice_index=slice_index,
                                                       sww_precision=self.precision,
                                                       **dynamic_quantities_centroid)
 
-            # Update extrema if requested
-            domain = self.domain
-            if domain.quantities_to_be_monitored is not None:
-                for q, info in list(domain.quantities_to_be_monitored.items()):
-                    if info['min'] is not None:
-                        fid.variables[q + '.extrema'][0] = info['min']
-                        fid.variables[q + '.min_location'][:] = \
-                            info['min_location']
-                        fid.variables[q + '.min_time'][0] = info['min_time']
-
-                    if info['max'] is not None:
-                        fid.variables[q + '.extrema'][1] = info['max']
-                        fid.variables[q + '.max_location'][:] = \
-                            info['max_location']
-                        fid.variables[q + '.max_time'][0] = info['max_time']
+            self.store_extrema(self.fid, snapshot['extrema'])
 
-            # Flush and close
-            # fid.sync()
-            fid.close()
+    def check_output_thread(self):
+        """Raise any error that occurred in the output thread.
+        """
+
+        if self.output_error is not None:
+            error = self.output_error
+            self.output_error = None
+            raise error
+
+    def drain(self):
+        """Wait until the output thread has written all queued snapshots.
+        """
+
+        if self.output_thread is None:
+            return
+
+        self.output_queue.join()
+        self.check_output_thread()
+
+    def stop_output_thread(self):
+        """Write all queued snapshots and stop the output thread.
+        """
+
+        if self.output_thread is None:
+            return
+
+        self.output_queue.put(None)
+        self.output_thread.join()
+
+        self.output_thread = None
+        self.output_queue = None
+        self.free_snapshots = None
+
+        self.check_output_thread()
+
+    def open_for_append(self):
+        """Open the sww file and keep the handle for subsequent
+        buffered writes. The number of stored frames is read once.
+        """
+
+        from os import stat
+
+        try:
+            self.fid = NetCDFFile(self.filename, netcdf_mode_a)
+        except IOError:
+            msg = 'File %s could not be opened for append' % self.filename
+            raise DataFileNotOpenError(msg)
+
+        self.number_of_frames = len(self.fid.variables['time'])
+        self.file_size = stat(self.filename)[6]
+        self.frame_buffer = []
+
+    def flush(self):
+        """Write all queued and buffered frames to the sww file.
+        """
+
+        self.drain()
+        self.write_frame_buffer()
+
+    def write_frame_buffer(self, extrema=None):
+        """Write the frames in the frame buffer to the sww file.
+        """
+
+        if self.fid is None or len(self.frame_buffer) == 0:
+            return
+
+        fid = self.fid
+        file_time = fid.variables['time']
+        n = len(file_time)
+
+        # Frames can only be appended as a block if they are newer
+        # than the last stored time (not so when restarting from a
+        # checkpoint). Those which are not are written one by one.
+        frames = []
+        for frame in self.frame_buffer:
+            t, dynamic_quantities, dynamic_quantities_centroid = frame
+            if n > 0 and t <= file_time[n-1] and len(frames) == 0:
+                slice_index = self.writer.store_quantities(fid,
+                                                           time=t,
+                                                           sww_precision=self.precision,
+                                                           **dynamic_quantities)
+                if self.store_centroids:
+                    self.writer.store_quantities_centroid(fid,
+                                                          slice_index=slice_index,
+                                                          sww_precision=self.precision,
+                                                          **dynamic_quantities_centroid)
+            else:
+                frames.append(frame)
+
+        if len(frames) > 0:
+            times = num.array([frame[0] for frame in frames])
+            quantities = {}
+            for name in self.writer.dynamic_quantities:
+                quantities[name] = num.array([frame[1][name] for frame in frames])
+
+            slice_index = self.writer.store_quantities_frames(fid,
+                                                              times,
+                                                              sww_precision=self.precision,
+                                                              **quantities)
+
+            if self.store_centroids:
+                quantities = {}
+                for name in self.writer.dynamic_c_quantities:
+                    quantities[name] = num.array([frame[2][name] for frame in frames])
+
+                self.writer.store_quantities_centroid_frames(fid,
+                                                             slice_index=slice_index,
+                                                             sww_precision=self.precision,
+                                                             **quantities)
+
+        self.store_extrema(fid, extrema)
+
+        fid.sync()
+        self.frame_buffer = []
+
+    def close(self):
+        """Stop the output thread, flush buffered frames and close the
+        persistent file handle.
+        """
+
+        try:
+            self.stop_output_thread()
+        finally:
+            if self.fid is not None:
+                self.write_frame_buffer()
+                self.fid.close()
+                self.fid = None
+
+    def __getstate__(self):
+        # An open NetCDF handle or thread cannot be pickled (e.g. on
+        # checkpointing). They are recreated on the next store_timestep.
+        self.flush()
+        state = self.__dict__.copy()
+        state['fid'] = None
+        state['frame_buffer'] = []
+        state['output_thread'] = None
+        state['output_queue'] = None
+        state['free_snapshots'] = None
+        state['output_error'] = None
+        return state
+
+    def store_timestep_in_next_file(self, file_size):
+        """The current file is too big, so continue storage in a new file
+        and store the current timestep there.
+        """
+
+        # In order to get the file name and start time correct,
+        # I change the domain.filename and domain.starttime.
+        # This is the only way to do this without changing
+        # other modules (I think).
+
+        # Write a filename addon that won't break the anuga viewers
+        # (10.sww is bad)
+        filename_ext = '_time_%s' % self.domain.relative_time
+        filename_ext = filename_ext.replace('.', '_')
+
+        # Remember the old filename, then give domain a
+        # name with the extension
+        old_domain_filename = self.domain.get_name()
+        if not self.recursion:
+            self.domain.set_name(old_domain_filename + filename_ext)
+
+        # Temporarily change the domain starttime to the current time
+        old_domain_starttime = self.domain.starttime
+        self.domain.starttime = self.domain.get_time()
+
+        # Build a new data_structure.
+        next_data_structure = SWW_file(self.domain, mode=self.mode,
+                                       max_size=self.max_size,
+                                       recursion=self.recursion+1)
+        if not self.recursion:
+            log.critical('    file_size = %s' % file_size)
+            log.critical('    saving file to %s'
+                         % next_data_structure.filename)
+
+        # Set up the new data_structure
+        self.domain.writer = next_data_structure
+
+        # Store connectivity and first timestep
+        next_data_structure.store_connectivity()
+        next_data_structure.store_timestep()
+
+        # Restore the old starttime and filename
+        self.domain.starttime = old_domain_starttime
+        self.domain.set_name(old_domain_filename)
+
+    def get_dynamic_quantities(self, copy=False, snapshot=None):
+        """Return dictionaries of vertex and centroid values of the
+        dynamic quantities to be stored for the current timestep.
+
+        If copy is True, the centroid values are copied so that they are
+        not changed by subsequent evolution.
+
+        If snapshot is given it must be a dictionary of
+        (vertex_values, centroid_values) for each quantity required,
+        which are then used in place of the current domain values.
+        """
+
+        domain = self.domain
+
+        def get_vertex_values(name, precision=None):
+            Q = domain.quantities[name]
+            if snapshot is None:
+                A, _ = Q.get_vertex_values(xy=False, precision=precision)
+            else:
+                vertex_values, centroid_values = snapshot[name]
+                A, _ = Q.get_vertex_values(xy=False, precision=precision,
+                                           vertex_values=vertex_values,
+                                           centroid_values=centroid_values)
+            return A
+
+        def get_centroid_values(name):
+            if snapshot is None:
+                return domain.quantities[name].centroid_values
+            else:
+                return snapshot[name][1]
+
+        if 'stage' in self.writer.dynamic_quantities:
+            # Select only those values for stage,
+            # xmomentum and ymomentum (if stored) where
+            # depth exceeds minimum_storable_height
+            #
+            # In this branch it is assumed that elevation
+            # is also available as a quantity
+
+            # Smoothing for the get_vertex_values will be obtained
+            # from the smooth setting in domain
+
+            w = get_vertex_values('stage')
+            z = get_vertex_values('elevation')
+
+            storable_indices = num.array(
+                w-z >= self.minimum_storable_height)
+
+            # print numpy.sum(storable_indices), len(z), self.minimum_storable_height, numpy.min(w-z)
+        else:
+            # Very unlikely branch
+            storable_indices = None  # This means take all
+
+        # Now store dynamic quantities
+        dynamic_quantities = {}
+        dynamic_quantities_centroid = {}
+
+        for name in self.writer.dynamic_quantities:
+            #netcdf_array = fid.variables[name]
+
+            A = get_vertex_values(name, precision=self.precision)
+
+            if storable_indices is not None:
+                if name == 'stage':
+                    A = num.choose(storable_indices, (z, A))
+
+                if name in ['xmomentum', 'ymomentum']:
+                    # Get xmomentum where depth exceeds
+                    # minimum_storable_height
+
+                    # Define a zero vector of same size and type as A
+                    # for use with momenta
+                    null = num.zeros(num.size(A), A.dtype.char)
+                    A = num.choose(storable_indices, (null, A))
+
+            dynamic_quantities[name] = A
+
+        for name in self.writer.dynamic_c_quantities:
+            centroid_values = get_centroid_values(name[:-2])
+            if copy:
+                dynamic_quantities_centroid[name] = \
+                    centroid_values.astype(self.precision)
+            else:
+                dynamic_quantities_centroid[name] = centroid_values
+
+        return dynamic_quantities, dynamic_quantities_centroid
+
+    def store_extrema(self, fid, extrema=None):
+        """Update extrema if requested
+
+        extrema defaults to the current domain.quantities_to_be_monitored
+        """
+
+        if extrema is None:
+            extrema = self.domain.quantities_to_be_monitored
+
+        if extrema is not None:
+            for q, info in list(extrema.items()):
+                if info['min'] is not None:
+                    fid.variables[q + '.extrema'][0] = info['min']
+                    fid.variables[q + '.min_location'][:] = \
+                        info['min_location']
+                    fid.variables[q + '.min_time'][0] = info['min_time']
+
+                if info['max'] is not None:
+                    fid.variables[q + '.extrema'][1] = info['max']
+                    fid.variables[q + '.max_location'][:] = \
+                        info['max_location']
+                    fid.variables[q + '.max_time'][0] = info['max_time']
 
 
 class Read_sww(object):
@@ -1090,6 +1472,80 @@ class Write_sww(Write_sts):
                 q_retyped = q_values.astype(sww_precision)
                 outfile.variables[q][slice_index] = q_retyped
 
+    def store_quantities_frames(self,
+                                outfile,
+                                times,
+                                sww_precision=num.float32,
+                                verbose=False,
+                                **quant):
+        """
+        Append several timesteps of quantity info in one write.
+
+        times is the array of times of the frames to be appended and
+        **quant are the 2D numpy arrays (number of frames x number of
+        points) to be stored for each dynamic quantity.
+
+        Returns the slice_index of the first appended frame.
+
+        Precondition:
+            store_triangulation and
+            store_header have been called.
+        """
+
+        times = ensure_numeric(times)
+
+        file_time = outfile.variables['time']
+        slice_index = len(file_time)
+        n = len(times)
+        file_time[slice_index:slice_index+n] = times
+
+        for q in self.dynamic_quantities:
+            if q not in quant:
+                msg = 'Values for quantity %s was not specified in ' % q
+                msg += 'store_quantities_frames so they cannot be stored.'
+                raise NewQuantity(msg)
+            else:
+                q_values = ensure_numeric(quant[q])
+
+                q_retyped = q_values.astype(sww_precision)
+                outfile.variables[q][slice_index:slice_index+n] = q_retyped
+
+                # This updates the _range values
+                q_range = outfile.variables[q + Write_sww.RANGE][:]
+                q_values_min = num.min(q_values)
+                if q_values_min < q_range[0]:
+                    outfile.variables[q + Write_sww.RANGE][0] = q_values_min
+                q_values_max = num.max(q_values)
+                if q_values_max > q_range[1]:
+                    outfile.variables[q + Write_sww.RANGE][1] = q_values_max
+
+        return slice_index
+
+    def store_quantities_centroid_frames(self,
+                                         outfile,
+                                         sww_precision=num.float32,
+                                         slice_index=None,
+                                         verbose=False,
+                                         **quant):
+        """
+        Write several timesteps of quantity centroid info in one write,
+        starting at slice_index as returned by store_quantities_frames.
+        """
+
+        assert slice_index is not None, 'slice_index should be set in store_quantities_frames'
+
+        for q in self.dynamic_c_quantities:
+            if q not in quant:
+                msg = 'Values for quantity %s was not specified in ' % q
+                msg += 'store_quantities_centroid_frames so they cannot be stored.'
+                raise NewQuantity(msg)
+            else:
+                q_values = ensure_numeric(quant[q])
+                n = q_values.shape[0]
+
+                q_retyped = q_values.astype(sww_precision)
+                outfile.variables[q][slice_index:slice_index+n] = q_retyped
+
     def verbose_quantities(self, outfile):
         log.critical('------------------------------------------------')
         log.critical('More Statistics:')
@@ -117,6 +117,52 @@ class Test_sww(unittest.TestCase):
         os.remove(domain.get_name() + '.sww') 
 
 
+    def test_buffered_store_timestep(self):
+        """Test that buffered and asynchronous sww output is identical
+        to unbuffered output
+        """
+
+        def run(name, buffer_frames, asynchronous=False):
+            points, vertices, boundary = rectangular(4, 4)
+            domain = Domain(points, vertices, boundary)
+            domain.set_name(name)
+            domain.set_sww_buffer_frames(buffer_frames)
+            domain.set_store_asynchronously(asynchronous)
+            domain.set_quantity('elevation', lambda x,y: -x/3.0)
+            domain.set_quantity('friction', 0.1)
+            domain.set_quantity('stage', expression='elevation + 0.05')
+
+            Br = Reflective_boundary(domain)
+            Bd = Dirichlet_boundary([0.2,0.,0.])
+            domain.set_boundary({'left': Bd, 'right': Br, 'top': Br, 'bottom': Br})
+
+            for t in domain.evolve(yieldstep = 0.01, finaltime = 0.1):
+                pass
+
+            return domain.get_name() + '.sww'
+
+        unbuffered = run('sww_unbuffered', 0)
+        fid0 = NetCDFFile(unbuffered, netcdf_mode_r)
+        assert len(fid0.variables['time']) == 11
+
+        for filename in [run('sww_buffered', 3),
+                         run('sww_async', 0, asynchronous=True),
+                         run('sww_async_buffered', 4, asynchronous=True)]:
+
+            fid1 = NetCDFFile(filename, netcdf_mode_r)
+
+            assert num.allclose(fid0.variables['time'][:], fid1.variables['time'][:])
+            for name in ['stage', 'xmomentum', 'ymomentum', 'stage_c',
+                         'stage_range', 'xmomentum_range']:
+                assert num.allclose(fid0.variables[name][:], fid1.variables[name][:])
+
+            fid1.close()
+            os.remove(filename)
+
+        fid0.close()
+        os.remove(unbuffered)
+
+
     def Xtest_sww2domain1(self):
     
         # FIXME (Ole): DELETE THIS TEST
@@ -28,6 +28,9 @@
 import numpy as num
 from . import fitsmooth_ext as fitsmooth
 import sys
+import time
+import threading
+import queue
 
 
 from anuga.abstract_2d_finite_volumes.neighbour_mesh import Mesh
@@ -51,6 +54,11 @@ class VertsWithNoTrianglesError(Exception):
     pass
 
 
+# Maximum number of points handled in one go when streaming the points
+# (bounds the memory used by the temporaries of a block)
+STREAM_BLOCK_SIZE = 2**20
+
+
 # ----------------------------------------------
 # C code to build interpolation matrices
 # ----------------------------------------------
@@ -116,6 +124,11 @@ class Fit(FitInterpolate):
         self.D = None
         self.point_count = 0
 
+        # CSR sparsity pattern of AtA, D and B (see _build_fit_pattern)
+        self.pattern_rowptr = None
+        self.pattern_colind = None
+        self.pattern_slots = None
+
         # NOTE PADARN: NEEDS FIXING - currently need smoothing matrix
         # even if alpha is zero, due to C function expecting it. This
         # could and should be removed.
@@ -194,6 +207,202 @@ class Fit(FitInterpolate):
     def get_D(self):
         return fitsmooth.return_full_D(self.D, self.mesh.number_of_nodes)
 
+    def _build_fit_pattern(self):
+        """Build the CSR sparsity pattern shared by AtA, D and B.
+
+        Entry (k,l) is nonzero only if vertices k and l belong to a common
+        triangle. pattern_slots[t] gives the positions in the CSR data of
+        the 9 entries (i,j) (i major) coupling the vertices of triangle t.
+        """
+
+        if self.pattern_rowptr is not None:
+            return
+
+        triangles = self.mesh.triangles
+        N = self.mesh.number_of_nodes
+
+        rows = num.repeat(triangles, 3, axis=1).astype(num.int64)
+        cols = num.tile(triangles, (1, 3)).astype(num.int64)
+
+        keys, slots = num.unique((rows*N + cols).ravel(), return_inverse=True)
+
+        self.pattern_slots = slots.reshape((-1, 9))
+        self.pattern_colind = keys % N
+        self.pattern_rowptr = num.zeros(N + 1, num.int64)
+        self.pattern_rowptr[1:] = num.cumsum(num.bincount(keys//N, minlength=N))
+
+    def _build_smoothing_matrix_D_data(self):
+        """Data of the smoothing matrix D in the CSR pattern of the mesh.
+
+        Same as _build_smoothing_matrix_D, but computed with numpy.
+        """
+
+        self._build_fit_pattern()
+
+        N = len(self.mesh.triangles)
+        V = self.mesh.vertex_coordinates.reshape((N, 3, 2))
+        x0, y0 = V[:, 0, 0], V[:, 0, 1]
+        x1, y1 = V[:, 1, 0], V[:, 1, 1]
+        x2, y2 = V[:, 2, 0], V[:, 2, 1]
+
+        det = (y2-y0)*(x1-x0) - (y1-y0)*(x2-x0)
+
+        # gradients of the basis functions
+        a = num.array([(y1-y2), (y2-y0), -(y1-y0)]).T/det[:, None]
+        b = num.array([(x2-x1), -(x2-x0), (x1-x0)]).T/det[:, None]
+
+        values = (a[:, :, None]*a[:, None, :] + b[:, :, None]*b[:, None, :]) \
+            *self.mesh.areas[:, None, None]
+
+        return num.bincount(self.pattern_slots.ravel(), weights=values.ravel(),
+                            minlength=len(self.pattern_colind))
+
+    def _accumulate_AtA_Atz(self, point_coordinates, z, AtA_data, Atz):
+        """Add the contribution of a block of points to AtA (data in the CSR
+        pattern of the mesh) and Atz. Points outside the mesh are ignored.
+
+        point_coordinates and the mesh vertices have the same origin.
+        """
+
+        tri_ids, sigmas = self.root.locate_points(point_coordinates)
+
+        found = tri_ids >= 0
+        tri_ids = tri_ids[found]
+        sigmas = sigmas[found]
+        z = z[found]
+
+        AtA_data += num.bincount(self.pattern_slots[tri_ids].ravel(),
+                                 weights=(sigmas[:, :, None]*sigmas[:, None, :]).ravel(),
+                                 minlength=len(AtA_data))
+
+        nodes = self.mesh.triangles[tri_ids].ravel()
+        N = self.mesh.number_of_nodes
+        if z.ndim == 1:
+            Atz += num.bincount(nodes, weights=(sigmas*z[:, None]).ravel(),
+                                minlength=N)
+        else:
+            for w in range(z.shape[1]):
+                Atz[:, w] += num.bincount(nodes, weights=(sigmas*z[:, w:w+1]).ravel(),
+                                          minlength=N)
+
+    def _build_matrix_AtA_Atz_streaming(self, point_coordinates_or_filename, z=None,
+                                        point_origin=None, attribute_name=None,
+                                        max_read_lines=None, workers=2,
+                                        verbose=False):
+        """Build AtA (returned as the data of a CSR matrix with the pattern
+        of the mesh) and self.Atz from a stream of blocks of points.
+
+        The blocks are read by a producer thread into a bounded queue, so
+        only a few blocks are held in memory at any time. Each of the worker
+        threads accumulates its own partial sums (points are located in
+        compiled code which releases the GIL), which are added together
+        once all the points have been read.
+        """
+
+        self._build_fit_pattern()
+
+        nnz = len(self.pattern_colind)
+        N = self.mesh.number_of_nodes
+
+        blocks = queue.Queue(maxsize=2*workers)
+        done = object()
+        errors = []
+        lock = threading.Lock()
+
+        start_time = time.time()
+        report = [start_time]
+
+        def produce():
+            try:
+                for block in _point_blocks(point_coordinates_or_filename, z,
+                                           point_origin=point_origin,
+                                           attribute_name=attribute_name,
+                                           max_read_lines=max_read_lines,
+                                           verbose=verbose):
+                    if errors:
+                        break
+                    blocks.put(block)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                for i in range(workers):
+                    blocks.put(done)
+
+        def consume():
+            AtA_data = num.zeros(nnz)
+            Atz = None
+            while True:
+                block = blocks.get()
+                if block is done:
+                    break
+                if errors:
+                    # Keep draining the queue so the producer can finish
+                    continue
+
+                try:
+                    points, values = block
+                    if Atz is None:
+                        Atz = num.zeros((N,) + values.shape[1:])
+                    self._accumulate_AtA_Atz(points, values, AtA_data, Atz)
+                except Exception as e:
+                    errors.append(e)
+                    continue
+
+                with lock:
+                    self.point_count += len(values)
+                    now = time.time()
+                    if verbose and now - report[0] > 10.0:
+                        report[0] = now
+                        log.critical('Fit: %d points processed (%.0f points/s)'
+                                     % (self.point_count,
+                                        self.point_count/(now - start_time)))
+
+            return AtA_data, Atz
+
+        producer = threading.Thread(target=produce, daemon=True)
+        producer.start()
+
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(consume) for i in range(workers)]
+            partials = [future.result() for future in futures]
+
+        producer.join()
+
+        if errors:
+            raise errors[0]
+
+        AtA_data = partials[0][0]
+        for partial in partials[1:]:
+            AtA_data += partial[0]
+
+        Atz = [partial[1] for partial in partials if partial[1] is not None]
+        if len(Atz) == 0:
+            self.Atz = num.zeros(N)
+        else:
+            self.Atz = num.sum(Atz, axis=0)
+
+        if verbose:
+            log.critical('Fit: %d points processed in %.1f s'
+                         % (self.point_count, time.time() - start_time))
+
+        return AtA_data
+
+    def _build_coefficient_matrix_B_streaming(self, AtA_data):
+        """
+        Build final coefficient matrix from AtA and D, both in the
+        CSR pattern of the mesh
+        """
+
+        msize = self.mesh.number_of_nodes
+
+        data = self.alpha*self._build_smoothing_matrix_D_data() + AtA_data
+
+        self.B = Sparse_CSR(data=data,
+                            Colind=self.pattern_colind,
+                            rowptr=self.pattern_rowptr,
+                            m=msize, n=msize)
+
     # NOTE PADARN: This function was added to emulate behavior of the original
     # class so as to pass a unit test. It is completely unneeded.
     def build_fit_subset(self, point_coordinates, z=None, attribute_name=None,
@@ -274,7 +483,8 @@ class Fit(FitInterpolate):
             verbose=False,
             point_origin=None,
             attribute_name=None,
-            max_read_lines=1e7):
+            max_read_lines=1e7,
+            workers=2):
         """Fit a smooth surface to given 1d array of data points z.
 
         The smooth surface is computed at each vertex in the underlying
@@ -285,9 +495,15 @@ class Fit(FitInterpolate):
               A filename of a .pts file or a
               List of coordinate pairs [x, y] of
               data points or an nx2 numeric array or a Geospatial_data object
-              or points file filename
+              or points file filename. A .npy file (opened memory mapped)
+              holds an n x (2+a) array of absolute x, y and the a
+              attributes of the points.
           z: Single 1d vector or array of data at the point_coordinates.
+          workers: Number of threads assembling AtA and Atz.
 
+        Unless subsets of points have already been added with
+        build_fit_subset, the points are streamed in blocks of at most
+        max_read_lines points and AtA is assembled directly in CSR format.
         """
         if isinstance(point_coordinates_or_filename, str):
             if point_coordinates_or_filename[-4:] != ".pts":
@@ -300,8 +516,20 @@ class Fit(FitInterpolate):
         if verbose:
             print('Fit.fit: Initializing')
 
+        AtA_data = None
+
+        if point_coordinates_or_filename is not None and self.AtA is None:
+            # Stream the points, building AtA in the CSR pattern of the mesh
+            AtA_data = self._build_matrix_AtA_Atz_streaming(point_coordinates_or_filename, z,
+                                                            point_origin=point_origin,
+                                                            attribute_name=attribute_name,
+                                                            max_read_lines=max_read_lines,
+                                                            workers=workers,
+                                                            verbose=verbose)
+            point_coordinates = None
+
         # Use blocking to load in the point info
-        if isinstance(point_coordinates_or_filename, str):
+        elif isinstance(point_coordinates_or_filename, str):
             msg = "Don't set a point origin when reading from a file"
             assert point_origin is None, msg
             filename = point_coordinates_or_filename
@@ -328,7 +556,10 @@ class Fit(FitInterpolate):
 
         # This condition either means a filename was read or the function
         # recieved a None as input
-        if point_coordinates is None:
+        if AtA_data is not None:
+            pass
+
+        elif point_coordinates is None:
             if verbose:
                 log.critical('Fit.fit: Warning: no data points in fit')
             msg = 'No interpolation matrix.'
@@ -355,7 +586,11 @@ class Fit(FitInterpolate):
             msg += 'positive value,\ne.g. 1.0e-3.'
             raise TooFewPointsError(msg)
 
-        self._build_coefficient_matrix_B(verbose)
+        if AtA_data is None:
+            self._build_coefficient_matrix_B(verbose)
+        else:
+            self._build_coefficient_matrix_B_streaming(AtA_data)
+
         loners = self.mesh.get_lone_vertices()
         # FIXME  - make this as error message.
         # test with
@@ -374,6 +609,85 @@ class Fit(FitInterpolate):
                                   precon=self.cg_precon)
 
 
+def _point_blocks(point_coordinates_or_filename, z=None,
+                  point_origin=None,
+                  attribute_name=None,
+                  max_read_lines=None,
+                  verbose=False):
+    """Generator of blocks (points, z) of absolute point coordinates and
+    their attributes, of at most max_read_lines (and STREAM_BLOCK_SIZE)
+    points. Files are read one block at a time.
+    """
+
+    if max_read_lines is None:
+        block_size = STREAM_BLOCK_SIZE
+    else:
+        block_size = max(1, min(int(max_read_lines), STREAM_BLOCK_SIZE))
+
+    def split(points, values):
+        if len(values.shape) == 2 and values.shape[1] == 1:
+            values = values[:, 0]
+        for start in range(0, len(values), block_size):
+            yield (num.ascontiguousarray(points[start:start+block_size], float),
+                   num.ascontiguousarray(values[start:start+block_size], float))
+
+    if isinstance(point_coordinates_or_filename, str) and \
+            point_coordinates_or_filename[-4:] == '.npy':
+        msg = "Don't set a point origin when reading from a file"
+        assert point_origin is None, msg
+        msg = 'Attributes of a .npy points file are not named'
+        assert attribute_name is None, msg
+
+        data = num.load(point_coordinates_or_filename, mmap_mode='r')
+
+        msg = 'A .npy points file should hold an n x (2+a) array'
+        assert len(data.shape) == 2 and data.shape[1] > 2, msg
+
+        if data.shape[1] == 3:
+            values = data[:, 2]
+        else:
+            values = data[:, 2:]
+        yield from split(data[:, :2], values)
+
+    elif isinstance(point_coordinates_or_filename, str):
+        msg = "Don't set a point origin when reading from a file"
+        assert point_origin is None, msg
+
+        G_data = Geospatial_data(point_coordinates_or_filename,
+                                 max_read_lines=max_read_lines,
+                                 load_file_now=False,
+                                 verbose=verbose)
+
+        for geo_block in G_data:
+            points = geo_block.get_data_points(absolute=True)
+            values = geo_block.get_attributes(attribute_name=attribute_name)
+            yield from split(points, ensure_numeric(values, float))
+
+    elif isinstance(point_coordinates_or_filename, Geospatial_data):
+        G_data = point_coordinates_or_filename
+        if z is None:
+            z = G_data.get_attributes(attribute_name)
+        points = ensure_absolute(G_data, geo_reference=point_origin)
+        yield from split(points, ensure_numeric(z, float))
+
+    else:
+        msg = 'z not specified'
+        assert z is not None, msg
+
+        # Convert to absolute coordinates one block at a time, so that a
+        # large (or memory mapped) array is not copied
+        points = ensure_numeric(point_coordinates_or_filename, float)
+        z = ensure_numeric(z, float)
+
+        msg = 'Number of points and number of values differ'
+        assert len(points) == len(z), msg
+
+        for start in range(0, len(z), block_size):
+            block = ensure_absolute(points[start:start+block_size],
+                                    geo_reference=point_origin)
+            yield from split(block, z[start:start+block_size])
+
+
 # poin_coordiantes can also be a points file name
 
 def fit_to_mesh(point_coordinates,
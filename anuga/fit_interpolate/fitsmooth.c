@@ -243,6 +243,37 @@ anuga_int _build_matrix_AtA_Atz_points(anuga_int N,
     return 0;
 }
 
+// Locates the points point_coordinates[point_ids[k]] in the mesh of the
+// quadtree. For each point returns the index of the containing triangle in
+// tri_ids[k] (-1 if not found, ie in a hole) and the barycentric weights
+// of its 3 vertices in sigmas[3k:3k+3].
+void _locate_points(anuga_int npts,
+    double * point_coordinates,
+    anuga_int * point_ids,
+    quad_tree * quadtree,
+    anuga_int * tri_ids,
+    double * sigmas)
+              {
+
+    anuga_int k;
+
+    #pragma omp parallel for private(k) schedule(dynamic, 1024)
+    for(k=0;k<npts;k++){
+
+        double x = point_coordinates[2*point_ids[k]];
+        double y = point_coordinates[2*point_ids[k]+1];
+        triangle * T = search(quadtree,x,y);
+
+        if(T!=NULL){
+            tri_ids[k] = T->index;
+            calculate_sigma_inplace(T,x,y,&sigmas[3*k]);
+        } else {
+            tri_ids[k] = -1;
+            sigmas[3*k] = sigmas[3*k+1] = sigmas[3*k+2] = -1.0;
+        }
+    }
+}
+
 // Combines two sparse_dok matricies and two vectors of doubles. 
 void _combine_partial_AtA_Atz(sparse_dok * dok_AtA1,sparse_dok * dok_AtA2,
                              double* Atz1,
@@ -52,6 +52,7 @@ cdef extern from "fitsmooth.c":
 	int64_t _build_matrix_AtA_Atz_points(int64_t N, int64_t* triangles, double* point_coordinates, double* point_values, int64_t zdims, int64_t npts, sparse_dok* AtA, double** Atz, quad_tree* quadtree)
 	void _combine_partial_AtA_Atz(sparse_dok* dok_AtA1, sparse_dok* dok_AtA2, double* Atz1, double* Atz2, int64_t n, int64_t zdim)
 	triangle* search(quad_tree* node ,double xp, double yp)
+	void _locate_points(int64_t npts, double* point_coordinates, int64_t* point_ids, quad_tree* quadtree, int64_t* tri_ids, double* sigmas) nogil
 	double* calculate_sigma(triangle* T, double x, double y)
 	int64_t quad_tree_node_count(quad_tree* tree)
 	int64_t get_dok_rows(sparse_dok* dok)
@@ -214,6 +215,25 @@ def individual_tree_search(object tree, np.ndarray[double, ndim=1, mode="c"] poi
 
 	return [found, sigmalist, index]
 
+def locate_points(object tree,\
+				  np.ndarray[double, ndim=2, mode="c"] point_coordinates not None,\
+				  np.ndarray[int64_t, ndim=1, mode="c"] point_ids not None,\
+				  np.ndarray[int64_t, ndim=1, mode="c"] tri_ids not None,\
+				  np.ndarray[double, ndim=2, mode="c"] sigmas not None):
+
+	cdef quad_tree* quadtree
+	cdef int64_t npts
+
+	npts = point_ids.shape[0]
+
+	if npts == 0:
+		return
+
+	quadtree = <quad_tree* > PyCapsule_GetPointer(tree, "quad tree")
+
+	with nogil:
+		_locate_points(npts, &point_coordinates[0,0], &point_ids[0], quadtree, &tri_ids[0], &sigmas[0,0])
+
 def items_in_tree(object tree):
 
 	cdef quad_tree* quadtree
@@ -33,7 +33,7 @@ from csv import writer, DictWriter
 
 from anuga.caching.caching import cache
 from anuga.abstract_2d_finite_volumes.neighbour_mesh import Mesh
-from anuga.utilities.sparse import Sparse, Sparse_CSR
+from anuga.utilities.sparse import Sparse_CSR
 from anuga.utilities.cg_solve import conjugate_gradient, VectorShapeError
 from anuga.coordinate_transforms.geo_reference import Geo_reference
 from anuga.utilities.numerical_tools import ensure_numeric, NAN
@@ -384,8 +384,7 @@ class Interpolate (FitInterpolate):
         z = self._A * f
 
         # Taking into account points outside the mesh.
-        for i in self.outside_poly_indices:
-            z[i] = NODATA_value
+        z[num.asarray(self.outside_poly_indices, dtype=int)] = NODATA_value
         return z
 
 
@@ -437,54 +436,57 @@ class Interpolate (FitInterpolate):
         if verbose: log.critical('Number of datapoints: %d' % n)
         if verbose: log.critical('Number of basis functions: %d' % m)
 
-        A = Sparse(n,m)
-
         n = len(inside_boundary_indices)
 
-        centroids = []
-        inside_poly_indices = []
-
         # Compute matrix elements for points inside the mesh
         if verbose: log.critical('Building interpolation matrix from %d points'
                                  % n)
 
-        for d, i in enumerate(inside_boundary_indices):
-            # For each data_coordinate point
-            if verbose and d % ((n+10) / 10) == 0: log.critical('Doing %d of %d'
-                                                                %(d, n))
-
-            x = point_coordinates[i]
-            element_found, sigma0, sigma1, sigma2, k = self.root.search_fast(x)
-            # Update interpolation matrix A if necessary
-            if element_found is True:
-
-                #if verbose:
-                #    print 'Point is within mesh:', d, i
-
-                inside_poly_indices.append(i)
+        # Locate all the points in one go
+        tri_ids, sigmas = self.root.locate_points(point_coordinates,
+                                                  inside_boundary_indices)
 
-                # Assign values to matrix A
-                j0 = self.mesh.triangles[k,0] # Global vertex id for sigma0
-                j1 = self.mesh.triangles[k,1] # Global vertex id for sigma1
-                j2 = self.mesh.triangles[k,2] # Global vertex id for sigma2
-                js = [j0, j1, j2]
-
-                if output_centroids is False:
-                    # Weight each vertex according to its distance from x
-                    sigmas = {j0:sigma0, j1:sigma1, j2:sigma2}
-                    for j in js:
-                        A[i, j] = sigmas[j]
-                else:
-                    # If centroids are needed, weight all 3 vertices equally
-                    for j in js:
-                        A[i, j] = 1.0/3.0
-                    centroids.append(self.mesh.centroid_coordinates[k])
-            else:
-                if verbose:
-                    log.critical('Mesh has a hole - moving this point to outside list')
+        found = tri_ids >= 0
+        inside_poly_indices = num.asarray(inside_boundary_indices, dtype=num.int64)[found]
+        tri_ids = tri_ids[found]
+        sigmas = sigmas[found]
 
-                # This is a numpy arrays, so we need to do a slow transfer
-                outside_poly_indices = num.append(outside_poly_indices, [i], axis=0)
+        hole_indices = num.asarray(inside_boundary_indices)[~found]
+        if len(hole_indices) > 0:
+            if verbose:
+                log.critical('Mesh has a hole - moving %d points to outside list'
+                             % len(hole_indices))
+            outside_poly_indices = num.concatenate((outside_poly_indices, hole_indices))
+
+        # Each point found contributes to the row of the 3 vertices
+        # of its triangle
+        js = self.mesh.triangles[tri_ids]
+        if output_centroids is False:
+            # Weight each vertex according to its distance from x
+            data = sigmas
+            centroids = []
+        else:
+            # If centroids are needed, weight all 3 vertices equally
+            data = num.full(sigmas.shape, 1.0/3.0)
+            centroids = self.mesh.centroid_coordinates[tri_ids]
+
+        # Build A directly in CSR format, with rows in point order and
+        # columns in vertex order
+        row_order = num.argsort(inside_poly_indices, kind='stable')
+        js = js[row_order]
+        data = data[row_order]
+        col_order = num.argsort(js, axis=1)
+        js = num.take_along_axis(js, col_order, axis=1)
+        data = num.take_along_axis(data, col_order, axis=1)
+
+        row_ptr = num.zeros(point_coordinates.shape[0]+1, dtype=num.int64)
+        row_ptr[inside_poly_indices+1] = 3
+        row_ptr = num.cumsum(row_ptr)
+
+        A = Sparse_CSR(None,
+                       num.ascontiguousarray(data.ravel(), dtype=float),
+                       num.ascontiguousarray(js.ravel(), dtype=num.int64),
+                       row_ptr, point_coordinates.shape[0], m)
 
         return A, inside_poly_indices, outside_poly_indices, centroids
 
@@ -1042,24 +1044,7 @@ class Interpolation_function(object):
                           'parameter point_id can be used'
                     raise Exception(msg)
 
-        msg = 'Model time %.16f' % t
-        msg += ' is not contained in function domain [%.16f:%.16f].\n' % (self.time[0], self.time[-1])
-        if t < self.time[0]: raise Modeltime_too_early(msg)
-        if t > self.time[-1]: raise Modeltime_too_late(msg)
-
-        oldindex = self.index #Time index
-
-        # Find current time slot
-        while t > self.time[self.index]: self.index += 1
-        while t < self.time[self.index]: self.index -= 1
-
-        if t == self.time[self.index]:
-            # Protect against case where t == T[-1] (last time)
-            #  - also works in general when t == T[i]
-            ratio = 0
-        else:
-            # t is now between index and index+1
-            ratio = (t - self.time[self.index]) / (self.time[self.index+1] - self.time[self.index])
+        ratio = self._find_time_slot(t)
 
         # Compute interpolated values
         q = num.zeros(len(self.quantity_names), float)
@@ -1115,6 +1100,85 @@ class Interpolation_function(object):
 
                 return res
 
+    def evaluate_points(self, t, point_ids=None):
+        """Evaluate f(t) at many preprocessed points in one array operation
+
+        Inputs:
+          t:         time - Model time. Must lie within existing timesteps
+          point_ids: array of indices of the preprocessed points.
+                     If None all preprocessed points are used.
+
+        Return value: Array of shape (len(point_ids), number of quantities)
+        where row k holds the same values as self(t, point_id=point_ids[k]).
+
+        If no spatial info is present the time dependent values are
+        replicated for each point.
+        """
+
+        if self.spatial is True and self.interpolation_points is None:
+            msg = 'Interpolation_function must be instantiated ' + \
+                  'with a list of interpolation points before ' + \
+                  'method evaluate_points can be used'
+            raise Exception(msg)
+
+        if point_ids is None:
+            if self.interpolation_points is None:
+                point_ids = num.zeros(1, int)
+            else:
+                point_ids = num.arange(len(self.interpolation_points))
+        else:
+            point_ids = num.asarray(point_ids, dtype=int)
+
+        ratio = self._find_time_slot(t)
+
+        N = len(point_ids)
+        q = num.zeros((N, len(self.quantity_names)), float)
+        for i, name in enumerate(self.quantity_names):
+            Q = self.precomputed_values[name]
+
+            if self.spatial is False:
+                # No spatial info: replicate value for all points
+                Q0 = Q[self.index]
+                if ratio > 0: Q1 = Q[self.index+1]
+            else:
+                Q0 = Q[self.index, point_ids]
+                if ratio > 0: Q1 = Q[self.index+1, point_ids]
+
+            # Linear temporal interpolation (NAN propagates as in __call__)
+            if ratio > 0:
+                with num.errstate(invalid='ignore'):
+                    q[:, i] = num.where((Q0 == NAN) & (Q1 == NAN),
+                                        Q0, Q0 + ratio*(Q1 - Q0))
+            else:
+                q[:, i] = Q0
+
+        return q
+
+    def _find_time_slot(self, t):
+        """Move self.index to the time slot containing t and return
+        the ratio used for linear interpolation between self.index
+        and self.index+1
+        """
+
+        msg = 'Model time %.16f' % t
+        msg += ' is not contained in function domain [%.16f:%.16f].\n' % (self.time[0], self.time[-1])
+        if t < self.time[0]: raise Modeltime_too_early(msg)
+        if t > self.time[-1]: raise Modeltime_too_late(msg)
+
+        # Find current time slot
+        while t > self.time[self.index]: self.index += 1
+        while t < self.time[self.index]: self.index -= 1
+
+        if t == self.time[self.index]:
+            # Protect against case where t == T[-1] (last time)
+            #  - also works in general when t == T[i]
+            ratio = 0
+        else:
+            # t is now between index and index+1
+            ratio = (t - self.time[self.index]) / (self.time[self.index+1] - self.time[self.index])
+
+        return ratio
+
     def get_time(self):
         """Return model time as a vector of timesteps
         """
@@ -247,6 +247,69 @@ class Test_Fit(unittest.TestCase):
         assert num.allclose(f, answer)
         os.remove(fileName)
 
+    def test_fit_streaming_same_as_fit_subset(self):
+
+        from anuga.abstract_2d_finite_volumes.mesh_factory import rectangular_cross
+
+        points, vertices, boundary = rectangular_cross(8, 6, len1=8.0, len2=6.0)
+
+        num.random.seed(17)
+        data_points = num.random.uniform(-0.5, 8.5, (500, 2))
+        data_points[:, 1] *= 0.75
+        z = num.array([num.sin(data_points[:, 0]), data_points[:, 1]**2]).T
+
+        # Old path: AtA assembled as a dictionary of keys
+        interp1 = Fit(points, vertices, alpha=0.01)
+        interp1.build_fit_subset(data_points, z)
+        f1 = interp1.fit()
+
+        # Streamed in blocks by several threads
+        interp2 = Fit(points, vertices, alpha=0.01)
+        f2 = interp2.fit(data_points, z, max_read_lines=37, workers=3)
+
+        assert interp1.point_count == interp2.point_count
+        assert num.allclose(interp1.Atz, interp2.Atz)
+        assert num.allclose(f1, f2)
+
+        # Smoothing matrix in the CSR pattern of the mesh (fit adds AtA
+        # to the D of interp1)
+        D = num.array(Fit(points, vertices).get_D())
+        D_data = interp2._build_smoothing_matrix_D_data()
+        rows = num.repeat(num.arange(len(points)), num.diff(interp2.pattern_rowptr))
+        assert num.allclose(D[rows, interp2.pattern_colind], D_data)
+        assert num.allclose(num.sum(num.abs(D)), num.sum(num.abs(D_data)))
+
+    def test_fit_npy_file(self):
+
+        a = [-1.0, 0.0]
+        b = [3.0, 4.0]
+        c = [4.0,1.0]
+        d = [-3.0, 2.0] #3
+        e = [-1.0,-2.0]
+        f = [1.0, -2.0] #5
+
+        vertices = [a, b, c, d,e,f]
+        triangles = [[0,1,3], [1,0,2], [0,4,5], [0,5,2]] #abd bac aef afc
+
+        interp = Fit(vertices, triangles, alpha=0.0)
+
+        point_coords = num.array([[-2.0, 2.0], [-1.0, 1.0], [0.0, 2.0],
+                                  [1.0, 1.0], [2.0, 1.0], [0.0, 0.0],
+                                  [1.0, 0.0], [0.0, -1.0], [-0.2, -0.5],
+                                  [-0.9, -1.5], [0.5, -1.9], [3.0, 1.0]])
+        data = num.zeros((len(point_coords), 3))
+        data[:, :2] = point_coords
+        data[:, 2] = linear_function(point_coords)
+
+        fileName = tempfile.mktemp(".npy")
+        num.save(fileName, data)
+
+        f = interp.fit(fileName, max_read_lines=5)
+        answer = linear_function(vertices)
+
+        assert num.allclose(f, answer)
+        os.remove(fileName)
+
     def test_fit_to_mesh_UTM_file(self):
         #Get (enough) datapoints
         data_points = [[-21.5, 114.5],[-21.4, 114.6],[-21.45,114.65],
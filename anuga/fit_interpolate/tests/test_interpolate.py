@@ -20,6 +20,7 @@ from math import sqrt
 import anuga
 from anuga.fit_interpolate.interpolate import Interpolate
 from anuga.fit_interpolate.interpolate import Interpolation_function
+from anuga.fit_interpolate.interpolate import Modeltime_too_late
 from anuga.fit_interpolate.interpolate import interpolate
 from anuga.fit_interpolate.interpolate import interpolate_sww2csv
 
@@ -143,6 +144,77 @@ class Test_Interpolate(unittest.TestCase):
         assert interp.outside_poly_indices[1] == 2, \
                'third outside point should be inside the hole!'
 
+    def test_locate_points(self):
+        # Bulk point location agrees with search_fast, including
+        # points outside the mesh and in a hole
+        from anuga.abstract_2d_finite_volumes.mesh_factory import rectangular_cross
+
+        points, vertices, boundary = rectangular_cross(10, 10, len1=10, len2=10)
+        vertices = num.array([v for k, v in enumerate(vertices) if k % 17 != 3])
+
+        interp = Interpolate(points, vertices)
+
+        data = num.random.RandomState(42).uniform(-1.0, 11.0, size=(500, 2))
+
+        tri_ids, sigmas = interp.root.locate_points(data)
+
+        assert num.any(tri_ids < 0)
+        for i, x in enumerate(data):
+            found, sigma0, sigma1, sigma2, k = interp.root.search_fast(x)
+            if found:
+                assert tri_ids[i] == k
+                assert num.allclose(sigmas[i], [sigma0, sigma1, sigma2])
+            else:
+                assert tri_ids[i] == -1
+
+        # Subset of points
+        ids = num.array([5, 1, 400])
+        tri_ids_subset, sigmas_subset = interp.root.locate_points(data, ids)
+        assert num.all(tri_ids_subset == tri_ids[ids])
+        assert num.allclose(sigmas_subset, sigmas[ids])
+
+        # The interpolation matrix only has rows for the points found
+        A, inside, outside, _ = interp._build_interpolation_matrix_A(data)
+        A = A.todense()
+        assert A.shape == (500, len(points))
+        assert len(inside) + len(outside) == 500
+        assert num.allclose(A[inside].sum(axis=1), 1.0)
+        assert num.allclose(A[outside], 0.0)
+
+    def test_build_interpolation_matrix_A_matches_sparse(self):
+        # The CSR matrix is the same as the one built entry by entry
+        # from search_fast into a Sparse matrix
+        from anuga.abstract_2d_finite_volumes.mesh_factory import rectangular_cross
+        from anuga.utilities.sparse import Sparse
+
+        points, vertices, boundary = rectangular_cross(10, 10, len1=10, len2=10)
+        vertices = num.array([v for k, v in enumerate(vertices) if k % 17 != 3])
+
+        interp = Interpolate(points, vertices)
+
+        data = num.random.RandomState(13).uniform(-1.0, 11.0, size=(300, 2))
+
+        for output_centroids in [False, True]:
+            A, inside, outside, centroids = \
+                interp._build_interpolation_matrix_A(data, output_centroids=output_centroids)
+
+            B = Sparse(len(data), len(points))
+            for i, x in enumerate(data):
+                found, sigma0, sigma1, sigma2, k = interp.root.search_fast(x)
+                if found:
+                    sigmas = [sigma0, sigma1, sigma2]
+                    for j in range(3):
+                        if output_centroids:
+                            B[i, interp.mesh.triangles[k, j]] = 1.0/3.0
+                        else:
+                            B[i, interp.mesh.triangles[k, j]] = sigmas[j]
+
+            assert A.shape == B.shape
+            assert num.allclose(A.todense(), B.todense())
+
+            f = num.arange(len(points), dtype=float)
+            assert num.allclose(A*f, B*f)
+
     def test_simple_interpolation_example1(self):
         
         from anuga.abstract_2d_finite_volumes.mesh_factory import rectangular
@@ -1510,6 +1582,62 @@ class Test_Interpolate(unittest.TestCase):
             raise Exception('Should raise exception')
 
 
+    def test_interpolation_function_evaluate_points(self):
+        # Test that evaluate_points agrees with pointwise evaluation
+        # including points outside the mesh
+
+        time = [1.0, 5.0, 6.0]
+
+        a = [0.0, 0.0]
+        b = [0.0, 2.0]
+        c = [2.0, 0.0]
+        d = [0.0, 4.0]
+        e = [2.0, 2.0]
+        f = [4.0, 0.0]
+
+        points = [a, b, c, d, e, f]
+        #bac, bce, ecf, dbe
+        triangles = [[1,0,2], [1,2,4], [4,2,5], [3,1,4]]
+
+        interpolation_points = [[ 0.0, 0.0],
+                                [ 0.5, 0.5],
+                                [ 0.7, 0.7],
+                                [ 1.0, 0.5],
+                                [ 2.0, 0.4],
+                                [ 545354534, 4354354353]] # outside the mesh
+
+        Q = num.zeros( (3,6), float )
+        for i, t in enumerate(time):
+            Q[i, :] = t*linear_function(points)
+
+        I = Interpolation_function(time, {'stage': Q, 'xmomentum': 2*Q},
+                                   quantity_names=['stage', 'xmomentum'],
+                                   vertex_coordinates = points,
+                                   triangles = triangles,
+                                   interpolation_points = interpolation_points,
+                                   verbose = False)
+
+        ids = num.array([4, 0, 2, 3])
+        t = time[0]
+        for j in range(50): #t in [1, 6]
+            q = I.evaluate_points(t, ids)
+            assert q.shape == (4, 2)
+            for k, id in enumerate(ids):
+                assert num.allclose(q[k], I(t, id))
+
+            q = I.evaluate_points(t)
+            assert q.shape == (6, 2)
+            assert num.all(q[5] == NAN)
+            t += 0.1
+
+        try:
+            I.evaluate_points(7.0, ids)
+        except Modeltime_too_late:
+            pass
+        else:
+            raise Exception('Should raise exception')
+
+
     def test_interpolation_function_time(self):
         #Test a long time series with an error in it (this did cause an
         #error once)
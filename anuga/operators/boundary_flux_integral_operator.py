@@ -61,6 +61,16 @@ class boundary_flux_integral_operator(Operator):
         # Zero the boundary_flux_sum 
         self.domain.boundary_flux_sum[:]=0.
 
+    def get_restart_state(self):
+        """Return the state kept by restart checkpoints
+        """
+
+        return {'boundary_flux_integral': self.boundary_flux_integral.tolist()}
+
+    def set_restart_state(self, state):
+
+        self.boundary_flux_integral = num.array(state['boundary_flux_integral'])
+
     def parallel_safe(self):
         """Operator is applied independently on each parallel domain
 
@@ -158,38 +158,11 @@ Parameters involving communication
         if self.indices is []:
             return
 
-        if self.rate_xarray:
-            # setup centroid_array from xarray corresponding to current time
-            self._update_Q_xarray()
-
         t = self.domain.get_time()
         timestep = self.domain.get_timestep()
-        factor = self.get_factor()
         indices = self.indices
 
-
-        if self.rate_spatial:
-            if indices is None:
-                x = self.coord_c[:,0]
-                y = self.coord_c[:,1]
-            else:
-                x = self.coord_c[indices,0]
-                y = self.coord_c[indices,1]
-
-            rate = self.get_spatial_rate(x,y,t)
-        elif self.rate_type == 'quantity':
-            if indices is None:
-                rate  = self.rate.centroid_values
-            else:
-                rate = self.rate.centroid_values[indices]
-        elif self.rate_type == 'centroid_array':
-            if indices is None:
-                rate  = self.rate
-            else:
-                rate = self.rate[indices]
-        else:
-            rate = self.get_non_spatial_rate(t)
-
+        rate = self.get_rate_values(t)
 
         factor = self.get_factor(t)
 
@@ -268,6 +241,44 @@ Parameters involving communication
 
         return
 
+    def get_rate_values(self, t=None):
+        """Rate on the triangles of the region at time t, either a scalar
+        or an array of the same length as indices
+        """
+
+        if t is None:
+            t = self.get_time()
+
+        if self.rate_xarray:
+            # setup centroid_array from xarray corresponding to current time
+            self._update_Q_xarray()
+
+        indices = self.indices
+
+        if self.rate_spatial:
+            if indices is None:
+                x = self.coord_c[:,0]
+                y = self.coord_c[:,1]
+            else:
+                x = self.coord_c[indices,0]
+                y = self.coord_c[indices,1]
+
+            rate = self.get_spatial_rate(x,y,t)
+        elif self.rate_type == 'quantity':
+            if indices is None:
+                rate  = self.rate.centroid_values
+            else:
+                rate = self.rate.centroid_values[indices]
+        elif self.rate_type == 'centroid_array':
+            if indices is None:
+                rate  = self.rate
+            else:
+                rate = self.rate[indices]
+        else:
+            rate = self.get_non_spatial_rate(t)
+
+        return rate
+
     def get_non_spatial_rate(self, t=None):
         """Provide a rate to calculate added volume
         """
@@ -441,6 +452,16 @@ Parameters involving communication
 
         self.full_indices = num.where(self.domain.tri_full_flag[self.indices] == 1)[0]
 
+    def get_restart_state(self):
+        """Return the state kept by restart checkpoints
+        """
+
+        return {'cumulative_influx': float(self.cumulative_influx)}
+
+    def set_restart_state(self, state):
+
+        self.cumulative_influx = state['cumulative_influx']
+
     def get_Q(self, full_only=True):
         """ Calculate current overall discharge
         """
@@ -510,78 +531,29 @@ Parameters involving communication
 
     def _prepare_xarray_rate(self, xa):
 
-        import numpy as np
-        import pandas
-
-        # to speed up parallel code it helps to load the xarray
-        self.xa = xa.load()
-
-        self.xa['time'] = pandas.to_datetime(xa['time'], utc=True)
-
-        # these are absolute coord (since we haven't implemented offsets)
-        # Convert to relative coords to domain xllcorner and yllcorner
-
-        xllcorner = self.domain.geo_reference.xllcorner
-        yllcorner = self.domain.geo_reference.yllcorner
-        self.xy = np.array([self.xa['eastings']-xllcorner, self.xa['northings']-yllcorner]).T
+        from anuga.operators.xarray_rate_source import Xarray_rate_source
 
+        # The xarray is not loaded, slices are read (and prefetched) as needed
+        self.xa = xa
+        self.xarray_source = Xarray_rate_source(self.domain, xa, verbose=self.verbose)
 
         # Determine data timestep from xarray. We assume the timestep is constant, so just test first 2 timeslices.
-        try:
-            data_dt = (self.xa['time'][1].values.astype('int64')-self.xa['time'][0].values.astype('int64'))/1.0e9
+        data_dt = self.xarray_source.get_data_timestep()
+        if data_dt is not None:
             self.domain.set_evolve_max_timestep(min(data_dt, self.domain.get_evolve_max_timestep()))
-        except:  # if we can't determine the timestep probably means there is just one timeslice so just
-            pass
-
-        from scipy.spatial import KDTree
-        tree = KDTree(self.xy)
-        if self.verbose:
-            print(tree.size, self.xy.shape)
-
-        #dd, ii = tree.query(self.domain.centroid_coordinates)
-        dd, ii = tree.query(self.domain.get_centroid_coordinates(absolute=True))
-
-        self.ii = ii
-
-        self.previous_Q_ref_time = None
-        self.previous_Q_numpy = None
 
 
     def _update_Q_xarray(self):
 
-        import pandas
-        current_utc_datetime64 = pandas.to_datetime(self.domain.get_datetime()).tz_convert('UTC')#.replace(tzinfo=None)
-
-        if self.verbose:
-            print(f"{self.domain.get_time()} {self.domain.get_datetime()}")
-            print(f"UTC time {current_utc_datetime64} type {type(current_utc_datetime64)} ")
-            print(self.xa.sel(time=current_utc_datetime64, method='nearest'))
-      
-        try:
-            Q_ref = self.xa.sel(time=current_utc_datetime64, method="ffill", tolerance='5m')
-
-            Q_ref_time = Q_ref['time'].values
+        # get_time is seconds since the epoch (utc)
+        Q_numpy = self.xarray_source.get_rate(self.domain.get_time())
 
-            if self.verbose:
-                print(f"UTC time {current_utc_datetime64} Q_ref time {Q_ref_time} {Q_ref_time == self.previous_Q_ref_time} ")
-
-            optimize = True
-            if optimize:
-                if Q_ref_time == self.previous_Q_ref_time :
-                    Q_numpy = self.previous_Q_numpy
-                else:
-                    Q_numpy = Q_ref[self.ii].to_numpy()
-                    self.previous_Q_numpy = Q_numpy
-                    self.previous_Q_ref_time = Q_ref_time
-            else:
-                Q_numpy = Q_ref[self.ii].to_numpy()
-                  
-        except:
+        if Q_numpy is None:
             Q_numpy = self.default_rate
             if self.verbose:
-                print(f"UTC time {current_utc_datetime64} Using default rate Q = {Q_numpy(self.get_time())}")
-            
-        self.set_rate(rate=Q_numpy)             
+                print(f"Time {self.domain.get_time()} Using default rate Q = {Q_numpy(self.get_time())}")
+
+        self.set_rate(rate=Q_numpy)
 
     def parallel_safe(self):
         """Operator is applied independently on each cell and
@@ -702,3 +674,219 @@ class Polygonal_rate_operator(Rate_operator):
                                polygon=polygon,
                                default_rate=default_rate,
                                verbose=verbose)
+
+
+#===============================================================================
+# Apply many rate operators together
+#===============================================================================
+class Combined_rate_operator(Operator):
+    """
+    Apply a collection of rate operators in one pass.
+
+    The rate operators are removed from the fractional step operators of
+    the domain. Their triangles are stored in one compressed (CSR like)
+    structure, so that each timestep the rates of all operators are
+    gathered into one array and added to the stage with a single
+    scatter. The cumulative influx and min/max rate statistics of each
+    rate operator are still updated.
+
+    Rates of all operators that are non negative are added in any order.
+    If some rates are negative the water removed is limited by the
+    water available, which is applied in one pass when the regions do not
+    overlap and operator by operator (in the order given) otherwise.
+    """
+
+    def __init__(self, domain,
+                 operators,
+                 description = None,
+                 label = None,
+                 logging = False,
+                 verbose = False):
+
+        Operator.__init__(self, domain, description, label, logging, verbose)
+
+        self.operators = list(operators)
+
+        for operator in self.operators:
+            msg = 'Combined_rate_operator can only combine Rate_operators'
+            assert isinstance(operator, Rate_operator), msg
+            msg = 'All rate operators must belong to the domain of the Combined_rate_operator'
+            assert operator.domain is domain, msg
+
+        self.setup_indices()
+
+        for operator in self.operators:
+            if operator in domain.fractional_step_operators:
+                domain.fractional_step_operators.remove(operator)
+
+        self.local_influx = 0.0
+
+
+    def setup_indices(self):
+        """Build the compressed index structure of the operators. The
+        triangles of operator k are indices[offsets[k]:offsets[k+1]].
+        """
+
+        N = self.domain.number_of_triangles
+
+        indices = []
+        for operator in self.operators:
+            if operator.indices is None:
+                indices.append(num.arange(N))
+            else:
+                indices.append(num.asarray(operator.indices, dtype=int).reshape(-1))
+
+        counts = num.array([len(ids) for ids in indices], dtype=int)
+
+        self.offsets = num.zeros(len(self.operators)+1, dtype=int)
+        self.offsets[1:] = num.cumsum(counts)
+
+        if len(indices) > 0:
+            self.indices = num.concatenate(indices)
+        else:
+            self.indices = num.zeros(0, dtype=int)
+
+        self.segments = num.repeat(num.arange(len(self.operators)), counts)
+        self.areas = self.domain.areas[self.indices]
+        self.full = self.domain.tri_full_flag[self.indices] == 1
+
+        self.overlapping = len(num.unique(self.indices)) < len(self.indices)
+
+        self.rates = num.zeros(len(self.indices))
+
+
+    def get_rates(self, t):
+        """Rate times factor on all triangles of all operators, and the
+        scalar rate of each operator (nan if its rate varies in space)
+        """
+
+        n = len(self.operators)
+
+        factors = num.zeros(n)
+        scalar_rates = num.full(n, num.nan)
+        for k, operator in enumerate(self.operators):
+            factors[k] = operator.get_factor(t)
+            rate = operator.get_rate_values(t)
+            if num.ndim(rate) == 0:
+                scalar_rates[k] = rate
+            else:
+                self.rates[self.offsets[k]:self.offsets[k+1]] = rate
+
+        scalar = ~num.isnan(scalar_rates)
+        scalar_entries = scalar[self.segments]
+        self.rates[scalar_entries] = scalar_rates[self.segments[scalar_entries]]
+
+        self.rates *= factors[self.segments]
+
+        return self.rates, scalar_rates*factors
+
+
+    def __call__(self):
+
+        t = self.domain.get_time()
+        timestep = self.domain.get_timestep()
+
+        rates, scalar_rates = self.get_rates(t)
+
+        indices = self.indices
+        local_rates = timestep*rates
+
+        if num.all(rates >= 0.0):
+            if self.overlapping:
+                num.add.at(self.stage_c, indices, local_rates)
+            else:
+                self.stage_c[indices] += local_rates
+        elif not self.overlapping:
+            self.apply_negative_rates(indices, local_rates)
+        else:
+            for k in range(len(self.operators)):
+                segment = slice(self.offsets[k], self.offsets[k+1])
+                local_rates[segment] = self.apply_negative_rates(indices[segment], local_rates[segment])
+
+        self.update_statistics(local_rates, scalar_rates, timestep)
+
+
+    def apply_negative_rates(self, indices, local_rates):
+        """Apply rates to triangles (no repeats) limiting the water removed
+        to the water available and scaling the momentum accordingly
+        """
+
+        heights = self.stage_c[indices] - self.elev_c[indices]
+        local_rates[:] = num.where(local_rates < 0.0, num.maximum(local_rates, -heights), local_rates)
+        local_factors = num.where(local_rates < 0.0, (local_rates+heights)/(heights+1.0e-10), 1.0)
+
+        self.stage_c[indices] = self.stage_c[indices] + local_rates
+        self.xmom_c[indices] = self.xmom_c[indices]*local_factors
+        self.ymom_c[indices] = self.ymom_c[indices]*local_factors
+
+        return local_rates
+
+
+    def update_statistics(self, local_rates, scalar_rates, timestep):
+        """Influx and min/max rate of each operator over its full triangles
+        """
+
+        n = len(self.operators)
+        full = self.full
+        segments = self.segments[full]
+        full_rates = local_rates[full]
+
+        influx = num.bincount(segments, weights=full_rates*self.areas[full], minlength=n)
+
+        local_max = num.zeros(n)
+        local_min = num.zeros(n)
+        if len(full_rates) > 0:
+            starts = num.flatnonzero(num.r_[True, segments[1:] != segments[:-1]])
+            present = segments[starts]
+            local_max[present] = num.maximum.reduceat(full_rates, starts)/timestep
+            local_min[present] = num.minimum.reduceat(full_rates, starts)/timestep
+
+        # Scalar rates report the rate itself (as Rate_operator does)
+        scalar = ~num.isnan(scalar_rates) & (scalar_rates >= 0.0)
+        local_max[scalar] = scalar_rates[scalar]
+        local_min[scalar] = scalar_rates[scalar]
+
+        for k, operator in enumerate(self.operators):
+            operator.local_influx = influx[k]
+            operator.local_max = local_max[k]
+            operator.local_min = local_min[k]
+            operator.cumulative_influx += influx[k]
+
+            if operator.monitor:
+                log.critical('Local Flux at time %.2f = %f'
+                             % (self.domain.get_time(), influx[k]))
+
+        self.local_influx = num.sum(influx)
+
+        # Update mass inflows from fractional steps
+        self.domain.fractional_step_volume_integral += self.local_influx
+
+
+    def get_operators(self):
+
+        return self.operators
+
+
+    def parallel_safe(self):
+        """Operator is applied independently on each cell and
+        so is parallel safe.
+        """
+        return True
+
+
+    def statistics(self):
+
+        message = 'Combined rate operator of %g rate operators' % len(self.operators)
+        return message
+
+
+    def timestepping_statistics(self):
+
+        messages = [operator.timestepping_statistics() for operator in self.operators]
+        return '\n'.join(messages)
+
+
+    def log_timestepping_statistics(self):
+
+        for operator in self.operators:
+            operator.log_timestepping_statistics()
@@ -1584,6 +1584,71 @@ class Test_rate_operators(unittest.TestCase):
         # operator_25: Min rate = 10 m/s, Max rate = 10 m/s, Total Q = 160 m^3
 
 
+    def test_subtriangle_centroids(self):
+
+        from anuga.operators.xarray_rate_source import get_subtriangle_centroids
+
+        for L in [1, 2, 3, 4]:
+            bary = get_subtriangle_centroids(L)
+
+            assert bary.shape == (L*L, 3)
+            assert num.allclose(bary.sum(axis=1), 1.0)
+            assert num.all(bary > 0.0)
+            # centroid of the subtriangle centroids is the centroid
+            assert num.allclose(bary.mean(axis=0), 1.0/3)
+
+
+    @pytest.mark.skipif('xarray' not in sys.modules,
+                    reason="requires the xarray module")
+    def test_xarray_rate_source(self):
+
+        import xarray
+        from anuga.operators.xarray_rate_source import Xarray_rate_source
+
+        domain = rectangular_cross_domain(4, 4, len1=4.0, len2=4.0)
+
+        # 2x2 raster of 2m cells, slices every 5 minutes (not in time order)
+        eastings = num.array([1.0, 3.0, 1.0, 3.0])
+        northings = num.array([1.0, 1.0, 3.0, 3.0])
+        times = num.array(['2020-01-01T00:10', '2020-01-01T00:00', '2020-01-01T00:05'],
+                          dtype='datetime64[ns]')
+        values = num.array([[3.0, 3.0, 3.0, 3.0],
+                            [1.0, 2.0, 3.0, 4.0],
+                            [2.0, 2.0, 2.0, 2.0]])
+
+        xa = xarray.DataArray(values, dims=['time', 'points'],
+                              coords={'time': times,
+                                      'eastings': ('points', eastings),
+                                      'northings': ('points', northings)})
+
+        source = Xarray_rate_source(domain, xa, prefetch=True)
+
+        t0 = num.datetime64('2020-01-01T00:00', 's').astype('int64')
+
+        assert num.allclose(source.get_data_timestep(), 300.0)
+
+        assert source.get_rate(t0 - 1.0) is None
+        assert source.get_rate(t0 + 1200.0) is None
+
+        # Triangles do not straddle the raster cells
+        x = domain.centroid_coordinates[:, 0]
+        y = domain.centroid_coordinates[:, 1]
+        expected = num.where(x < 2.0, 1.0, 2.0) + num.where(y < 2.0, 0.0, 2.0)
+
+        assert num.allclose(source.get_rate(t0), expected)
+        assert num.allclose(source.get_rate(t0 + 299.0), expected)
+        assert source.executor is not None
+        assert num.allclose(source.get_rate(t0 + 300.0), 2.0)
+        assert num.allclose(source.get_rate(t0 + 900.0), 3.0)
+
+        # The prefetch thread is shut down once the last slice is read
+        assert source.executor is None
+
+        assert num.allclose(source.get_rate(t0 + 299.0), expected)
+        source.close()
+        assert source.executor is None
+
+
     def test_rate_operator_functions_empty_indices(self):
         from anuga.config import rho_a, rho_w, eta_w
         from math import pi, cos, sin
@@ -1769,6 +1834,190 @@ class Test_rate_operators(unittest.TestCase):
 
 
 
+    def test_combined_rate_operator(self):
+
+        a = [0.0, 0.0]
+        b = [0.0, 2.0]
+        c = [2.0, 0.0]
+        d = [0.0, 4.0]
+        e = [2.0, 2.0]
+        f = [4.0, 0.0]
+
+        points = [a, b, c, d, e, f]
+        #             bac,     bce,     ecf,     dbe
+        vertices = [[1,0,2], [1,2,4], [4,2,5], [3,1,4]]
+
+        domain = Domain(points, vertices)
+
+        #Flat surface with 1m of water
+        domain.set_quantity('elevation', 0.0)
+        domain.set_quantity('stage', 1.0)
+        domain.set_quantity('xmomentum', 1.0)
+        domain.set_quantity('friction', 0.0)
+
+        Br = Reflective_boundary(domain)
+        domain.set_boundary({'exterior': Br})
+
+        def main_spatial_rate(x,y,t):
+            # x and y should be an n by 1 array
+            return x + y
+
+        # Overlapping regions and a negative rate
+        operator1 = Rate_operator(domain, rate=1.0, factor=2.0, indices=[0,1])
+        operator2 = Rate_operator(domain, rate=main_spatial_rate, indices=[1,3])
+        operator3 = Rate_operator(domain, rate=-0.25, indices=[2])
+
+        operators = [operator1, operator2, operator3]
+        combined = Combined_rate_operator(domain, operators)
+
+        # The combined operator replaces the rate operators
+        for operator in operators:
+            assert operator not in domain.fractional_step_operators
+        assert combined in domain.fractional_step_operators
+
+        # Apply Operator
+        domain.timestep = 2.0
+        combined()
+
+        x = domain.centroid_coordinates[:,0]
+        y = domain.centroid_coordinates[:,1]
+        areas = domain.areas
+
+        stage_ex = num.array([ 1.0,  1.0,   1.0,  1.0])
+        stage_ex[[0,1]] += 2.0*2.0*1.0
+        stage_ex[[1,3]] += 2.0*main_spatial_rate(x[[1,3]], y[[1,3]], 0.0)
+        stage_ex[2] -= 2.0*0.25
+
+        # Momentum scaled with the water removed
+        xmom_ex = num.array([ 1.0,  1.0,   0.5,  1.0])
+
+        if verbose:
+            print(domain.quantities['stage'].centroid_values)
+            print(domain.quantities['xmomentum'].centroid_values)
+
+        assert num.allclose(domain.quantities['stage'].centroid_values, stage_ex)
+        assert num.allclose(domain.quantities['xmomentum'].centroid_values, xmom_ex)
+        assert num.allclose(domain.quantities['ymomentum'].centroid_values, 0.0)
+
+        Q1 = 2.0*2.0*1.0*areas[[0,1]].sum()
+        Q2 = 2.0*(main_spatial_rate(x, y, 0.0)*areas)[[1,3]].sum()
+        Q3 = -2.0*0.25*areas[2]
+
+        assert num.allclose(operator1.local_influx, Q1)
+        assert num.allclose(operator2.local_influx, Q2)
+        assert num.allclose(operator3.local_influx, Q3)
+        assert num.allclose(operator1.cumulative_influx, Q1)
+        assert num.allclose(domain.fractional_step_volume_integral, Q1 + Q2 + Q3)
+
+
+    def _compare_combined_rate_operator(self, create_operators):
+        """Apply the operators from create_operators one after the other
+        and through a Combined_rate_operator over several steps
+        """
+
+        domains = []
+        operator_lists = []
+        for i in range(2):
+            domain = rectangular_cross_domain(10, 10, len1=10.0, len2=10.0)
+            domain.set_quantity('elevation', 0.0)
+            domain.set_quantity('stage', 1.0)
+            domain.set_quantity('xmomentum', 1.0)
+            domain.set_quantity('ymomentum', 2.0)
+            # A ghost triangle does not count in the influx and statistics
+            domain.tri_full_flag[0] = 0
+            domain.timestep = 0.75
+
+            domains.append(domain)
+            operator_lists.append(create_operators(domain))
+
+        combined = Combined_rate_operator(domains[1], operator_lists[1])
+
+        for step in range(3):
+            for domain in domains:
+                domain.set_time(0.5*step)
+
+            for operator in operator_lists[0]:
+                operator()
+            combined()
+
+        for name in ['stage', 'xmomentum', 'ymomentum']:
+            assert num.allclose(domains[0].quantities[name].centroid_values,
+                                domains[1].quantities[name].centroid_values)
+
+        assert num.allclose(domains[0].fractional_step_volume_integral,
+                            domains[1].fractional_step_volume_integral)
+
+        for operator0, operator1 in zip(operator_lists[0], operator_lists[1]):
+            assert num.allclose(operator0.cumulative_influx, operator1.cumulative_influx)
+            assert num.allclose(operator0.local_influx, operator1.local_influx)
+            assert num.allclose(operator0.local_max, operator1.local_max)
+            assert num.allclose(operator0.local_min, operator1.local_min)
+
+        return combined
+
+
+    def test_combined_rate_operator_mixed_rates(self):
+
+        def create_operators(domain):
+
+            N = domain.number_of_triangles
+            rate = num.linspace(-2.0, 1.0, N)
+
+            operators = []
+            operators.append(Rate_operator(domain, rate=lambda t: 1.0 + t, factor=2.0,
+                                           polygon=[[0.0, 0.0], [5.0, 0.0], [5.0, 5.0], [0.0, 5.0]]))
+            operators.append(Circular_rate_operator(domain, rate=lambda x, y: x + y,
+                                                    center=[7.0, 5.0], radius=2.0))
+            operators.append(Rate_operator(domain, rate=0.5, indices=[]))
+            operators.append(Rate_operator(domain, rate=rate))
+            operators.append(Rate_operator(domain, rate=-1.0, indices=[0, 1, 2, 3]))
+
+            return operators
+
+        combined = self._compare_combined_rate_operator(create_operators)
+        assert combined.overlapping
+
+
+    def test_combined_rate_operator_positive_rates(self):
+
+        def create_operators(domain):
+
+            N = domain.number_of_triangles
+            rate = num.linspace(0.0, 1.0, N)
+
+            operators = []
+            operators.append(Rate_operator(domain, rate=lambda t: 1.0 + t, factor=2.0,
+                                           polygon=[[0.0, 0.0], [5.0, 0.0], [5.0, 5.0], [0.0, 5.0]]))
+            operators.append(Circular_rate_operator(domain, rate=lambda x, y: x + y,
+                                                    center=[3.0, 3.0], radius=2.0))
+            operators.append(Rate_operator(domain, rate=rate))
+
+            return operators
+
+        combined = self._compare_combined_rate_operator(create_operators)
+        assert combined.overlapping
+
+
+    def test_combined_rate_operator_separate_negative_rates(self):
+
+        def create_operators(domain):
+
+            N = domain.number_of_triangles
+            indices = num.arange(N)
+
+            operators = []
+            # Removes more water than available on some triangles
+            operators.append(Rate_operator(domain, rate=lambda x, y: -x, indices=indices[0:N:2]))
+            operators.append(Rate_operator(domain, rate=-0.5, factor=lambda t: 1.0 + t,
+                                           indices=indices[1:N//2:2]))
+            operators.append(Rate_operator(domain, rate=1.0, indices=indices[N//2+1:N:2]))
+
+            return operators
+
+        combined = self._compare_combined_rate_operator(create_operators)
+        assert not combined.overlapping
+
+
 if __name__ == "__main__":
     suite = unittest.TestLoader().loadTestsFromTestCase(Test_rate_operators)
     runner = unittest.TextTestRunner(verbosity=1)
@@ -0,0 +1,200 @@
+"""
+Rainfall rates from an xarray DataArray (e.g. radar rainfall)
+
+The DataArray has a time dimension and a points dimension, with the
+coordinates of the points (raster cell centres) given by the
+coordinates 'eastings' and 'northings'. It can be opened lazily from a
+chunked NetCDF or Zarr archive (xarray.open_dataarray(..., chunks={})),
+only the slices needed are read.
+"""
+
+import numpy as num
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Xarray_rate_source(object):
+    """
+    Provide the rate on the triangles of a domain at time t from an
+    xarray DataArray.
+
+    The time slice is found by a binary search in the sorted slice times
+    (forward fill, within tolerance seconds of the slice time). Each
+    triangle is split into subdivisions**2 subtriangles of equal area,
+    each assigned to the raster cell containing its centroid, so the rate
+    on a triangle is the area weighted average of the cells it overlaps.
+    The remap is stored as a sparse matrix.
+
+    With prefetch = True the next slice is read in a background thread
+    while the current slice is used. The thread is shut down when the
+    last slice has been read, or by close.
+    """
+
+    def __init__(self,
+                 domain,
+                 xa,
+                 subdivisions=2,
+                 tolerance=300.0,
+                 prefetch=True,
+                 verbose=False):
+
+        self.domain = domain
+        self.xa = xa
+        self.tolerance = tolerance
+        self.verbose = verbose
+
+        # Slice times as utc nanoseconds since the epoch
+        times = num.asarray(xa['time'].values).astype('datetime64[ns]').astype('int64')
+        self.slice_order = num.argsort(times, kind='stable')
+        self.times = times[self.slice_order]
+
+        self.setup_remap(subdivisions)
+
+        self.current_slice = None
+        self.current_rate = None
+
+        self.prefetch = prefetch
+        self.executor = None
+        self.prefetched = {}
+
+
+    def __del__(self):
+
+        self.close()
+
+
+    def close(self):
+        """Shut down the prefetch thread (it is started again if another
+        slice is read)
+        """
+
+        executor = getattr(self, 'executor', None)
+        if executor is not None:
+            for future in self.prefetched.values():
+                future.cancel()
+            executor.shutdown(wait=False)
+            self.executor = None
+        self.prefetched = {}
+
+
+    def setup_remap(self, subdivisions):
+        """Sparse matrix mapping the raster cells to the triangles
+        """
+
+        from scipy.spatial import KDTree
+        from scipy.sparse import coo_matrix
+
+        domain = self.domain
+
+        # these are absolute coords
+        xy = num.array([num.asarray(self.xa['eastings']).reshape(-1),
+                        num.asarray(self.xa['northings']).reshape(-1)]).T
+
+        N = domain.number_of_triangles
+        vertices = domain.get_vertex_coordinates(absolute=True).reshape((N, 3, 2))
+
+        bary = get_subtriangle_centroids(subdivisions)
+        samples = num.einsum('sk,nkd->nsd', bary, vertices)
+
+        tree = KDTree(xy)
+        if self.verbose:
+            print(tree.size, xy.shape)
+
+        dd, cells = tree.query(samples.reshape((-1, 2)))
+
+        rows = num.repeat(num.arange(N), len(bary))
+        weights = num.full(len(rows), 1.0/len(bary))
+
+        self.remap = coo_matrix((weights, (rows, cells)), shape=(N, len(xy))).tocsr()
+
+
+    def get_data_timestep(self):
+        """Time between the first two slices, None if only one slice
+        """
+
+        if len(self.times) < 2:
+            return None
+
+        return (self.times[1] - self.times[0])/1.0e9
+
+
+    def get_slice_index(self, t):
+        """Index of the slice (in time order) in use at time t (seconds
+        since the epoch, utc), None if there is no such slice
+        """
+
+        t_ns = int(round(t*1.0e9))
+
+        k = num.searchsorted(self.times, t_ns, side='right') - 1
+
+        if k < 0 or (t_ns - self.times[k]) > self.tolerance*1.0e9:
+            return None
+
+        return k
+
+
+    def read_slice(self, k):
+        """Read slice k and remap to the triangles
+        """
+
+        values = self.xa.isel(time=int(self.slice_order[k])).values
+        values = num.asarray(values, dtype=float).reshape(-1)
+
+        return self.remap.dot(values)
+
+
+    def get_slice(self, k):
+
+        future = self.prefetched.pop(k, None)
+        if future is not None:
+            rate = future.result()
+        else:
+            rate = self.read_slice(k)
+
+        # Drop stale prefetches and read the next slice in the background
+        self.prefetched.clear()
+        if k + 1 == len(self.times):
+            # No more slices to read
+            self.close()
+        elif self.prefetch:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=1)
+            self.prefetched[k+1] = self.executor.submit(self.read_slice, k+1)
+
+        return rate
+
+
+    def get_rate(self, t):
+        """Rate on all triangles at time t (seconds since the epoch, utc),
+        None if t is not covered by the data
+        """
+
+        k = self.get_slice_index(t)
+
+        if k is None:
+            return None
+
+        if k != self.current_slice:
+            self.current_rate = self.get_slice(k)
+            self.current_slice = k
+
+            if self.verbose:
+                print(f"Time {t} using slice {num.datetime64(int(self.times[k]), 'ns')}")
+
+        return self.current_rate
+
+
+def get_subtriangle_centroids(subdivisions):
+    """Barycentric coordinates of the centroids of the subdivisions**2
+    subtriangles of equal area of a triangle
+    """
+
+    L = subdivisions
+    centroids = []
+    for i in range(L):
+        for j in range(L - i):
+            k = L - 1 - i - j
+            centroids.append([i + 1.0/3, j + 1.0/3, k + 1.0/3])
+            if k > 0:
+                centroids.append([i + 2.0/3, j + 2.0/3, k - 1.0/3])
+
+    return num.array(centroids)/L
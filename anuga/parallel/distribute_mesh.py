@@ -45,6 +45,12 @@ except:
 
 from pymetis import part_graph
 
+try:
+    from pymetis import CSRAdjacency
+except ImportError:
+    # Older pymetis only take xadj and adjncy
+    CSRAdjacency = None
+
 try:
     from pymetis import part_mesh
     metis_version = "5_part_mesh"
@@ -120,6 +126,152 @@ def reorder_new(quantities, epart_order, proc_sum):
     return q_reord
 
 
+#########################################################
+#
+# Weights used to balance the partition
+#
+#  *) parameters['partition_weights'] gives the cost of
+# each triangle. It can be an array (one value per
+# triangle), the name of a quantity (its centroid values
+# are used, eg 'max_speed' stored from a prior run), or
+# 'wet_dry', in which case dry triangles (initial depth
+# below parameters['partition_minimum_height']) have
+# weight parameters['partition_dry_weight'] and wet
+# triangles weight 1.
+#
+#  *) parameters['partition_edge_weights'] gives the
+# communication cost of each edge of each triangle, an
+# (number of triangles, 3) array ordered as
+# domain.neighbours.
+#
+# -------------------------------------------------------
+#
+#  *) The triangle weights and edge weights are returned
+# (None if not specified).
+#
+#########################################################
+
+def get_partition_weights(domain, parameters=None):
+
+    if parameters is None:
+        parameters = {}
+
+    weights = parameters.get('partition_weights', None)
+    edge_weights = parameters.get('partition_edge_weights', None)
+
+    n_tri = len(domain.triangles)
+
+    if weights is not None:
+        if isinstance(weights, str):
+            if weights == 'wet_dry':
+                minimum_height = parameters.get('partition_minimum_height',
+                                                domain.minimum_allowed_height)
+                dry_weight = parameters.get('partition_dry_weight', 0.2)
+                depth = domain.quantities['stage'].centroid_values - \
+                        domain.quantities['elevation'].centroid_values
+                weights = num.where(depth > minimum_height, 1.0, dry_weight)
+            else:
+                weights = domain.quantities[weights].centroid_values
+
+        weights = num.array(weights, float).reshape(-1)
+
+        msg = 'partition_weights must have one value per triangle'
+        assert weights.shape == (n_tri,), msg
+
+        msg = 'partition_weights must be non negative'
+        assert num.all(weights >= 0.0), msg
+
+    if edge_weights is not None:
+        edge_weights = num.array(edge_weights, float)
+
+        msg = 'partition_edge_weights must have shape (number of triangles, 3)'
+        assert edge_weights.shape == (n_tri, 3), msg
+
+    return weights, edge_weights
+
+
+def _integer_weights(weights, resolution=1000):
+    """Scale non negative weights to positive integers as required by metis
+    """
+
+    wmax = num.max(weights)
+    if wmax <= 0.0:
+        return num.ones(len(weights), num.int64)
+
+    return num.maximum(1, num.rint(weights*(resolution/wmax))).astype(num.int64)
+
+
+def _weighted_dual_graph(domain, edge_weights=None):
+    """Return the dual graph (xadj, adjncy, eweights) of the mesh
+    in compressed format, with symmetric integer edge weights
+    """
+
+    neighbours = domain.neighbours
+    n_tri = len(neighbours)
+
+    mask = neighbours >= 0
+    rows = num.repeat(num.arange(n_tri), 3).reshape(n_tri, 3)[mask]
+    adjncy = neighbours[mask].astype(num.int64)
+
+    xadj = num.zeros(n_tri+1, num.int64)
+    xadj[1:] = num.cumsum(mask.sum(axis=1))
+
+    if edge_weights is None:
+        return xadj, adjncy, None
+
+    # Make the weights symmetric, using the larger of the two
+    # values given for each internal edge
+    w = edge_weights[mask]
+    keys = num.minimum(rows, adjncy)*n_tri + num.maximum(rows, adjncy)
+    unique_keys, inverse = num.unique(keys, return_inverse=True)
+    wsym = num.zeros(len(unique_keys), float)
+    num.maximum.at(wsym, inverse, w)
+
+    eweights = _integer_weights(wsym[inverse])
+
+    return xadj, adjncy, eweights
+
+#########################################################
+#
+# Measure the balance of a partition
+#
+#  *) weights are the weights of the triangles in the
+# original ordering (None counts triangles) and
+# epart_order the map from the partitioned ordering to
+# the original ordering (as returned by
+# pmesh_divide_metis_with_map)
+#
+# -------------------------------------------------------
+#
+#  *) The load (total weight) of each processor and the
+# imbalance, max load / mean load, are returned.
+#
+#########################################################
+
+def get_partition_imbalance(triangles_per_proc, weights=None, epart_order=None):
+
+    triangles_per_proc = num.asarray(triangles_per_proc)
+
+    if weights is None:
+        loads = triangles_per_proc.astype(float)
+    else:
+        weights = num.asarray(weights, float)
+        if len(epart_order) > 0:
+            weights = weights[epart_order]
+        proc_sum = num.zeros(len(triangles_per_proc)+1, int)
+        proc_sum[1:] = num.cumsum(triangles_per_proc)
+        loads = num.add.reduceat(weights, proc_sum[:-1]) if len(weights) > 0 \
+                else num.zeros(len(triangles_per_proc))
+
+    mean_load = num.mean(loads)
+    if mean_load > 0.0:
+        imbalance = num.max(loads)/mean_load
+    else:
+        imbalance = 1.0
+
+    return loads, imbalance
+
+
 #########################################################
 #
 # Divide the mesh using a call to metis, through pymetis.
@@ -136,20 +288,20 @@ def reorder_new(quantities, epart_order, proc_sum):
 #########################################################
 
 
-def pmesh_divide_metis(domain, n_procs):
+def pmesh_divide_metis(domain, n_procs, weights=None, edge_weights=None):
     # Wrapper for old pmesh_divide_metis which does not return tri_index or r_tri_index
     nodes, ttriangles, boundary, triangles_per_proc, quantities, tri_index, r_tri_index = pmesh_divide_metis_helper(
-        domain, n_procs)
+        domain, n_procs, weights, edge_weights)
 
     return nodes, ttriangles, boundary, triangles_per_proc, quantities
 
 
-def pmesh_divide_metis_with_map(domain, n_procs):
+def pmesh_divide_metis_with_map(domain, n_procs, weights=None, edge_weights=None):
 
-    return pmesh_divide_metis_helper(domain, n_procs)
+    return pmesh_divide_metis_helper(domain, n_procs, weights, edge_weights)
 
 
-def pmesh_divide_metis_helper(domain, n_procs):
+def pmesh_divide_metis_helper(domain, n_procs, weights=None, edge_weights=None):
 
     # Initialise the lists
     # List, indexed by processor of # triangles.
@@ -169,7 +321,23 @@ def pmesh_divide_metis_helper(domain, n_procs):
     n_tri = len(domain.triangles)
     if n_procs != 1:  # Because metis chokes on it...
 
-        if metis_version == 4:
+        if weights is not None or edge_weights is not None:
+            # Weighted partition of the dual graph of the mesh
+            xadj, adjncy, eweights = _weighted_dual_graph(domain, edge_weights)
+
+            if weights is not None:
+                vweights = _integer_weights(weights)
+            else:
+                vweights = None
+
+            if CSRAdjacency is not None:
+                cutcount, epart = part_graph(n_procs, CSRAdjacency(xadj, adjncy),
+                                             vweights=vweights, eweights=eweights)
+            else:
+                cutcount, epart = part_graph(n_procs, xadj=xadj, adjncy=adjncy,
+                                             vweights=vweights, eweights=eweights)
+
+        elif metis_version == 4:
             n_vert = domain.get_number_of_nodes()
             t_list2 = domain.triangles.copy()
             t_list = num.reshape(t_list2, (-1,))
@@ -181,13 +349,12 @@ def pmesh_divide_metis_helper(domain, n_procs):
             del edgecut
             del npart
 
-
-        if metis_version == "5_part_mesh":
+        elif metis_version == "5_part_mesh":
 
             objval, epart, npart = part_mesh(n_procs, domain.triangles)
 
 
-        if metis_version == "5_part_graph":
+        elif metis_version == "5_part_graph":
             # build adjacency list
             # neighbours uses negative integer-indices to denote boudary edges.
             # pymetis totally cant handle that, so we have to delete these.
@@ -985,6 +1152,39 @@ def submesh_quantities(submesh, quantities, triangles_per_proc):
 
     return submesh
 
+#########################################################
+#
+# Set the width of the ghost layer
+#
+#  *) If parameters['deep_halo'] is True, the ghost layer
+# is made deep enough to compute all the stages of a
+# timestep of the domain without updating the ghost
+# triangles between the stages (see
+# Generic_Domain.get_deep_ghost_layer_width)
+#
+# -------------------------------------------------------
+#
+#  *) A copy of parameters with 'ghost_layer_width'
+# set is returned.
+#
+#########################################################
+
+def get_ghost_layer_parameters(domain, parameters=None):
+
+    if parameters is None:
+        parameters = {}
+    else:
+        parameters = dict(parameters)
+
+    layer_width = parameters.get('ghost_layer_width', 2)
+
+    if parameters.get('deep_halo', False):
+        layer_width = max(layer_width, domain.get_deep_ghost_layer_width())
+
+    parameters['ghost_layer_width'] = layer_width
+
+    return parameters
+
 #########################################################
 #
 # Build the grid partition on the host.
@@ -1661,3 +1861,260 @@ def extract_l2g_map(map):
     l2g[l_ids] = g_ids
 
     return l2g
+
+
+#########################################################
+#
+# Send the local meshes as raw numpy buffers instead of
+# pickled tuples.
+#
+# *) pack_submesh packs the local mesh of one processor
+# (as returned by Sequential_distribute.extract_submesh)
+# into an integer and a float buffer, unpack_submesh
+# reverses this.
+#
+# *) The information which is the same on all processors
+# (boundary map, domain attributes, tags and quantity
+# names) is broadcast once.
+#
+# *) scatter_submeshes sends the buffers with Scatterv,
+# in batches of processors so that processor 0 only
+# holds the buffers of one batch at a time.
+#
+# *) distribute_partition_file writes the buffers of all
+# processors to one file which each processor reads via
+# a memory map.
+#
+#########################################################
+
+# Number of integers at the start of each packed submesh
+SUBMESH_HEADER_SIZE = 8
+
+
+def get_submesh_common(partition):
+    """Information needed to unpack the local meshes which is the
+    same on all processors. Should only be run on processor 0.
+    """
+
+    submesh = partition.extract_submesh(0)
+    kwargs, quantities = submesh[0], submesh[4]
+
+    common_kwargs = {}
+    for key in ['geo_reference', 'number_of_global_triangles',
+                'number_of_global_nodes', 'numproc']:
+        common_kwargs[key] = kwargs[key]
+
+    tags = sorted(set(partition.domain.get_boundary_tags()) | set(['ghost']))
+    quantity_names = sorted(quantities.keys())
+
+    # boundary_map, domain name, directory etc
+    attributes = submesh[5:]
+
+    return tags, quantity_names, common_kwargs, attributes
+
+
+def pack_submesh(submesh, tags, quantity_names):
+    """Pack the local mesh of one processor into an integer and
+    a float buffer
+    """
+
+    kwargs, points, vertices, boundary, quantities = submesh[:5]
+
+    tag_ids = {}
+    for i, tag in enumerate(tags):
+        tag_ids[tag] = i
+
+    ghost_recv_dict = kwargs['ghost_recv_dict']
+    full_send_dict = kwargs['full_send_dict']
+
+    bnd = num.zeros((len(boundary), 3), num.int64)
+    for i, ((vol_id, edge_id), tag) in enumerate(boundary.items()):
+        bnd[i] = vol_id, edge_id, tag_ids[tag]
+
+    header = [len(points), len(vertices), len(boundary),
+              kwargs['number_of_full_nodes'], kwargs['number_of_full_triangles'],
+              kwargs['ghost_layer_width'], len(ghost_recv_dict), len(full_send_dict)]
+
+    ints = [header, vertices, bnd.T, kwargs['tri_l2g'], kwargs['node_l2g']]
+
+    for commun in [ghost_recv_dict, full_send_dict]:
+        for proc in sorted(commun):
+            local_ids, global_ids = commun[proc][0], commun[proc][1]
+            ints.append([proc, len(local_ids)])
+            ints.append(local_ids)
+            ints.append(global_ids)
+
+    floats = [points]
+    for name in quantity_names:
+        floats.append(quantities[name])
+
+    ibuf = num.concatenate([num.asarray(x, num.int64).ravel() for x in ints])
+    fbuf = num.concatenate([num.asarray(x, float).ravel() for x in floats])
+
+    return ibuf, fbuf
+
+
+def unpack_submesh(ibuf, fbuf, common, p):
+    """Unpack the local mesh of processor p, returns the same tuple as
+    Sequential_distribute.extract_submesh
+    """
+
+    tags, quantity_names, common_kwargs, attributes = common
+
+    pos = [0]
+    def take(n):
+        x = ibuf[pos[0]:pos[0]+n]
+        pos[0] += n
+        return num.array(x, int)
+
+    number_of_nodes, number_of_triangles, number_of_boundary, \
+        number_of_full_nodes, number_of_full_triangles, ghost_layer_width, \
+        number_of_ghost_recv, number_of_full_send = take(SUBMESH_HEADER_SIZE)
+
+    vertices = take(3*number_of_triangles).reshape((number_of_triangles, 3))
+    bnd = take(3*number_of_boundary).reshape((3, number_of_boundary))
+    boundary = {}
+    for vol_id, edge_id, tag_id in bnd.T:
+        boundary[(int(vol_id), int(edge_id))] = tags[tag_id]
+
+    tri_l2g = take(number_of_triangles)
+    node_l2g = take(number_of_nodes)
+
+    communs = []
+    for number_of_procs in [number_of_ghost_recv, number_of_full_send]:
+        commun = {}
+        for i in range(number_of_procs):
+            proc, n = take(2)
+            local_ids = take(n)
+            global_ids = take(n)
+            commun[int(proc)] = [local_ids, global_ids]
+        communs.append(commun)
+    ghost_recv_dict, full_send_dict = communs
+
+    points = num.array(fbuf[:2*number_of_nodes], float).reshape((number_of_nodes, 2))
+    quantities = {}
+    offset = 2*number_of_nodes
+    for name in quantity_names:
+        quantities[name] = num.array(fbuf[offset:offset+3*number_of_triangles],
+                                     float).reshape((number_of_triangles, 3))
+        offset += 3*number_of_triangles
+
+    kwargs = {'full_send_dict': full_send_dict,
+              'ghost_recv_dict': ghost_recv_dict,
+              'number_of_full_nodes': int(number_of_full_nodes),
+              'number_of_full_triangles': int(number_of_full_triangles),
+              'processor': p,
+              's2p_map': None,
+              'p2s_map': None,
+              'tri_l2g': tri_l2g,
+              'node_l2g': node_l2g,
+              'ghost_layer_width': int(ghost_layer_width)}
+    kwargs.update(common_kwargs)
+
+    return (kwargs, points, vertices, boundary, quantities) + tuple(attributes)
+
+
+def scatter_submeshes(partition=None, batch_size=64, verbose=False):
+    """Send each processor its local mesh using Scatterv. partition
+    (a distributed Sequential_distribute) is only needed on processor 0.
+    Must be called on all processors, returns the same tuple as
+    Sequential_distribute.extract_submesh
+    """
+
+    from anuga.utilities import parallel_abstraction as pypar
+
+    comm = pypar.comm
+    myid = comm.rank
+    numprocs = comm.size
+
+    if myid == 0:
+        common = get_submesh_common(partition)
+    else:
+        common = None
+    common = comm.bcast(common, root=0)
+
+    local = None
+    for start in range(0, numprocs, batch_size):
+        procs = list(range(start, min(start+batch_size, numprocs)))
+
+        # Pack the local meshes of this batch of processors
+        if myid == 0:
+            if verbose: print('scatter_submeshes: Sending submeshes to P%d-P%d' % (procs[0], procs[-1]))
+
+            sizes = num.zeros((numprocs, 2), num.int64)
+            ibufs = []
+            fbufs = []
+            for p in procs:
+                ibuf, fbuf = pack_submesh(partition.extract_submesh(p), common[0], common[1])
+                sizes[p] = len(ibuf), len(fbuf)
+                ibufs.append(ibuf)
+                fbufs.append(fbuf)
+            isend = [num.concatenate(ibufs), sizes[:, 0].tolist()]
+            fsend = [num.concatenate(fbufs), sizes[:, 1].tolist()]
+        else:
+            sizes = None
+            isend = None
+            fsend = None
+
+        size = num.zeros(2, num.int64)
+        comm.Scatter(sizes, size, root=0)
+
+        ibuf = num.empty(size[0], num.int64)
+        fbuf = num.empty(size[1], float)
+        comm.Scatterv(isend, ibuf, root=0)
+        comm.Scatterv(fsend, fbuf, root=0)
+
+        if myid in procs:
+            local = (ibuf, fbuf)
+
+    return unpack_submesh(local[0], local[1], common, myid)
+
+
+def distribute_partition_file(partition=None, filename=None, verbose=False):
+    """Processor 0 writes the local meshes of all processors to one binary
+    file, which each processor then reads via a memory map (so filename must
+    be on a file system shared by all processors). The file is removed
+    once it has been read. Must be called on all processors, returns the same
+    tuple as Sequential_distribute.extract_submesh
+    """
+
+    import os
+    from anuga.utilities import parallel_abstraction as pypar
+
+    comm = pypar.comm
+    myid = comm.rank
+    numprocs = comm.size
+
+    if myid == 0:
+        common = get_submesh_common(partition)
+
+        if verbose: print('distribute_partition_file: Writing %s' % filename)
+
+        # Byte offset and length of the integer and float buffers of each processor
+        offsets = num.zeros((numprocs, 4), num.int64)
+        offset = 0
+        with open(filename, 'wb') as fid:
+            for p in range(numprocs):
+                ibuf, fbuf = pack_submesh(partition.extract_submesh(p), common[0], common[1])
+                offsets[p] = offset, len(ibuf), offset + ibuf.nbytes, len(fbuf)
+                fid.write(ibuf.tobytes())
+                fid.write(fbuf.tobytes())
+                offset += ibuf.nbytes + fbuf.nbytes
+    else:
+        common = None
+        offsets = None
+
+    common, offsets, filename = comm.bcast((common, offsets, filename), root=0)
+
+    ioffset, isize, foffset, fsize = offsets[myid]
+    ibuf = num.memmap(filename, dtype=num.int64, mode='r', offset=ioffset, shape=(isize,))
+    fbuf = num.memmap(filename, dtype=float, mode='r', offset=foffset, shape=(fsize,))
+
+    submesh = unpack_submesh(ibuf, fbuf, common, myid)
+    del ibuf, fbuf
+
+    comm.barrier()
+    if myid == 0:
+        os.remove(filename)
+
+    return submesh
@@ -25,6 +25,11 @@ if pypar_available:
     # Mesh partitioning using Metis
     from anuga.parallel.distribute_mesh import build_submesh
     from anuga.parallel.distribute_mesh import pmesh_divide_metis_with_map
+    from anuga.parallel.distribute_mesh import get_ghost_layer_parameters
+    from anuga.parallel.distribute_mesh import get_partition_weights
+    from anuga.parallel.distribute_mesh import get_partition_imbalance
+    from anuga.parallel.distribute_mesh import scatter_submeshes
+    from anuga.parallel.distribute_mesh import distribute_partition_file
 
     from anuga.parallel.parallel_shallow_water import Parallel_domain
 
@@ -72,23 +77,58 @@ def distribute(domain, verbose=False, debug=False, parameters = None):
     """ Distribute the domain to all processes
 
     parameters allows user to change size of ghost layer
+    ('ghost_layer_width'), or to use a ghost layer deep enough to
+    avoid updating the ghost cells between the stages of a
+    timestep ('deep_halo': True)
+
+    The partition can be balanced by the cost of each triangle
+    ('partition_weights': an array, a quantity name or 'wet_dry')
+    and of each edge ('partition_edge_weights'), see
+    distribute_mesh.get_partition_weights
+
+    The local meshes are sent from processor 0 as pickled objects
+    ('distribute_method': 'pickle', the default), as numpy buffers
+    using Scatterv in batches of 'distribute_batch_size' processors
+    ('distribute_method': 'scatter') or via a file ('partition_file',
+    default <name>_partition.bin in the data directory) on a shared
+    file system which each processor reads using a memory map
+    ('distribute_method': 'file')
     """
 
     if not pypar_available or numprocs == 1 : return domain # Bypass
 
+    if parameters is None:
+        parameters = {}
+
+    method = parameters.get('distribute_method', 'pickle')
+    methods = ['pickle', 'scatter', 'file']
+    if method not in methods:
+        msg = 'distribute_method must be one of %s' % methods
+        raise ValueError(msg)
 
     if myid == 0:
         from .sequential_distribute import Sequential_distribute
         partition = Sequential_distribute(domain, verbose, debug, parameters)
 
         partition.distribute(numprocs)
+    else:
+        partition = None
+
+    if method == 'scatter':
+        batch_size = parameters.get('distribute_batch_size', 64)
+        submesh = scatter_submeshes(partition, batch_size, verbose=verbose)
+
+    elif method == 'file':
+        if myid == 0:
+            from os.path import join
+            default_filename = join(domain.get_datadir(), domain.get_name() + '_partition.bin')
+            filename = parameters.get('partition_file', default_filename)
+        else:
+            filename = None
+        submesh = distribute_partition_file(partition, filename, verbose=verbose)
 
-        kwargs, points, vertices, boundary, quantities, boundary_map, \
-                domain_name, domain_dir, domain_store, domain_store_centroids, \
-                domain_minimum_storable_height, domain_minimum_allowed_height, \
-                domain_flow_algorithm, domain_georef, \
-                domain_quantities_to_be_stored, domain_smooth, domain_low_froude \
-                 = partition.extract_submesh(0)
+    elif myid == 0:
+        submesh = partition.extract_submesh(0)
 
         for p in range(1, numprocs):
 
@@ -97,13 +137,14 @@ def distribute(domain, verbose=False, debug=False, parameters = None):
             send(tostore,p)
 
     else:
+        submesh = receive(0)
 
-        kwargs, points, vertices, boundary, quantities, boundary_map, \
-            domain_name, domain_dir, domain_store, domain_store_centroids, \
-            domain_minimum_storable_height, domain_minimum_allowed_height, \
-            domain_flow_algorithm, domain_georef, \
-            domain_quantities_to_be_stored, domain_smooth, domain_low_froude\
-             = receive(0)
+    kwargs, points, vertices, boundary, quantities, boundary_map, \
+        domain_name, domain_dir, domain_store, domain_store_centroids, \
+        domain_minimum_storable_height, domain_minimum_allowed_height, \
+        domain_flow_algorithm, domain_georef, \
+        domain_quantities_to_be_stored, domain_smooth, domain_low_froude \
+         = submesh
 
     #---------------------------------------------------------------------------
     # Now Create parallel domain
@@ -398,9 +439,16 @@ def distribute_mesh(domain, verbose=False, debug=False, parameters=None):
 
     # Subdivide the mesh
     if verbose: print('Subdivide mesh')
+    weights, edge_weights = get_partition_weights(domain, parameters)
+
     new_nodes, new_triangles, new_boundary, triangles_per_proc, quantities, \
            s2p_map, p2s_map = \
-           pmesh_divide_metis_with_map(domain, numprocs)
+           pmesh_divide_metis_with_map(domain, numprocs, weights, edge_weights)
+
+    if verbose:
+        loads, imbalance = get_partition_imbalance(triangles_per_proc, weights, p2s_map)
+        print('Partition loads', loads)
+        print('Partition imbalance %g' % imbalance)
 
     #PETE: s2p_map (maps serial domain triangles to parallel domain triangles)
     #      sp2_map (maps parallel domain triangles to domain triangles)
@@ -410,6 +458,7 @@ def distribute_mesh(domain, verbose=False, debug=False, parameters=None):
     # Build the mesh that should be assigned to each processor,
     # this includes ghost nodes and the communication pattern
     if verbose: print('Build submeshes')
+    parameters = get_ghost_layer_parameters(domain, parameters)
     submesh = build_submesh(new_nodes, new_triangles, new_boundary, quantities, triangles_per_proc, parameters)
 
     if verbose:
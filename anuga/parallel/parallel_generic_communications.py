@@ -31,6 +31,83 @@ def setup_buffers(domain):
     domain.calls_to_update_ghosts = 0
     domain.calls_to_update_timestep = 0
 
+    # Requests of a ghost exchange in progress (see start_ghost_exchange)
+    domain.ghost_exchange_requests = None
+
+    # Timestep reduction (see communicate_flux_timestep_non_blocking
+    # and communicate_flux_timestep_lagged)
+    domain.timestep_reduction = 'blocking'
+    domain.timestep_reduction_interval = 1
+    domain.timestep_safety_factor = 1.0
+
+    domain.flux_timestep_request = None
+    domain.flux_call_count = 0
+
+    domain.lagged_flux_timestep = None
+    domain.lagged_steps_remaining = 0
+    domain.timestep_check_request = None
+    domain.timestep_check_time = None
+    domain.local_timestep_violation = num.zeros(1, float)
+    domain.global_timestep_violation = num.zeros(1, float)
+
+    domain.number_of_timestep_reductions = 0
+    domain.number_of_timestep_rollbacks = 0
+
+    setup_ghost_buffers(domain)
+
+
+def setup_ghost_buffers(domain):
+    """Combine the index arrays of full_send_dict and ghost_recv_dict into
+    contiguous int64 arrays with a single buffer each, so that all the
+    ghost data is packed and unpacked in one pass by pack_ghost_buffers
+    and unpack_ghost_buffers. The rows for each processor are given by
+    ghost_send_slices and ghost_recv_slices.
+    """
+
+    domain.ghost_send_ids, domain.ghost_send_buffer, domain.ghost_send_slices = \
+        _combine_ghost_buffers(domain.full_send_dict, domain.nsys)
+
+    domain.ghost_recv_ids, domain.ghost_recv_buffer, domain.ghost_recv_slices = \
+        _combine_ghost_buffers(domain.ghost_recv_dict, domain.nsys)
+
+
+def _combine_ghost_buffers(buffer_dict, nsys):
+
+    n = sum(len(buffer_dict[proc][0]) for proc in buffer_dict)
+
+    ids = num.zeros(n, num.int64)
+    buffer = num.zeros((n, nsys), float)
+    slices = {}
+
+    offset = 0
+    for proc in buffer_dict:
+        m = len(buffer_dict[proc][0])
+        ids[offset:offset+m] = buffer_dict[proc][0]
+        slices[proc] = slice(offset, offset+m)
+        offset += m
+
+    return ids, buffer, slices
+
+
+def pack_ghost_buffers(domain, quantities):
+    """Copy the full cell centroid values of quantities into the send buffers
+    """
+
+    from anuga.shallow_water.sw_domain_openmp_ext import pack_ghost_buffer
+
+    Q_cvs = [domain.quantities[q].centroid_values for q in quantities]
+    pack_ghost_buffer(Q_cvs, domain.ghost_send_ids, domain.ghost_send_buffer)
+
+
+def unpack_ghost_buffers(domain, quantities):
+    """Copy the receive buffers into the ghost cell centroid values of quantities
+    """
+
+    from anuga.shallow_water.sw_domain_openmp_ext import unpack_ghost_buffer
+
+    Q_cvs = [domain.quantities[q].centroid_values for q in quantities]
+    unpack_ghost_buffer(Q_cvs, domain.ghost_recv_ids, domain.ghost_recv_buffer)
+
 
 def communicate_flux_timestep(domain, yieldstep, finaltime):
     """Calculate local timestep
@@ -86,6 +163,137 @@ def communicate_flux_timestep(domain, yieldstep, finaltime):
 
     #old_flux_timestep = domain.flux_timestep
     domain.flux_timestep = domain.global_timestep[0]
+
+    domain.number_of_timestep_reductions += 1
+
+
+def start_flux_timestep_reduction(domain):
+    """Post a non-blocking allreduce of the local flux timestep, which is
+    completed by communicate_flux_timestep_non_blocking. Called straight
+    after the first compute_fluxes of a timestep, so the reduction is
+    overlapped with the computation of the forcing terms.
+    """
+
+    import time
+    from mpi4py import MPI
+
+    # No allreduce needed if fixed_flux_timestep is set
+    if domain.fixed_flux_timestep is not None and not domain.test_allreduce:
+        return
+
+    t0 = time.time()
+
+    domain.local_timestep[0] = domain.flux_timestep
+    domain.flux_timestep_request = pypar.comm.Iallreduce(domain.local_timestep,
+                                                         domain.global_timestep,
+                                                         op=MPI.MIN)
+
+    domain.communication_reduce_time += time.time()-t0
+
+
+def communicate_flux_timestep_non_blocking(domain, yieldstep, finaltime):
+    """Complete the allreduce posted by start_flux_timestep_reduction
+    """
+
+    import time
+
+    if domain.flux_timestep_request is None:
+        communicate_flux_timestep(domain, yieldstep, finaltime)
+        return
+
+    import anuga
+    if anuga.myid == 0:
+        domain.calls_to_update_timestep += 1
+
+    t0 = time.time()
+
+    domain.flux_timestep_request.Wait()
+    domain.flux_timestep_request = None
+
+    domain.communication_reduce_time += time.time()-t0
+
+    if domain.fixed_flux_timestep is not None:
+        domain.flux_timestep = domain.fixed_flux_timestep
+    else:
+        domain.flux_timestep = domain.global_timestep[0]
+
+    domain.number_of_timestep_reductions += 1
+
+
+def communicate_flux_timestep_lagged(domain, yieldstep, finaltime):
+    """Only calculate the global timestep every timestep_reduction_interval
+    steps. In between, the global timestep scaled by timestep_safety_factor
+    is used, and each processor flags whether this violates its local CFL
+    condition. The flags are combined with a non-blocking allreduce, which
+    is completed by finish_flux_timestep_check once the step has been taken.
+    """
+
+    import time
+    from mpi4py import MPI
+
+    if domain.fixed_flux_timestep is not None or domain.lagged_steps_remaining <= 0:
+        communicate_flux_timestep(domain, yieldstep, finaltime)
+
+        domain.lagged_flux_timestep = domain.timestep_safety_factor*domain.flux_timestep
+        domain.lagged_steps_remaining = domain.timestep_reduction_interval - 1
+        return
+
+    import anuga
+    if anuga.myid == 0:
+        domain.calls_to_update_timestep += 1
+
+    domain.lagged_steps_remaining -= 1
+
+    t0 = time.time()
+
+    violation = domain.flux_timestep < domain.lagged_flux_timestep
+    domain.local_timestep_violation[0] = float(violation)
+    domain.timestep_check_time = domain.get_relative_time()
+    domain.timestep_check_request = pypar.comm.Iallreduce(domain.local_timestep_violation,
+                                                          domain.global_timestep_violation,
+                                                          op=MPI.MAX)
+
+    domain.communication_reduce_time += time.time()-t0
+
+    domain.flux_timestep = domain.lagged_flux_timestep
+
+
+def finish_flux_timestep_check(domain):
+    """Complete the check posted by communicate_flux_timestep_lagged.
+
+    Returns True if the lagged timestep satisfied the CFL condition on all
+    processors. Otherwise the conserved quantities and time are restored
+    to their values at the start of the step (from the backup made at the
+    start of the step) so that the step can be repeated with a global
+    timestep, and False is returned.
+    """
+
+    import time
+
+    if domain.timestep_check_request is None:
+        return True
+
+    t0 = time.time()
+
+    domain.timestep_check_request.Wait()
+    domain.timestep_check_request = None
+
+    domain.communication_reduce_time += time.time()-t0
+
+    if domain.global_timestep_violation[0] == 0.0:
+        return True
+
+    for name in domain.conserved_quantities:
+        Q = domain.quantities[name]
+        Q.centroid_values[:] = Q.centroid_backup_values
+
+    domain.set_relative_time(domain.timestep_check_time)
+
+    # Force a global timestep for the repeated step
+    domain.lagged_steps_remaining = 0
+    domain.number_of_timestep_rollbacks += 1
+
+    return False
     
     
 
@@ -164,7 +372,16 @@ def communicate_ghosts_non_blocking(domain, quantities=None):
     # the separate processors
     # Using isend and irecv
 
-    import numpy as num
+    start_ghost_exchange(domain, quantities)
+    finish_ghost_exchange(domain)
+
+
+def start_ghost_exchange(domain, quantities=None):
+    """Pack the full cell data into the send buffers and post the
+    isends and irecvs for the ghost cells. Computation which does not
+    read ghost centroid values can be done before finish_ghost_exchange
+    """
+
     import time
     import anuga
     t0 = time.time()
@@ -179,20 +396,16 @@ def communicate_ghosts_non_blocking(domain, quantities=None):
     if quantities is None:
         quantities = domain.conserved_quantities
 
+    msg = 'Ghost exchange already in progress'
+    assert domain.ghost_exchange_requests is None, msg
+
     # update of non-local ghost cells by copying full cell data into the
     # Xout buffer arrays
 
     #iproc == domain.processor
 
     #Setup send buffer arrays for sending full data to other processors
-    for send_proc in domain.full_send_dict:
-        Idf  = sendDict[send_proc][0]
-        Xout = sendDict[send_proc][2]
-
-        for i, q in enumerate(quantities):
-            #print 'Store send data',i,q
-            Q_cv =  domain.quantities[q].centroid_values
-            Xout[:,i] = num.take(Q_cv, Idf)
+    pack_ghost_buffers(domain, quantities)
 
     #--------------------------------------------
     # Do all the comuunication using isend/irecv 
@@ -207,8 +420,7 @@ def communicate_ghosts_non_blocking(domain, quantities=None):
     recv_requests = []
     for recv_proc in recvDict:
 
-        Idg = recvDict[recv_proc][0]
-        X   = recvDict[recv_proc][2]
+        X   = domain.ghost_recv_buffer[domain.ghost_recv_slices[recv_proc]]
 
         request = pypar.comm.Irecv(X, recv_proc, 123)
         recv_requests.append(request)
@@ -219,31 +431,39 @@ def communicate_ghosts_non_blocking(domain, quantities=None):
     send_requests = []
     for send_proc in sendDict:
 
-        Idg = sendDict[send_proc][0]
-        X   = sendDict[send_proc][2]
+        X   = domain.ghost_send_buffer[domain.ghost_send_slices[send_proc]]
 
         request = pypar.comm.Isend(X, send_proc, 123)
         send_requests.append(request)
 
+    domain.ghost_exchange_requests = (quantities, recv_requests, send_requests)
+
+    domain.communication_time += time.time()-t0
+
+
+def finish_ghost_exchange(domain):
+    """Wait for the communication posted by start_ghost_exchange and
+    copy the received data into the ghost cells
+    """
+
+    import time
+    t0 = time.time()
+
+    quantities, recv_requests, send_requests = domain.ghost_exchange_requests
+    domain.ghost_exchange_requests = None
+
     #-----------------------------------------
     # Now complete communication.
-    # We could put some computation between the 
-    # communication calls above and this call.
     #-----------------------------------------
     import mpi4py
-    re=mpi4py.MPI.Request.Waitall(recv_requests)
+    mpi4py.MPI.Request.Waitall(recv_requests)
 
 
     # Now copy data from receive buffers to the domain
-    for recv_proc in recvDict:
-        Idg  = recvDict[recv_proc][0]
-        X    = recvDict[recv_proc][2]
-
-        for i, q in enumerate(quantities):
-            #print 'Read receive data',i,q
-            Q_cv =  domain.quantities[q].centroid_values
-            num.put(Q_cv, Idg, X[:,i])
+    unpack_ghost_buffers(domain, quantities)
 
+    # The send buffers are reused by the next exchange
+    mpi4py.MPI.Request.Waitall(send_requests)
 
     domain.communication_time += time.time()-t0
 
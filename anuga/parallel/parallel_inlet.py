@@ -6,7 +6,7 @@ from anuga.config import velocity_protection, g
 import math
 
 import numpy as num
-from anuga.structures.inlet import Inlet
+from anuga.structures.inlet import Inlet, compute_level_stage
 import warnings
 from anuga import Region
 
@@ -51,10 +51,18 @@ class Parallel_Inlet(Inlet):
         from anuga.utilities import parallel_abstraction as pypar
         self.myid = pypar.rank()
 
+        # Communicator for the processors of this inlet (shared with other
+        # inlets on the same processors)
+        self.comm = pypar.create_comm(self.procs)
+        self.master_rank = sorted(self.procs).index(self.master_proc)
+
         self.triangle_indices = self.region.get_indices(full_only=True)
         self.compute_area()
         #self.compute_inlet_length()
 
+        # The area does not change so only reduce it once
+        self.global_area = self.reduce_sum(self.area)
+
     def compute_area(self):
 
         # Compute inlet area as the sum of areas of triangles identified
@@ -96,26 +104,81 @@ class Parallel_Inlet(Inlet):
         return self.area
 
     def get_global_area(self):
-        # GLOBAL: Master processor gathers area from all child processors, and returns value
+        # GLOBAL: Area of the inlet over all procs (computed once at setup)
+
+        return self.global_area
+
+    def reduce_sum(self, values):
+        # GLOBAL: Sum of values (a float or an array) over all procs of this
+        # inlet, returned on all procs
 
         # WARNING: requires synchronization, must be called by all procs associated
         # with this inlet
 
         from anuga.utilities import parallel_abstraction as pypar
-        local_area = self.area
-        area = local_area
 
-        if self.myid == self.master_proc:
+        if self.comm is None:
+            return values
 
-            for i in self.procs:
-                if i == self.master_proc: continue
+        local_values = num.atleast_1d(num.array(values, float))
+        global_values = num.zeros_like(local_values)
+        self.comm.Allreduce(local_values, global_values, op=pypar.SUM)
 
-                val = pypar.receive(i)
-                area = area + val
+        if num.ndim(values) == 0:
+            return float(global_values[0])
         else:
-            pypar.send(area, self.master_proc)
+            return global_values
+
+    def reduce_max(self, values):
+        # GLOBAL: Maximum of an array of values over all procs of this inlet,
+        # returned on all procs
+
+        # WARNING: requires synchronization, must be called by all procs associated
+        # with this inlet
+
+        from anuga.utilities import parallel_abstraction as pypar
+
+        if self.comm is None:
+            return values
+
+        local_values = num.array(values, float)
+        global_values = num.zeros_like(local_values)
+        self.comm.Allreduce(local_values, global_values, op=pypar.MAX)
+
+        return global_values
+
+    def broadcast(self, value):
+        # GLOBAL: Send value from the master proc to all procs of this inlet
+
+        # WARNING: requires synchronization, must be called by all procs associated
+        # with this inlet
+
+        if self.comm is None:
+            return value
 
-        return area
+        return self.comm.bcast(value, root=self.master_rank)
+
+    def get_local_sums(self):
+        # LOCAL: Water volume and area weighted sums of stage, elevation,
+        # xmomentum and ymomentum
+
+        areas = self.get_areas()
+        stages = self.get_stages()
+        elevations = self.get_elevations()
+
+        return num.array([num.sum((stages - elevations)*areas),
+                          num.sum(stages*areas),
+                          num.sum(elevations*areas),
+                          num.sum(self.get_xmoms()*areas),
+                          num.sum(self.get_ymoms()*areas)])
+
+    def get_global_sums(self):
+        # GLOBAL: get_local_sums over all procs of the inlet, in one reduction
+
+        # WARNING: requires synchronization, must be called by all procs associated
+        # with this inlet
+
+        return self.reduce_sum(self.get_local_sums())
 
 
     def get_areas(self):
@@ -137,28 +200,15 @@ class Parallel_Inlet(Inlet):
         return num.sum(self.get_stages()*self.get_areas())/self.area
 
     def get_global_average_stage(self):
-        # GLOBAL: Master processor gathers stages from all child processors, and returns average
+        # GLOBAL: Average stage over all procs of the inlet, returned on all procs
 
         # WARNING: requires synchronization, must be called by all procs associated
         # with this inlet
 
-        from anuga.utilities import parallel_abstraction as pypar
         local_stage = num.sum(self.get_stages()*self.get_areas())
         global_area = self.get_global_area()
 
-
-
-        global_stage = local_stage
-
-        if self.myid == self.master_proc:
-            for i in self.procs:
-                if i == self.master_proc: continue
-
-                val = pypar.receive(i)
-                global_stage = global_stage + val
-        else:
-            pypar.send(local_stage, self.master_proc)
-
+        global_stage = self.reduce_sum(local_stage)
 
         if global_area > 0.0:
             return global_stage/global_area
@@ -178,28 +228,15 @@ class Parallel_Inlet(Inlet):
             return 0.0
 
     def get_global_average_elevation(self):
-        # GLOBAL: Master processor gathers elevations from all child processors, and returns average
+        # GLOBAL: Average elevation over all procs of the inlet, returned on all procs
 
         # WARNING: requires synchronization, must be called by all procs associated
         # with this inlet
 
-        from anuga.utilities import parallel_abstraction as pypar
         local_elevation = num.sum(self.get_elevations()*self.get_areas())
         global_area = self.get_global_area()
 
-
-
-        global_elevation = local_elevation
-
-        if self.myid == self.master_proc:
-            for i in self.procs:
-                if i == self.master_proc: continue
-
-                val = pypar.receive(i)
-                global_elevation = global_elevation + val
-        else:
-            pypar.send(local_elevation, self.master_proc)
-
+        global_elevation = self.reduce_sum(local_elevation)
 
         if global_area > 0.0:
             return global_elevation/global_area
@@ -220,24 +257,13 @@ class Parallel_Inlet(Inlet):
             return 0.0
 
     def get_global_average_xmom(self):
-        # GLOBAL: master proc gathers all xmom values and returns average
+        # GLOBAL: Average xmom over all procs of the inlet, returned on all procs
         # WARNING: requires synchronization, must be called by all procs associated
         # with this inlet
 
-        from anuga.utilities import parallel_abstraction as pypar
         global_area = self.get_global_area()
         local_xmoms = num.sum(self.get_xmoms()*self.get_areas())
-        global_xmoms = local_xmoms
-
-        if self.myid == self.master_proc:
-            for i in self.procs:
-                if i == self.master_proc: continue
-
-                val = pypar.receive(i)
-                global_xmoms = global_xmoms + val
-        else:
-            pypar.send(local_xmoms, self.master_proc)
-
+        global_xmoms = self.reduce_sum(local_xmoms)
 
         if global_area > 0.0:
             return global_xmoms/global_area
@@ -255,24 +281,13 @@ class Parallel_Inlet(Inlet):
         return num.sum(self.get_ymoms()*self.get_areas())/self.area
 
     def get_global_average_ymom(self):
-        # GLOBAL: master proc gathers all ymom values and returns average
+        # GLOBAL: Average ymom over all procs of the inlet, returned on all procs
         # WARNING: requires synchronization, must be called by all procs associated
         # with this inlet
 
-        from anuga.utilities import parallel_abstraction as pypar
         global_area = self.get_global_area()
         local_ymoms = num.sum(self.get_ymoms()*self.get_areas())
-        global_ymoms = local_ymoms
-
-        if self.myid == self.master_proc:
-            for i in self.procs:
-                if i == self.master_proc: continue
-
-                val = pypar.receive(i)
-                global_ymoms = global_ymoms + val
-        else:
-            pypar.send(local_ymoms, self.master_proc)
-
+        global_ymoms = self.reduce_sum(local_ymoms)
 
         if global_area > 0.0:
             return global_ymoms/global_area
@@ -289,25 +304,13 @@ class Parallel_Inlet(Inlet):
        return num.sum(self.get_depths()*self.get_areas())
 
     def get_global_total_water_volume(self):
-        # GLOBAL: master proc gathers total water volumes from each proc and returns average
+        # GLOBAL: Total water volume over all procs of the inlet, returned on all procs
         # WARNING: requires synchronization, must be called by all procs associated
         # with this inlet
 
-        from anuga.utilities import parallel_abstraction as pypar
         local_volume = num.sum(self.get_depths()*self.get_areas())
-        volume = local_volume
 
-        if self.myid == self.master_proc:
-
-            for i in self.procs:
-                if i == self.master_proc: continue
-
-                val = pypar.receive(i)
-                volume = volume + val
-        else:
-            pypar.send(volume, self.master_proc)
-
-        return volume
+        return self.reduce_sum(local_volume)
 
     def get_average_depth(self):
         # LOCAL
@@ -318,7 +321,7 @@ class Parallel_Inlet(Inlet):
             return 0.0
 
     def get_global_average_depth(self):
-        # GLOBAL: master proc gathers all depth values and returns average
+        # GLOBAL: Average depth over all procs of the inlet, returned on all procs
         # WARNING: requires synchronization, must be called by all procs associated
         # with this inlet
 
@@ -411,111 +414,19 @@ class Parallel_Inlet(Inlet):
         # WARNING: requires synchronization, must be called by all procs associated
         # with this inlet
 
-        from anuga.utilities import parallel_abstraction as pypar
-        centroid_coordinates = self.domain.get_full_centroid_coordinates(absolute=True)
+        # The level is found by a search which only needs sums and maxima
+        # over the inlet, so each proc applies it to its own cells
         areas = self.get_areas()
         stages = self.get_stages()
 
-        stages_order = stages.argsort()
-
-        # PETE: send stages and areas, apply merging procedure
+        new_stage = compute_level_stage(stages, areas, volume,
+                                        reduce_sum=self.reduce_sum,
+                                        reduce_max=self.reduce_max)
 
-        s_areas = {}
-        s_stages = {}
-        s_stages_order = {}
-        total_stages = len(stages)
-
-        if self.myid == self.master_proc:
-            s_areas[self.myid] = areas
-            s_stages[self.myid] = stages
-            s_stages_order[self.myid] = stages_order
-
-            # Recieve areas, stages, and stages order
-            for i in self.procs:
-                if i != self.master_proc:
-                    s_areas[i] = pypar.receive(i)
-                    s_stages[i] = pypar.receive(i)
-                    s_stages_order[i] = pypar.receive(i)
-                    total_stages = total_stages + len(s_stages[i])
-
-        else:
-            # Send areas, stages, and stages order to master proc of inlet
-            pypar.send(areas, self.master_proc)
-            pypar.send(stages, self.master_proc)
-            pypar.send(stages_order, self.master_proc)
-
-        # merge sorted stage order
-        if self.myid == self.master_proc:
-            pos = {}
-            summed_volume = 0.
-            summed_areas = 0.
-            prev_stage = 0.
-            num_stages = 0.
-            first = True
-
-            for i in self.procs:
-                pos[i] = 0
-
-            while num_stages < total_stages:
-                # Determine current minimum stage of all the processors in s_stages
-                num_stages = num_stages + 1
-                current_stage = num.finfo(num.float32).max
-                index = -1
-
-                for i in self.procs:
-                    if pos[i] >= len(s_stages[i]):
-                        continue
-
-                    if s_stages[i][s_stages_order[i][pos[i]]] < current_stage:
-                        current_stage = s_stages[i][s_stages_order[i][pos[i]]]
-                        index = i
-
-                # If first iteration, then only update summed_areas, position, and prev|current stage
-
-                if first:
-                    first = False
-                    summed_areas = s_areas[index][s_stages_order[index][pos[index]]]
-                    pos[index] = pos[index] + 1
-                    prev_stage = current_stage
-                    continue
-
-                assert index >= 0, "Index out of bounds"
-
-                # Update summed volume and summed areas
-                tmp_volume = summed_volume + (summed_areas * (current_stage - prev_stage))
-
-                # Terminate if volume exceeded
-                if tmp_volume >= volume:
-                    break
-
-                summed_areas = summed_areas + s_areas[index][s_stages_order[index][pos[index]]]
-                pos[index] = pos[index] + 1
-                summed_volume = tmp_volume
-
-                # Update position of index processor and current stage
-                prev_stage = current_stage
-
-            # Calculate new stage
-            new_stage = prev_stage + (volume - summed_volume)/ summed_areas
-
-            # Send postion and new stage to all processors
-            for i in self.procs:
-                if i != self.master_proc:
-                    pypar.send(pos[i], i)
-                    pypar.send(new_stage, i)
-
-            # Update own depth
-            stages[stages_order[0:pos[self.myid]]] = new_stage
-        else:
-            pos = pypar.receive(self.master_proc)
-            new_stage = pypar.receive(self.master_proc)
-            stages[stages_order[0:pos]] = new_stage
+        stages[stages < new_stage] = new_stage
 
         self.set_stages(stages)
 
-        stages = self.get_stages()
-        stages_order = stages.argsort()
-
     def set_depths_evenly(self,volume):
         """ Distribute volume over all exchange
         cells with equal depth of water
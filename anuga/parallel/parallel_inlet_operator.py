@@ -99,33 +99,25 @@ class Parallel_Inlet_operator(Inlet_operator):
 
     def __call__(self):
 
-        from anuga.utilities import parallel_abstraction as pypar
         volume = 0
 
-        # Need to run global command on all processors
+        # Need to run global command on all processors, the total
+        # volume is available on all of them and the area is cached
         current_volume = self.inlet.get_global_total_water_volume()
         total_area = self.inlet.get_global_area()
+        timestep = self.domain.get_timestep()
 
         # Only the master proc calculates the update
         if self.myid == self.master_proc:
-            timestep = self.domain.get_timestep()
-
             t = self.domain.get_time()
             Q1 = self.update_Q(t)
             Q2 = self.update_Q(t + timestep)
 
             volume = 0.5*(Q1+Q2)*timestep
 
-
-
             assert current_volume >= 0.0 , 'Volume of watrer in inlet negative!'
 
-            for i in self.procs:
-                if i == self.master_proc: continue
-
-                pypar.send((volume, current_volume, total_area, timestep), i)
-        else:
-            volume, current_volume, total_area, timestep = pypar.receive(self.master_proc)
+        volume = self.inlet.broadcast(volume)
 
 
         #print self.myid, volume, current_volume, total_area, timestep
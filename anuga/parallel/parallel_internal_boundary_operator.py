@@ -155,8 +155,6 @@ class Parallel_Internal_boundary_operator(Parallel_Structure_operator):
 
     def discharge_routine_explicit(self):
 
-        from anuga.utilities import parallel_abstraction as pypar
-
         local_debug = False
         
         # If the structure has been closed, then no water gets through
@@ -172,33 +170,10 @@ class Parallel_Internal_boundary_operator(Parallel_Structure_operator):
             else:
                 return None, None, None
 
-        #Send attributes of both enquiry points to the master proc
+        # Attributes of both enquiry points (see update_global_values)
         if self.myid == self.master_proc:
-
-            if self.myid == self.enquiry_proc[0]:
-                enq_total_energy0 = self.inlets[0].get_enquiry_total_energy()
-                enq_stage0 = self.inlets[0].get_enquiry_stage()
-            else:
-                enq_total_energy0 = pypar.receive(self.enquiry_proc[0])
-                enq_stage0 = pypar.receive(self.enquiry_proc[0])
-
-
-            if self.myid == self.enquiry_proc[1]:
-                enq_total_energy1 = self.inlets[1].get_enquiry_total_energy()
-                enq_stage1 = self.inlets[1].get_enquiry_stage()
-            else:
-                enq_total_energy1 = pypar.receive(self.enquiry_proc[1])
-                enq_stage1 = pypar.receive(self.enquiry_proc[1])
-
-        else:
-            if self.myid == self.enquiry_proc[0]:
-                pypar.send(self.inlets[0].get_enquiry_total_energy(), self.master_proc)
-                pypar.send(self.inlets[0].get_enquiry_stage(), self.master_proc)
-
-            if self.myid == self.enquiry_proc[1]:
-                pypar.send(self.inlets[1].get_enquiry_total_energy(), self.master_proc)
-                pypar.send(self.inlets[1].get_enquiry_stage(), self.master_proc)
-
+            enq_total_energy0, enq_stage0 = self.enquiry_values[0, :2]
+            enq_total_energy1, enq_stage1 = self.enquiry_values[1, :2]
 
         # Determine the direction of the flow
         if self.myid == self.master_proc:
@@ -268,20 +243,17 @@ class Parallel_Internal_boundary_operator(Parallel_Structure_operator):
                 self.inflow_index = 1
                 self.outflow_index = 0
 
-                for i in self.procs:
-                    if i == self.master_proc: continue
-                    pypar.send(True, i)
+                reverse = True
             else:
-                for i in self.procs:
-                    if i == self.master_proc: continue
-                    pypar.send(False, i)
+                reverse = False
 
         else:
-            reverse = pypar.receive(self.master_proc)
+            reverse = None
 
-            if reverse:
-                self.inflow_index = 1
-                self.outflow_index = 0
+        # master proc sends the direction to all procs of the structure
+        if self.broadcast(reverse):
+            self.inflow_index = 1
+            self.outflow_index = 0
 
         # Master proc computes return values
         if self.myid == self.master_proc:
@@ -308,8 +280,6 @@ class Parallel_Internal_boundary_operator(Parallel_Structure_operator):
 
         """
 
-        from anuga.utilities import parallel_abstraction as pypar
-
         local_debug = False
         
         # If the structure has been closed, then no water gets through
@@ -325,55 +295,13 @@ class Parallel_Internal_boundary_operator(Parallel_Structure_operator):
             else:
                 return None, None, None
 
-        #Send attributes of both enquiry points to the master proc
+        # Attributes of both enquiry points (see update_global_values)
         if self.myid == self.master_proc:
+            enq_total_energy0, enq_stage0 = self.enquiry_values[0, :2]
+            enq_total_energy1, enq_stage1 = self.enquiry_values[1, :2]
 
-            if self.myid == self.enquiry_proc[0]:
-                enq_total_energy0 = self.inlets[0].get_enquiry_total_energy()
-                enq_stage0 = self.inlets[0].get_enquiry_stage()
-            else:
-                enq_total_energy0 = pypar.receive(self.enquiry_proc[0])
-                enq_stage0 = pypar.receive(self.enquiry_proc[0])
-
-
-            if self.myid == self.enquiry_proc[1]:
-                enq_total_energy1 = self.inlets[1].get_enquiry_total_energy()
-                enq_stage1 = self.inlets[1].get_enquiry_stage()
-            else:
-                enq_total_energy1 = pypar.receive(self.enquiry_proc[1])
-                enq_stage1 = pypar.receive(self.enquiry_proc[1])
-
-        else:
-            if self.myid == self.enquiry_proc[0]:
-                pypar.send(self.inlets[0].get_enquiry_total_energy(), self.master_proc)
-                pypar.send(self.inlets[0].get_enquiry_stage(), self.master_proc)
-
-            if self.myid == self.enquiry_proc[1]:
-                pypar.send(self.inlets[1].get_enquiry_total_energy(), self.master_proc)
-                pypar.send(self.inlets[1].get_enquiry_stage(), self.master_proc)
-
-        # Send inlet areas to the master proc. FIXME: Inlet areas don't change
-        # -- perhaps we could just do this once?
-
-        # area0
-        if self.myid in self.inlet_procs[0]:
-            area0 = self.inlets[0].get_global_area()
-
-        if self.myid == self.master_proc:
-            if self.myid != self.inlet_master_proc[0]:
-                area0 = pypar.receive(self.inlet_master_proc[0])
-        elif self.myid == self.inlet_master_proc[0]:
-            pypar.send(area0, self.master_proc)
-        
-        # area1
-        if self.myid in self.inlet_procs[1]:
-            area1 = self.inlets[1].get_global_area()
-
-        if self.myid == self.master_proc:
-            if self.myid != self.inlet_master_proc[1]:
-                area1 = pypar.receive(self.inlet_master_proc[1])
-        elif self.myid == self.inlet_master_proc[1]:
-            pypar.send(area1, self.master_proc)
+        # Inlet areas (computed once at setup)
+        area0, area1 = self.inlet_areas
 
         # Compute discharge
         if self.myid == self.master_proc:
@@ -438,20 +366,17 @@ class Parallel_Internal_boundary_operator(Parallel_Structure_operator):
                 self.inflow_index = 1
                 self.outflow_index = 0
 
-                for i in self.procs:
-                    if i == self.master_proc: continue
-                    pypar.send(True, i)
+                reverse = True
             else:
-                for i in self.procs:
-                    if i == self.master_proc: continue
-                    pypar.send(False, i)
+                reverse = False
 
         else:
-            reverse = pypar.receive(self.master_proc)
+            reverse = None
 
-            if reverse:
-                self.inflow_index = 1
-                self.outflow_index = 0
+        # master proc sends the direction to all procs of the structure
+        if self.broadcast(reverse):
+            self.inflow_index = 1
+            self.outflow_index = 0
 
         # Master proc computes return values
         if self.myid == self.master_proc:
@@ -0,0 +1,383 @@
+"""
+Dynamic load rebalancing of parallel domains.
+
+The compute time of each processor is measured between yieldsteps
+(see Parallel_domain.evolve). When the imbalance (max time / mean time)
+exceeds a threshold the mesh is repartitioned, using the measured
+cost per triangle as partition weights, and the domain is rebuilt in
+place on each processor with its current state.
+"""
+
+import numpy as num
+
+import anuga.utilities.parallel_abstraction as pypar
+
+
+# Attributes carried over when the domain is rebuilt for a new
+# partition. Everything else (in particular anything describing the
+# local mesh) is set up afresh by __init__.
+
+# Numerical settings
+SETTING_ATTRIBUTES = ['flow_algorithm', 'timestepping_method', 'timestep_fluxcalls',
+                      'compute_fluxes_method', 'distribute_to_vertices_and_edges_method',
+                      'CFL', 'H0', 'g', 'epsilon', 'low_froude', '_order_', 'default_order',
+                      'alpha_balance', 'beta_w', 'beta_w_dry', 'beta_uh', 'beta_uh_dry',
+                      'beta_vh', 'beta_vh_dry', 'tight_slope_limiters',
+                      'optimised_gradient_limiter', 'use_edge_limiter',
+                      'extrapolate_velocity_second_order', 'use_centroid_velocities',
+                      'using_centroid_averaging', 'using_discontinuous_elevation',
+                      'centroid_transmissive_bc', 'use_sloped_mannings',
+                      'use_new_velocity_head', 'optimise_dry_cells',
+                      'protect_against_isolated_degenerate_timesteps',
+                      'minimum_allowed_height', 'minimum_storable_height',
+                      'maximum_allowed_speed', 'max_smallsteps',
+                      'evolve_min_timestep', 'evolve_max_timestep', 'fixed_flux_timestep',
+                      'use_fused_rk2_step', 'verbose']
+
+# Output, checkpointing and parallel settings
+OUTPUT_ATTRIBUTES = ['global_name', 'simulation_name', 'datadir', 'institution',
+                     'store', 'store_centroids', 'store_asynchronously',
+                     'store_queue_depth', 'sww_buffer_frames',
+                     'quantities_to_be_stored', 'timezone', 'geo_reference',
+                     'checkpoint', 'checkpoint_dir', 'checkpoint_step',
+                     'checkpoint_time', 'checkpoint_format', 'checkpoint_asynchronous',
+                     'keep_checkpoints', 'checkpoint_writer', 'walltime_prev',
+                     'timestep_reduction', 'timestep_reduction_interval',
+                     'timestep_safety_factor', 'overlap_ghost_exchange',
+                     'rebalance_interval', 'rebalance_threshold', 'rebalance_yieldsteps',
+                     'rebalance_warned', 'load_imbalance', 'rebalance_base_name',
+                     'number_of_rebalances']
+
+# State of the run in progress
+EVOLVE_ATTRIBUTES = ['starttime', 'evolve_starttime', 'relative_time', 'finaltime',
+                     'relative_finaltime', 'yieldstep', 'yieldtime', 'relative_yieldtime',
+                     'evolved_called', 'yieldstep_counter', 'output_frequency',
+                     'timestep', 'flux_timestep', 'recorded_min_timestep',
+                     'recorded_max_timestep', 'number_of_steps',
+                     'number_of_first_order_steps', 'smallsteps', 'last_walltime',
+                     'fractional_step_volume_integral',
+                     'number_of_timestep_reductions', 'number_of_timestep_rollbacks',
+                     'calls_to_update_ghosts', 'calls_to_update_timestep',
+                     'communication_time', 'communication_reduce_time',
+                     'communication_broadcast_time', 'compute_time']
+
+CARRIED_ATTRIBUTES = SETTING_ATTRIBUTES + OUTPUT_ATTRIBUTES + EVOLVE_ATTRIBUTES
+
+
+def setup_load_balance(domain):
+    """Attributes used to measure the load and rebalance
+    """
+
+    domain.rebalance_interval = 0
+    domain.rebalance_threshold = 1.2
+    domain.rebalance_yieldsteps = 0
+
+    domain.rebalance_warned = False
+
+    domain.compute_time = 0.0
+    domain.load_imbalance = 1.0
+    domain.number_of_rebalances = 0
+    domain.rebalance_base_name = None
+
+
+def get_communication_time(domain):
+    """Total time spent in ghost updates and timestep reductions
+    """
+
+    return domain.communication_time + domain.communication_reduce_time + \
+        domain.communication_broadcast_time
+
+
+def get_rebalance_support(domain):
+    """Return None if the domain can be rebalanced, otherwise the reason
+    it cannot be.
+
+    Fractional step operators (inlets, rate operators, structures, ...),
+    riverwalls and file boundaries hold data (indices, interpolation
+    weights, communicators) computed for the local mesh and are not
+    migrated. The default boundary flux integral operator is recreated by
+    the rebuilt domain and its integral carried over.
+    """
+
+    from anuga.abstract_2d_finite_volumes.generic_boundary_conditions import File_boundary
+    from anuga.shallow_water.boundaries import Field_boundary
+
+    operators = [op for op in domain.fractional_step_operators
+                 if op is not getattr(domain, 'boundary_flux_integral', None)]
+    if len(operators) > 0:
+        return 'fractional step operators are not migrated'
+
+    if len(domain.riverwallData.names) > 0:
+        return 'riverwalls are not migrated'
+
+    if domain.multiprocessor_mode == 2:
+        return 'the gpu interface is not migrated'
+
+    if domain.boundary_map is not None:
+        for B in domain.boundary_map.values():
+            if isinstance(B, (File_boundary, Field_boundary)):
+                return 'file boundaries are not migrated'
+
+    return None
+
+
+def warn_rebalance_support(domain, msg):
+    """Warn (once, on processor 0) that the domain cannot be rebalanced
+    """
+
+    import warnings
+
+    if domain.rebalance_warned:
+        return
+
+    domain.rebalance_warned = True
+    if domain.processor == 0:
+        warnings.warn(msg)
+
+
+def measure_load_imbalance(domain):
+    """Gather the compute time of all processors since the last
+    measurement. Returns the compute times and the imbalance
+    (max time / mean time).
+    """
+
+    times = num.array(pypar.comm.allgather(domain.compute_time), float)
+    domain.compute_time = 0.0
+
+    mean_time = num.mean(times)
+    if mean_time > 0.0:
+        imbalance = num.max(times)/mean_time
+    else:
+        imbalance = 1.0
+
+    domain.load_imbalance = imbalance
+
+    return times, imbalance
+
+
+def check_load_balance(domain, verbose=False):
+    """Called after each yieldstep. Every domain.rebalance_interval
+    yieldsteps measure the load imbalance and rebalance the domain if
+    it exceeds domain.rebalance_threshold. Returns True if the domain
+    was rebalanced.
+    """
+
+    if domain.rebalance_interval <= 0:
+        return False
+
+    domain.rebalance_yieldsteps += 1
+    if domain.rebalance_yieldsteps % domain.rebalance_interval != 0:
+        return False
+
+    times, imbalance = measure_load_imbalance(domain)
+
+    if imbalance <= domain.rebalance_threshold:
+        return False
+
+    reason = get_rebalance_support(domain)
+    if reason is not None:
+        warn_rebalance_support(domain, 'Load imbalance %g but domain not rebalanced: %s'
+                               % (imbalance, reason))
+        return False
+
+    # Cost of each full triangle estimated from the compute time
+    # of its processor
+    n_full = domain.number_of_full_triangles
+    cost = times[domain.processor]/max(n_full, 1)
+    weights = num.full(n_full, cost)
+
+    rebalance(domain, weights, verbose=verbose)
+
+    return True
+
+
+def gather_global_domain(domain, weights=None):
+    """Gather the mesh, boundary, quantities and (optionally) the
+    triangle weights of the full triangles of all processors to
+    processor 0, using the global numbering (tri_l2g and node_l2g).
+
+    Returns (nodes, triangles, boundary, vertex_values, centroid_values,
+    weights) on processor 0 and None on the other processors.
+    """
+
+    n_full = domain.number_of_full_triangles
+    full_ids = num.flatnonzero(domain.tri_full_flag == 1)[:n_full]
+
+    tri_l2g = num.asarray(domain.tri_l2g)
+    node_l2g = num.asarray(domain.node_l2g)
+
+    triangles = domain.triangles[full_ids]
+    boundary = {}
+    for (vol_id, edge_id), tag in domain.boundary.items():
+        if tag != 'ghost' and domain.tri_full_flag[vol_id] == 1:
+            boundary[(int(tri_l2g[vol_id]), int(edge_id))] = tag
+
+    vertex_values = {}
+    centroid_values = {}
+    for name, Q in domain.quantities.items():
+        vertex_values[name] = Q.vertex_values[full_ids]
+        centroid_values[name] = Q.centroid_values[full_ids]
+
+    local = (tri_l2g[full_ids], node_l2g, domain.get_nodes(), node_l2g[triangles],
+             boundary, vertex_values, centroid_values, weights)
+
+    gathered = pypar.comm.gather(local, root=0)
+
+    if domain.processor != 0:
+        return None
+
+    N = domain.number_of_global_triangles
+    M = domain.number_of_global_nodes
+
+    global_nodes = num.zeros((M, 2), float)
+    global_triangles = num.zeros((N, 3), int)
+    global_boundary = {}
+    global_vertex_values = {}
+    global_centroid_values = {}
+    for name in domain.quantities:
+        global_vertex_values[name] = num.zeros((N, 3), float)
+        global_centroid_values[name] = num.zeros(N, float)
+
+    if weights is not None:
+        global_weights = num.zeros(N, float)
+    else:
+        global_weights = None
+
+    for (l2g, nl2g, nodes, tris, bdry, vv, cv, w) in gathered:
+        global_nodes[nl2g] = nodes
+        global_triangles[l2g] = tris
+        global_boundary.update(bdry)
+        for name in domain.quantities:
+            global_vertex_values[name][l2g] = vv[name]
+            global_centroid_values[name][l2g] = cv[name]
+        if global_weights is not None:
+            global_weights[l2g] = w
+
+    return global_nodes, global_triangles, global_boundary, \
+        global_vertex_values, global_centroid_values, global_weights
+
+
+def rebalance(domain, weights=None, verbose=False):
+    """Repartition the mesh of a parallel domain and rebuild the domain in
+    place on each processor, migrating the quantities, ghost communication
+    pattern and boundary map. Must be called on all processors.
+
+    weights is the cost of each full triangle of this processor (default
+    uniform). Output continues to a new set of sww files with the suffix
+    _<number of rebalances>.
+    """
+
+    from anuga import Domain, Quantity
+    from anuga.parallel.sequential_distribute import Sequential_distribute
+
+    reason = get_rebalance_support(domain)
+    if reason is not None:
+        raise Exception('Domain cannot be rebalanced: %s' % reason)
+
+    gathered = gather_global_domain(domain, weights)
+
+    numprocs = domain.numproc
+
+    if domain.processor == 0:
+        nodes, triangles, boundary, vertex_values, centroid_values, global_weights = gathered
+
+        global_domain = Domain(nodes, triangles, boundary,
+                               geo_reference=domain.geo_reference)
+
+        for name in vertex_values:
+            if name not in global_domain.quantities:
+                Quantity(global_domain, name=name, register=True)
+            global_domain.quantities[name].vertex_values[:] = vertex_values[name]
+
+        parameters = {'ghost_layer_width': domain.ghost_layer_width}
+        if global_weights is not None:
+            parameters['partition_weights'] = global_weights
+
+        partition = Sequential_distribute(global_domain, verbose=verbose,
+                                          parameters=parameters)
+        partition.distribute(numprocs)
+
+        for p in range(numprocs):
+            submesh = partition.extract_submesh(p)
+            kwargs = submesh[0]
+
+            # tri_l2g is already mapped back to the numbering of global_domain
+            old_ids = kwargs['tri_l2g']
+            centroids = {}
+            for name in centroid_values:
+                centroids[name] = centroid_values[name][old_ids]
+
+            tostore = (kwargs, submesh[1], submesh[2], submesh[3], submesh[4], centroids)
+
+            if p == 0:
+                local = tostore
+            else:
+                pypar.send(tostore, p)
+
+        if verbose:
+            print('Rebalanced partition, triangles per proc', partition.triangles_per_proc)
+    else:
+        local = pypar.receive(0)
+
+    kwargs, points, vertices, boundary, quantities, centroids = local
+
+    rebuild_domain(domain, points, vertices, boundary, kwargs, quantities, centroids)
+
+
+def rebuild_domain(domain, points, vertices, boundary, kwargs, quantities, centroids):
+    """Rebuild a Parallel_domain in place for a new submesh, keeping its
+    settings and the state of the run (see CARRIED_ATTRIBUTES), boundary
+    map and storage.
+    """
+
+    from anuga import Quantity
+
+    state = dict(domain.__dict__)
+    boundary_map = domain.boundary_map
+    flux_integral = domain.boundary_flux_integral.boundary_flux_integral
+
+    if domain.store:
+        domain.close_storage()
+
+    # Start from an empty instance so no arrays of the old mesh survive
+    domain.__dict__.clear()
+    domain.__class__.__init__(domain, points, vertices, boundary, **kwargs)
+
+    # Restore settings and the state of the run
+    for key in CARRIED_ATTRIBUTES:
+        if key in state:
+            domain.__dict__[key] = state[key]
+
+    # Settings which allocate arrays for the new mesh
+    domain.set_multiprocessor_mode(state['multiprocessor_mode'])
+    domain.set_use_active_cells(state['use_active_cells'])
+
+    # The default operator is recreated by __init__, keep its integral
+    domain.boundary_flux_integral.boundary_flux_integral = flux_integral
+
+    # Migrate quantities
+    for name in quantities:
+        if name not in domain.quantities:
+            Quantity(domain, name=name, register=True)
+        domain.set_quantity(name, quantities[name])
+    for name in centroids:
+        domain.quantities[name].centroid_values[:] = centroids[name]
+
+    # Migrate boundary map
+    if boundary_map is not None:
+        boundary_map['ghost'] = None
+        domain.boundary_map = None
+        domain.set_boundary(boundary_map)
+
+    domain.number_of_rebalances += 1
+
+    # Continue output in a new set of sww files
+    if domain.rebalance_base_name is None:
+        domain.rebalance_base_name = domain.get_global_name()
+    domain.set_name('%s_%d' % (domain.rebalance_base_name, domain.number_of_rebalances))
+
+    domain.distribute_to_vertices_and_edges()
+    domain.update_ghosts()
+
+    if domain.store:
+        domain.initialise_storage()
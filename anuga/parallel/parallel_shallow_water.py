@@ -14,6 +14,7 @@ Geoscience Australia, 2004-2005
 from anuga import Domain
 
 from . import parallel_generic_communications as generic_comms
+from . import parallel_rebalance
 
 import anuga.utilities.parallel_abstraction as pypar
 
@@ -88,6 +89,7 @@ class Parallel_domain(Domain):
             self.number_of_full_triangles_tmp = self.get_number_of_triangles()
 
         generic_comms.setup_buffers(self)
+        parallel_rebalance.setup_load_balance(self)
 
         self.global_name = 'domain'
 
@@ -125,15 +127,191 @@ class Parallel_domain(Domain):
         return self.global_name
 
 
+    def set_timestep_reduction(self, mode='blocking', interval=10, safety_factor=0.5):
+        """Set how the global timestep is calculated.
+
+        :param str mode: 'blocking' does an allreduce of the local timesteps
+            every timestep. 'nonblocking' overlaps the allreduce with the
+            computation of the forcing terms. 'lagged' only does an allreduce
+            every interval timesteps and in between uses the last global
+            timestep times safety_factor. If that turns out to violate the
+            CFL condition on any processor, the step is repeated with a
+            global timestep.
+        :param int interval: Number of timesteps between allreduces ('lagged')
+        :param float safety_factor: Factor applied to the lagged global timestep
+
+        The lagged mode repeats a rejected step by restoring the conserved
+        quantities, so it is only suitable when fractional step operators
+        are applied after the step has been accepted (the default).
+        """
+
+        modes = ['blocking', 'nonblocking', 'lagged']
+        if mode not in modes:
+            msg = 'timestep reduction mode must be one of %s' % modes
+            raise ValueError(msg)
+
+        interval = int(interval)
+        if interval < 1:
+            raise ValueError('interval must be at least 1')
+
+        if not 0.0 < safety_factor <= 1.0:
+            raise ValueError('safety_factor must be in (0, 1]')
+
+        self.timestep_reduction = mode
+        self.timestep_reduction_interval = interval
+        self.timestep_safety_factor = safety_factor
+        self.lagged_steps_remaining = 0
+
+    def get_timestep_reduction(self):
+
+        return self.timestep_reduction
+
+    def compute_fluxes(self):
+        """Compute fluxes and, for the nonblocking timestep reduction,
+        start the reduction of the timestep after the first
+        compute_fluxes of each timestep
+        """
+
+        Domain.compute_fluxes(self)
+
+        if self.timestep_reduction == 'nonblocking':
+            first_call = self.flux_call_count % self.timestep_fluxcalls == 0
+            self.flux_call_count += 1
+
+            if first_call:
+                generic_comms.start_flux_timestep_reduction(self)
+
     def update_timestep(self, yieldstep, finaltime):
         """Calculate local timestep
         """
 
-        generic_comms.communicate_flux_timestep(self, yieldstep, finaltime)
+        if self.timestep_reduction == 'nonblocking':
+            generic_comms.communicate_flux_timestep_non_blocking(self, yieldstep, finaltime)
+        elif self.timestep_reduction == 'lagged':
+            generic_comms.communicate_flux_timestep_lagged(self, yieldstep, finaltime)
+        else:
+            generic_comms.communicate_flux_timestep(self, yieldstep, finaltime)
 
         Domain.update_timestep(self, yieldstep, finaltime)
 
+    def evolve_one_euler_step(self, yieldstep, finaltime):
+
+        # A lagged timestep may need the step to be repeated
+        if self.timestep_reduction == 'lagged':
+            self.backup_conserved_quantities()
+
+        Domain.evolve_one_euler_step(self, yieldstep, finaltime)
+
+    def validate_timestep(self):
+        """Check the lagged timestep satisfied the CFL condition on all processors
+        """
+
+        return generic_comms.finish_flux_timestep_check(self)
+
+    def get_communication_statistics(self):
+        """Return a dictionary of the time spent communicating and the
+        number of ghost updates, timestep reductions and repeated steps
+        """
+
+        return {'communication_time': self.communication_time,
+                'communication_reduce_time': self.communication_reduce_time,
+                'communication_broadcast_time': self.communication_broadcast_time,
+                'calls_to_update_ghosts': self.calls_to_update_ghosts,
+                'calls_to_update_timestep': self.calls_to_update_timestep,
+                'timestep_reductions': self.number_of_timestep_reductions,
+                'timestep_rollbacks': self.number_of_timestep_rollbacks}
+
+
+
+    def set_rebalancing(self, every=10, threshold=1.2):
+        """Rebalance the partition during evolve.
+
+        :param int every: Number of yieldsteps between measurements of the
+            compute time of each processor. 0 switches rebalancing off.
+        :param float threshold: Repartition the mesh if the maximum compute
+            time of a processor divided by the mean compute time exceeds
+            threshold.
 
+        The measured cost per triangle is used to weight the new METIS
+        partition. The domain is rebuilt in place on each processor,
+        and sww output continues in a new set of files with the
+        suffix _<number of rebalances>, which are merged separately.
+
+        Only the default boundary flux integral operator is migrated.
+        Domains with any other fractional step operator (inlets, rate
+        operators, structures, ...), riverwalls or file boundaries are
+        never rebalanced. A warning is given once, when rebalancing is
+        enabled or first refused.
+        """
+
+        every = int(every)
+        if every < 0:
+            raise ValueError('every must be non negative')
+
+        if threshold < 1.0:
+            raise ValueError('threshold must be at least 1.0')
+
+        self.rebalance_interval = every
+        self.rebalance_threshold = threshold
+        self.rebalance_yieldsteps = 0
+        self.compute_time = 0.0
+
+        if every > 0:
+            reason = parallel_rebalance.get_rebalance_support(self)
+            if reason is not None:
+                parallel_rebalance.warn_rebalance_support(self,
+                    'Rebalancing enabled but domain cannot be rebalanced: %s' % reason)
+
+    def get_load_imbalance(self):
+        """Return the last measured load imbalance (max compute time / mean compute time)
+        """
+
+        return self.load_imbalance
+
+    def rebalance(self, weights=None, verbose=False):
+        """Repartition the mesh now, weights is the cost of each full
+        triangle (default uniform). Must be called on all processors.
+        """
+
+        parallel_rebalance.rebalance(self, weights, verbose=verbose)
+
+    def evolve(self,
+               yieldstep=None,
+               outputstep=None,
+               finaltime=None,
+               duration=None,
+               skip_initial_step=False):
+        """Evolve method from Domain class, measuring the compute time
+        between yieldsteps and rebalancing the domain (see set_rebalancing)
+        """
+
+        import time
+
+        evolver = Domain.evolve(self,
+                                yieldstep=yieldstep,
+                                outputstep=outputstep,
+                                finaltime=finaltime,
+                                duration=duration,
+                                skip_initial_step=skip_initial_step)
+
+        try:
+            while True:
+                walltime = time.time()
+                comm_time = parallel_rebalance.get_communication_time(self)
+
+                try:
+                    t = next(evolver)
+                except StopIteration:
+                    return
+
+                comm_time = parallel_rebalance.get_communication_time(self) - comm_time
+                self.compute_time += time.time() - walltime - comm_time
+
+                yield t
+
+                parallel_rebalance.check_load_balance(self, verbose=self.verbose)
+        finally:
+            evolver.close()
 
     def update_ghosts(self, quantities=None):
         """We must send the information from the full cells and
@@ -144,6 +322,20 @@ class Parallel_domain(Domain):
         generic_comms.communicate_ghosts_non_blocking(self, quantities)
         #generic_comms.communicate_ghosts_blocking(self)
 
+    def start_ghost_exchange(self, quantities=None):
+        """Post the communication for the ghost cells, computation
+        which does not read ghost centroid values can be done before
+        calling finish_ghost_exchange
+        """
+
+        generic_comms.start_ghost_exchange(self, quantities)
+
+    def finish_ghost_exchange(self):
+        """Wait for the ghost cell communication to complete
+        """
+
+        generic_comms.finish_ghost_exchange(self)
+
     def apply_fractional_steps(self):
 
         for operator in self.fractional_step_operators:
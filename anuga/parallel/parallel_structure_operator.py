@@ -169,6 +169,11 @@ class Parallel_Structure_operator(anuga.Operator):
         else:
             raise Exception('Define either exchange_lines or end_points')
         
+        # Communicator for the processors of this structure (shared with
+        # other structures on the same processors)
+        self.comm = pypar.create_comm(self.procs)
+        self.master_rank = sorted(self.procs).index(self.master_proc)
+
         self.inlets = []
 
         # Allocate parallel inlet enquiry, assign None if processor is not associated with particular
@@ -250,36 +255,87 @@ class Parallel_Structure_operator(anuga.Operator):
         self.inflow_index = 0
         self.outflow_index = 1
 
+        # The inlet areas do not change so only reduce them once
+        local_areas = num.zeros(2)
+        for i, inlet in enumerate(self.inlets):
+            if inlet is not None:
+                local_areas[i] = inlet.get_area()
+        self.inlet_areas = self.reduce_sum(local_areas)
+
+        # Values needed by a discharge_routine called from a subclass constructor
+        self.update_global_values()
+
         self.set_parallel_logging(logging)
 
+    def reduce_sum(self, values):
+        # GLOBAL: Sum of the array values over all procs of the structure,
+        # returned on all procs
+
+        # WARNING: requires synchronization, must be called by all procs associated
+        # with this structure
+
+        global_values = num.zeros_like(values)
+        self.comm.Allreduce(values, global_values, op=pypar.SUM)
+
+        return global_values
+
+    def broadcast(self, value):
+        # GLOBAL: Send value from the master proc to all procs of the structure
+
+        # WARNING: requires synchronization, must be called by all procs associated
+        # with this structure
+
+        return self.comm.bcast(value, root=self.master_rank)
+
+    def update_global_values(self):
+        """Reduce the enquiry point values (total energy, stage, depth and
+        specific energy) and the inlet sums (water volume and area weighted
+        stage, elevation, xmomentum and ymomentum) of both inlets, in one
+        reduction over the procs of the structure. The results are stored
+        in self.enquiry_values and self.inlet_sums on all these procs.
+        """
+
+        # WARNING: requires synchronization, must be called by all procs associated
+        # with this structure
+
+        local_values = num.zeros((2, 9))
+
+        for i, inlet in enumerate(self.inlets):
+            if inlet is None:
+                continue
+
+            local_values[i, 4:] = inlet.get_local_sums()
+
+            # Only one proc holds the enquiry point
+            if inlet.enquiry_index >= 0:
+                local_values[i, 0] = inlet.get_enquiry_total_energy()
+                local_values[i, 1] = inlet.get_enquiry_stage()
+                local_values[i, 2] = inlet.get_enquiry_depth()
+                local_values[i, 3] = inlet.get_enquiry_specific_energy()
+
+        global_values = self.reduce_sum(local_values)
+
+        self.enquiry_values = global_values[:, :4]
+        self.inlet_sums = global_values[:, 4:]
+
+    def get_global_inlet_averages(self, i):
+        """Return the average depth, stage, elevation, xmomentum and
+        ymomentum of inlet i (from the last update_global_values)
+        """
+
+        if self.inlet_areas[i] > 0.0:
+            return self.inlet_sums[i]/self.inlet_areas[i]
+        else:
+            return num.zeros(5)
+
     def __call__(self):
 
         timestep = self.domain.get_timestep()
 
-        Q, barrel_speed, outlet_depth = self.discharge_routine()
-
-        # Get attributes of Inflow inlet, all procs associated with inlet must call
-        if self.myid in self.inlet_procs[self.inflow_index]:
-            old_inflow_depth = self.inlets[self.inflow_index].get_global_average_depth()
-            old_inflow_stage = self.inlets[self.inflow_index].get_global_average_stage()
-            old_inflow_xmom = self.inlets[self.inflow_index].get_global_average_xmom()
-            old_inflow_ymom = self.inlets[self.inflow_index].get_global_average_ymom()
-            inflow_area = self.inlets[self.inflow_index].get_global_area()
+        # All communication for the enquiry points and the inlets in one reduction
+        self.update_global_values()
 
-        # Master proc of inflow inlet sends attributes to master proc of structure
-        if self.myid == self.master_proc:
-            if self.myid != self.inlet_master_proc[self.inflow_index]:
-                old_inflow_depth = pypar.receive(self.inlet_master_proc[self.inflow_index])
-                old_inflow_stage = pypar.receive(self.inlet_master_proc[self.inflow_index])
-                old_inflow_xmom = pypar.receive(self.inlet_master_proc[self.inflow_index])
-                old_inflow_ymom = pypar.receive(self.inlet_master_proc[self.inflow_index])
-                inflow_area = pypar.receive(self.inlet_master_proc[self.inflow_index])
-        elif self.myid == self.inlet_master_proc[self.inflow_index]:
-            pypar.send(old_inflow_depth, self.master_proc)
-            pypar.send(old_inflow_stage, self.master_proc)
-            pypar.send(old_inflow_xmom, self.master_proc)
-            pypar.send(old_inflow_ymom, self.master_proc)
-            pypar.send(inflow_area, self.master_proc)
+        Q, barrel_speed, outlet_depth = self.discharge_routine()
 
         # Implement the update of flow over a timestep by
         # using a semi-implict update. This ensures that
@@ -287,6 +343,22 @@ class Parallel_Structure_operator(anuga.Operator):
         
         # Master proc of structure only
         if self.myid == self.master_proc:
+            # Attributes of the inflow and outflow inlets. The outflow
+            # attributes are taken before the inflow inlet is updated,
+            # which assumes the inlets do not overlap
+            old_inflow_depth, old_inflow_stage, _, old_inflow_xmom, old_inflow_ymom = \
+                self.get_global_inlet_averages(self.inflow_index)
+            inflow_area = self.inlet_areas[self.inflow_index]
+
+            outflow_average_depth, _, _, outflow_average_xmom, outflow_average_ymom = \
+                self.get_global_inlet_averages(self.outflow_index)
+            outflow_area = self.inlet_areas[self.outflow_index]
+
+            if self.outflow_index == 0:
+                outflow_outward_culvert_vector = self.culvert_vector
+            else:
+                outflow_outward_culvert_vector = - self.culvert_vector
+
             if old_inflow_depth > 0.0 :
                 dt_Q_on_d = timestep*Q/old_inflow_depth
             else:
@@ -347,48 +419,6 @@ class Parallel_Structure_operator(anuga.Operator):
                 new_inflow_xmom = old_inflow_xmom*factor2
                 new_inflow_ymom = old_inflow_ymom*factor2
 
-        # Master proc of structure sends new inflow attributes to all inflow inlet processors
-
-        if self.myid == self.master_proc:
-            for i in self.inlet_procs[self.inflow_index]:
-                if i == self.master_proc: continue
-                pypar.send(new_inflow_depth, i)
-                pypar.send(new_inflow_xmom, i)
-                pypar.send(new_inflow_ymom, i)
-        elif self.myid in self.inlet_procs[self.inflow_index]:
-            new_inflow_depth = pypar.receive(self.master_proc)
-            new_inflow_xmom = pypar.receive(self.master_proc)
-            new_inflow_ymom = pypar.receive(self.master_proc)
-
-        # Inflow inlet procs sets new attributes
-        if self.myid in self.inlet_procs[self.inflow_index]:
-            self.inlets[self.inflow_index].set_depths(new_inflow_depth)
-            self.inlets[self.inflow_index].set_xmoms(new_inflow_xmom)
-            self.inlets[self.inflow_index].set_ymoms(new_inflow_ymom)
-
-        # Get outflow inlet attributes, all processors associated with outflow inlet must call
-        if self.myid in self.inlet_procs[self.outflow_index]:
-            outflow_area = self.inlets[self.outflow_index].get_global_area()
-            outflow_average_depth = self.inlets[self.outflow_index].get_global_average_depth()
-            outflow_outward_culvert_vector = self.inlets[self.outflow_index].outward_culvert_vector
-            outflow_average_xmom = self.inlets[self.outflow_index].get_global_average_xmom()
-            outflow_average_ymom = self.inlets[self.outflow_index].get_global_average_ymom()
-
-        # Master proc of outflow inlet sends attribute to master proc of structure
-        if self.myid == self.master_proc:
-            if self.myid != self.inlet_master_proc[self.outflow_index]:
-                outflow_area = pypar.receive(self.inlet_master_proc[self.outflow_index])
-                outflow_average_depth = pypar.receive(self.inlet_master_proc[self.outflow_index])
-                outflow_outward_culvert_vector = pypar.receive(self.inlet_master_proc[self.outflow_index])
-                outflow_average_xmom = pypar.receive(self.inlet_master_proc[self.outflow_index])
-                outflow_average_ymom = pypar.receive(self.inlet_master_proc[self.outflow_index])
-        elif self.myid == self.inlet_master_proc[self.outflow_index]:
-            pypar.send(outflow_area, self.master_proc)
-            pypar.send(outflow_average_depth, self.master_proc)
-            pypar.send(outflow_outward_culvert_vector, self.master_proc)
-            pypar.send(outflow_average_xmom, self.master_proc)
-            pypar.send(outflow_average_ymom, self.master_proc)
-
         # Master proc of structure computes new outflow attributes
         if self.myid == self.master_proc:
             loss = (old_inflow_depth - new_inflow_depth)*inflow_area
@@ -450,17 +480,20 @@ class Parallel_Structure_operator(anuga.Operator):
                 new_outflow_xmom = outflow_average_xmom + xmom_loss/outflow_area
                 new_outflow_ymom = outflow_average_ymom + ymom_loss/outflow_area
 
-            # master proc of structure sends outflow attributes to all outflow procs
-            for i in self.inlet_procs[self.outflow_index]:
-                if i == self.myid: continue
-                pypar.send(new_outflow_depth, i)
-                pypar.send(new_outflow_xmom, i)
-                pypar.send(new_outflow_ymom, i)
-        # outflow inlet procs receives new outflow attributes
-        elif self.myid in self.inlet_procs[self.outflow_index]:
-            new_outflow_depth = pypar.receive(self.master_proc)
-            new_outflow_xmom = pypar.receive(self.master_proc)
-            new_outflow_ymom = pypar.receive(self.master_proc)
+            new_values = (new_inflow_depth, new_inflow_xmom, new_inflow_ymom,
+                          new_outflow_depth, new_outflow_xmom, new_outflow_ymom)
+        else:
+            new_values = None
+
+        # Master proc of structure sends new inflow and outflow attributes to all procs
+        new_inflow_depth, new_inflow_xmom, new_inflow_ymom, \
+            new_outflow_depth, new_outflow_xmom, new_outflow_ymom = self.broadcast(new_values)
+
+        # Inflow inlet procs sets new attributes
+        if self.myid in self.inlet_procs[self.inflow_index]:
+            self.inlets[self.inflow_index].set_depths(new_inflow_depth)
+            self.inlets[self.inflow_index].set_xmoms(new_inflow_xmom)
+            self.inlets[self.inflow_index].set_ymoms(new_inflow_ymom)
 
         # outflow inlet procs sets new outflow attributes
         if self.myid in self.inlet_procs[self.outflow_index]:
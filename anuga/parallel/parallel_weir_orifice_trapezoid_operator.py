@@ -154,37 +154,12 @@ class Parallel_Weir_orifice_trapezoid_operator(Parallel_Structure_operator):
         Get info from inlets and then call sequential function
         """
 
-        from anuga.utilities import parallel_abstraction as pypar
-
         local_debug = False
 
-        #Send attributes of both enquiry points to the master proc
+        # Attributes of both enquiry points (see update_global_values)
         if self.myid == self.master_proc:
-
-            if self.myid == self.enquiry_proc[0]:
-                enq_total_energy0 = self.inlets[0].get_enquiry_total_energy()
-                enq_stage0 = self.inlets[0].get_enquiry_stage()
-            else:
-                enq_total_energy0 = pypar.receive(self.enquiry_proc[0])
-                enq_stage0 = pypar.receive(self.enquiry_proc[0])
-
-
-            if self.myid == self.enquiry_proc[1]:
-                enq_total_energy1 = self.inlets[1].get_enquiry_total_energy()
-                enq_stage1 = self.inlets[1].get_enquiry_stage()
-            else:
-                enq_total_energy1 = pypar.receive(self.enquiry_proc[1])
-                enq_stage1 = pypar.receive(self.enquiry_proc[1])
-
-        else:
-            if self.myid == self.enquiry_proc[0]:
-                pypar.send(self.inlets[0].get_enquiry_total_energy(), self.master_proc)
-                pypar.send(self.inlets[0].get_enquiry_stage(), self.master_proc)
-
-            if self.myid == self.enquiry_proc[1]:
-                pypar.send(self.inlets[1].get_enquiry_total_energy(), self.master_proc)
-                pypar.send(self.inlets[1].get_enquiry_stage(), self.master_proc)
-
+            enq_total_energy0, enq_stage0 = self.enquiry_values[0, :2]
+            enq_total_energy1, enq_stage1 = self.enquiry_values[1, :2]
 
         # Determine the direction of the flow
         if self.myid == self.master_proc:
@@ -225,53 +200,25 @@ class Parallel_Weir_orifice_trapezoid_operator(Parallel_Structure_operator):
                 #self.delta_total_energy = -self.delta_total_energy
                 self.delta_total_energy = -self.smooth_delta_total_energy
 
-                for i in self.procs:
-                    if i == self.master_proc: continue
-                    pypar.send(True, i)
+                reverse = True
             else:
                 self.delta_total_energy = self.smooth_delta_total_energy
-                for i in self.procs:
-                    if i == self.master_proc: continue
-                    pypar.send(False, i)
+                reverse = False
 
             #print "ZZZZ: Delta total energy = %f" %(self.delta_total_energy)
         else:
-            reverse = pypar.receive(self.master_proc)
-
-            if reverse:
-                self.inflow_index = 1
-                self.outflow_index = 0
-
-        # Get attribute from inflow enquiry point
-        if self.myid == self.master_proc:
+            reverse = None
 
-            if self.myid == self.enquiry_proc[self.inflow_index]:
-                    inflow_enq_depth = self.inlets[self.inflow_index].get_enquiry_depth()
-                    inflow_enq_specific_energy = self.inlets[self.inflow_index].get_enquiry_specific_energy()
-            else:
-                    inflow_enq_depth = pypar.receive(self.enquiry_proc[self.inflow_index])
-                    inflow_enq_specific_energy = pypar.receive(self.enquiry_proc[self.inflow_index])
-        else:
-            if self.myid == self.enquiry_proc[self.inflow_index]:
-                pypar.send(self.inlets[self.inflow_index].get_enquiry_depth(), self.master_proc)
-                pypar.send(self.inlets[self.inflow_index].get_enquiry_specific_energy(), self.master_proc)
+        # master proc sends the direction to all procs of the structure
+        if self.broadcast(reverse):
+            self.inflow_index = 1
+            self.outflow_index = 0
 
-        # Get attribute from outflow enquiry point
+        # Attributes of the inflow and outflow enquiry points
         if self.myid == self.master_proc:
-            
-            if self.myid == self.enquiry_proc[self.outflow_index]:
-                outflow_enq_depth = self.inlets[self.outflow_index].get_enquiry_depth()
-            else:
-                outflow_enq_depth = pypar.receive(self.enquiry_proc[self.outflow_index])
-
-            #print "ZZZZZ: outflow_enq_depth = %f" %(outflow_enq_depth)
-
-        else:
-            if self.myid == self.enquiry_proc[self.outflow_index]:
-                pypar.send(self.inlets[self.outflow_index].get_enquiry_depth(), self.master_proc)
-
-
-
+            inflow_enq_depth = self.enquiry_values[self.inflow_index, 2]
+            inflow_enq_specific_energy = self.enquiry_values[self.inflow_index, 3]
+            outflow_enq_depth = self.enquiry_values[self.outflow_index, 2]
 
         # Master proc computes return values
         if self.myid == self.master_proc:
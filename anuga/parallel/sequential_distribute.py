@@ -14,6 +14,9 @@ from anuga.parallel.distribute_mesh  import extract_submesh
 # Mesh partitioning using Metis
 from anuga.parallel.distribute_mesh import build_submesh
 from anuga.parallel.distribute_mesh import pmesh_divide_metis_with_map
+from anuga.parallel.distribute_mesh import get_ghost_layer_parameters
+from anuga.parallel.distribute_mesh import get_partition_weights
+from anuga.parallel.distribute_mesh import get_partition_imbalance
 
 from anuga.parallel.parallel_shallow_water import Parallel_domain
 
@@ -39,7 +42,7 @@ class Sequential_distribute(object):
         domain = self.domain
         verbose = self.verbose
         debug = self.debug
-        parameters = self.parameters
+        parameters = get_ghost_layer_parameters(domain, self.parameters)
 
         # FIXME: Dummy assignment (until boundaries are refactored to
         # be independent of domains until they are applied)
@@ -69,9 +72,19 @@ class Sequential_distribute(object):
         # Subdivide the mesh
         if verbose: print('sequential_distribute: Subdivide mesh')
 
+        weights, edge_weights = get_partition_weights(domain, parameters)
+
         new_nodes, new_triangles, new_boundary, triangles_per_proc, quantities, \
                s2p_map, p2s_map = \
-               pmesh_divide_metis_with_map(domain, numprocs)
+               pmesh_divide_metis_with_map(domain, numprocs, weights, edge_weights)
+
+        self.partition_loads, self.partition_imbalance = \
+               get_partition_imbalance(triangles_per_proc, weights, p2s_map)
+
+        if verbose:
+            print('sequential_distribute: triangles per proc = ', triangles_per_proc)
+            print('sequential_distribute: partition loads = ', self.partition_loads)
+            print('sequential_distribute: partition imbalance = %g' % self.partition_imbalance)
 
 
         # Build the mesh that should be assigned to each processor,
@@ -0,0 +1,130 @@
+"""Run sw_flow simulation (sequentially or in parallel) with one of
+   the optional parallel modes to support test_parallel_sw_flow_modes.py
+
+   python run_parallel_sw_flow_modes.py mode
+
+   where mode is one of standard, nonblocking, lagged, overlap, deep_halo,
+   rebalance, auto_rebalance, scatter, file
+"""
+
+# ------------------------
+# Import necessary modules
+# ------------------------
+import sys
+import numpy as num
+import anuga
+from anuga import rectangular_cross_domain
+from anuga import Reflective_boundary, Dirichlet_boundary
+from anuga import myid, distribute, barrier, numprocs, finalize
+
+
+#-----------------
+# Setup parameters
+#-----------------
+verbose = False
+
+mode = sys.argv[1] if len(sys.argv) > 1 else 'standard'
+
+#-------------------------------------
+# Setup function for initial condition
+#-------------------------------------
+def topography(x, y): 
+    return -x / 2    
+
+#------------------------------------------
+# Setup computational domain and quantities
+#------------------------------------------
+domain = rectangular_cross_domain(29, 29)
+domain.set_quantity('elevation', topography) # Use function for elevation
+domain.set_quantity('friction', 0.0)         # Constant friction 
+domain.set_quantity('stage', expression='elevation') # Dry initial stage
+domain.set_flow_algorithm('DE1')
+
+#------------------------
+# Setup domain parameters
+#------------------------
+domain.set_datadir('.')          # Set output dir
+
+# ----------------------------------------------
+# Decide if this is a sequential or parallel run
+# ----------------------------------------------
+if numprocs == 1:
+    # This is a sequential run
+    domain.set_name('sw_flow_modes_sequential')
+else:
+    # This is a parallel run
+    parameters = {'deep_halo': mode == 'deep_halo'}
+    if mode in ['scatter', 'file']:
+        parameters['distribute_method'] = mode
+        parameters['distribute_batch_size'] = 2
+    domain = distribute(domain, verbose=verbose, parameters=parameters)
+    domain.set_name('sw_flow_modes_' + mode)
+
+    if mode in ['nonblocking', 'lagged']:
+        domain.set_timestep_reduction(mode, interval=5, safety_factor=0.5)
+
+    if mode == 'overlap':
+        domain.set_overlap_ghost_exchange(True)
+
+    if mode == 'auto_rebalance':
+        domain.set_rebalancing(every=2, threshold=2.0)
+
+#---------------------------------------------------------------
+# Setup boundary conditions
+# This must currently happen *AFTER* domain has been distributed
+#---------------------------------------------------------------
+Br = Reflective_boundary(domain)         # Solid reflective wall
+Bd = Dirichlet_boundary([-0.2, 0., 0.])  # Constant boundary values
+
+# Associate boundary tags with boundary objects
+domain.set_boundary({'left': Br, 'right': Bd, 'top': Br, 'bottom': Br})
+        
+#---------------------------
+# Evolve system through time
+#---------------------------
+initial_volume = domain.get_water_volume()
+
+for t in domain.evolve(yieldstep=0.25, finaltime=1.0):
+    if myid == 0 and verbose: domain.print_timestepping_statistics()
+
+    if numprocs > 1 and mode == 'rebalance' and t == 0.5:
+        # Repartition as if processor 0 were twice as slow, output
+        # continues in sw_flow_modes_rebalance_1
+        weights = num.ones(domain.number_of_full_triangles)
+        if myid == 0:
+            weights[:] = 2.0
+        domain.rebalance(weights, verbose=verbose)
+
+    if numprocs > 1 and mode == 'auto_rebalance':
+        if t == 0.25:
+            # Processor 0 appears much slower than the others, so the
+            # measurement after this (second) yield triggers a rebalance
+            if myid == 0:
+                domain.compute_time += 10.0
+        elif t == 0.5:
+            # Output continues in sw_flow_modes_auto_rebalance_1
+            assert domain.number_of_rebalances == 1
+            domain.set_rebalancing(every=0)
+
+if numprocs > 1 and mode == 'auto_rebalance':
+    # Water is conserved across the rebalance, the boundary flux
+    # integral being carried over to the rebuilt domain
+    volume = domain.get_water_volume()
+    flux_integral = domain.get_boundary_flux_integral()
+    assert num.allclose(volume - initial_volume, flux_integral, rtol=1.0e-10, atol=1.0e-10), \
+        (volume - initial_volume, flux_integral)
+
+if numprocs > 1 and myid == 0 and verbose:
+    print(domain.get_communication_statistics())
+
+#-------------------------------------
+# Wrap up parallel matters if required
+#-------------------------------------
+domain.sww_merge(delete_old=True)
+
+if numprocs > 1 and mode == 'auto_rebalance' and myid == 0:
+    # Also merge the output from before the rebalance
+    from anuga.utilities.sww_merge import sww_merge_parallel
+    sww_merge_parallel('sw_flow_modes_auto_rebalance', numprocs, delete_old=True)
+
+finalize()
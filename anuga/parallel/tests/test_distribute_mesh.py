@@ -18,6 +18,11 @@ from anuga.parallel.distribute_mesh import (
     submesh_quantities,
 )
 from anuga.parallel.distribute_mesh import extract_submesh, rec_submesh, send_submesh
+from anuga.parallel.distribute_mesh import get_ghost_layer_parameters
+from anuga.parallel.distribute_mesh import get_partition_weights
+from anuga.parallel.distribute_mesh import get_partition_imbalance
+from anuga.parallel.distribute_mesh import pmesh_divide_metis_with_map
+from anuga.parallel.distribute_mesh import get_submesh_common, pack_submesh, unpack_submesh
 
 import numpy as num
 
@@ -2893,6 +2898,161 @@ class Test_Distribute_Mesh(unittest.TestCase):
 
 # -------------------------------------------------------------
 
+    def test_get_ghost_layer_parameters(self):
+        """
+        Test the ghost layer width used for deep halos
+        """
+
+        points, vertices, boundary = rectangular_cross(2, 2)
+        domain = Domain(points, vertices, boundary)
+
+        parameters = get_ghost_layer_parameters(domain)
+        assert parameters['ghost_layer_width'] == 2
+
+        parameters = get_ghost_layer_parameters(domain, {'ghost_layer_width': 3})
+        assert parameters['ghost_layer_width'] == 3
+
+        domain.set_timestepping_method('euler')
+        parameters = get_ghost_layer_parameters(domain, {'deep_halo': True})
+        assert parameters['ghost_layer_width'] == 2
+
+        domain.set_timestepping_method('rk2')
+        original = {'deep_halo': True}
+        parameters = get_ghost_layer_parameters(domain, original)
+        assert parameters['ghost_layer_width'] == 4
+        assert 'ghost_layer_width' not in original
+
+        domain.set_timestepping_method('rk3')
+        parameters = get_ghost_layer_parameters(domain, {'deep_halo': True})
+        assert parameters['ghost_layer_width'] == 6
+
+        parameters = get_ghost_layer_parameters(domain, {'deep_halo': True, 'ghost_layer_width': 8})
+        assert parameters['ghost_layer_width'] == 8
+
+        assert not domain.has_deep_ghost_layer()
+        domain.ghost_layer_width = 6
+        assert domain.has_deep_ghost_layer()
+        domain.set_timestepping_method('rk2')
+        assert domain.has_deep_ghost_layer()
+
+    def test_get_partition_weights(self):
+        """
+        Test the triangle and edge weights used to balance the partition
+        """
+
+        points, vertices, boundary = rectangular_cross(4, 4)
+        domain = Domain(points, vertices, boundary)
+        domain.set_quantity('elevation', lambda x, y: -x)
+        domain.set_quantity('stage', -0.5)
+        n = domain.number_of_triangles
+
+        weights, edge_weights = get_partition_weights(domain)
+        assert weights is None
+        assert edge_weights is None
+
+        weights, _ = get_partition_weights(domain, {'partition_weights': 'wet_dry',
+                                                    'partition_dry_weight': 0.1})
+        x = domain.centroid_coordinates[:, 0]
+        assert num.allclose(weights[x > 0.5], 1.0)
+        assert num.allclose(weights[x < 0.5], 0.1)
+
+        domain.set_quantity('friction', lambda x, y: x)
+        weights, _ = get_partition_weights(domain, {'partition_weights': 'friction'})
+        assert num.allclose(weights, domain.quantities['friction'].centroid_values)
+
+        weights, edge_weights = get_partition_weights(domain, {'partition_weights': num.arange(n),
+                                                               'partition_edge_weights': num.ones((n, 3))})
+        assert num.allclose(weights, num.arange(n))
+        assert edge_weights.shape == (n, 3)
+
+        try:
+            get_partition_weights(domain, {'partition_weights': num.ones(n+1)})
+        except AssertionError:
+            pass
+        else:
+            raise Exception('Wrong number of weights should raise an exception')
+
+    def test_pmesh_divide_metis_weighted(self):
+        """
+        Test a partition balanced by triangle weights
+        """
+
+        points, vertices, boundary = rectangular_cross(8, 8)
+        domain = Domain(points, vertices, boundary)
+        n = domain.number_of_triangles
+
+        # Triangles in the lower left quarter are 10 times as costly
+        x = domain.centroid_coordinates[:, 0]
+        y = domain.centroid_coordinates[:, 1]
+        weights = num.where((x < 0.5) & (y < 0.5), 10.0, 1.0)
+
+        nodes, triangles, boundary, triangles_per_proc, quantities, s2p, p2s = \
+            pmesh_divide_metis_with_map(domain, 2)
+        _, imbalance = get_partition_imbalance(triangles_per_proc, weights, p2s)
+
+        nodes, triangles, boundary, triangles_per_proc_w, quantities, s2p, p2s = \
+            pmesh_divide_metis_with_map(domain, 2, weights, num.ones((n, 3)))
+        loads, imbalance_w = get_partition_imbalance(triangles_per_proc_w, weights, p2s)
+
+        assert num.sum(triangles_per_proc_w) == n
+        assert num.allclose(num.sum(loads), num.sum(weights))
+        assert imbalance_w < imbalance
+        assert imbalance_w < 1.2
+
+        # Unweighted loads are the triangle counts
+        loads, _ = get_partition_imbalance(triangles_per_proc_w)
+        assert num.allclose(loads, triangles_per_proc_w)
+
+    def test_pack_submesh(self):
+        """
+        Test packing the local meshes into numpy buffers
+        """
+
+        from anuga.parallel.sequential_distribute import Sequential_distribute
+
+        points, vertices, boundary = rectangular_cross(4, 4)
+        domain = Domain(points, vertices, boundary)
+        domain.set_quantity('elevation', lambda x, y: x + 2*y)
+        domain.set_quantity('stage', 1.0)
+
+        partition = Sequential_distribute(domain)
+        partition.distribute(3)
+
+        common = get_submesh_common(partition)
+        assert 'ghost' in common[0]
+
+        for p in range(3):
+            submesh = partition.extract_submesh(p)
+            ibuf, fbuf = pack_submesh(submesh, common[0], common[1])
+
+            assert ibuf.dtype == num.int64
+            assert fbuf.dtype == float
+
+            unpacked = unpack_submesh(ibuf, fbuf, common, p)
+
+            kwargs, points, vertices, boundary, quantities = submesh[:5]
+            u_kwargs, u_points, u_vertices, u_boundary, u_quantities = unpacked[:5]
+
+            assert num.allclose(points, u_points)
+            assert num.all(vertices == u_vertices)
+            assert boundary == u_boundary
+            for name in quantities:
+                assert num.allclose(quantities[name], u_quantities[name])
+
+            for key in kwargs:
+                if key in ['full_send_dict', 'ghost_recv_dict']:
+                    assert sorted(kwargs[key]) == sorted(u_kwargs[key])
+                    for proc in kwargs[key]:
+                        assert num.all(kwargs[key][proc][0] == u_kwargs[key][proc][0])
+                        assert num.all(kwargs[key][proc][1] == u_kwargs[key][proc][1])
+                elif key in ['tri_l2g', 'node_l2g']:
+                    assert num.all(kwargs[key] == u_kwargs[key])
+                else:
+                    assert kwargs[key] == u_kwargs[key], key
+
+            assert unpacked[6:] == submesh[6:]
+
+
 if __name__ == "__main__":
     suite = unittest.TestLoader().loadTestsFromTestCase(Test_Distribute_Mesh)
     runner = unittest.TextTestRunner()
@@ -0,0 +1,150 @@
+"""
+Test the optional parallel modes (timestep reduction, overlapped
+ghost exchange, deep halo, rebalancing and the scatter and file
+distribute methods) against a sequential run
+"""
+
+# ------------------------
+# Import necessary modules
+# ------------------------
+import platform
+import unittest
+import numpy as num
+import os
+import glob
+import subprocess
+
+# Setup to skip test if mpi4py not available
+import sys
+try:
+    import mpi4py
+except ImportError:
+    pass
+
+import pytest
+
+verbose = False
+
+path = os.path.dirname(__file__)  # Get folder where this script lives
+run_filename = os.path.join(path, 'run_parallel_sw_flow_modes.py')
+
+# These must be the same as given in the run_file.
+sequential_sww_file = 'sw_flow_modes_sequential.sww'
+
+def parallel_sww_file(mode):
+    return 'sw_flow_modes_%s.sww' % mode
+
+
+def run(cmd):
+    if verbose:
+        print(cmd)
+
+    result = subprocess.run(cmd.split(), capture_output=True)
+    if result.returncode != 0:
+        print(result.stdout)
+        print(result.stderr)
+        raise Exception(result.stderr)
+
+
+@pytest.mark.skipif('mpi4py' not in sys.modules,
+                    reason="requires the mpi4py module")
+class Test_parallel_sw_flow_modes(unittest.TestCase):
+    def setUp(self):
+        # ----------------------
+        # First run sequentially
+        # ----------------------
+        run('python ' + run_filename)
+
+        # --------------------
+        # Calculate extra_options
+        # --------------------
+        extra_options = '--oversubscribe'
+        cmd = 'mpiexec -np 3 ' + extra_options + ' echo '
+
+        result = subprocess.run(cmd.split(), capture_output=True)
+        if result.returncode != 0:
+            extra_options = ' '
+
+        if platform.system() == 'Windows':
+            extra_options = ' '
+
+        self.extra_options = extra_options
+        self.modes = []
+
+    def tearDown(self):
+        os.remove(sequential_sww_file)
+        for mode in self.modes:
+            for filename in glob.glob('sw_flow_modes_%s*.sww' % mode):
+                os.remove(filename)
+
+    def run_parallel(self, mode):
+        run('mpiexec -np 3 ' + self.extra_options + ' python ' + run_filename + ' ' + mode)
+        self.modes.append(mode)
+
+    def test_identical_modes(self):
+        from anuga.file.sww import sww_files_are_equal
+
+        for mode in ['nonblocking', 'overlap', 'deep_halo', 'scatter', 'file']:
+            self.run_parallel(mode)
+            assert sww_files_are_equal(sequential_sww_file, parallel_sww_file(mode)), mode
+
+    def test_lagged_timestep(self):
+        import anuga.utilities.plot_utils as util
+
+        # The lagged timestep uses smaller timesteps so the results
+        # are not identical, but should be close
+        self.run_parallel('lagged')
+
+        sequential_c = util.get_centroids(util.get_output(sequential_sww_file))
+        lagged_c = util.get_centroids(util.get_output(parallel_sww_file('lagged')))
+
+        assert sequential_c.stage.shape == lagged_c.stage.shape
+        assert num.allclose(sequential_c.stage, lagged_c.stage, atol=1.0e-2)
+
+    def test_rebalance(self):
+        import anuga.utilities.plot_utils as util
+
+        # Sort by centroid so the comparison does not depend on the
+        # triangle order of the merged file
+        self.run_parallel('rebalance')
+
+        sequential_c = util.get_centroids(util.get_output(sequential_sww_file))
+        rebalance_c = util.get_centroids(util.get_output(parallel_sww_file('rebalance_1')))
+
+        assert sequential_c.stage.shape[1] == rebalance_c.stage.shape[1]
+
+        seq_order = num.lexsort((sequential_c.y, sequential_c.x))
+        reb_order = num.lexsort((rebalance_c.y, rebalance_c.x))
+
+        assert num.allclose(sequential_c.x[seq_order], rebalance_c.x[reb_order])
+        assert num.allclose(sequential_c.y[seq_order], rebalance_c.y[reb_order])
+        assert num.allclose(sequential_c.stage[-1, seq_order], rebalance_c.stage[-1, reb_order])
+
+    def test_automatic_rebalance(self):
+        import anuga.utilities.plot_utils as util
+
+        # set_rebalancing with an imbalance imposed at t = 0.25. The
+        # run checks the domain was rebalanced once and that water is
+        # conserved (volume change equals the boundary flux integral)
+        self.run_parallel('auto_rebalance')
+
+        sequential_c = util.get_centroids(util.get_output(sequential_sww_file))
+        before_c = util.get_centroids(util.get_output(parallel_sww_file('auto_rebalance')))
+        after_c = util.get_centroids(util.get_output(parallel_sww_file('auto_rebalance_1')))
+
+        # Output switched to a new file at the rebalance
+        assert num.allclose(before_c.time, [0.0, 0.25])
+        assert num.allclose(after_c.time, [0.5, 0.75, 1.0])
+
+        seq_order = num.lexsort((sequential_c.y, sequential_c.x))
+        before_order = num.lexsort((before_c.y, before_c.x))
+        after_order = num.lexsort((after_c.y, after_c.x))
+
+        assert num.allclose(sequential_c.stage[:2][:, seq_order], before_c.stage[:, before_order])
+        assert num.allclose(sequential_c.stage[2:][:, seq_order], after_c.stage[:, after_order])
+
+
+if __name__ == "__main__":
+    runner = unittest.TextTestRunner()
+    suite = unittest.TestLoader().loadTestsFromTestCase(Test_parallel_sw_flow_modes)
+    runner.run(suite)
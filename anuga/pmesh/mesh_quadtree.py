@@ -125,6 +125,44 @@ class MeshQuadtree(Cell):
 
         return element_found, sigma[0], sigma[1], sigma[2], index
 
+    def locate_points(self, points, point_ids=None):
+        """
+        Find the triangles (elements) that a collection of points are in.
+
+        Vectorised version of search_fast, the points are searched for in
+        compiled code (using OpenMP threads).
+
+        Inputs:
+            points:    N x 2 array of points
+            point_ids: Indices of the points to locate (default all)
+
+        Return:
+            tri_ids, sigmas
+
+            where
+            tri_ids: Index of the triangle containing each point, -1 if
+                     no triangle was found
+            sigmas: len(tri_ids) x 3 array of the interpolation weights
+                    of the triangle vertices (-1 if not found)
+        """
+
+        if not hasattr(self, 'root'):
+            self.add_quad_tree()
+
+        points = num.ascontiguousarray(ensure_numeric(points, float))
+
+        if point_ids is None:
+            point_ids = num.arange(points.shape[0], dtype=num.int64)
+        else:
+            point_ids = num.ascontiguousarray(point_ids, dtype=num.int64)
+
+        tri_ids = num.zeros(len(point_ids), dtype=num.int64)
+        sigmas = num.zeros((len(point_ids), 3), float)
+
+        fitsmooth.locate_points(self.root, points, point_ids, tri_ids, sigmas)
+
+        return tri_ids, sigmas
+
     # PADARN NOTE: Only here to pass unit tests - does nothing.
     def set_last_triangle(self):
         pass
@@ -81,6 +81,8 @@ class Reflective_boundary(Boundary):
         self.conserved_quantities = np.zeros(3, float)
 
 
+    segment_kernel = 'reflective'
+
     def __repr__(self):
         return 'Reflective_boundary'
 
@@ -378,7 +380,18 @@ class Transmissive_n_momentum_zero_t_momentum_set_stage_boundary(Boundary):
 
         return q
 
-    # TODO JLGV, needs openmp version
+    segment_kernel = 'transmissive_n_momentum_zero_t_momentum_set_stage'
+
+    def get_segment_values(self):
+
+        value = self.get_boundary_values()
+        try:
+            x = float(value)
+        except:
+            x = float(value[0])
+
+        return [x]
+
     def evaluate_segment(self, domain, segment_edges): 
         """Apply BC on the boundary edges defined by segment_edges
 
@@ -507,6 +520,7 @@ class Time_stage_zero_momentum_boundary(Boundary):
 
 
         self.f = function
+        self.function = function
         self.domain = domain
 
     def __repr__(self):
@@ -517,6 +531,11 @@ class Time_stage_zero_momentum_boundary(Boundary):
 
         return self.get_boundary_values()
 
+    segment_kernel = 'time_stage_zero_momentum'
+
+    def get_segment_values(self):
+
+        return [float(self.get_boundary_values())]
 
     def evaluate_segment(self, domain, segment_edges):
 
@@ -659,6 +678,18 @@ class Characteristic_stage_boundary(Boundary):
         return q
 
 
+    segment_kernel = 'characteristic_stage'
+
+    def get_segment_values(self):
+
+        value = self.function(self.domain.get_time())
+        try:
+            w_outside = float(value)
+        except:
+            w_outside = float(value[0])
+
+        return [w_outside]
+
     def evaluate_segment(self, domain, segment_edges):
         """Apply BC on the boundary edges defined by
         segment_edges
@@ -1144,6 +1175,18 @@ class Flather_external_stage_zero_velocity_boundary(Boundary):
         return q
 
     
+    segment_kernel = 'flather_external_stage_zero_velocity'
+
+    def get_segment_values(self):
+
+        value = self.function(self.domain.get_time())
+        try:
+            stage_outside = float(value)
+        except:
+            stage_outside = float(value[0])
+
+        return [stage_outside]
+
     def evaluate_segment(self, domain, segment_edges): 
         """Applied in vectorized form for speed. Gareth Davies 14/07/2016
         """
@@ -14,24 +14,53 @@ read in the last stored domain. Do that via
 
 domain = load_last_checkpoint_file(domain_name, checkpoint_dir)
 
+
+Alternatively use the restart format via
+
+domain.set_checkpointing(checkpoint_format='restart', ...)
+
+where only the state of the evolving domain is stored (centroid values, time,
+and the state operators and boundaries provide via get_restart_state) as .npy files with a small json manifest. As the
+domain itself is not stored, restart by setting up the domain as usual and
+then read the last restart files into it via
+
+domain = load_checkpoint_file(domain_name, checkpoint_dir, domain=domain)
+
 """
 
 from anuga import send, receive, myid, numprocs, barrier
 from time import time as walltime
 import os
+import json
+import zlib
+import threading
+import numpy as num
 
+restart_format_version = 1
 
-def load_checkpoint_file(domain_name = 'domain', checkpoint_dir = '.', time = None):
+
+def load_checkpoint_file(domain_name = 'domain', checkpoint_dir = '.', time = None,
+                         domain = None):
+    """Read the last (or specified by time) checkpoint available on all
+    processors.
+
+    If domain is None the pickled domain is read and returned. Otherwise
+    the restart files are read into domain which is then returned.
+    """
 
     from os.path import join
 
     if numprocs > 1:
         domain_name = domain_name+'_P{}_{}'.format(numprocs,myid)
 
+    if domain is None:
+        extension = '.pickle'
+    else:
+        extension = '.restart'
 
     if time is None:
         # will pull out the last available time
-        times = _get_checkpoint_times(domain_name, checkpoint_dir)
+        times = _get_checkpoint_times(domain_name, checkpoint_dir, extension)
 
         times = list(times)
         times.sort()
@@ -43,15 +72,18 @@ def load_checkpoint_file(domain_name = 'domain', checkpoint_dir = '.', time = No
 
     for time in reversed(times):
 
-        pickle_name = join(checkpoint_dir,domain_name)+'_'+str(time)+'.pickle'
-        #print pickle_name
+        checkpoint_name = join(checkpoint_dir,domain_name)+'_'+str(time)+extension
+        #print checkpoint_name
 
         try:
-            try:
-                import dill as pickle
-            except:
-                import pickle
-            domain = pickle.load(open(pickle_name, 'rb'))
+            if extension == '.pickle':
+                try:
+                    import dill as pickle
+                except:
+                    import pickle
+                domain = pickle.load(open(checkpoint_name, 'rb'))
+            else:
+                load_restart_file(domain, checkpoint_name)
             success = True
         except:
             success = False
@@ -82,25 +114,27 @@ def load_checkpoint_file(domain_name = 'domain', checkpoint_dir = '.', time = No
     return domain
 
 
-def _get_checkpoint_times(domain_name, checkpoint_dir):
+def _get_local_checkpoint_times(domain_name, checkpoint_dir, extension='.pickle'):
 
-    import os
     times = set()
 
-    for (path, directory, filenames) in os.walk(checkpoint_dir):
-        #print filenames
-        #print directory
+    for filename in os.listdir(checkpoint_dir):
+        filebase, ext = os.path.splitext(filename)
+        if ext != extension:
+            continue
+        filebase = filebase.rpartition("_")
+        time = filebase[-1]
+        domain_name_base = filebase[0]
+        if domain_name_base == domain_name :
+            #print domain_name_base, time
+            times.add(float(time))
 
-        if len(filenames) == 0:
-            return None
-        else:
-            for filename in filenames:
-                filebase = os.path.splitext(filename)[0].rpartition("_")
-                time = filebase[-1]
-                domain_name_base = filebase[0]
-                if domain_name_base == domain_name :
-                    #print domain_name_base, time
-                    times.add(float(time))
+    return times
+
+
+def _get_checkpoint_times(domain_name, checkpoint_dir, extension='.pickle'):
+
+    times = _get_local_checkpoint_times(domain_name, checkpoint_dir, extension)
 
 
     #times.sort()
@@ -119,3 +153,284 @@ def _get_checkpoint_times(domain_name, checkpoint_dir):
     #print combined
 
     return combined
+
+
+def save_restart_file(domain, restart_name):
+    """Store the state of the evolving domain in the directory restart_name.
+
+    Centroid values of the evolved quantities (and of elevation, friction
+    and height) are stored as .npy files, together with a json manifest
+    holding the model time, mesh identity and operator and boundary state.
+    """
+
+    manifest, arrays = get_restart_state(domain)
+    write_restart_state(restart_name, manifest, arrays)
+
+
+def get_restart_state(domain):
+    """Return the manifest and a copy of the arrays making up the restart
+    state of domain, as used by write_restart_state. Once this returns the
+    domain can continue to evolve while the state is written.
+    """
+
+    manifest = {}
+    manifest['format_version'] = restart_format_version
+    manifest['domain_name'] = domain.get_name()
+    manifest['numprocs'] = numprocs
+    manifest['myid'] = myid
+    manifest['mesh'] = _get_mesh_identity(domain)
+    manifest['starttime'] = domain.starttime
+    manifest['relative_time'] = domain.relative_time
+    manifest['yieldstep_counter'] = domain.yieldstep_counter
+
+    arrays = {}
+
+    names = _get_restart_quantity_names(domain)
+    manifest['quantities'] = names
+    for name in names:
+        arrays[name] = domain.quantities[name].centroid_values.copy()
+
+    # Elevation is continuous so also keep its vertex values
+    if 'elevation' in names:
+        arrays['elevation_vertex'] = domain.quantities['elevation'].vertex_values.copy()
+
+    manifest['operators'] = []
+    for operator in domain.fractional_step_operators:
+        manifest['operators'].append([operator.__class__.__name__,
+                                      _get_object_state(operator)])
+
+    manifest['boundaries'] = {}
+    for tag, B in domain.boundary_map.items():
+        if B is not None:
+            manifest['boundaries'][tag] = [B.__class__.__name__,
+                                           _get_object_state(B)]
+
+    # State of numpy global random number generator
+    kind, keys, pos, has_gauss, cached_gaussian = num.random.get_state()
+    arrays['random_keys'] = keys
+    manifest['random_state'] = [kind, int(pos), int(has_gauss),
+                                float(cached_gaussian)]
+
+    return manifest, arrays
+
+
+def write_restart_state(restart_name, manifest, arrays):
+    """Write restart state to the directory restart_name.
+
+    The files are written to a temporary directory which is then renamed,
+    so that restart_name is never left incomplete by a crash.
+    """
+
+    import shutil
+
+    tmp_name = restart_name + '.tmp'
+    if os.path.exists(tmp_name):
+        shutil.rmtree(tmp_name)
+    os.mkdir(tmp_name)
+
+    for name, values in arrays.items():
+        num.save(os.path.join(tmp_name, name + '.npy'), values)
+
+    with open(os.path.join(tmp_name, 'manifest.json'), 'w') as fid:
+        json.dump(manifest, fid, indent=1)
+
+    if os.path.exists(restart_name):
+        shutil.rmtree(restart_name)
+    os.rename(tmp_name, restart_name)
+
+
+def write_checkpoint_bytes(pickle_name, data):
+    """Write a pickled domain to pickle_name via a temporary file, so
+    that pickle_name is never left incomplete by a crash.
+    """
+
+    tmp_name = pickle_name + '.tmp'
+    with open(tmp_name, 'wb') as fid:
+        fid.write(data)
+        fid.flush()
+        os.fsync(fid.fileno())
+
+    os.replace(tmp_name, pickle_name)
+
+
+def delete_old_checkpoint_files(domain_name, checkpoint_dir, extension, keep):
+    """Delete all but the last keep checkpoint files of domain_name on this
+    processor.
+    """
+
+    import shutil
+
+    times = sorted(_get_local_checkpoint_times(domain_name, checkpoint_dir, extension))
+
+    for time in times[:max(len(times) - keep, 0)]:
+        checkpoint_name = os.path.join(checkpoint_dir, domain_name)+'_'+str(time)+extension
+        if os.path.isdir(checkpoint_name):
+            shutil.rmtree(checkpoint_name)
+        else:
+            os.remove(checkpoint_name)
+
+
+class Checkpoint_writer(object):
+    """Write checkpoint files in a background thread.
+
+    Only one checkpoint is written at a time, submitting another waits for
+    the previous one to finish. Errors in the writing thread are raised
+    on the next call to submit or wait.
+    """
+
+    def __init__(self):
+        self.thread = None
+        self.error = None
+
+    def submit(self, write):
+        """Run the function write in the background
+        """
+
+        self.wait()
+
+        def run():
+            try:
+                write()
+            except BaseException as e:
+                self.error = e
+
+        self.thread = threading.Thread(target=run, name='checkpoint_writer',
+                                       daemon=True)
+        self.thread.start()
+
+    def wait(self):
+        """Wait until the current checkpoint has been written
+        """
+
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+        if self.error is not None:
+            error = self.error
+            self.error = None
+            raise error
+
+    def __getstate__(self):
+        # Threads cannot be pickled, a restored writer is idle
+        return {'thread': None, 'error': None}
+
+
+def load_restart_file(domain, restart_name):
+    """Read the state of the evolving domain from the directory restart_name
+    as written by save_restart_file. The domain must have been set up on the
+    same mesh (and partition) as the domain which was stored.
+    """
+
+    with open(os.path.join(restart_name, 'manifest.json')) as fid:
+        manifest = json.load(fid)
+
+    msg = 'Restart file %s has format version %s, expected %s' \
+          % (restart_name, manifest['format_version'], restart_format_version)
+    assert manifest['format_version'] == restart_format_version, msg
+
+    msg = 'Restart file %s was not written from this mesh' % restart_name
+    assert manifest['mesh'] == _get_mesh_identity(domain), msg
+
+    msg = 'Restart file %s was written by processor %d of %d' \
+          % (restart_name, manifest['myid'], manifest['numprocs'])
+    assert manifest['myid'] == myid and manifest['numprocs'] == numprocs, msg
+
+    # Check operators before changing any state of domain
+    operators = domain.fractional_step_operators
+    msg = 'Operators of domain do not match those in restart file %s' % restart_name
+    assert len(operators) == len(manifest['operators']), msg
+    for operator, (name, state) in zip(operators, manifest['operators']):
+        assert operator.__class__.__name__ == name, msg
+
+    # Memory mapped reads avoid holding a second copy of the data
+    for name in manifest['quantities']:
+        values = num.load(os.path.join(restart_name, name + '.npy'), mmap_mode='r')
+        domain.quantities[name].centroid_values[:] = values
+
+    if 'elevation' in manifest['quantities']:
+        Q = domain.quantities['elevation']
+        values = num.load(os.path.join(restart_name, 'elevation_vertex.npy'), mmap_mode='r')
+        Q.vertex_values[:] = values
+        Q.interpolate_from_vertices_to_edges()
+
+    for operator, (name, state) in zip(operators, manifest['operators']):
+        _set_object_state(operator, state)
+
+    for tag, (name, state) in manifest['boundaries'].items():
+        B = domain.boundary_map.get(tag, None)
+        if B is not None and B.__class__.__name__ == name:
+            _set_object_state(B, state)
+
+    kind, pos, has_gauss, cached_gaussian = manifest['random_state']
+    keys = num.load(os.path.join(restart_name, 'random_keys.npy'))
+    num.random.set_state((kind, keys, pos, has_gauss, cached_gaussian))
+
+    domain.starttime = manifest['starttime']
+    domain.set_relative_time(manifest['relative_time'])
+    domain.yieldstep_counter = manifest['yieldstep_counter']
+
+    # Continue as if evolve had been called on this domain, appending
+    # to the existing sww file
+    domain.evolved_called = True
+    if domain.store:
+        from anuga.file.sww import SWW_file
+        from anuga.config import netcdf_mode_a
+        from anuga.utilities.file_utils import create_filename
+
+        sww_name = create_filename(domain.get_datadir(), domain.get_name(), 'sww')
+        if os.path.exists(sww_name):
+            domain.writer = SWW_file(domain, mode=netcdf_mode_a)
+        else:
+            domain.initialise_storage()
+
+    return domain
+
+
+def _get_restart_quantity_names(domain):
+
+    names = list(domain.evolved_quantities)
+    for name in ['elevation', 'friction', 'height']:
+        if name in domain.quantities and name not in names:
+            names.append(name)
+
+    return names
+
+
+def _get_mesh_identity(domain):
+    """Return a small description of the mesh, used to check that restart
+    files are read into the same mesh as they were written from.
+    """
+
+    coordinates = num.ascontiguousarray(domain.centroid_coordinates, dtype=float)
+    triangles = num.ascontiguousarray(domain.triangles, dtype=num.int64)
+
+    return {'number_of_triangles': int(domain.number_of_triangles),
+            'number_of_nodes': int(domain.number_of_nodes),
+            'centroid_checksum': zlib.crc32(coordinates.tobytes()),
+            'triangles_checksum': zlib.crc32(triangles.tobytes())}
+
+
+def _get_object_state(obj):
+    """Return the state of an operator or boundary object that changes
+    during a run (counters, accumulated values).
+
+    Objects opt in via a method get_restart_state returning a json
+    serialisable dictionary, others have no state. Settings are not
+    stored, they are those chosen by the script setting up the restarted
+    domain.
+    """
+
+    if hasattr(obj, 'get_restart_state'):
+        return obj.get_restart_state()
+
+    return {}
+
+
+def _set_object_state(obj, state):
+    """Restore the state returned by _get_object_state via the method
+    set_restart_state of obj
+    """
+
+    if hasattr(obj, 'set_restart_state'):
+        obj.set_restart_state(state)
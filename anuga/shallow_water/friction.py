@@ -21,7 +21,16 @@ from anuga.config import netcdf_mode_r, netcdf_mode_w, netcdf_mode_a
 
 def manning_friction_semi_implicit(domain):
     
-    if domain.multiprocessor_mode == 1:
+    if domain.multiprocessor_mode == 1 and domain.active_cells is not None:
+        # Only the active triangles (see Domain.set_use_active_cells)
+        if domain.use_sloped_mannings:
+            from .sw_domain_openmp_ext import manning_friction_sloped_semi_implicit_edge_based_active
+            manning_friction_sloped_semi_implicit_edge_based_active(domain, domain.active_cells)
+        else:
+            from .sw_domain_openmp_ext import manning_friction_flat_semi_implicit_active
+            manning_friction_flat_semi_implicit_active(domain, domain.active_cells)
+
+    elif domain.multiprocessor_mode == 1:
         if domain.use_sloped_mannings:
             # OpenMP version for sloped mannings
             from .sw_domain_openmp_ext import manning_friction_sloped_semi_implicit_edge_based
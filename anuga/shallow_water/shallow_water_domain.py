@@ -343,6 +343,8 @@ class Domain(Generic_Domain):
         self.set_store(True)
         self.set_store_centroids(True)
         self.set_store_vertices_uniquely(False)
+        self.set_sww_buffer_frames(0)
+        self.set_store_asynchronously(False)
         self.quantities_to_be_stored = {'elevation': 1,
                                         'friction':1,
                                         'stage': 2,
@@ -356,6 +358,38 @@ class Domain(Generic_Domain):
         self.checkpoint = False
         self.yieldstep_counter = 0
         self.checkpoint_step = 10
+        self.checkpoint_format = 'pickle'
+        self.keep_checkpoints = None
+        self.checkpoint_asynchronous = False
+        self.checkpoint_writer = None
+
+        #-------------------------------
+        # Overlap the ghost exchange with
+        # the extrapolation of interior
+        # triangles (parallel runs)
+        #-------------------------------
+        self.set_overlap_ghost_exchange(False)
+
+        #-------------------------------
+        # Restrict the per-step kernels
+        # to the wet triangles and a
+        # dry fringe
+        #-------------------------------
+        self.set_use_active_cells(False)
+
+        #-------------------------------
+        # Compute the rk2 step with the
+        # fused native stepping engine
+        #-------------------------------
+        self.set_use_fused_rk2_step(False)
+
+        #-------------------------------
+        # Native kernels used by
+        # update_boundary for the standard
+        # boundary conditions
+        #-------------------------------
+        from anuga.shallow_water.sw_domain_openmp_ext import BOUNDARY_KERNELS
+        self.segment_kernels = BOUNDARY_KERNELS
 
         #-------------------------------
         # Useful auxiliary quantity
@@ -397,11 +431,14 @@ class Domain(Generic_Domain):
 
         # Work arrays [avoid allocate statements in compute_fluxes or extrapolate_second_order]
         self.edge_flux_work=num.zeros(len(self.edge_coordinates[:,0])*3) # Advective fluxes
-        self.neigh_work=num.zeros(len(self.edge_coordinates[:,0])*3) # Advective fluxes
+        self.neigh_work=num.zeros(len(self.edge_coordinates[:,0])*3) # Advective fluxes (max edge speeds for DE_edge)
         self.pressuregrad_work=num.zeros(len(self.edge_coordinates[:,0])) # Gravity related terms
         self.x_centroid_work=num.zeros(len(self.edge_coordinates[:,0])//3)
         self.y_centroid_work=num.zeros(len(self.edge_coordinates[:,0])//3)
 
+        # One half edge per edge, for the DE_edge fluxes (see get_unique_edges)
+        self.unique_edges = None
+
         ############################################################################
         ## Local-timestepping information
         #
@@ -1124,7 +1161,64 @@ class Domain(Generic_Domain):
 
         return self.store_centroids
 
-    def set_checkpointing(self, checkpoint= True, checkpoint_dir = 'CHECKPOINTS', checkpoint_step=10, checkpoint_time = None):
+    def set_sww_buffer_frames(self, frames=0):
+        """Set number of output frames buffered in memory before being
+        written to the sww file.
+
+        If frames > 0 the sww file is kept open for the duration of evolve
+        and buffered frames are written in one go. They are also flushed
+        on checkpointing and at the end of evolve. If frames is 0 (default)
+        the sww file is opened and closed for each stored timestep.
+        """
+
+        frames = int(frames)
+        msg = 'Number of buffered sww frames must be non negative'
+        assert frames >= 0, msg
+
+        self.sww_buffer_frames = frames
+
+        if hasattr(self, 'writer'):
+            if frames == 0:
+                self.writer.close()
+            self.writer.buffer_frames = frames
+
+    def get_sww_buffer_frames(self):
+        """Get number of output frames buffered before being written
+        to the sww file.
+        """
+
+        return self.sww_buffer_frames
+
+    def set_store_asynchronously(self, flag=True, queue_depth=2):
+        """Set whether sww output is written by a background thread.
+
+        If flag is True, store_timestep copies the quantities to be stored
+        into one of queue_depth reusable buffers and returns, while a
+        separate thread gathers the vertex values and writes them to the
+        sww file. If all buffers are waiting to be written store_timestep
+        blocks. All output is written by the end of evolve.
+        """
+
+        queue_depth = int(queue_depth)
+        msg = 'queue_depth must be at least 1'
+        assert queue_depth >= 1, msg
+
+        self.store_asynchronously = flag
+        self.store_queue_depth = queue_depth
+
+        if hasattr(self, 'writer'):
+            self.writer.close()
+            self.writer.asynchronous = flag
+            self.writer.queue_depth = queue_depth
+
+    def get_store_asynchronously(self):
+        """Get whether sww output is written by a background thread.
+        """
+
+        return self.store_asynchronously
+
+    def set_checkpointing(self, checkpoint= True, checkpoint_dir = 'CHECKPOINTS', checkpoint_step=10, checkpoint_time = None,
+                          checkpoint_format = 'pickle', keep_checkpoints = None, asynchronous = False):
         """Set up checkpointing.
 
         @param checkpoint: Default = True. Set to False will turn off checkpointing
@@ -1132,9 +1226,27 @@ class Domain(Generic_Domain):
         @param checkpoint_step: Save checkpoint files after this many yieldsteps
         @param checkpoint_time: If set, over-rides checkpoint_step. save checkpoint files
         after this amount of walltime
+        @param checkpoint_format: 'pickle' stores the whole domain, 'restart' only stores
+        the evolving state as arrays (see anuga.shallow_water.checkpoint)
+        @param keep_checkpoints: If set, only keep this many of the latest committed
+        checkpoint files on each processor. Default None keeps all.
+        @param asynchronous: If True, a copy of the state is written to file in a
+        background thread while evolve continues
         """
 
+        msg = "checkpoint_format must be either 'pickle' or 'restart'"
+        assert checkpoint_format in ['pickle', 'restart'], msg
 
+        msg = 'keep_checkpoints must be None or at least 1'
+        assert keep_checkpoints is None or keep_checkpoints >= 1, msg
+
+        self.checkpoint_format = checkpoint_format
+        self.keep_checkpoints = keep_checkpoints
+        self.checkpoint_asynchronous = asynchronous
+
+        if asynchronous and self.checkpoint_writer is None:
+            from anuga.shallow_water.checkpoint import Checkpoint_writer
+            self.checkpoint_writer = Checkpoint_writer()
 
         if checkpoint:
 
@@ -1183,8 +1295,10 @@ class Domain(Generic_Domain):
            wb_3
            tsunami
            DE
+           DE_edge  (DE fluxes, computed once per edge rather than
+                     from both sides of each edge)
         """
-        compute_fluxes_methods = ['original', 'wb_1', 'wb_2', 'wb_3', 'tsunami', 'DE']
+        compute_fluxes_methods = ['original', 'wb_1', 'wb_2', 'wb_3', 'tsunami', 'DE', 'DE_edge']
 
         if flag in compute_fluxes_methods:
             self.compute_fluxes_method = flag
@@ -1213,8 +1327,23 @@ class Domain(Generic_Domain):
         if(self.max_flux_update_frequency != 1):
             if self.timestepping_method != 'euler':
                 raise Exception('Local extrapolation and flux updating only supported with euler timestepping')
-            if self.compute_fluxes_method != 'DE':
+            if self.compute_fluxes_method not in ['DE', 'DE_edge']:
                 raise Exception('Local extrapolation and flux updating only supported for discontinuous flow algorithms')
+            if self.numproc > 1:
+                raise Exception('Local extrapolation and flux updating only supported for sequential domains')
+            if self.use_active_cells:
+                raise Exception('Local extrapolation and flux updating can not be used with active cells')
+
+        # Start a new cycle with all the fluxes computed
+        N = self.number_of_elements
+        self.flux_update_step = 0
+        self.flux_update_timestep = None
+        self.flux_update_accumulator = num.zeros(3*N)
+        self.flux_update_elapsed = num.zeros(N)
+        self.flux_update_edges = num.zeros(3*N, dtype=num.int64)
+        self.flux_update_frequency[:] = 1
+        self.update_next_flux[:] = 1
+        self.update_extrapolation[:] = 1
 
 
     def get_compute_fluxes_method(self):
@@ -1686,7 +1815,7 @@ class Domain(Generic_Domain):
 
         from anuga import numprocs
 
-        if not self.compute_fluxes_method=='DE':
+        if self.compute_fluxes_method not in ['DE', 'DE_edge']:
             msg='Boundary flux integral only supported for DE fluxes '+\
                 '(because computation of boundary_flux_sum is only implemented there)'
             raise Exception(msg)
@@ -1868,11 +1997,40 @@ class Domain(Generic_Domain):
             raise Exception('Not implemented')
 
         timestep = self.evolve_max_timestep
-        self.flux_timestep = compute_fluxes_ext_central(self, timestep)
+
+        if self.multiprocessor_mode == 1 and self.active_cells is not None:
+            if self.compute_fluxes_method == 'DE_edge':
+                from .sw_domain_openmp_ext import compute_fluxes_ext_central_edge_based_active
+                self.flux_timestep = compute_fluxes_ext_central_edge_based_active(self, timestep,
+                                                                                  self.active_edges,
+                                                                                  self.active_cells)
+            else:
+                from .sw_domain_openmp_ext import compute_fluxes_ext_central_active
+                self.flux_timestep = compute_fluxes_ext_central_active(self, timestep, self.active_cells)
+        elif self.multiprocessor_mode == 1 and self.compute_fluxes_method == 'DE_edge':
+            from .sw_domain_openmp_ext import compute_fluxes_ext_central_edge_based
+            self.flux_timestep = compute_fluxes_ext_central_edge_based(self, timestep,
+                                                                       self.get_unique_edges())
+        else:
+            self.flux_timestep = compute_fluxes_ext_central(self, timestep)
 
         # nvtxRangePop()
 
         
+    def get_unique_edges(self):
+        """Return the ids 3*k+i of one half edge (triangle k, edge i) for
+        each edge of the mesh, the one with k < neighbour or on the boundary.
+
+        Used by the DE_edge compute_fluxes_method.
+        """
+
+        if self.unique_edges is None:
+            k = num.arange(self.number_of_elements)[:, None]
+            neighbours = self.neighbours
+            self.unique_edges = num.flatnonzero((neighbours < 0) | (k < neighbours)).astype(num.int64)
+
+        return self.unique_edges
+
     def distribute_to_vertices_and_edges(self):
         """ extrapolate centroid values to vertices and edges"""
 
@@ -1894,7 +2052,53 @@ class Domain(Generic_Domain):
             raise Exception('Not implemented')
 
         nvtxRangePush('extrapolate_second_order_edge_sw')
-        extrapolate_second_order_edge_sw(self)
+        if self.multiprocessor_mode == 1 and self.active_cells is not None:
+            from .sw_domain_openmp_ext import extrapolate_second_order_edge_sw_active
+            extrapolate_second_order_edge_sw_active(self, self.active_cells)
+        else:
+            extrapolate_second_order_edge_sw(self)
+        nvtxRangePop()
+
+    def update_ghosts_and_distribute(self):
+        """Update ghost cells and extrapolate centroid values to vertices and edges.
+
+        Same result as update_ghosts followed by distribute_to_vertices_and_edges.
+        If overlap_ghost_exchange is set, the interior triangles are extrapolated
+        while the ghost exchange is in progress and the triangles next to the
+        ghost cells once it has completed.
+        """
+
+        if not self.overlap_ghost_exchange or self.multiprocessor_mode != 1 \
+                or self.active_cells is not None:
+            self.update_ghosts()
+            self.distribute_to_vertices_and_edges()
+            return
+
+        from .sw_domain_openmp_ext import update_centroid_values_subset
+        from .sw_domain_openmp_ext import extrapolate_second_order_edge_sw_subset
+        from .sw_domain_openmp_ext import finish_extrapolate_second_order_edge_sw
+
+        interior_ids, halo_ids, full_ids, ghost_ids = self.get_halo_partition()
+
+        # Protection only depends on the triangle itself, so the full cells
+        # can be protected before they are sent
+        nvtxRangePush('protect against negative heights')
+        self.protect_against_infinitesimal_and_negative_heights()
+        nvtxRangePop()
+
+        self.start_ghost_exchange()
+
+        nvtxRangePush('extrapolate interior')
+        update_centroid_values_subset(self, full_ids)
+        extrapolate_second_order_edge_sw_subset(self, interior_ids)
+        nvtxRangePop()
+
+        self.finish_ghost_exchange()
+
+        nvtxRangePush('extrapolate halo')
+        update_centroid_values_subset(self, ghost_ids)
+        extrapolate_second_order_edge_sw_subset(self, halo_ids)
+        finish_extrapolate_second_order_edge_sw(self)
         nvtxRangePop()
 
     def distribute_to_edges(self):
@@ -2056,7 +2260,11 @@ class Domain(Generic_Domain):
             raise Exception('Not implemented')
 
 
-        mass_error = protect_new(self)
+        if self.multiprocessor_mode == 1 and self.active_cells is not None:
+            from .sw_domain_openmp_ext import protect_new_active
+            mass_error = protect_new_active(self, self.active_cells)
+        else:
+            mass_error = protect_new(self)
         # nvtxRangePop()
 
         if mass_error > 0.0 and self.verbose :
@@ -2165,7 +2373,12 @@ class Domain(Generic_Domain):
         assert self.get_using_discontinuous_elevation()
 
         # Update height based on discontinuous elevation
-        if self.multiprocessor_mode == 1:
+        if self.multiprocessor_mode == 1 and self.active_cells is not None:
+
+            from .sw_domain_openmp_ext import update_conserved_quantities_active
+            num_negative_ids = update_conserved_quantities_active(self, timestep, self.active_cells)
+
+        elif self.multiprocessor_mode == 1:
             
             from .sw_domain_openmp_ext import update_conserved_quantities
             num_negative_ids = update_conserved_quantities(self, timestep)
@@ -2369,6 +2582,10 @@ class Domain(Generic_Domain):
         msg = 'Attribute self.beta_w must be in the interval [0, 2]'
         assert 0 <= self.beta_w <= 2.0, msg
 
+        # Arrays may have been reallocated since the last evolve, the
+        # native domain is rebuilt by the first kernel call
+        self.invalidate_native_domain()
+
         # Initial update of vertex and edge values before any STORAGE
         # and or visualisation.
         # This is done again in the initialisation of the Generic_Domain
@@ -2385,48 +2602,60 @@ class Domain(Generic_Domain):
         nvtxRangePush('_evolve_base')
 
         # Call basic machinery from parent class
-        for t in self._evolve_base(yieldstep=yieldstep,
-                                   finaltime=finaltime, duration=duration,
-                                   skip_initial_step=skip_initial_step):
+        try:
+            for t in self._evolve_base(yieldstep=yieldstep,
+                                       finaltime=finaltime, duration=duration,
+                                       skip_initial_step=skip_initial_step):
 
 
-            walltime = time.time()
+                walltime = time.time()
 
-            #print t , self.get_time()
-            # Store model data, e.g. for subsequent visualisation
-            if self.store:
-                if self.yieldstep_counter%self.output_frequency == 0:
-                    self.store_timestep()
+                #print t , self.get_time()
+                # Store model data, e.g. for subsequent visualisation
+                if self.store:
+                    if self.yieldstep_counter%self.output_frequency == 0:
+                        self.store_timestep()
 
-            if self.checkpoint:
-                save_checkpoint=False
-                if self.checkpoint_step == 0:
-                    if rank() == 0:
-                        if walltime - self.walltime_prev > self.checkpoint_time:
+                if self.checkpoint:
+                    save_checkpoint=False
+                    if self.checkpoint_step == 0:
+                        if rank() == 0:
+                            if walltime - self.walltime_prev > self.checkpoint_time:
 
-                            save_checkpoint = True
-                        for cpu in range(size()):
-                            if cpu != rank():
-                                send(save_checkpoint, cpu)
-                    else:
-                        save_checkpoint = receive(0)
+                                save_checkpoint = True
+                            for cpu in range(size()):
+                                if cpu != rank():
+                                    send(save_checkpoint, cpu)
+                        else:
+                            save_checkpoint = receive(0)
 
-                elif self.yieldstep_counter%self.checkpoint_step == 0:
-                        save_checkpoint = True
+                    elif self.yieldstep_counter%self.checkpoint_step == 0:
+                            save_checkpoint = True
 
-                if save_checkpoint:
-                    pickle_name = os.path.join(self.checkpoint_dir,self.get_name())+'_'+str(self.get_time())+'.pickle'
-                    pickle.dump(self, open(pickle_name, 'wb'))
+                    if save_checkpoint:
+                        # The previous checkpoint is committed once it has
+                        # been written on all processors, only then can
+                        # older ones be deleted
+                        self.wait_for_checkpoint()
+                        barrier()
+                        self.delete_old_checkpoints()
 
-                    barrier()
-                    self.walltime_prev = time.time()
+                        self.store_checkpoint()
+                        self.walltime_prev = time.time()
 
-                    #print 'Stored Checkpoint File '+pickle_name
+                # Pass control on to outer loop for more specific actions
+                yield(t)
 
-            # Pass control on to outer loop for more specific actions
-            yield(t)
+                self.yieldstep_counter += 1
+        finally:
+            # Write out buffered frames and release sww file
+            self.close_storage()
+            self.wait_for_checkpoint()
 
-            self.yieldstep_counter += 1
+        # Commit last checkpoint
+        if self.checkpoint:
+            barrier()
+            self.delete_old_checkpoints()
 
         #nvtx marker
         nvtxRangePop()
@@ -2460,6 +2689,79 @@ class Domain(Generic_Domain):
         nvtxRangePop()
 
 
+    def store_checkpoint(self):
+        """Store checkpoint file for current time in checkpoint_dir.
+
+        Either the whole domain is pickled or restart files are written
+        depending on the checkpoint_format set in set_checkpointing.
+        """
+
+        # Make sure buffered output is on disk
+        self.flush_storage()
+
+        from anuga.shallow_water.checkpoint import get_restart_state, write_restart_state
+        from anuga.shallow_water.checkpoint import write_checkpoint_bytes
+
+        checkpoint_name = os.path.join(self.checkpoint_dir,self.get_name())+'_'+str(self.get_time())
+
+        # Take a copy of the state, so that it can be written while
+        # the domain continues to evolve
+        if self.checkpoint_format == 'restart':
+            manifest, arrays = get_restart_state(self)
+            def write():
+                write_restart_state(checkpoint_name+'.restart', manifest, arrays)
+        else:
+            data = pickle.dumps(self)
+            def write():
+                write_checkpoint_bytes(checkpoint_name+'.pickle', data)
+
+        if self.checkpoint_asynchronous:
+            self.checkpoint_writer.submit(write)
+        else:
+            write()
+
+
+    def wait_for_checkpoint(self):
+        """Wait until a checkpoint being written in the background is
+        complete on this processor.
+        """
+
+        if self.checkpoint_writer is not None:
+            self.checkpoint_writer.wait()
+
+
+    def delete_old_checkpoints(self):
+        """Delete all but the latest keep_checkpoints checkpoint files
+        of this processor (as set in set_checkpointing).
+        """
+
+        if self.keep_checkpoints is None:
+            return
+
+        from anuga.shallow_water.checkpoint import delete_old_checkpoint_files
+
+        delete_old_checkpoint_files(self.get_name(), self.checkpoint_dir,
+                                    '.'+self.checkpoint_format,
+                                    self.keep_checkpoints)
+
+
+    def flush_storage(self):
+        """Write any buffered output frames to the sww file.
+        """
+
+        if hasattr(self, 'writer'):
+            self.writer.flush()
+
+
+    def close_storage(self):
+        """Write any buffered output frames and close the sww file
+        if it has been kept open.
+        """
+
+        if hasattr(self, 'writer'):
+            self.writer.close()
+
+
     def sww_merge(self,  *args, **kwargs):
         """Dummy function for sequential algorithms where the sww produced is the final products.
 
@@ -2483,6 +2785,13 @@ class Domain(Generic_Domain):
         vertices and edges
         """
 
+        if self.max_flux_update_frequency != 1:
+            self.evolve_one_local_euler_step(yieldstep, finaltime)
+            return
+
+        if self.use_active_cells and self.multiprocessor_mode == 1:
+            self.update_active_cells()
+
         #nvtx marker
         nvtxRangePush('distribute_to_vertices_and_edges')
 
@@ -2520,14 +2829,6 @@ class Domain(Generic_Domain):
         #nvtx marker
         nvtxRangePop()
 
-        #nvtx marker
-        nvtxRangePush('compute_flux_update_frequency')
-        if self.max_flux_update_frequency != 1:
-            # Update flux_update_frequency using the new timestep
-            self.compute_flux_update_frequency()
-        #nvtx marker
-        nvtxRangePop()
-
         #nvtx marker
         nvtxRangePush('update_conserved_quantities')
         # Update conserved quantities
@@ -2535,6 +2836,74 @@ class Domain(Generic_Domain):
         #nvtx marker
         nvtxRangePop()
 
+        self.active_cells = None
+
+    def evolve_one_local_euler_step(self, yieldstep, finaltime):
+        """One Euler timestep with local timestepping
+        (see set_local_extrapolation_and_flux_updating)
+
+        Only the fluxes due this timestep are recomputed and only the
+        triangles next to them extrapolated. The flux integrals are
+        accumulated and a triangle is updated every flux_update_frequency
+        timesteps of its edges, all the triangles are updated at the end
+        of a cycle of max_flux_update_frequency timesteps and before
+        yielding.
+        """
+
+        if self.multiprocessor_mode != 1:
+            raise Exception('Local extrapolation and flux updating only supported with multiprocessor mode 1')
+
+        from .sw_domain_openmp_ext import extrapolate_second_order_edge_sw_local
+        from .sw_domain_openmp_ext import get_flux_update_edges
+        from .sw_domain_openmp_ext import compute_fluxes_ext_central_edge_based
+        from .sw_domain_openmp_ext import update_conserved_quantities_local
+
+        # Extrapolate the triangles flagged in update_extrapolation
+        self.protect_against_infinitesimal_and_negative_heights()
+        extrapolate_second_order_edge_sw_local(self)
+
+        self.update_boundary()
+
+        # Fluxes across the edges flagged in update_next_flux, the last
+        # flux computed is used across the other edges
+        number_of_edges = get_flux_update_edges(self, self.flux_update_edges)
+        self.flux_timestep = compute_fluxes_ext_central_edge_based(self, self.evolve_max_timestep,
+                                                                   self.flux_update_edges[:number_of_edges])
+
+        # The timestep is not allowed to increase during a cycle
+        if self.flux_update_step == 0:
+            self.flux_update_timestep = self.flux_timestep
+        else:
+            self.flux_timestep = min(self.flux_timestep, self.flux_update_timestep)
+
+        self.compute_forcing_terms()
+
+        self.update_timestep(yieldstep, finaltime)
+
+        if self.flux_update_step == 0:
+            self.compute_flux_update_frequency()
+
+        # Bring all the triangles up to date before yielding
+        flush = self.relative_time + self.timestep >= self.relative_yieldtime
+        if self.relative_finaltime is not None:
+            flush = flush or self.relative_time + self.timestep >= self.relative_finaltime
+
+        num_negative_ids, restart = update_conserved_quantities_local(self, self.timestep,
+                                                                      self.flux_update_step, int(flush),
+                                                                      self.flux_update_accumulator,
+                                                                      self.flux_update_elapsed)
+
+        if restart:
+            self.flux_update_step = 0
+        else:
+            self.flux_update_step += 1
+
+        if num_negative_ids > 0:
+            import warnings
+            msg = f'{num_negative_ids} negative cells being set to zero depth, possible loss of conservation. \n' +\
+            'Consider using domain.report_water_volume_statistics() to check the extent of the problem'
+            warnings.warn(msg)
+
     def evolve_one_rk2_step(self, yieldstep, finaltime):
         """One 2nd order RK timestep
         Q^{n+1} = 0.5 Q^n + 0.5 E(h)^2 Q^n
@@ -2543,6 +2912,15 @@ class Domain(Generic_Domain):
         vertices and edges
         """
 
+        if self.use_fused_rk2_step:
+            friction_method = self.get_fused_rk2_friction_method()
+            if friction_method is not None:
+                self.evolve_one_fused_rk2_step(yieldstep, finaltime, friction_method)
+                return
+
+        if self.use_active_cells and self.multiprocessor_mode == 1:
+            self.update_active_cells()
+
         # Save initial initial conserved quantities values
         self.backup_conserved_quantities()
 
@@ -2574,12 +2952,11 @@ class Domain(Generic_Domain):
         # Update time
         self.set_relative_time(self.get_relative_time() + self.timestep)
 
-        # Update ghosts
-        if self.ghost_layer_width < 4:
-            self.update_ghosts()
-
-        # Update vertex and edge values
-        self.distribute_to_vertices_and_edges()
+        # Update ghosts, vertex and edge values
+        if not self.has_deep_ghost_layer():
+            self.update_ghosts_and_distribute()
+        else:
+            self.distribute_to_vertices_and_edges()
 
         # Update boundary values
         self.update_boundary()
@@ -2608,6 +2985,67 @@ class Domain(Generic_Domain):
         # Combine steps
         self.saxpy_conserved_quantities(0.5, 0.5)
 
+        self.active_cells = None
+
+
+    def evolve_one_fused_rk2_step(self, yieldstep, finaltime, friction_method):
+        """One 2nd order RK timestep computed by the fused native stepping
+        engine, two native calls instead of the separate kernel calls
+        of evolve_one_rk2_step (see set_use_fused_rk2_step)
+        """
+
+        from .sw_domain_openmp_ext import evolve_one_rk2_stage
+
+        batch = self.boundary_segment_batch
+
+        #==========================================
+        # First euler step
+        #==========================================
+
+        self.update_boundary_segment_values(batch)
+
+        self.flux_timestep, mass_error, num_negative_ids = \
+            evolve_one_rk2_stage(self, 0, 0.0, friction_method,
+                                 batch['ids'], batch['vol_ids'], batch['edge_ids'],
+                                 batch['normals'], batch['segment_boundary'],
+                                 batch['boundary_kernel'], batch['boundary_values'])
+        self.report_fused_rk2_stage(mass_error, num_negative_ids)
+
+        # Update timestep to fit yieldstep and finaltime
+        self.update_timestep(yieldstep, finaltime)
+
+        # Update time
+        self.set_relative_time(self.get_relative_time() + self.timestep)
+
+        #=========================================
+        # Second Euler step using the same timestep
+        # and combine with the initial values
+        #=========================================
+
+        self.update_boundary_segment_values(batch)
+
+        self.flux_timestep, mass_error, num_negative_ids = \
+            evolve_one_rk2_stage(self, 1, self.timestep, friction_method,
+                                 batch['ids'], batch['vol_ids'], batch['edge_ids'],
+                                 batch['normals'], batch['segment_boundary'],
+                                 batch['boundary_kernel'], batch['boundary_values'])
+        self.report_fused_rk2_stage(mass_error, num_negative_ids)
+
+    def report_fused_rk2_stage(self, mass_error, num_negative_ids):
+        """Report the protection and negative cells of a fused rk2 stage
+        as protect_against_infinitesimal_and_negative_heights and
+        update_conserved_quantities do
+        """
+
+        if mass_error > 0.0 and self.verbose:
+            print('Cumulative mass protection: {0} m^3'.format(mass_error))
+
+        if num_negative_ids > 0:
+            import warnings
+            msg = f'{num_negative_ids} negative cells being set to zero depth, possible loss of conservation. \n' +\
+            'Consider using domain.report_water_volume_statistics() to check the extent of the problem'
+            warnings.warn(msg)
+
 
     def evolve_one_rk3_step(self, yieldstep, finaltime):
         """One 3rd order RK timestep
@@ -2618,6 +3056,9 @@ class Domain(Generic_Domain):
         vertices and edges
         """
 
+        if self.use_active_cells and self.multiprocessor_mode == 1:
+            self.update_active_cells()
+
         # Save initial initial conserved quantities values
         self.backup_conserved_quantities()
 
@@ -2651,11 +3092,11 @@ class Domain(Generic_Domain):
         # Update time
         self.set_relative_time(self.relative_time+ self.timestep)
 
-        # Update ghosts
-        self.update_ghosts()
-
-        # Update vertex and edge values
-        self.distribute_to_vertices_and_edges()
+        # Update ghosts, vertex and edge values
+        if not self.has_deep_ghost_layer():
+            self.update_ghosts_and_distribute()
+        else:
+            self.distribute_to_vertices_and_edges()
 
         # Update boundary values
         self.update_boundary()
@@ -2690,11 +3131,11 @@ class Domain(Generic_Domain):
         # Set substep time
         self.set_relative_time(initial_time + self.timestep * 0.5)
 
-        # Update ghosts
-        self.update_ghosts()
-
-        # Update vertex and edge values
-        self.distribute_to_vertices_and_edges()
+        # Update ghosts, vertex and edge values
+        if not self.has_deep_ghost_layer():
+            self.update_ghosts_and_distribute()
+        else:
+            self.distribute_to_vertices_and_edges()
 
         # Update boundary values
         self.update_boundary()
@@ -2727,6 +3168,19 @@ class Domain(Generic_Domain):
         # Set new time
         self.set_relative_time(initial_time + self.timestep)
 
+        self.active_cells = None
+
+
+    def evaluate_boundary_segments(self, batch):
+        """Evaluate the boundary values of a batch of boundary
+        segments (see get_boundary_segment_batch) with the native kernels
+        """
+
+        from anuga.shallow_water.sw_domain_openmp_ext import evaluate_boundary_segments
+
+        evaluate_boundary_segments(self, batch['ids'], batch['vol_ids'], batch['edge_ids'],
+                                   batch['normals'], batch['segment_boundary'],
+                                   batch['boundary_kernel'], batch['boundary_values'])
 
     def backup_conserved_quantities(self):
 
@@ -2745,8 +3199,12 @@ class Domain(Generic_Domain):
         if self.multiprocessor_mode == 1:
             if c is None:
                 c = 1.0
-            from anuga.shallow_water.sw_domain_openmp_ext import saxpy_conserved_quantities
-            saxpy_conserved_quantities(self, a, b, c)
+            if self.active_cells is not None:
+                from anuga.shallow_water.sw_domain_openmp_ext import saxpy_conserved_quantities_active
+                saxpy_conserved_quantities_active(self, a, b, c, self.active_cells)
+            else:
+                from anuga.shallow_water.sw_domain_openmp_ext import saxpy_conserved_quantities
+                saxpy_conserved_quantities(self, a, b, c)
         else:
             for name in self.conserved_quantities:
                 Q = self.quantities[name]
@@ -3037,7 +3495,7 @@ class Domain(Generic_Domain):
             raise Exception('Not implemented')
 
 
-        compute_flux_update_frequency(self, self.timestep)
+        compute_flux_update_frequency(self, self.flux_timestep)
 
         nvtxRangePop()
 
@@ -3050,7 +3508,7 @@ class Domain(Generic_Domain):
         """
         from anuga import myid
 
-        if(self.compute_fluxes_method != 'DE'):
+        if(self.compute_fluxes_method not in ['DE', 'DE_edge']):
             if(myid == 0):
                 print('Water_volume_statistics only supported for DE algorithm ')
             return
@@ -3162,6 +3620,7 @@ class Domain(Generic_Domain):
             raise ValueError('Invalid multiprocessor mode. Must be one of [1,2] (openmp, cupy)')
 
         self.multiprocessor_mode = multiprocessor_mode
+        self.invalidate_native_domain()
 
         if self.multiprocessor_mode == 2:
             self.set_gpu_interface()
@@ -3175,6 +3634,170 @@ class Domain(Generic_Domain):
         """
         return self.multiprocessor_mode 
 
+    def set_overlap_ghost_exchange(self, flag=True):
+        """Set whether the ghost exchange is overlapped with computation.
+
+        If flag is True the update of the ghost cells within a timestep is
+        split into start_ghost_exchange and finish_ghost_exchange, and the
+        interior triangles (see get_halo_partition) are extrapolated while
+        the ghost data is in transit. Only used with multiprocessor mode 1.
+        """
+
+        self.overlap_ghost_exchange = flag
+
+    def get_overlap_ghost_exchange(self):
+        """Get whether the ghost exchange is overlapped with computation.
+        """
+
+        return self.overlap_ghost_exchange
+
+    def set_use_active_cells(self, flag=True):
+        """Set whether the per-step kernels only work on the active triangles.
+
+        The active triangles are the wet triangles, the triangles on the
+        boundary and a fringe of dry triangles around them, wide enough that
+        the result is the same as updating all the triangles (see
+        update_active_cells). The list is recomputed at the start of each
+        timestep, so operators can wet any triangle. Only used with
+        multiprocessor mode 1, and can not be used with local extrapolation
+        and flux updating.
+
+        Forcing terms would only be applied to the active triangles, so
+        Manning friction must be the only forcing term (use operators, e.g.
+        Rate_operator, to add water to dry regions).
+        """
+
+        if flag:
+            if self.max_flux_update_frequency != 1:
+                raise Exception('Active cells can not be used with local extrapolation and flux updating')
+            self.check_active_cells_forcing_terms()
+
+        self.use_active_cells = flag
+
+        self.active_cells = None
+        self.active_edges = None
+
+        if flag:
+            N = self.number_of_elements
+            # Start with all triangles active, so the inactive ones are
+            # set dry by the first update_active_cells
+            self.active_cell_flag = num.ones(N, dtype=num.int64)
+            self.active_cell_old_flag = num.zeros(N, dtype=num.int64)
+            self.active_cell_ids = num.zeros(N, dtype=num.int64)
+            self.active_edge_ids = num.zeros(3*N, dtype=num.int64)
+
+    def get_use_active_cells(self):
+        """Get whether the per-step kernels only work on the active triangles.
+        """
+
+        return self.use_active_cells
+
+    def check_active_cells_forcing_terms(self):
+        """Raise an exception if a forcing term other than Manning friction
+        is set, as forcing terms are not applied to the inactive triangles.
+        """
+
+        from .friction import manning_friction_semi_implicit
+
+        for forcing_term in self.forcing_terms:
+            if forcing_term is not manning_friction_semi_implicit:
+                msg = ('Active cells can not be used with the forcing term %s, '
+                       'use an operator instead (e.g. Rate_operator for rainfall)'
+                       % getattr(forcing_term, '__name__', type(forcing_term).__name__))
+                raise Exception(msg)
+
+    def update_active_cells(self):
+        """Recompute the active triangles (self.active_cells) and one half
+        edge per edge of the active triangles (self.active_edges).
+
+        Active triangles are wet, on the boundary or within
+        2*timestep_fluxcalls neighbours of such a triangle. The
+        wet region grows by at most two triangles per flux calculation so
+        the fluxes into the inactive triangles are zero for the whole
+        timestep. Triangles leaving the active set are made dry.
+        """
+
+        from .sw_domain_openmp_ext import update_active_cells
+
+        # Forcing terms may have been added after set_use_active_cells
+        self.check_active_cells_forcing_terms()
+
+        # Keep the flags of the last update to find the triangles
+        # leaving the active set
+        self.active_cell_flag, self.active_cell_old_flag = \
+            self.active_cell_old_flag, self.active_cell_flag
+
+        n, number_of_edges = update_active_cells(self,
+                                                 self.active_cell_flag,
+                                                 self.active_cell_old_flag,
+                                                 2*self.timestep_fluxcalls,
+                                                 self.active_cell_ids,
+                                                 self.active_edge_ids)
+
+        self.active_cells = self.active_cell_ids[:n]
+        self.active_edges = self.active_edge_ids[:number_of_edges]
+
+    def set_use_fused_rk2_step(self, flag=True):
+        """Set whether rk2 steps are computed by the fused native stepping
+        engine.
+
+        The engine computes each of the two stages of an rk2 step
+        (protection, extrapolation, boundary values, fluxes, friction,
+        update and the final combination) in one OpenMP parallel region,
+        with the same result as evolve_one_rk2_step. The timestep and the
+        time dependent boundary values are still set from python between
+        the stages.
+
+        Only used where the engine can replace the python step (see
+        get_fused_rk2_friction_method): multiprocessor mode 1, a single
+        processor, compute_fluxes_method 'DE', boundaries with native
+        kernels only, Manning friction as the only forcing term, and
+        neither active cells nor local timestepping. Otherwise the usual
+        rk2 step is taken. Operators are applied between steps as usual.
+        """
+
+        self.use_fused_rk2_step = flag
+
+    def get_use_fused_rk2_step(self):
+        """Get whether rk2 steps are computed by the fused native stepping
+        engine.
+        """
+
+        return self.use_fused_rk2_step
+
+    def get_fused_rk2_friction_method(self):
+        """Return the friction method code for the fused rk2 stepping
+        engine, or None if the engine cannot be used with the current
+        setup of the domain (see set_use_fused_rk2_step).
+        """
+
+        from .friction import manning_friction_semi_implicit
+        from .sw_domain_openmp_ext import FRICTION_METHODS
+
+        if self.multiprocessor_mode != 1 \
+                or self.use_active_cells \
+                or self.max_flux_update_frequency != 1 \
+                or self.compute_fluxes_method != 'DE' \
+                or self.number_of_full_triangles != self.number_of_elements:
+            return None
+
+        if self.boundary_segment_batch is None:
+            self.boundary_segment_batch = self.get_boundary_segment_batch()
+
+        if len(self.boundary_segment_batch['fallback_tags']) > 0:
+            return None
+
+        if len(self.forcing_terms) == 0:
+            return FRICTION_METHODS['none']
+
+        if self.forcing_terms != [manning_friction_semi_implicit]:
+            return None
+
+        if self.use_sloped_mannings:
+            return FRICTION_METHODS['sloped']
+        else:
+            return FRICTION_METHODS['flat']
+
     def set_omp_num_threads(self, omp_num_threads=None):
         """
         Set the number of OpenMP threads to use for parallel processing.
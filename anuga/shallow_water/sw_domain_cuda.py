@@ -1108,6 +1108,8 @@ class GPU_interface(object):
         domain.x_centroid_work = self.cpu_x_centroid_work
         domain.y_centroid_work = self.cpu_y_centroid_work
 
+        domain.invalidate_native_domain()
+
         return domain
 
 
@@ -450,12 +450,171 @@ void apply_weir_discharge_correction(const struct domain * __restrict D, const E
     }
 }
 
-double _openmp_compute_fluxes_central(const struct domain *__restrict D,
-                                      double timestep)
+// Count of flux calculations, used to flag which substep of the
+// timestepping method (rk2/rk3) the current flux calculation belongs to
+static anuga_int flux_call = 0;
+static anuga_int flux_timestep_fluxcalls = 1;
+static anuga_int flux_base_call = 1;
+
+// Start counting substeps from the first substep of a timestep
+void _openmp_reset_flux_substep_count(void)
+{
+  flux_call = 0;
+  flux_timestep_fluxcalls = 1;
+  flux_base_call = 1;
+}
+
+static anuga_int get_flux_substep_count(const struct domain *__restrict D)
+{
+  flux_call++; // Flag 'id' of flux calculation for this timestep
+
+  if (D->timestep_fluxcalls != flux_timestep_fluxcalls)
+  {
+    flux_timestep_fluxcalls = D->timestep_fluxcalls;
+    flux_base_call = flux_call;
+  }
+
+  return (flux_call - flux_base_call) % D->timestep_fluxcalls;
+}
+
+// Flux (multiplied by -edgelength), max speed and pressure flux
+// across edge E of triangle k
+static inline void compute_edge_flux_central(const struct domain *__restrict D,
+                                             const EdgeData *__restrict E,
+                                             const anuga_int k,
+                                             const anuga_int ncol_riverwall_hydraulic_properties,
+                                             const double epsilon, const double g,
+                                             const anuga_int low_froude,
+                                             double *__restrict edgeflux,
+                                             double *__restrict max_speed_local,
+                                             double *__restrict pressure_flux)
+{
+  if (E->h_left == 0.0 && E->h_right == 0.0)
+  {
+    // If both heights are zero, then no flux
+    edgeflux[0] = 0.0;
+    edgeflux[1] = 0.0;
+    edgeflux[2] = 0.0;
+    *max_speed_local = 0.0;
+    *pressure_flux = 0.0;
+  }
+  else
+  {
+    // Compute the fluxes using the central scheme
+    __flux_function_central((double *) E->ql, (double *) E->qr,
+                            E->h_left, E->h_right,
+                            E->hle, E->hre,
+                            E->normal_x, E->normal_y,
+                            epsilon, E->z_half, g,
+                            edgeflux, max_speed_local, pressure_flux,
+                            low_froude);
+  }
+
+  // Weir flux adjustment
+  if (E->is_riverwall) {
+    apply_weir_discharge_correction(D, E, k, ncol_riverwall_hydraulic_properties, g, edgeflux, max_speed_local);
+  }
+
+  // Multiply edgeflux by edgelength
+  for (anuga_int j = 0; j < 3; j++)
+  {
+    edgeflux[j] *= -1.0 * E->length;
+  }
+}
+
+// Flux calculation for triangle k. Sets the explicit updates of triangle k
+// and returns its timestep in *timestep_k (1.0e+100 if not limited) and its
+// contribution to the boundary flux integral in *boundary_flux_k
+static inline void compute_fluxes_central_k(const struct domain *__restrict D,
+                                            const anuga_int k,
+                                            const anuga_int substep_count,
+                                            const anuga_int ncol_riverwall_hydraulic_properties,
+                                            const double epsilon, const double g,
+                                            const anuga_int low_froude,
+                                            double *__restrict timestep_k,
+                                            double *__restrict boundary_flux_k)
+{
+  double edgeflux[3];
+  double pressure_flux;
+  double max_speed_local;
+  EdgeData edge_data;
+
+  double local_timestep = 1.0e+100;
+  double boundary_flux_sum_substep = 0.0;
+  double speed_max_last = 0.0;
+
+  // Set explicit_update to zero for all conserved_quantities.
+  // This assumes compute_fluxes called before forcing terms
+  D->stage_explicit_update[k] = 0.0;
+  D->xmom_explicit_update[k] = 0.0;
+  D->ymom_explicit_update[k] = 0.0;
+
+  // Loop through neighbours and compute edge flux for each
+  for (anuga_int i = 0; i < 3; i++)
+  {
+    get_edge_data_central_flux(D,k,i,&edge_data);
+
+    // Edge flux computation (triangle k, edge i)
+    compute_edge_flux_central(D, &edge_data, k, ncol_riverwall_hydraulic_properties,
+                              epsilon, g, low_froude,
+                              edgeflux, &max_speed_local, &pressure_flux);
+    // Update timestep based on edge i and possibly neighbour n
+    // NOTE: We should only change the timestep on the 'first substep'
+    // of the timestepping method [substep_count==0]
+    if (substep_count == 0 && D->tri_full_flag[k] == 1 && max_speed_local > epsilon)
+    {
+      // Compute the 'edge-timesteps' (useful for setting flux_update_frequency)
+      double edge_timestep = D->radii[k] * 1.0 / fmax(max_speed_local, epsilon);
+      // Update the timestep
+      // Apply CFL condition for triangles joining this edge (triangle k and triangle n)
+      // CFL for triangle k
+      local_timestep = fmin(local_timestep, edge_timestep);
+      speed_max_last = fmax(speed_max_last, max_speed_local);
+    }
+
+    D->stage_explicit_update[k] += edgeflux[0];
+    D->xmom_explicit_update[k] += edgeflux[1];
+    D->ymom_explicit_update[k] += edgeflux[2];
+    // If this cell is not a ghost, and the neighbour is a
+    // boundary condition OR a ghost cell, then add the flux to the
+    // boundary_flux_integral
+    if (((edge_data.n < 0) & (D->tri_full_flag[k] == 1)) | ((edge_data.n >= 0) && ((D->tri_full_flag[k] == 1) & (D->tri_full_flag[edge_data.n] == 0))))
+    {
+      // boundary_flux_sum is an array with length = timestep_fluxcalls
+      // For each sub-step, we put the boundary flux sum in.
+      boundary_flux_sum_substep += edgeflux[0];
+    }
+
+    // bedslope_work contains all gravity related terms
+    double pressuregrad_work = edge_data.length * (-g * 0.5 * (edge_data.h_left * edge_data.h_left - edge_data.hle * edge_data.hle - (edge_data.hle + edge_data.hc) * (edge_data.zl - edge_data.zc)) + pressure_flux);
+    D->xmom_explicit_update[k] -= D->normals[edge_data.ki2] * pressuregrad_work;
+    D->ymom_explicit_update[k] -= D->normals[edge_data.ki2 + 1] * pressuregrad_work;
+
+  } // End edge i (and neighbour n)
+
+  // Keep track of maximal speeds
+  if (substep_count == 0){
+    D->max_speed[k] = speed_max_last; // max_speed;
+  }
+  // Normalise triangle k by area and store for when all conserved
+  // quantities get updated
+  double inv_area = 1.0 / D->areas[k];
+  D->stage_explicit_update[k] *= inv_area;
+  D->xmom_explicit_update[k] *= inv_area;
+  D->ymom_explicit_update[k] *= inv_area;
+
+  *timestep_k = local_timestep;
+  *boundary_flux_k = boundary_flux_sum_substep;
+}
+
+// Flux calculation for the triangles tri_ids[0:number_of_elements], or
+// for all the triangles if tri_ids is NULL
+static double compute_fluxes_central_ids(const struct domain *__restrict D,
+                                         double timestep,
+                                         const anuga_int *__restrict tri_ids,
+                                         const anuga_int number_of_elements)
 {
   // Local variables 
-  anuga_int number_of_elements = D->number_of_elements;
-  // anuga_int KI, KI2, KI3, B, RW, RW5, SubSteps;
   anuga_int substep_count;
 
   // // FIXME: limiting_threshold is not used for DE1
@@ -464,130 +623,182 @@ double _openmp_compute_fluxes_central(const struct domain *__restrict D,
   double epsilon = D->epsilon;
   anuga_int ncol_riverwall_hydraulic_properties = D->ncol_riverwall_hydraulic_properties;
 
-  static anuga_int call = 0; // Static local variable flagging already computed flux
-  static anuga_int timestep_fluxcalls = 1;
-  static anuga_int base_call = 1;
+  // Which substep of the timestepping method are we on?
+  substep_count = get_flux_substep_count(D);
 
-  call++; // Flag 'id' of flux calculation for this timestep
+  double local_timestep = 1.0e+100;
+  double boundary_flux_sum_substep = 0.0;
 
-  if (D->timestep_fluxcalls != timestep_fluxcalls)
+// For all triangles
+#pragma omp parallel for simd default(none) schedule(static) shared(D, substep_count, number_of_elements, tri_ids) \
+    firstprivate(ncol_riverwall_hydraulic_properties, epsilon, g, low_froude)                              \
+    reduction(min : local_timestep) reduction(+ : boundary_flux_sum_substep)
+  for (anuga_int j = 0; j < number_of_elements; j++)
   {
-    timestep_fluxcalls = D->timestep_fluxcalls;
-    base_call = call;
+    anuga_int k = (tri_ids == NULL) ? j : tri_ids[j];
+    double timestep_k, boundary_flux_k;
+
+    compute_fluxes_central_k(D, k, substep_count, ncol_riverwall_hydraulic_properties,
+                             epsilon, g, low_froude, &timestep_k, &boundary_flux_k);
+
+    local_timestep = fmin(local_timestep, timestep_k);
+    boundary_flux_sum_substep += boundary_flux_k;
+  } // End triangle k
+
+  // variable to accumulate D->boundary_flux_sum[substep_count]
+  D->boundary_flux_sum[substep_count] = boundary_flux_sum_substep;
+
+  // Ensure we only update the timestep on the first call within each rk2/rk3 step
+  if (substep_count == 0){
+    timestep = local_timestep;
   }
 
+  return timestep;
+}
+
+double _openmp_compute_fluxes_central(const struct domain *__restrict D,
+                                      double timestep)
+{
+  return compute_fluxes_central_ids(D, timestep, NULL, D->number_of_elements);
+}
+
+// Flux calculation restricted to the active triangles tri_ids[0:n]
+// (see _openmp_update_active_cells)
+double _openmp_compute_fluxes_central_active(const struct domain *__restrict D,
+                                             double timestep,
+                                             const anuga_int *__restrict tri_ids,
+                                             const anuga_int n)
+{
+  return compute_fluxes_central_ids(D, timestep, tri_ids, n);
+}
+
+// Edge based version of _openmp_compute_fluxes_central.
+//
+// edge_ids lists one half edge ki = 3*k+i for each edge of the mesh (the
+// one with k < neighbour, or a boundary edge). The flux across each edge is
+// computed once and its contribution to both triangles is stored by half
+// edge in the work arrays (edge_flux_work, pressuregrad_work and
+// neigh_work for the max speed), so the edge loop has no write
+// conflicts. The contributions are then summed triangle by triangle,
+// in the same order as _openmp_compute_fluxes_central.
+//
+// With tri_ids the contributions are only summed for the triangles
+// tri_ids[0:number_of_elements] (NULL for all the triangles).
+static double compute_fluxes_central_edge_based_ids(const struct domain *__restrict D,
+                                                    double timestep,
+                                                    const anuga_int *__restrict edge_ids,
+                                                    const anuga_int number_of_edges,
+                                                    const anuga_int *__restrict tri_ids,
+                                                    const anuga_int number_of_elements)
+{
+  anuga_int substep_count;
+
+  anuga_int low_froude = D->low_froude;
+  double g = D->g;
+  double epsilon = D->epsilon;
+  anuga_int ncol_riverwall_hydraulic_properties = D->ncol_riverwall_hydraulic_properties;
+
   // Which substep of the timestepping method are we on?
-  substep_count = (call - base_call) % D->timestep_fluxcalls;
+  substep_count = get_flux_substep_count(D);
 
   double local_timestep = 1.0e+100;
   double boundary_flux_sum_substep = 0.0;
-  // double max_speed_local;
 
-      double edgeflux[3];
-      double pressure_flux;
-      double max_speed_local;
-      EdgeData edge_data;
-// For all triangles
-#pragma omp parallel for simd default(none) schedule(static) shared(D, substep_count, number_of_elements) \
-    firstprivate(ncol_riverwall_hydraulic_properties, epsilon, g, low_froude)                              \
-    private(edgeflux, pressure_flux, max_speed_local, edge_data) \
-    reduction(min : local_timestep) reduction(+ : boundary_flux_sum_substep)
-  for (anuga_int k = 0; k < number_of_elements; k++)
+  double edgeflux[3];
+  double pressure_flux;
+  double max_speed_local;
+  EdgeData edge_data;
+
+  // For all edges
+#pragma omp parallel for default(none) schedule(static) shared(D, edge_ids, number_of_edges) \
+    firstprivate(ncol_riverwall_hydraulic_properties, epsilon, g, low_froude)                   \
+    private(edgeflux, pressure_flux, max_speed_local, edge_data)
+  for (anuga_int e = 0; e < number_of_edges; e++)
   {
+    anuga_int ki = edge_ids[e];
+    anuga_int k = ki / 3;
+
+    get_edge_data_central_flux(D, k, ki - 3 * k, &edge_data);
+
+    compute_edge_flux_central(D, &edge_data, k, ncol_riverwall_hydraulic_properties,
+                              epsilon, g, low_froude,
+                              edgeflux, &max_speed_local, &pressure_flux);
+
+    // Contribution to triangle k
+    D->edge_flux_work[3 * ki] = edgeflux[0];
+    D->edge_flux_work[3 * ki + 1] = edgeflux[1];
+    D->edge_flux_work[3 * ki + 2] = edgeflux[2];
+    D->neigh_work[ki] = max_speed_local;
+    D->pressuregrad_work[ki] = edge_data.length * (-g * 0.5 * (edge_data.h_left * edge_data.h_left - edge_data.hle * edge_data.hle - (edge_data.hle + edge_data.hc) * (edge_data.zl - edge_data.zc)) + pressure_flux);
+
+    if (edge_data.is_boundary)
+    {
+      continue;
+    }
+
+    // Contribution to the neighbour n, the flux is reversed, the left
+    // and right states are swapped
+    anuga_int nm = 3 * edge_data.n + D->neighbour_edges[ki];
+    double length_n = D->edgelengths[nm];
+
+    D->edge_flux_work[3 * nm] = -edgeflux[0];
+    D->edge_flux_work[3 * nm + 1] = -edgeflux[1];
+    D->edge_flux_work[3 * nm + 2] = -edgeflux[2];
+    D->neigh_work[nm] = max_speed_local;
+    D->pressuregrad_work[nm] = length_n * (-g * 0.5 * (edge_data.h_right * edge_data.h_right - edge_data.hre * edge_data.hre - (edge_data.hre + edge_data.hc_n) * (edge_data.zr - edge_data.zc_n)) + pressure_flux);
+  }
+
+  // For all triangles
+#pragma omp parallel for simd default(none) schedule(static) shared(D, substep_count, number_of_elements, tri_ids) \
+    firstprivate(epsilon) reduction(min : local_timestep) reduction(+ : boundary_flux_sum_substep)
+  for (anuga_int j = 0; j < number_of_elements; j++)
+  {
+    anuga_int k = (tri_ids == NULL) ? j : tri_ids[j];
     double speed_max_last = 0.0;
-    // Set explicit_update to zero for all conserved_quantities.
-    // This assumes compute_fluxes called before forcing terms
+
     D->stage_explicit_update[k] = 0.0;
     D->xmom_explicit_update[k] = 0.0;
     D->ymom_explicit_update[k] = 0.0;
 
-    // Loop through neighbours and compute edge flux for each
     for (anuga_int i = 0; i < 3; i++)
     {
-      get_edge_data_central_flux(D,k,i,&edge_data);
+      anuga_int ki = 3 * k + i;
+      anuga_int n = D->neighbours[ki];
+      double max_speed_local = D->neigh_work[ki];
 
-      // Edge flux computation (triangle k, edge i)
-      if (edge_data.h_left == 0.0 && edge_data.h_right == 0.0)
-      {
-        // If both heights are zero, then no flux
-        edgeflux[0] = 0.0;
-        edgeflux[1] = 0.0;
-        edgeflux[2] = 0.0;
-        max_speed_local = 0.0;
-        pressure_flux = 0.0;
-      }
-      else
-      {
-        // Compute the fluxes using the central scheme
-        __flux_function_central(edge_data.ql, edge_data.qr,
-                                edge_data.h_left, edge_data.h_right,
-                                edge_data.hle, edge_data.hre,
-                                edge_data.normal_x, edge_data.normal_y,
-                                epsilon, edge_data.z_half, g,
-                                edgeflux, &max_speed_local, &pressure_flux,
-                                low_froude);
-      }
-
-    // Weir flux adjustment
-    if (edge_data.is_riverwall) {
-      apply_weir_discharge_correction(D, &edge_data, k, ncol_riverwall_hydraulic_properties, g, edgeflux, &max_speed_local);
-    }
-
-      // Multiply edgeflux by edgelength
-      for (anuga_int j = 0; j < 3; j++)
-      {
-        edgeflux[j] *= -1.0 * edge_data.length;
-      }
-      // Update timestep based on edge i and possibly neighbour n
-      // NOTE: We should only change the timestep on the 'first substep'
-      // of the timestepping method [substep_count==0]
+      // Update timestep based on edge i (only on the first substep)
       if (substep_count == 0 && D->tri_full_flag[k] == 1 && max_speed_local > epsilon)
       {
-        // Compute the 'edge-timesteps' (useful for setting flux_update_frequency)
         double edge_timestep = D->radii[k] * 1.0 / fmax(max_speed_local, epsilon);
-        // Update the timestep
-        // Apply CFL condition for triangles joining this edge (triangle k and triangle n)
-        // CFL for triangle k
         local_timestep = fmin(local_timestep, edge_timestep);
         speed_max_last = fmax(speed_max_last, max_speed_local);
       }
 
-      D->stage_explicit_update[k] += edgeflux[0];
-      D->xmom_explicit_update[k] += edgeflux[1];
-      D->ymom_explicit_update[k] += edgeflux[2];
-      // If this cell is not a ghost, and the neighbour is a
-      // boundary condition OR a ghost cell, then add the flux to the
-      // boundary_flux_integral
-      if (((edge_data.n < 0) & (D->tri_full_flag[k] == 1)) | ((edge_data.n >= 0) && ((D->tri_full_flag[k] == 1) & (D->tri_full_flag[edge_data.n] == 0))))
+      D->stage_explicit_update[k] += D->edge_flux_work[3 * ki];
+      D->xmom_explicit_update[k] += D->edge_flux_work[3 * ki + 1];
+      D->ymom_explicit_update[k] += D->edge_flux_work[3 * ki + 2];
+
+      // Flux out of the full cells through a boundary or into a ghost cell
+      if (((n < 0) & (D->tri_full_flag[k] == 1)) | ((n >= 0) && ((D->tri_full_flag[k] == 1) & (D->tri_full_flag[n] == 0))))
       {
-        // boundary_flux_sum is an array with length = timestep_fluxcalls
-        // For each sub-step, we put the boundary flux sum in.
-        boundary_flux_sum_substep += edgeflux[0];
+        boundary_flux_sum_substep += D->edge_flux_work[3 * ki];
       }
 
-      // bedslope_work contains all gravity related terms
-      double pressuregrad_work = edge_data.length * (-g * 0.5 * (edge_data.h_left * edge_data.h_left - edge_data.hle * edge_data.hle - (edge_data.hle + edge_data.hc) * (edge_data.zl - edge_data.zc)) + pressure_flux);
-      D->xmom_explicit_update[k] -= D->normals[edge_data.ki2] * pressuregrad_work;
-      D->ymom_explicit_update[k] -= D->normals[edge_data.ki2 + 1] * pressuregrad_work;
-
-    } // End edge i (and neighbour n)
+      D->xmom_explicit_update[k] -= D->normals[2 * ki] * D->pressuregrad_work[ki];
+      D->ymom_explicit_update[k] -= D->normals[2 * ki + 1] * D->pressuregrad_work[ki];
+    }
 
     // Keep track of maximal speeds
     if (substep_count == 0){
-      D->max_speed[k] = speed_max_last; // max_speed;
+      D->max_speed[k] = speed_max_last;
     }
-    // Normalise triangle k by area and store for when all conserved
-    // quantities get updated
+
     double inv_area = 1.0 / D->areas[k];
     D->stage_explicit_update[k] *= inv_area;
     D->xmom_explicit_update[k] *= inv_area;
     D->ymom_explicit_update[k] *= inv_area;
+  }
 
-  } // End triangle k
-
-  //   // Now add up stage, xmom, ymom explicit updates
-
-  // variable to accumulate D->boundary_flux_sum[substep_count]
   D->boundary_flux_sum[substep_count] = boundary_flux_sum_substep;
 
   // Ensure we only update the timestep on the first call within each rk2/rk3 step
@@ -598,23 +809,80 @@ double _openmp_compute_fluxes_central(const struct domain *__restrict D,
   return timestep;
 }
 
+double _openmp_compute_fluxes_central_edge_based(const struct domain *__restrict D,
+                                                 double timestep,
+                                                 const anuga_int *__restrict edge_ids,
+                                                 const anuga_int number_of_edges)
+{
+  return compute_fluxes_central_edge_based_ids(D, timestep, edge_ids, number_of_edges,
+                                               NULL, D->number_of_elements);
+}
+
+// Edge based flux calculation restricted to the active edges and
+// triangles (see _openmp_update_active_cells)
+double _openmp_compute_fluxes_central_edge_based_active(const struct domain *__restrict D,
+                                                        double timestep,
+                                                        const anuga_int *__restrict edge_ids,
+                                                        const anuga_int number_of_edges,
+                                                        const anuga_int *__restrict tri_ids,
+                                                        const anuga_int n)
+{
+  return compute_fluxes_central_edge_based_ids(D, timestep, edge_ids, number_of_edges,
+                                               tri_ids, n);
+}
+
+// Protect against the water elevation falling below the bed of triangle k.
+// Returns the mass added
+static inline double protect_k(const struct domain *__restrict D,
+                               const anuga_int k,
+                               const double minimum_allowed_height)
+{
+  double mass_error = 0.0;
+  anuga_int k3 = 3 * k;
+  double hc = D->stage_centroid_values[k] - D->bed_centroid_values[k];
+  if (hc < minimum_allowed_height * 1.0)
+  {
+    // Set momentum to zero and ensure h is non negative
+    D->xmom_centroid_values[k] = 0.;
+    D->xmom_centroid_values[k] = 0.;
+    if (hc <= 0.0)
+    {
+      double bmin = D->bed_centroid_values[k];
+      // Minimum allowed stage = bmin
+
+      // WARNING: ADDING MASS if wc[k]<bmin
+      if (D->stage_centroid_values[k] < bmin)
+      {
+        mass_error += (bmin - D->stage_centroid_values[k]) * D->areas[k];
+        // mass_added = 1; //Flag to warn of added mass
+
+        D->stage_centroid_values[k] = bmin;
+
+        // FIXME: Set vertex values as well. Seems that this shouldn't be
+        // needed. However, from memory this is important at the first
+        // time step, for 'dry' areas where the designated stage is
+        // less than the bed centroid value
+        D->stage_vertex_values[k3] = bmin;     // min(bmin, wc[k]); //zv[3*k]-minimum_allowed_height);
+        D->stage_vertex_values[k3 + 1] = bmin; // min(bmin, wc[k]); //zv[3*k+1]-minimum_allowed_height);
+        D->stage_vertex_values[k3 + 2] = bmin; // min(bmin, wc[k]); //zv[3*k+2]-minimum_allowed_height);
+      }
+    }
+  }
+
+  return mass_error;
+}
+
 // Protect against the water elevation falling below the triangle bed
-double _openmp_protect(const struct domain *__restrict D)
+// for the triangles tri_ids[0:number_of_elements] (NULL for all)
+static double protect_ids(const struct domain *__restrict D,
+                          const anuga_int *__restrict tri_ids,
+                          const anuga_int number_of_elements)
 {
 
   double mass_error = 0.;
 
   double minimum_allowed_height = D->minimum_allowed_height;
 
-  anuga_int number_of_elements = D->number_of_elements;
-
-  // wc = D->stage_centroid_values;
-  // zc = D->bed_centroid_values;
-  // wv = D->stage_vertex_values;
-  // xmomc = D->xmom_centroid_values;
-  // ymomc = D->xmom_centroid_values;
-  // areas = D->areas;
-
   // This acts like minimum_allowed height, but scales with the vertical
   // distance between the bed_centroid_value and the max bed_edge_value of
   // every triangle.
@@ -624,38 +892,10 @@ double _openmp_protect(const struct domain *__restrict D)
   // Protect against inifintesimal and negative heights
   // if (maximum_allowed_speed < epsilon) {
 #pragma omp parallel for schedule(static) reduction(+ : mass_error) firstprivate(minimum_allowed_height)
-  for (anuga_int k = 0; k < number_of_elements; k++)
+  for (anuga_int j = 0; j < number_of_elements; j++)
   {
-    anuga_int k3 = 3 * k;
-    double hc = D->stage_centroid_values[k] - D->bed_centroid_values[k];
-    if (hc < minimum_allowed_height * 1.0)
-    {
-      // Set momentum to zero and ensure h is non negative
-      D->xmom_centroid_values[k] = 0.;
-      D->xmom_centroid_values[k] = 0.;
-      if (hc <= 0.0)
-      {
-        double bmin = D->bed_centroid_values[k];
-        // Minimum allowed stage = bmin
-
-        // WARNING: ADDING MASS if wc[k]<bmin
-        if (D->stage_centroid_values[k] < bmin)
-        {
-          mass_error += (bmin - D->stage_centroid_values[k]) * D->areas[k];
-          // mass_added = 1; //Flag to warn of added mass
-
-          D->stage_centroid_values[k] = bmin;
-
-          // FIXME: Set vertex values as well. Seems that this shouldn't be
-          // needed. However, from memory this is important at the first
-          // time step, for 'dry' areas where the designated stage is
-          // less than the bed centroid value
-          D->stage_vertex_values[k3] = bmin;     // min(bmin, wc[k]); //zv[3*k]-minimum_allowed_height);
-          D->stage_vertex_values[k3 + 1] = bmin; // min(bmin, wc[k]); //zv[3*k+1]-minimum_allowed_height);
-          D->stage_vertex_values[k3 + 2] = bmin; // min(bmin, wc[k]); //zv[3*k+2]-minimum_allowed_height);
-        }
-      }
-    }
+    anuga_int k = (tri_ids == NULL) ? j : tri_ids[j];
+    mass_error += protect_k(D, k, minimum_allowed_height);
   }
 
   // if(mass_added == 1){
@@ -665,6 +905,18 @@ double _openmp_protect(const struct domain *__restrict D)
   return mass_error;
 }
 
+double _openmp_protect(const struct domain *__restrict D)
+{
+  return protect_ids(D, NULL, D->number_of_elements);
+}
+
+double _openmp_protect_active(const struct domain *__restrict D,
+                              const anuga_int *__restrict tri_ids,
+                              const anuga_int n)
+{
+  return protect_ids(D, tri_ids, n);
+}
+
 static inline anuga_int __find_qmin_and_qmax_dq1_dq2(const double dq0, const double dq1, const double dq2,
                                                    double *qmin, double *qmax)
 {
@@ -794,6 +1046,35 @@ static inline void compute_qmin_qmax_from_dq1(const double dq1, double *qmin, do
 }
 
 
+#pragma omp declare simd
+static inline void update_centroid_value_k(struct domain *__restrict D,
+                                           const anuga_int k,
+                                           const double minimum_allowed_height,
+                                           const anuga_int extrapolate_velocity_second_order)
+{
+  double stage = D->stage_centroid_values[k];
+  double bed   = D->bed_centroid_values[k];
+  double xmom  = D->xmom_centroid_values[k];
+  double ymom  = D->ymom_centroid_values[k];
+
+  double dk_local = fmax(stage - bed, 0.0);
+  D->height_centroid_values[k] = dk_local;
+
+  anuga_int is_dry = (dk_local <= minimum_allowed_height);
+  anuga_int extrapolate = (extrapolate_velocity_second_order == 1) & (dk_local > minimum_allowed_height);
+
+  // Prepare outputs branchless
+  double xmom_out = (is_dry) ? 0.0 : xmom;
+  double ymom_out = (is_dry) ? 0.0 : ymom;
+
+  double inv_dk = (extrapolate) ? (1.0 / dk_local) : 1.0;
+
+  D->x_centroid_work[k] = (extrapolate) ? xmom_out : 0.0;
+  D->y_centroid_work[k] = (extrapolate) ? ymom_out : 0.0;
+  D->xmom_centroid_values[k] = xmom_out * inv_dk;
+  D->ymom_centroid_values[k] = ymom_out * inv_dk;
+}
+
 static inline void update_centroid_values(struct domain *__restrict D,
                                           const anuga_int number_of_elements,
                                           const double minimum_allowed_height,
@@ -803,27 +1084,7 @@ static inline void update_centroid_values(struct domain *__restrict D,
     firstprivate(number_of_elements, minimum_allowed_height, extrapolate_velocity_second_order)
   for (anuga_int k = 0; k < number_of_elements; ++k)
   {
-    double stage = D->stage_centroid_values[k];
-    double bed   = D->bed_centroid_values[k];
-    double xmom  = D->xmom_centroid_values[k];
-    double ymom  = D->ymom_centroid_values[k];
-
-    double dk_local = fmax(stage - bed, 0.0);
-    D->height_centroid_values[k] = dk_local;
-
-    anuga_int is_dry = (dk_local <= minimum_allowed_height);
-    anuga_int extrapolate = (extrapolate_velocity_second_order == 1) & (dk_local > minimum_allowed_height);
-
-    // Prepare outputs branchless
-    double xmom_out = (is_dry) ? 0.0 : xmom;
-    double ymom_out = (is_dry) ? 0.0 : ymom;
-
-    double inv_dk = (extrapolate) ? (1.0 / dk_local) : 1.0;
-
-    D->x_centroid_work[k] = (extrapolate) ? xmom_out : 0.0;
-    D->y_centroid_work[k] = (extrapolate) ? ymom_out : 0.0;
-    D->xmom_centroid_values[k] = xmom_out * inv_dk;
-    D->ymom_centroid_values[k] = ymom_out * inv_dk;
+    update_centroid_value_k(D, k, minimum_allowed_height, extrapolate_velocity_second_order);
   }
 }
 
@@ -1022,6 +1283,216 @@ static inline void compute_edge_diffs(const double x, const double y,
   *dyv2 = yv2 - y;
 }
 
+// Extrapolate second order edge values of triangle k from the centroid values
+// of k and its surrogate neighbours
+static inline void extrapolate_second_order_edge_k(struct domain *__restrict D,
+                                                   const anuga_int k,
+                                                   const double minimum_allowed_height,
+                                                   const double c_tmp,
+                                                   const double d_tmp)
+{
+
+  // // Useful indices
+  anuga_int k2 = k * 2;
+  anuga_int k3 = k * 3;
+  anuga_int k6 = k * 6;
+
+  // Get the edge coordinates
+  const double xv0 = D->edge_coordinates[k6 + 0];
+  const double yv0 = D->edge_coordinates[k6 + 1];
+  const double xv1 = D->edge_coordinates[k6 + 2];
+  const double yv1 = D->edge_coordinates[k6 + 3];
+  const double xv2 = D->edge_coordinates[k6 + 4];
+  const double yv2 = D->edge_coordinates[k6 + 5];
+
+  // Get the centroid coordinates
+  const double x = D->centroid_coordinates[k2 + 0];
+  const double y = D->centroid_coordinates[k2 + 1];
+
+  // needed in the boundaries section
+  double dxv0, dxv1, dxv2;
+  double dyv0, dyv1, dyv2;
+  compute_edge_diffs(x, y,
+                     xv0, yv0,
+                     xv1, yv1,
+                     xv2, yv2,
+                     &dxv0, &dxv1, &dxv2,
+                     &dyv0, &dyv1, &dyv2);
+  // dxv0 = dxv0;
+  // dxv1 = dxv1;
+  // dxv2 = dxv2;
+  // dyv0 = dyv0;
+  // dyv1 = dyv1;
+  // dyv2 = dyv2;
+
+  anuga_int k0 = D->surrogate_neighbours[k3 + 0];
+  anuga_int k1 = D->surrogate_neighbours[k3 + 1];
+  k2 = D->surrogate_neighbours[k3 + 2];
+
+  anuga_int coord_index = 2 * k0;
+  double x0 = D->centroid_coordinates[coord_index + 0];
+  double y0 = D->centroid_coordinates[coord_index + 1];
+
+  coord_index = 2 * k1;
+  double x1 = D->centroid_coordinates[coord_index + 0];
+  double y1 = D->centroid_coordinates[coord_index + 1];
+
+  coord_index = 2 * k2;
+  double x2 = D->centroid_coordinates[coord_index + 0];
+  double y2 = D->centroid_coordinates[coord_index + 1];
+
+  // needed in the boundaries section
+  double dx1 = x1 - x0;
+  double dx2 = x2 - x0;
+  double dy1 = y1 - y0;
+  double dy2 = y2 - y0;
+  // dx1 = dx1;
+  // dx2 = dx2;
+  // dy1 = dy1;
+  // dy2 = dy2;
+  // needed in the boundaries section
+  double area2 = dy2 * dx1 - dy1 * dx2;
+  // area2 = area2;
+  // the calculation of dx0 dx1 dx2 dy0 dy1 dy2 etc could be calculated once and stored 
+  // in the domain structure.
+
+
+  const anuga_int dry =
+      ((D->height_centroid_values[k0] < minimum_allowed_height) | (k0 == k)) &
+      ((D->height_centroid_values[k1] < minimum_allowed_height) | (k1 == k)) &
+      ((D->height_centroid_values[k2] < minimum_allowed_height) | (k2 == k));
+
+  if (dry)
+  {
+    D->x_centroid_work[k] = 0.0;
+    D->xmom_centroid_values[k] = 0.0;
+    D->y_centroid_work[k] = 0.0;
+    D->ymom_centroid_values[k] = 0.0;
+  }
+
+  // int k0 = D->surrogate_neighbours[k3 + 0];
+  // int k1 = D->surrogate_neighbours[k3 + 1];
+  // k2 = D->surrogate_neighbours[k3 + 2];
+
+  if (D->number_of_boundaries[k] == 3)
+  {
+    // Very unlikely
+    // No neighbourso, set gradient on the triangle to zero
+    set_all_edge_values_from_centroid(D, k);
+  }
+  else if (D->number_of_boundaries[k] <= 1)
+  {
+    //==============================================
+    // Number of boundaries <= 1
+    // 'Typical case'
+    //==============================================
+    double hfactor, inv_area2;
+    compute_hfactor_and_inv_area(D, k, k0, k1, k2, area2, c_tmp, d_tmp, &hfactor, &inv_area2);
+    // stage
+    interpolate_edges_with_beta(D->stage_centroid_values, D->stage_edge_values,
+                                k, k0, k1, k2, k3,
+                                dxv0, dxv1, dxv2, dyv0, dyv1, dyv2,
+                                dx1, dx2, dy1, dy2, inv_area2,
+                                D->beta_w_dry, D->beta_w, hfactor);
+    // height
+    interpolate_edges_with_beta(D->height_centroid_values, D->height_edge_values,
+                                k, k0, k1, k2, k3,
+                                dxv0, dxv1, dxv2, dyv0, dyv1, dyv2,
+                                dx1, dx2, dy1, dy2, inv_area2,
+                                D->beta_w_dry, D->beta_w, hfactor);
+    // xmom
+    interpolate_edges_with_beta(D->xmom_centroid_values, D->xmom_edge_values,
+                                k, k0, k1, k2, k3,
+                                dxv0, dxv1, dxv2, dyv0, dyv1, dyv2,
+                                dx1, dx2, dy1, dy2, inv_area2,
+                                D->beta_uh_dry, D->beta_uh, hfactor);
+    // ymom
+    interpolate_edges_with_beta(D->ymom_centroid_values, D->ymom_edge_values,
+                                k, k0, k1, k2, k3,
+                                dxv0, dxv1, dxv2, dyv0, dyv1, dyv2,
+                                dx1, dx2, dy1, dy2, inv_area2,
+                                D->beta_vh_dry, D->beta_vh, hfactor);
+
+  } // End number_of_boundaries <=1
+  else
+  {
+    //==============================================
+    //  Number of boundaries == 2
+    //==============================================
+    // One internal neighbour and gradient is in direction of the neighbour's centroid
+    // Find the only internal neighbour (k1?)
+    k1 = get_internal_neighbour(D, k);
+    compute_gradient_projection_between_centroids(D, k, k1, &dx2, &dy2);
+    // stage
+    extrapolate_gradient_limited(D->stage_centroid_values, D->stage_edge_values,
+                                 k, k1, k3, dx2, dy2,
+                                 dxv0, dxv1, dxv2,
+                                 dyv0, dyv1, dyv2, D->beta_w);
+    // height
+    extrapolate_gradient_limited(D->height_centroid_values, D->height_edge_values,
+                                 k, k1, k3, dx2, dy2,
+                                 dxv0, dxv1, dxv2,
+                                 dyv0, dyv1, dyv2, D->beta_w);
+    // xmom
+    extrapolate_gradient_limited(D->xmom_centroid_values, D->xmom_edge_values,
+                                 k, k1, k3, dx2, dy2,
+                                 dxv0, dxv1, dxv2,
+                                 dyv0, dyv1, dyv2, D->beta_w);
+    // ymom
+    extrapolate_gradient_limited(D->ymom_centroid_values, D->ymom_edge_values,
+                                 k, k1, k3, dx2, dy2,
+                                 dxv0, dxv1, dxv2,
+                                 dyv0, dyv1, dyv2, D->beta_w);
+
+  } // else [number_of_boundaries]
+
+  // If needed, convert from velocity to momenta
+  if (D->extrapolate_velocity_second_order == 1)
+  {
+    // Re-compute momenta at edges
+    for (anuga_int i = 0; i < 3; i++)
+    {
+      double dk = D->height_edge_values[k3 + i];
+      D->xmom_edge_values[k3 + i] = D->xmom_edge_values[k3 + i] * dk;
+      D->ymom_edge_values[k3 + i] = D->ymom_edge_values[k3 + i] * dk;
+    }
+  }
+
+  for (anuga_int i = 0; i < 3; i++)
+  {
+    D->bed_edge_values[k3 + i] = D->stage_edge_values[k3 + i] - D->height_edge_values[k3 + i];
+  }
+
+  // This should not be needed, as now the evolve loop should just depend
+  // on the edge values, which are reconstructed from the centroid values
+  // reconstruct_vertex_values(D->stage_edge_values, D->stage_vertex_values, k3);
+  // reconstruct_vertex_values(D->height_edge_values, D->height_vertex_values, k3);
+  // reconstruct_vertex_values(D->xmom_edge_values, D->xmom_vertex_values, k3);
+  // reconstruct_vertex_values(D->ymom_edge_values, D->ymom_vertex_values, k3);
+  // reconstruct_vertex_values(D->bed_edge_values, D->bed_vertex_values, k3);
+}
+
+// Parameters used to control how the limiter is forced to first-order near
+// wet-dry regions
+static inline void get_hfactor_parameters(double *c_tmp, double *d_tmp)
+{
+  double a_tmp = 0.3; // Highest depth ratio with hfactor=1
+  double b_tmp = 0.1; // Highest depth ratio with hfactor=0
+  *c_tmp = 1.0 / (a_tmp - b_tmp);
+  *d_tmp = 1.0 - (*c_tmp * a_tmp);
+}
+
+// Convert velocity back to momenta at centroids
+static inline void restore_centroid_momenta(struct domain *__restrict D)
+{
+#pragma omp parallel for simd schedule(static)
+  for (anuga_int k = 0; k < D->number_of_elements; k++)
+  {
+      D->xmom_centroid_values[k] = D->x_centroid_work[k];
+      D->ymom_centroid_values[k] = D->y_centroid_work[k];
+  }
+}
+
 // Computational routine
 // Extrapolate second order edge values from centroid values
 // This is the current procedure used in evolve loop.
@@ -1031,271 +1502,372 @@ void _openmp_extrapolate_second_order_edge_sw(struct domain *__restrict D)
   anuga_int number_of_elements = D->number_of_elements;
   anuga_int extrapolate_velocity_second_order = D->extrapolate_velocity_second_order;
 
-  // Parameters used to control how the limiter is forced to first-order near
-  // wet-dry regions
-  double a_tmp = 0.3; // Highest depth ratio with hfactor=1
-  double b_tmp = 0.1; // Highest depth ratio with hfactor=0
-  double c_tmp = 1.0 / (a_tmp - b_tmp);
-  double d_tmp = 1.0 - (c_tmp * a_tmp);
+  double c_tmp, d_tmp;
+  get_hfactor_parameters(&c_tmp, &d_tmp);
 
   update_centroid_values(D, number_of_elements, minimum_allowed_height, extrapolate_velocity_second_order);
 
 #pragma omp parallel for simd default(none) schedule(static) \
     shared(D)                                                 \
-    firstprivate(number_of_elements, minimum_allowed_height, extrapolate_velocity_second_order, c_tmp, d_tmp)
+    firstprivate(number_of_elements, minimum_allowed_height, c_tmp, d_tmp)
   for (anuga_int k = 0; k < number_of_elements; k++)
   {
-    // // Useful indices
-    anuga_int k2 = k * 2;
-    anuga_int k3 = k * 3;
-    anuga_int k6 = k * 6;
-
-    // Get the edge coordinates
-    const double xv0 = D->edge_coordinates[k6 + 0];
-    const double yv0 = D->edge_coordinates[k6 + 1];
-    const double xv1 = D->edge_coordinates[k6 + 2];
-    const double yv1 = D->edge_coordinates[k6 + 3];
-    const double xv2 = D->edge_coordinates[k6 + 4];
-    const double yv2 = D->edge_coordinates[k6 + 5];
-
-    // Get the centroid coordinates
-    const double x = D->centroid_coordinates[k2 + 0];
-    const double y = D->centroid_coordinates[k2 + 1];
-
-    // needed in the boundaries section
-    double dxv0, dxv1, dxv2;
-    double dyv0, dyv1, dyv2;
-    compute_edge_diffs(x, y,
-                       xv0, yv0,
-                       xv1, yv1,
-                       xv2, yv2,
-                       &dxv0, &dxv1, &dxv2,
-                       &dyv0, &dyv1, &dyv2);
-    // dxv0 = dxv0;
-    // dxv1 = dxv1;
-    // dxv2 = dxv2;
-    // dyv0 = dyv0;
-    // dyv1 = dyv1;
-    // dyv2 = dyv2;
-
-    anuga_int k0 = D->surrogate_neighbours[k3 + 0];
-    anuga_int k1 = D->surrogate_neighbours[k3 + 1];
-    k2 = D->surrogate_neighbours[k3 + 2];
-
-    anuga_int coord_index = 2 * k0;
-    double x0 = D->centroid_coordinates[coord_index + 0];
-    double y0 = D->centroid_coordinates[coord_index + 1];
-
-    coord_index = 2 * k1;
-    double x1 = D->centroid_coordinates[coord_index + 0];
-    double y1 = D->centroid_coordinates[coord_index + 1];
-
-    coord_index = 2 * k2;
-    double x2 = D->centroid_coordinates[coord_index + 0];
-    double y2 = D->centroid_coordinates[coord_index + 1];
-
-    // needed in the boundaries section
-    double dx1 = x1 - x0;
-    double dx2 = x2 - x0;
-    double dy1 = y1 - y0;
-    double dy2 = y2 - y0;
-    // dx1 = dx1;
-    // dx2 = dx2;
-    // dy1 = dy1;
-    // dy2 = dy2;
-    // needed in the boundaries section
-    double area2 = dy2 * dx1 - dy1 * dx2;
-    // area2 = area2;
-    // the calculation of dx0 dx1 dx2 dy0 dy1 dy2 etc could be calculated once and stored 
-    // in the domain structure.
-
-
-    const anuga_int dry =
-        ((D->height_centroid_values[k0] < minimum_allowed_height) | (k0 == k)) &
-        ((D->height_centroid_values[k1] < minimum_allowed_height) | (k1 == k)) &
-        ((D->height_centroid_values[k2] < minimum_allowed_height) | (k2 == k));
-
-    if (dry)
+    extrapolate_second_order_edge_k(D, k, minimum_allowed_height, c_tmp, d_tmp);
+  }
+
+  if (extrapolate_velocity_second_order == 1)
+  {
+    restore_centroid_momenta(D);
+  }
+}
+
+// Split phase version of _openmp_extrapolate_second_order_edge_sw.
+// The triangles are processed in subsets (e.g. interior triangles while
+// the ghost exchange is in flight, then the triangles near the halo).
+// _openmp_update_centroid_values_subset must be called on every triangle
+// read by a subset before _openmp_extrapolate_second_order_edge_sw_subset,
+// and _openmp_finish_extrapolate_second_order_edge_sw once all subsets
+// have been extrapolated.
+void _openmp_update_centroid_values_subset(struct domain *__restrict D,
+                                           const anuga_int *__restrict tri_ids,
+                                           const anuga_int n)
+{
+  double minimum_allowed_height = D->minimum_allowed_height;
+  anuga_int extrapolate_velocity_second_order = D->extrapolate_velocity_second_order;
+
+#pragma omp parallel for simd default(none) schedule(static) \
+    shared(D, tri_ids)                                        \
+    firstprivate(n, minimum_allowed_height, extrapolate_velocity_second_order)
+  for (anuga_int i = 0; i < n; i++)
+  {
+    update_centroid_value_k(D, tri_ids[i], minimum_allowed_height, extrapolate_velocity_second_order);
+  }
+}
+
+void _openmp_extrapolate_second_order_edge_sw_subset(struct domain *__restrict D,
+                                                     const anuga_int *__restrict tri_ids,
+                                                     const anuga_int n)
+{
+  double minimum_allowed_height = D->minimum_allowed_height;
+
+  double c_tmp, d_tmp;
+  get_hfactor_parameters(&c_tmp, &d_tmp);
+
+#pragma omp parallel for simd default(none) schedule(static) \
+    shared(D, tri_ids)                                        \
+    firstprivate(n, minimum_allowed_height, c_tmp, d_tmp)
+  for (anuga_int i = 0; i < n; i++)
+  {
+    extrapolate_second_order_edge_k(D, tri_ids[i], minimum_allowed_height, c_tmp, d_tmp);
+  }
+}
+
+void _openmp_finish_extrapolate_second_order_edge_sw(struct domain *__restrict D)
+{
+  if (D->extrapolate_velocity_second_order == 1)
+  {
+    restore_centroid_momenta(D);
+  }
+}
+
+// Active cells
+//
+// The per-step kernels can be restricted to a list of active triangles:
+// the seeds, triangles which are wet (stage above the bed), have stage
+// below the bed (to be fixed by protect) or have a boundary edge (water
+// can flow in through the boundary), plus a fringe of dry triangles around
+// the seeds. A dry triangle only gets water through an edge with non zero
+// edge height, which needs a wet triangle within one neighbour, so the wet
+// region grows by at most two triangles per flux calculation. With a
+// fringe of 2*timestep_fluxcalls triangles the fluxes across the edges
+// between active and inactive triangles are zero for the whole timestep,
+// and updating the active triangles only gives the same result as updating
+// all of them.
+//
+// active_flag is set to 0 for inactive triangles, 1 for the seeds and
+// 1 + (distance to the seeds) for the fringe, old_flag holds the flags of
+// the previous call. Triangles which have become inactive are set dry and
+// extrapolated once, they then keep the edge and vertex values the full
+// extrapolation would give them. The ids of the active triangles are
+// written to tri_ids and one half edge for each edge of an active triangle
+// to edge_ids (for the edge based fluxes, see get_unique_edges).
+// Returns the number of active triangles.
+anuga_int _openmp_update_active_cells(struct domain *__restrict D,
+                                      anuga_int *__restrict active_flag,
+                                      const anuga_int *__restrict old_flag,
+                                      const anuga_int fringe,
+                                      anuga_int *__restrict tri_ids,
+                                      anuga_int *__restrict edge_ids,
+                                      anuga_int *__restrict number_of_edges)
+{
+  anuga_int N = D->number_of_elements;
+  double minimum_allowed_height = D->minimum_allowed_height;
+
+  double c_tmp, d_tmp;
+  get_hfactor_parameters(&c_tmp, &d_tmp);
+
+  // Seeds, and the heights read by the extrapolation below
+#pragma omp parallel for simd schedule(static)
+  for (anuga_int k = 0; k < N; k++)
+  {
+    double stage = D->stage_centroid_values[k];
+    double bed = D->bed_centroid_values[k];
+
+    D->height_centroid_values[k] = fmax(stage - bed, 0.0);
+    active_flag[k] = (stage != bed) | (D->number_of_boundaries[k] > 0);
+  }
+
+  // Grow the fringe one layer of neighbours at a time. A triangle being
+  // flagged level + 1 is never read as level, so the order is irrelevant.
+  for (anuga_int level = 1; level <= fringe; level++)
+  {
+#pragma omp parallel for schedule(static)
+    for (anuga_int k = 0; k < N; k++)
     {
-      D->x_centroid_work[k] = 0.0;
-      D->xmom_centroid_values[k] = 0.0;
-      D->y_centroid_work[k] = 0.0;
-      D->ymom_centroid_values[k] = 0.0;
+      if (active_flag[k] != 0)
+      {
+        continue;
+      }
+      for (anuga_int i = 0; i < 3; i++)
+      {
+        anuga_int n = D->neighbours[3 * k + i];
+        if (n >= 0 && active_flag[n] == level)
+        {
+          active_flag[k] = level + 1;
+          break;
+        }
+      }
     }
+  }
 
-    // int k0 = D->surrogate_neighbours[k3 + 0];
-    // int k1 = D->surrogate_neighbours[k3 + 1];
-    // k2 = D->surrogate_neighbours[k3 + 2];
-
-    if (D->number_of_boundaries[k] == 3)
+  // Triangles leaving the active set are dry (stage equals bed)
+#pragma omp parallel for schedule(static)
+  for (anuga_int k = 0; k < N; k++)
+  {
+    if (active_flag[k] == 0 && old_flag[k] != 0)
     {
-      // Very unlikely
-      // No neighbourso, set gradient on the triangle to zero
-      set_all_edge_values_from_centroid(D, k);
+      D->xmom_centroid_values[k] = 0.0;
+      D->ymom_centroid_values[k] = 0.0;
+      D->x_centroid_work[k] = 0.0;
+      D->y_centroid_work[k] = 0.0;
+      D->max_speed[k] = 0.0;
     }
-    else if (D->number_of_boundaries[k] <= 1)
+    else if (active_flag[k] != 0 && old_flag[k] == 0)
     {
-      //==============================================
-      // Number of boundaries <= 1
-      // 'Typical case'
-      //==============================================
-      double hfactor, inv_area2;
-      compute_hfactor_and_inv_area(D, k, k0, k1, k2, area2, c_tmp, d_tmp, &hfactor, &inv_area2);
-      // stage
-      interpolate_edges_with_beta(D->stage_centroid_values, D->stage_edge_values,
-                                  k, k0, k1, k2, k3,
-                                  dxv0, dxv1, dxv2, dyv0, dyv1, dyv2,
-                                  dx1, dx2, dy1, dy2, inv_area2,
-                                  D->beta_w_dry, D->beta_w, hfactor);
-      // height
-      interpolate_edges_with_beta(D->height_centroid_values, D->height_edge_values,
-                                  k, k0, k1, k2, k3,
-                                  dxv0, dxv1, dxv2, dyv0, dyv1, dyv2,
-                                  dx1, dx2, dy1, dy2, inv_area2,
-                                  D->beta_w_dry, D->beta_w, hfactor);
-      // xmom
-      interpolate_edges_with_beta(D->xmom_centroid_values, D->xmom_edge_values,
-                                  k, k0, k1, k2, k3,
-                                  dxv0, dxv1, dxv2, dyv0, dyv1, dyv2,
-                                  dx1, dx2, dy1, dy2, inv_area2,
-                                  D->beta_uh_dry, D->beta_uh, hfactor);
-      // ymom
-      interpolate_edges_with_beta(D->ymom_centroid_values, D->ymom_edge_values,
-                                  k, k0, k1, k2, k3,
-                                  dxv0, dxv1, dxv2, dyv0, dyv1, dyv2,
-                                  dx1, dx2, dy1, dy2, inv_area2,
-                                  D->beta_vh_dry, D->beta_vh, hfactor);
-
-    } // End number_of_boundaries <=1
-    else
+      // Forcing terms may have added to the inactive triangle
+      D->stage_semi_implicit_update[k] = 0.0;
+      D->xmom_semi_implicit_update[k] = 0.0;
+      D->ymom_semi_implicit_update[k] = 0.0;
+    }
+  }
+
+#pragma omp parallel for schedule(static)
+  for (anuga_int k = 0; k < N; k++)
+  {
+    if (active_flag[k] == 0 && old_flag[k] != 0)
     {
-      //==============================================
-      //  Number of boundaries == 2
-      //==============================================
-      // One internal neighbour and gradient is in direction of the neighbour's centroid
-      // Find the only internal neighbour (k1?)
-      k1 = get_internal_neighbour(D, k);
-      compute_gradient_projection_between_centroids(D, k, k1, &dx2, &dy2);
-      // stage
-      extrapolate_gradient_limited(D->stage_centroid_values, D->stage_edge_values,
-                                   k, k1, k3, dx2, dy2,
-                                   dxv0, dxv1, dxv2,
-                                   dyv0, dyv1, dyv2, D->beta_w);
-      // height
-      extrapolate_gradient_limited(D->height_centroid_values, D->height_edge_values,
-                                   k, k1, k3, dx2, dy2,
-                                   dxv0, dxv1, dxv2,
-                                   dyv0, dyv1, dyv2, D->beta_w);
-      // xmom
-      extrapolate_gradient_limited(D->xmom_centroid_values, D->xmom_edge_values,
-                                   k, k1, k3, dx2, dy2,
-                                   dxv0, dxv1, dxv2,
-                                   dyv0, dyv1, dyv2, D->beta_w);
-      // ymom
-      extrapolate_gradient_limited(D->ymom_centroid_values, D->ymom_edge_values,
-                                   k, k1, k3, dx2, dy2,
-                                   dxv0, dxv1, dxv2,
-                                   dyv0, dyv1, dyv2, D->beta_w);
-
-    } // else [number_of_boundaries]
-
-    // If needed, convert from velocity to momenta
-    if (D->extrapolate_velocity_second_order == 1)
+      anuga_int k3 = 3 * k;
+
+      extrapolate_second_order_edge_k(D, k, minimum_allowed_height, c_tmp, d_tmp);
+
+      reconstruct_vertex_values(D->stage_edge_values, D->stage_vertex_values, k3);
+      reconstruct_vertex_values(D->height_edge_values, D->height_vertex_values, k3);
+      reconstruct_vertex_values(D->xmom_edge_values, D->xmom_vertex_values, k3);
+      reconstruct_vertex_values(D->ymom_edge_values, D->ymom_vertex_values, k3);
+      reconstruct_vertex_values(D->bed_edge_values, D->bed_vertex_values, k3);
+    }
+  }
+
+  // Compact lists of the active triangles and their edges
+  anuga_int n_tri = 0;
+  anuga_int n_edge = 0;
+  for (anuga_int k = 0; k < N; k++)
+  {
+    if (active_flag[k] == 0)
     {
-      // Re-compute momenta at edges
-      for (anuga_int i = 0; i < 3; i++)
-      {
-        double dk = D->height_edge_values[k3 + i];
-        D->xmom_edge_values[k3 + i] = D->xmom_edge_values[k3 + i] * dk;
-        D->ymom_edge_values[k3 + i] = D->ymom_edge_values[k3 + i] * dk;
-      }
+      continue;
     }
+    tri_ids[n_tri++] = k;
 
     for (anuga_int i = 0; i < 3; i++)
     {
-      D->bed_edge_values[k3 + i] = D->stage_edge_values[k3 + i] - D->height_edge_values[k3 + i];
+      anuga_int ki = 3 * k + i;
+      anuga_int n = D->neighbours[ki];
+      if (n < 0 || k < n || active_flag[n] == 0)
+      {
+        edge_ids[n_edge++] = ki;
+      }
     }
-
-    // This should not be needed, as now the evolve loop should just depend
-    // on the edge values, which are reconstructed from the centroid values
-    // reconstruct_vertex_values(D->stage_edge_values, D->stage_vertex_values, k3);
-    // reconstruct_vertex_values(D->height_edge_values, D->height_vertex_values, k3);
-    // reconstruct_vertex_values(D->xmom_edge_values, D->xmom_vertex_values, k3);
-    // reconstruct_vertex_values(D->ymom_edge_values, D->ymom_vertex_values, k3);
-    // reconstruct_vertex_values(D->bed_edge_values, D->bed_vertex_values, k3);
   }
-  // for k=0 to number_of_elements-1
-// Fix xmom and ymom centroid values
-if(extrapolate_velocity_second_order == 1)
+
+  *number_of_edges = n_edge;
+
+  return n_tri;
+}
+
+// Extrapolation restricted to the active triangles tri_ids[0:n] (see
+// _openmp_update_active_cells). The inactive triangles are dry with dry
+// neighbours, their centroid and edge values do not change.
+void _openmp_extrapolate_second_order_edge_sw_active(struct domain *__restrict D,
+                                                     const anuga_int *__restrict tri_ids,
+                                                     const anuga_int n)
 {
-#pragma omp parallel for simd schedule(static) firstprivate(extrapolate_velocity_second_order)
-  for (anuga_int k = 0; k < D->number_of_elements; k++)
+  _openmp_update_centroid_values_subset(D, tri_ids, n);
+  _openmp_extrapolate_second_order_edge_sw_subset(D, tri_ids, n);
+
+  if (D->extrapolate_velocity_second_order == 1)
   {
-      // Convert velocity back to momenta at centroids
+#pragma omp parallel for simd schedule(static)
+    for (anuga_int i = 0; i < n; i++)
+    {
+      anuga_int k = tri_ids[i];
       D->xmom_centroid_values[k] = D->x_centroid_work[k];
       D->ymom_centroid_values[k] = D->y_centroid_work[k];
+    }
   }
 }
 
-}
-
-void _openmp_distribute_edges_to_vertices(struct domain *__restrict D)
+// Extrapolation for local timestepping, only the triangles flagged in
+// update_extrapolation (those with an edge flux to update, see
+// _openmp_update_conserved_quantities_local) are extrapolated. The
+// centroid velocities are computed for all the triangles as the flagged
+// triangles read the velocities of their neighbours.
+void _openmp_extrapolate_second_order_edge_sw_local(struct domain *__restrict D)
 {
-  // Distribute edge values to vertices
+  double minimum_allowed_height = D->minimum_allowed_height;
   anuga_int number_of_elements = D->number_of_elements;
+  anuga_int extrapolate_velocity_second_order = D->extrapolate_velocity_second_order;
 
-#pragma omp parallel for simd default(none) shared(D) schedule(static) firstprivate(number_of_elements)
+  double c_tmp, d_tmp;
+  get_hfactor_parameters(&c_tmp, &d_tmp);
+
+  update_centroid_values(D, number_of_elements, minimum_allowed_height, extrapolate_velocity_second_order);
+
+#pragma omp parallel for default(none) schedule(static) \
+    shared(D)                                             \
+    firstprivate(number_of_elements, minimum_allowed_height, c_tmp, d_tmp)
   for (anuga_int k = 0; k < number_of_elements; k++)
   {
+    if (D->update_extrapolation[k] == 0)
+    {
+      continue;
+    }
+
     anuga_int k3 = 3 * k;
 
-    // Set vertex values from edge values
+    extrapolate_second_order_edge_k(D, k, minimum_allowed_height, c_tmp, d_tmp);
+
     reconstruct_vertex_values(D->stage_edge_values, D->stage_vertex_values, k3);
     reconstruct_vertex_values(D->height_edge_values, D->height_vertex_values, k3);
     reconstruct_vertex_values(D->xmom_edge_values, D->xmom_vertex_values, k3);
     reconstruct_vertex_values(D->ymom_edge_values, D->ymom_vertex_values, k3);
     reconstruct_vertex_values(D->bed_edge_values, D->bed_vertex_values, k3);
-  
+  }
+
+  if (extrapolate_velocity_second_order == 1)
+  {
+    restore_centroid_momenta(D);
   }
 }
 
-void _openmp_manning_friction_flat_semi_implicit(const struct domain *__restrict D)
+// Set the vertex values of triangle k from its edge values
+static inline void distribute_edges_to_vertices_k(struct domain *__restrict D, const anuga_int k)
 {
+  anuga_int k3 = 3 * k;
 
-  anuga_int k;
+  reconstruct_vertex_values(D->stage_edge_values, D->stage_vertex_values, k3);
+  reconstruct_vertex_values(D->height_edge_values, D->height_vertex_values, k3);
+  reconstruct_vertex_values(D->xmom_edge_values, D->xmom_vertex_values, k3);
+  reconstruct_vertex_values(D->ymom_edge_values, D->ymom_vertex_values, k3);
+  reconstruct_vertex_values(D->bed_edge_values, D->bed_vertex_values, k3);
+}
+
+void _openmp_distribute_edges_to_vertices_active(struct domain *__restrict D,
+                                                 const anuga_int *__restrict tri_ids,
+                                                 const anuga_int n)
+{
+#pragma omp parallel for simd default(none) shared(D, tri_ids) schedule(static) firstprivate(n)
+  for (anuga_int i = 0; i < n; i++)
+  {
+    distribute_edges_to_vertices_k(D, tri_ids[i]);
+  }
+}
+
+void _openmp_distribute_edges_to_vertices(struct domain *__restrict D)
+{
+  // Distribute edge values to vertices
+  anuga_int number_of_elements = D->number_of_elements;
+
+#pragma omp parallel for simd default(none) shared(D) schedule(static) firstprivate(number_of_elements)
+  for (anuga_int k = 0; k < number_of_elements; k++)
+  {
+    // Set vertex values from edge values
+    distribute_edges_to_vertices_k(D, k);
+  }
+}
+
+// Friction on triangle k
+static inline void manning_friction_flat_semi_implicit_k(const struct domain *__restrict D,
+                                                         const anuga_int k,
+                                                         const double eps,
+                                                         const double g,
+                                                         const double seven_thirds)
+{
+  double S = 0.0;
+  double h;
+  double uh = D->xmom_centroid_values[k];
+  double vh = D->ymom_centroid_values[k];
+  double eta = D->friction_centroid_values[k];
+  double abs_mom = sqrt( uh*uh + vh*vh );
+
+  if (eta > 1.0e-15)
+  {
+    h = D->stage_centroid_values[k] - D->bed_centroid_values[k];
+    if (h >= eps)
+     {
+      S = -g * eta * eta * abs_mom;
+      S /= pow(h, seven_thirds); 
+     }
+    }
+  D->xmom_semi_implicit_update[k] += S * D->xmom_centroid_values[k];
+  D->ymom_semi_implicit_update[k] += S * D->ymom_centroid_values[k];
+}
+
+// Friction on the triangles tri_ids[0:N] (NULL for all the triangles)
+static void manning_friction_flat_semi_implicit_ids(const struct domain *__restrict D,
+                                                    const anuga_int *__restrict tri_ids,
+                                                    const anuga_int N)
+{
+
+  anuga_int j;
 
-  const anuga_int N = D->number_of_elements;
   const double eps = D->minimum_allowed_height;
   const double g = D->g;
   const double seven_thirds = 7.0 / 3.0;
 
  
-#pragma omp parallel for simd default(none) shared(D) schedule(static) \
-        firstprivate(N, eps, g, seven_thirds)
+#pragma omp parallel for simd default(none) shared(D, tri_ids, N) schedule(static) \
+        firstprivate(eps, g, seven_thirds)
 
-  for (k = 0; k < N; k++)
+  for (j = 0; j < N; j++)
   {
-    double S = 0.0;
-    double h;
-    double uh = D->xmom_centroid_values[k];
-    double vh = D->ymom_centroid_values[k];
-    double eta = D->friction_centroid_values[k];
-    double abs_mom = sqrt( uh*uh + vh*vh );
-
-    if (eta > 1.0e-15)
-    {
-      h = D->stage_centroid_values[k] - D->bed_centroid_values[k];
-      if (h >= eps)
-       {
-        S = -g * eta * eta * abs_mom;
-        S /= pow(h, seven_thirds); 
-       }
-      }
-    D->xmom_semi_implicit_update[k] += S * D->xmom_centroid_values[k];
-    D->ymom_semi_implicit_update[k] += S * D->ymom_centroid_values[k];
+    anuga_int k = (tri_ids == NULL) ? j : tri_ids[j];
+    manning_friction_flat_semi_implicit_k(D, k, eps, g, seven_thirds);
   }
 }
 
+void _openmp_manning_friction_flat_semi_implicit(const struct domain *__restrict D)
+{
+  manning_friction_flat_semi_implicit_ids(D, NULL, D->number_of_elements);
+}
+
+void _openmp_manning_friction_flat_semi_implicit_active(const struct domain *__restrict D,
+                                                        const anuga_int *__restrict tri_ids,
+                                                        const anuga_int n)
+{
+  manning_friction_flat_semi_implicit_ids(D, tri_ids, n);
+}
+
 
 
 
@@ -1363,68 +1935,94 @@ for (k = 0; k < N; k++)
   }
 }
 
-void _openmp_manning_friction_sloped_semi_implicit_edge_based(const struct domain *__restrict D)
+// Friction on triangle k, with the bed slope from the bed edge values
+static inline void manning_friction_sloped_semi_implicit_edge_based_k(const struct domain *__restrict D,
+                                                                      const anuga_int k,
+                                                                      const double eps,
+                                                                      const double g,
+                                                                      const double one_third,
+                                                                      const double seven_thirds)
 {
-  anuga_int k;
-  const double one_third = 1.0 / 3.0;
-  const double seven_thirds = 7.0 / 3.0;
+  double S, h, z, z0, z1, z2, zs, zx, zy;
+  double x0, y0, x1, y1, x2, y2;
+  anuga_int k3, k6;
 
-  anuga_int N = D->number_of_elements;
-  const double  g = D->g;
-  const double  eps = D->minimum_allowed_height;
+  double w = D->stage_centroid_values[k];
+  double uh = D->xmom_centroid_values[k];
+  double vh = D->ymom_centroid_values[k];
+  double eta = D->friction_centroid_values[k];
+
+  S = 0.0;
+  k3 = 3 * k;
   
-#pragma omp parallel for simd default(none) shared(D) schedule(static) \
-        firstprivate(N, eps, g, seven_thirds, one_third)
-for (k = 0; k < N; k++)
-  {
-    double S, h, z, z0, z1, z2, zs, zx, zy;
-    double x0, y0, x1, y1, x2, y2;
-    anuga_int k3, k6;
+  // Get bathymetry
+  z0 = D->bed_edge_values[k3 + 0];
+  z1 = D->bed_edge_values[k3 + 1];
+  z2 = D->bed_edge_values[k3 + 2];
 
-    double w = D->stage_centroid_values[k];
-    double uh = D->xmom_centroid_values[k];
-    double vh = D->ymom_centroid_values[k];
-    double eta = D->friction_centroid_values[k];
+  // Compute bed slope
+  k6 = 6 * k; // base index
 
-    S = 0.0;
-    k3 = 3 * k;
-    
-    // Get bathymetry
-    z0 = D->bed_edge_values[k3 + 0];
-    z1 = D->bed_edge_values[k3 + 1];
-    z2 = D->bed_edge_values[k3 + 2];
+  
+  x0 = D->edge_coordinates[k6 + 0];
+  y0 = D->edge_coordinates[k6 + 1];
+  x1 = D->edge_coordinates[k6 + 2];
+  y1 = D->edge_coordinates[k6 + 3];
+  x2 = D->edge_coordinates[k6 + 4];
+  y2 = D->edge_coordinates[k6 + 5];
 
-    // Compute bed slope
-    k6 = 6 * k; // base index
+  
+  if (eta > 1.0e-16)
+  {
+    _gradient(x0, y0, x1, y1, x2, y2, z0, z1, z2, &zx, &zy);
 
-    
-    x0 = D->edge_coordinates[k6 + 0];
-    y0 = D->edge_coordinates[k6 + 1];
-    x1 = D->edge_coordinates[k6 + 2];
-    y1 = D->edge_coordinates[k6 + 3];
-    x2 = D->edge_coordinates[k6 + 4];
-    y2 = D->edge_coordinates[k6 + 5];
+    zs = sqrt(1.0 + zx * zx + zy * zy);
+    z = (z0 + z1 + z2) * one_third;
 
-    
-    if (eta > 1.0e-16)
+    h = w - z;
+    if (h >= eps)
     {
-      _gradient(x0, y0, x1, y1, x2, y2, z0, z1, z2, &zx, &zy);
+      S = -g*eta*eta*zs * sqrt((uh*uh + vh*vh));
+      S /= pow(h, seven_thirds); 
+    }
+  }
+  D->xmom_semi_implicit_update[k] += S * uh;
+  D->ymom_semi_implicit_update[k] += S * vh;
+}
 
-      zs = sqrt(1.0 + zx * zx + zy * zy);
-      z = (z0 + z1 + z2) * one_third;
+// Friction on the triangles tri_ids[0:N] (NULL for all the triangles)
+static void manning_friction_sloped_semi_implicit_edge_based_ids(const struct domain *__restrict D,
+                                                                 const anuga_int *__restrict tri_ids,
+                                                                 const anuga_int N)
+{
+  anuga_int j;
+  const double one_third = 1.0 / 3.0;
+  const double seven_thirds = 7.0 / 3.0;
 
-      h = w - z;
-      if (h >= eps)
-      {
-        S = -g*eta*eta*zs * sqrt((uh*uh + vh*vh));
-        S /= pow(h, seven_thirds); 
-      }
-    }
-    D->xmom_semi_implicit_update[k] += S * uh;
-    D->ymom_semi_implicit_update[k] += S * vh;
+  const double  g = D->g;
+  const double  eps = D->minimum_allowed_height;
+  
+#pragma omp parallel for simd default(none) shared(D, tri_ids, N) schedule(static) \
+        firstprivate(eps, g, seven_thirds, one_third)
+for (j = 0; j < N; j++)
+  {
+    anuga_int k = (tri_ids == NULL) ? j : tri_ids[j];
+    manning_friction_sloped_semi_implicit_edge_based_k(D, k, eps, g, one_third, seven_thirds);
   }
 }
 
+void _openmp_manning_friction_sloped_semi_implicit_edge_based(const struct domain *__restrict D)
+{
+  manning_friction_sloped_semi_implicit_edge_based_ids(D, NULL, D->number_of_elements);
+}
+
+void _openmp_manning_friction_sloped_semi_implicit_edge_based_active(const struct domain *__restrict D,
+                                                                     const anuga_int *__restrict tri_ids,
+                                                                     const anuga_int n)
+{
+  manning_friction_sloped_semi_implicit_edge_based_ids(D, tri_ids, n);
+}
+
 // Original function for flat friction
 void _openmp_manning_friction_flat(const double g, const double eps, const anuga_int N,
                                    double *__restrict w, double *__restrict z_centroid,
@@ -1555,25 +2153,48 @@ void _openmp_manning_friction_sloped_edge_based(const double g, const double eps
 }
 
 
+// Set a full triangle k with negative depth to zero depth and momentum.
+// Returns 1 if the triangle was fixed, 0 otherwise
+static inline anuga_int fix_negative_cell_k(const struct domain *__restrict D, const anuga_int k)
+{
+  if ((D->stage_centroid_values[k] - D->bed_centroid_values[k] < 0.0) & (D->tri_full_flag[k] > 0))
+  {
+    D->stage_centroid_values[k] = D->bed_centroid_values[k];
+    D->xmom_centroid_values[k] = 0.0;
+    D->ymom_centroid_values[k] = 0.0;
+    return 1;
+  }
+  return 0;
+}
+
 // Computational function for flux computation
-anuga_int _openmp_fix_negative_cells(const struct domain *__restrict D)
+static anuga_int fix_negative_cells_ids(const struct domain *__restrict D,
+                                        const anuga_int *__restrict tri_ids,
+                                        const anuga_int N)
 {
   anuga_int num_negative_cells = 0;
 
-#pragma omp parallel for schedule(static) reduction(+ : num_negative_cells)
-  for (anuga_int k = 0; k < D->number_of_elements; k++)
-  {
-    if ((D->stage_centroid_values[k] - D->bed_centroid_values[k] < 0.0) & (D->tri_full_flag[k] > 0))
-    {
-      num_negative_cells = num_negative_cells + 1;
-      D->stage_centroid_values[k] = D->bed_centroid_values[k];
-      D->xmom_centroid_values[k] = 0.0;
-      D->ymom_centroid_values[k] = 0.0;
-    }
+#pragma omp parallel for schedule(static) reduction(+ : num_negative_cells)
+  for (anuga_int j = 0; j < N; j++)
+  {
+    anuga_int k = (tri_ids == NULL) ? j : tri_ids[j];
+    num_negative_cells += fix_negative_cell_k(D, k);
   }
   return num_negative_cells;
 }
 
+anuga_int _openmp_fix_negative_cells(const struct domain *__restrict D)
+{
+  return fix_negative_cells_ids(D, NULL, D->number_of_elements);
+}
+
+anuga_int _openmp_fix_negative_cells_active(const struct domain *__restrict D,
+                                            const anuga_int *__restrict tri_ids,
+                                            const anuga_int n)
+{
+  return fix_negative_cells_ids(D, tri_ids, n);
+}
+
 
 anuga_int _openmp_gravity(const struct domain *__restrict D) {
 
@@ -2303,81 +2924,107 @@ anuga_int _extrapolate_second_order_sw(anuga_int number_of_elements,
 }
 
 
-anuga_int _openmp_update_conserved_quantities(const struct domain *__restrict D, 
-                                              const double timestep)
+// Update the centroid values of triangle k based on the values stored in
+// explicit_update and semi_implicit_update and the given timestep
+static inline void update_conserved_quantities_k(const struct domain *__restrict D,
+                                                 const anuga_int k,
+                                                 const double timestep)
+{
+  double stage_c, xmom_c, ymom_c;
+
+  double denominator;
+
+  // use previous centroid value
+  stage_c = D->stage_centroid_values[k];
+  if (stage_c == 0.0) {
+    D->stage_semi_implicit_update[k] = 0.0;
+  } else {
+    D->stage_semi_implicit_update[k] /= stage_c;
+  }
+
+
+  xmom_c = D->xmom_centroid_values[k];
+  if (xmom_c == 0.0) {
+    D->xmom_semi_implicit_update[k] = 0.0;
+  } else {
+    D->xmom_semi_implicit_update[k] /= xmom_c;
+  }
+
+  ymom_c = D->ymom_centroid_values[k];
+  if (ymom_c == 0.0) {
+    D->ymom_semi_implicit_update[k] = 0.0;
+  } else {
+    D->ymom_semi_implicit_update[k] /= ymom_c;
+  }
+
+  // Explicit updates
+  D->stage_centroid_values[k] += timestep*D->stage_explicit_update[k];
+  D->xmom_centroid_values[k]  += timestep*D->xmom_explicit_update[k];
+  D->ymom_centroid_values[k]  += timestep*D->ymom_explicit_update[k];
+
+  // Semi implicit updates
+  denominator = 1.0 - timestep*D->stage_semi_implicit_update[k];
+  if (denominator > 0.0) {
+    //Update conserved_quantities from semi implicit updates
+    D->stage_centroid_values[k] /= denominator;
+  }
+
+  denominator = 1.0 - timestep*D->xmom_semi_implicit_update[k];
+  if (denominator > 0.0) {
+    //Update conserved_quantities from semi implicit updates
+    D->xmom_centroid_values[k] /= denominator;
+  }
+
+  denominator = 1.0 - timestep*D->ymom_semi_implicit_update[k];
+  if (denominator > 0.0) {
+    //Update conserved_quantities from semi implicit updates
+    D->ymom_centroid_values[k] /= denominator;
+  }
+
+  // Reset semi_implicit_update here ready for next time step
+  D->stage_semi_implicit_update[k] = 0.0;
+  D->xmom_semi_implicit_update[k] = 0.0;
+  D->ymom_semi_implicit_update[k] = 0.0;
+}
+
+static anuga_int update_conserved_quantities_ids(const struct domain *__restrict D, 
+                                                 const double timestep,
+                                                 const anuga_int *__restrict tri_ids,
+                                                 const anuga_int N)
       {
 	// Update centroid values based on values stored in
 	// explicit_update and semi_implicit_update as well as given timestep
+	// for the triangles tri_ids[0:N] (NULL for all the triangles)
 
 
-	anuga_int k;
-  anuga_int N = D->number_of_elements;
+	anuga_int j;
   
 
 	// Divide semi_implicit update by conserved quantity
-	#pragma omp parallel for private(k) schedule(static) shared(D) firstprivate(N, timestep)
-	for (k=0; k<N; k++) {
-
-    double stage_c, xmom_c, ymom_c;
-
-    double denominator;
-
-		// use previous centroid value
-		stage_c = D->stage_centroid_values[k];
-		if (stage_c == 0.0) {
-			D->stage_semi_implicit_update[k] = 0.0;
-		} else {
-			D->stage_semi_implicit_update[k] /= stage_c;
-		}
- 
+	#pragma omp parallel for private(j) schedule(static) shared(D, tri_ids) firstprivate(timestep)
+	for (j=0; j<N; j++) {
 
-    xmom_c = D->xmom_centroid_values[k];
-		if (xmom_c == 0.0) {
-			D->xmom_semi_implicit_update[k] = 0.0;
-		} else {
-			D->xmom_semi_implicit_update[k] /= xmom_c;
-		}
-
-    ymom_c = D->ymom_centroid_values[k];
-		if (ymom_c == 0.0) {
-			D->ymom_semi_implicit_update[k] = 0.0;
-		} else {
-			D->ymom_semi_implicit_update[k] /= ymom_c;
-		}
-
-		// Explicit updates
-		D->stage_centroid_values[k] += timestep*D->stage_explicit_update[k];
-    D->xmom_centroid_values[k]  += timestep*D->xmom_explicit_update[k];
-    D->ymom_centroid_values[k]  += timestep*D->ymom_explicit_update[k];
-
-		// Semi implicit updates
-		denominator = 1.0 - timestep*D->stage_semi_implicit_update[k];
-		if (denominator > 0.0) {
-			//Update conserved_quantities from semi implicit updates
-			D->stage_centroid_values[k] /= denominator;
-		}
-
-    denominator = 1.0 - timestep*D->xmom_semi_implicit_update[k];
-		if (denominator > 0.0) {
-			//Update conserved_quantities from semi implicit updates
-			D->xmom_centroid_values[k] /= denominator;
-		}
-
-    denominator = 1.0 - timestep*D->ymom_semi_implicit_update[k];
-		if (denominator > 0.0) {
-			//Update conserved_quantities from semi implicit updates
-			D->ymom_centroid_values[k] /= denominator;
-		}
-		
-		// Reset semi_implicit_update here ready for next time step
-		D->stage_semi_implicit_update[k] = 0.0;
-    D->xmom_semi_implicit_update[k] = 0.0;
-    D->ymom_semi_implicit_update[k] = 0.0;
+    anuga_int k = (tri_ids == NULL) ? j : tri_ids[j];
+    update_conserved_quantities_k(D, k, timestep);
 	}
 
 	return 0;
 }
 
+anuga_int _openmp_update_conserved_quantities(const struct domain *__restrict D, 
+                                              const double timestep)
+{
+  return update_conserved_quantities_ids(D, timestep, NULL, D->number_of_elements);
+}
+
+anuga_int _openmp_update_conserved_quantities_active(const struct domain *__restrict D, 
+                                                     const double timestep,
+                                                     const anuga_int *__restrict tri_ids,
+                                                     const anuga_int n)
+{
+  return update_conserved_quantities_ids(D, timestep, tri_ids, n);
+}
+
 anuga_int _openmp_saxpy_conserved_quantities(const struct domain *__restrict D, 
                                              const double a, 
                                              const double b, 
@@ -2440,6 +3087,228 @@ anuga_int _openmp_saxpy_conserved_quantities(const struct domain *__restrict D,
   return 0;
 }
 
+// Local timestepping
+//
+// With max_flux_update_frequency F = 2**nlevels > 1 the flux across an
+// edge is only recomputed every flux_update_frequency (1, 2, 4, .. F)
+// timesteps, the last flux being used in between, and a triangle is only
+// updated every P timesteps, P the largest flux_update_frequency of its
+// edges. The flux integrals (flux times timestep) are accumulated for each
+// triangle until it is updated, so the same amount leaves one triangle
+// and enters its neighbour and the scheme stays conservative. The
+// frequencies are set at the start of each cycle of F timesteps, when all
+// the fluxes are recomputed and all the triangles are up to date.
+
+// Largest power of 2 (up to F) such that frequency*flux_timestep is within
+// the CFL timestep of triangle k, from the edge max speeds (neigh_work)
+static inline anuga_int triangle_flux_update_frequency(const struct domain *__restrict D,
+                                                       const anuga_int k,
+                                                       const double flux_timestep)
+{
+  anuga_int k3 = 3 * k;
+  double max_speed = fmax(fmax(D->neigh_work[k3], D->neigh_work[k3 + 1]), D->neigh_work[k3 + 2]);
+
+  if (max_speed <= D->epsilon)
+  {
+    return D->max_flux_update_frequency;
+  }
+
+  double triangle_timestep = D->radii[k] / max_speed;
+
+  anuga_int frequency = 1;
+  while (2 * frequency <= D->max_flux_update_frequency && 2 * frequency * flux_timestep <= triangle_timestep)
+  {
+    frequency *= 2;
+  }
+
+  return frequency;
+}
+
+// Set flux_update_frequency (and edge_timestep) for each edge from the
+// last flux calculation across all the edges. flux_timestep is the smallest
+// CFL timestep, the timestep is not allowed to increase during the cycle.
+// The frequency of an edge is the smaller of the frequencies of its two
+// triangles.
+void _openmp_compute_flux_update_frequency(const struct domain *__restrict D,
+                                           const double flux_timestep)
+{
+  anuga_int N = D->number_of_elements;
+  double epsilon = D->epsilon;
+
+#pragma omp parallel for schedule(static) firstprivate(N, epsilon, flux_timestep)
+  for (anuga_int k = 0; k < N; k++)
+  {
+    anuga_int frequency_k = triangle_flux_update_frequency(D, k, flux_timestep);
+
+    for (anuga_int i = 0; i < 3; i++)
+    {
+      anuga_int ki = 3 * k + i;
+      anuga_int n = D->neighbours[ki];
+
+      anuga_int frequency = frequency_k;
+      if (n >= 0)
+      {
+        anuga_int frequency_n = triangle_flux_update_frequency(D, n, flux_timestep);
+        frequency = (frequency_n < frequency) ? frequency_n : frequency;
+      }
+
+      D->flux_update_frequency[ki] = frequency;
+      D->edge_timestep[ki] = D->radii[k] / fmax(D->neigh_work[ki], epsilon);
+    }
+  }
+}
+
+// Euler update for local timestepping, timestep number step of the cycle.
+//
+// The flux integrals are accumulated in accumulator (stage, xmom and ymom
+// of each triangle) and the time since the last update in elapsed. The
+// triangles at the end of their update period are updated, all of them if
+// flush is set or at the end of the cycle. update_next_flux and
+// update_extrapolation are set for the next timestep. Returns 1 if the
+// next timestep starts a new cycle.
+anuga_int _openmp_update_conserved_quantities_local(const struct domain *__restrict D,
+                                                    const double timestep,
+                                                    const anuga_int step,
+                                                    const anuga_int flush,
+                                                    double *__restrict accumulator,
+                                                    double *__restrict elapsed)
+{
+  anuga_int N = D->number_of_elements;
+  anuga_int next_step = step + 1;
+  anuga_int restart = (flush != 0) | (next_step >= D->max_flux_update_frequency);
+
+#pragma omp parallel for schedule(static) firstprivate(N, timestep, next_step, restart)
+  for (anuga_int k = 0; k < N; k++)
+  {
+    anuga_int k3 = 3 * k;
+
+    accumulator[k3] += timestep * D->stage_explicit_update[k];
+    accumulator[k3 + 1] += timestep * D->xmom_explicit_update[k];
+    accumulator[k3 + 2] += timestep * D->ymom_explicit_update[k];
+    elapsed[k] += timestep;
+
+    anuga_int period = D->flux_update_frequency[k3];
+    for (anuga_int i = 1; i < 3; i++)
+    {
+      period = (D->flux_update_frequency[k3 + i] > period) ? D->flux_update_frequency[k3 + i] : period;
+    }
+
+    if (restart || (next_step % period == 0))
+    {
+      double dt = elapsed[k];
+      double stage_c = D->stage_centroid_values[k];
+      double xmom_c = D->xmom_centroid_values[k];
+      double ymom_c = D->ymom_centroid_values[k];
+
+      // Semi implicit updates divided by the conserved quantity
+      double stage_si = (stage_c == 0.0) ? 0.0 : D->stage_semi_implicit_update[k] / stage_c;
+      double xmom_si = (xmom_c == 0.0) ? 0.0 : D->xmom_semi_implicit_update[k] / xmom_c;
+      double ymom_si = (ymom_c == 0.0) ? 0.0 : D->ymom_semi_implicit_update[k] / ymom_c;
+
+      // Accumulated explicit updates
+      D->stage_centroid_values[k] += accumulator[k3];
+      D->xmom_centroid_values[k] += accumulator[k3 + 1];
+      D->ymom_centroid_values[k] += accumulator[k3 + 2];
+
+      // Semi implicit updates over the elapsed time
+      double denominator = 1.0 - dt * stage_si;
+      if (denominator > 0.0)
+      {
+        D->stage_centroid_values[k] /= denominator;
+      }
+      denominator = 1.0 - dt * xmom_si;
+      if (denominator > 0.0)
+      {
+        D->xmom_centroid_values[k] /= denominator;
+      }
+      denominator = 1.0 - dt * ymom_si;
+      if (denominator > 0.0)
+      {
+        D->ymom_centroid_values[k] /= denominator;
+      }
+
+      accumulator[k3] = 0.0;
+      accumulator[k3 + 1] = 0.0;
+      accumulator[k3 + 2] = 0.0;
+      elapsed[k] = 0.0;
+    }
+
+    // The forcing terms are recomputed every timestep
+    D->stage_semi_implicit_update[k] = 0.0;
+    D->xmom_semi_implicit_update[k] = 0.0;
+    D->ymom_semi_implicit_update[k] = 0.0;
+
+    // Fluxes and extrapolation needed for the next timestep
+    anuga_int extrapolate = 0;
+    for (anuga_int i = 0; i < 3; i++)
+    {
+      anuga_int update = restart || (next_step % D->flux_update_frequency[k3 + i] == 0);
+      D->update_next_flux[k3 + i] = update;
+      extrapolate = extrapolate | update;
+    }
+    D->update_extrapolation[k] = extrapolate;
+  }
+
+  return restart;
+}
+
+// One half edge (see get_unique_edges) for each edge flagged in
+// update_next_flux, returns the number of edges
+anuga_int _openmp_get_flux_update_edges(const struct domain *__restrict D,
+                                        anuga_int *__restrict edge_ids)
+{
+  anuga_int number_of_edges = 0;
+
+  for (anuga_int k = 0; k < D->number_of_elements; k++)
+  {
+    if (D->update_extrapolation[k] == 0)
+    {
+      continue;
+    }
+    for (anuga_int i = 0; i < 3; i++)
+    {
+      anuga_int ki = 3 * k + i;
+      anuga_int n = D->neighbours[ki];
+      if (D->update_next_flux[ki] && (n < 0 || k < n))
+      {
+        edge_ids[number_of_edges++] = ki;
+      }
+    }
+  }
+
+  return number_of_edges;
+}
+
+// SAXPY of the active triangles tri_ids[0:n] only, the inactive
+// triangles do not change during a timestep
+anuga_int _openmp_saxpy_conserved_quantities_active(const struct domain *__restrict D, 
+                                                    const double a, 
+                                                    const double b, 
+                                                    const double c,
+                                                    const anuga_int *__restrict tri_ids,
+                                                    const anuga_int n)
+{
+  double c_inv = 1.0 / c;
+
+  #pragma omp parallel for simd schedule(static)
+  for (anuga_int i = 0; i < n; i++)
+  {
+    anuga_int k = tri_ids[i];
+    D->stage_centroid_values[k] = a*D->stage_centroid_values[k] + b*D->stage_backup_values[k];
+    D->xmom_centroid_values[k]  = a*D->xmom_centroid_values[k] + b*D->xmom_backup_values[k];
+    D->ymom_centroid_values[k]  = a*D->ymom_centroid_values[k] + b*D->ymom_backup_values[k];
+
+    if (c != 1.0)
+    {
+      D->stage_centroid_values[k] *= c_inv;
+      D->xmom_centroid_values[k]  *= c_inv;
+      D->ymom_centroid_values[k]  *= c_inv;
+    }
+  }
+
+  return 0;
+}
+
 anuga_int _openmp_backup_conserved_quantities(const struct domain *__restrict D)
 {
   anuga_int k;
@@ -2485,13 +3354,144 @@ void _openmp_set_omp_num_threads(anuga_int num_threads)
   omp_set_num_threads(num_threads);
 }
 
+// Boundary kernels used by _openmp_evaluate_boundary_segments, the codes
+// must match BOUNDARY_KERNELS in sw_domain_openmp_ext.pyx
+#define BOUNDARY_REFLECTIVE 0
+#define BOUNDARY_DIRICHLET 1
+#define BOUNDARY_TRANSMISSIVE_N_MOMENTUM_ZERO_T_MOMENTUM_SET_STAGE 2
+#define BOUNDARY_TIME_STAGE_ZERO_MOMENTUM 3
+#define BOUNDARY_CHARACTERISTIC_STAGE 4
+#define BOUNDARY_FLATHER_EXTERNAL_STAGE_ZERO_VELOCITY 5
+
+static inline void reflective_boundary_edge(struct domain *D, const anuga_int b,
+                                            const anuga_int ki, const double n1, const double n2)
+{
+  D->stage_boundary_values[b] = D->stage_edge_values[ki];
+  // the bed is the elevation
+  D->bed_boundary_values[b] = D->bed_edge_values[ki];
+  D->height_boundary_values[b] = D->height_edge_values[ki];
+
+  double q1 = D->xmom_edge_values[ki];
+  double q2 = D->ymom_edge_values[ki];
+
+  double r1 = -q1 * n1 - q2 * n2;
+  double r2 = -q1 * n2 + q2 * n1;
+
+  D->xmom_boundary_values[b] = n1 * r1 - n2 * r2;
+  D->ymom_boundary_values[b] = n2 * r1 + n1 * r2;
+
+  q1 = D->xvelocity_edge_values[ki];
+  q2 = D->yvelocity_edge_values[ki];
+
+  r1 = q1 * n1 + q2 * n2;
+  r2 = q1 * n2 - q2 * n1;
+
+  D->xvelocity_boundary_values[b] = n1 * r1 - n2 * r2;
+  D->yvelocity_boundary_values[b] = n2 * r1 + n1 * r2;
+}
+
+// Stage set from outside, normal momentum from inside, zero tangential momentum
+static inline void transmissive_n_momentum_boundary_edge(struct domain *D, const anuga_int b,
+                                                         const anuga_int ki, const double n1, const double n2,
+                                                         const double stage)
+{
+  const double ndotq = n1 * D->xmom_edge_values[ki] + n2 * D->ymom_edge_values[ki];
+
+  D->stage_boundary_values[b] = stage;
+  D->xmom_boundary_values[b] = ndotq * n1;
+  D->ymom_boundary_values[b] = ndotq * n2;
+}
+
+// Stage set from outside via the Riemann invariant of a simple incoming wave
+static inline void characteristic_stage_boundary_edge(struct domain *D, const anuga_int b,
+                                                      const anuga_int ki, const double n1, const double n2,
+                                                      const double w_outside)
+{
+  const double elev = D->bed_edge_values[ki];
+  const double xmom = D->xmom_edge_values[ki];
+  const double ymom = D->ymom_edge_values[ki];
+
+  D->bed_boundary_values[b] = elev;
+
+  const double h_inside = fmax(D->stage_edge_values[ki] - elev, 0.0);
+  const double h_outside = fmax(w_outside - elev, 0.0);
+
+  if (h_inside == 0.0 || h_outside == 0.0)
+  {
+    D->stage_boundary_values[b] = w_outside;
+    D->xmom_boundary_values[b] = 0.0;
+    D->ymom_boundary_values[b] = 0.0;
+    return;
+  }
+
+  const double sqrt_g = sqrt(D->g);
+  const double uh_inside = n1 * xmom + n2 * ymom;
+  const double vh_inside = n2 * xmom - n1 * ymom;
+  const double u_inside = uh_inside / h_inside;
+
+  const double sqrt_h_inside = sqrt(h_inside);
+  const double sqrt_h_outside = sqrt(h_outside);
+
+  const double h_m = pow(0.5 * (sqrt_h_inside + sqrt_h_outside) + u_inside / 4.0 / sqrt_g, 2.0);
+  const double u_m = 0.5 * u_inside + sqrt_g * (sqrt_h_inside - sqrt_h_outside);
+
+  const double uh_m = h_m * u_m;
+  // if uh_inside > 0.0 then outflow
+  const double vh_m = (uh_inside > 0.0) ? vh_inside : 0.0;
+
+  D->stage_boundary_values[b] = h_m + elev;
+  D->xmom_boundary_values[b] = uh_m * n1 + vh_m * n2;
+  D->ymom_boundary_values[b] = uh_m * n2 - vh_m * n1;
+}
+
+// Flather type boundary with external stage and zero external velocity
+static inline void flather_boundary_edge(struct domain *D, const anuga_int b, const anuga_int k,
+                                         const anuga_int ki, const double n1, const double n2,
+                                         const double stage_outside)
+{
+  const double elev = D->bed_edge_values[ki];
+  const double stage = D->stage_edge_values[ki];
+  const double xmom = D->xmom_edge_values[ki];
+  const double ymom = D->ymom_edge_values[ki];
+  const double bed = D->bed_centroid_values[k];
+
+  D->bed_boundary_values[b] = elev;
+
+  const double depth_inside = fmax(stage - bed, 0.0);
+
+  if (depth_inside == 0.0 || stage_outside > bed)
+  {
+    D->stage_boundary_values[b] = (bed <= stage_outside) ? stage_outside : elev;
+    D->xmom_boundary_values[b] = 0.0;
+    D->ymom_boundary_values[b] = 0.0;
+    return;
+  }
+
+  // Assume subcritical flow, see Blayo and Debreu (2005)
+  const double sqrt_g_on_depth_inside = sqrt(D->g / depth_inside);
+  const double ndotq_inside = n1 * xmom + n2 * ymom;
+
+  // w1 = u - sqrt(g/depth)*(Stage_outside)  -- uses 'outside' info
+  const double w1 = 0.0 - sqrt_g_on_depth_inside * stage_outside;
+  // w2 = v [velocity parallel to boundary] -- uses 'inside' info for outflow
+  const double w2 = (ndotq_inside > 0.0) ? (n2 * xmom - n1 * ymom) / depth_inside : 0.0;
+  // w3 = u + sqrt(g/depth)*(Stage_inside) -- uses 'inside info'
+  const double w3 = ndotq_inside / depth_inside + sqrt_g_on_depth_inside * stage;
+
+  const double qperp = (w3 + w1) / 2.0 * depth_inside;
+  const double qpar = w2 * depth_inside;
+
+  D->stage_boundary_values[b] = (w3 - w1) / (2.0 * sqrt_g_on_depth_inside);
+  D->xmom_boundary_values[b] = qperp * n1 + qpar * n2;
+  D->ymom_boundary_values[b] = qperp * n2 - qpar * n1;
+}
+
 void _openmp_evaluate_reflective_segment(struct domain *D, anuga_int N,
    anuga_int *edge_segment, anuga_int *vol_ids, anuga_int *edge_ids){
 
     #pragma omp parallel for schedule(static)
      for(int k = 0; k < N; k++){
 
-
       // get vol_ids 
       int edge_segment_id = edge_segment[k];
       int vid = vol_ids[k];
@@ -2499,35 +3499,267 @@ void _openmp_evaluate_reflective_segment(struct domain *D, anuga_int N,
       double n1 = D->normals[vid * 6 + 2 * edge_id];
       double n2 = D->normals[vid * 6 + 2 * edge_id + 1];
 
-      D->stage_boundary_values[edge_segment_id] = D->stage_edge_values[3 * vid + edge_id];
-      // the bed is the elevation
-      D->bed_boundary_values[edge_segment_id] = D->bed_edge_values[3 * vid + edge_id];
-      D->height_boundary_values[edge_segment_id] = D->height_edge_values[3 * vid + edge_id];
+      reflective_boundary_edge(D, edge_segment_id, 3 * vid + edge_id, n1, n2);
+     }
+
+}
+
+// Evaluate the boundary values of segment i (see _openmp_evaluate_boundary_segments)
+static inline void evaluate_boundary_segment_i(struct domain *D, const anuga_int i,
+                                               const anuga_int *__restrict ids,
+                                               const anuga_int *__restrict vol_ids,
+                                               const anuga_int *__restrict edge_ids,
+                                               const double *__restrict normals,
+                                               const anuga_int *__restrict segment_boundary,
+                                               const anuga_int *__restrict boundary_kernel,
+                                               const double *__restrict boundary_values)
+{
+  const anuga_int b = ids[i];
+  const anuga_int k = vol_ids[i];
+  const anuga_int ki = 3 * k + edge_ids[i];
+  const double n1 = normals[2 * i];
+  const double n2 = normals[2 * i + 1];
+  const anuga_int j = segment_boundary[i];
+  const double *values = &boundary_values[3 * j];
+
+  switch (boundary_kernel[j])
+  {
+  case BOUNDARY_REFLECTIVE:
+    reflective_boundary_edge(D, b, ki, n1, n2);
+    break;
+  case BOUNDARY_DIRICHLET:
+    D->stage_boundary_values[b] = values[0];
+    D->xmom_boundary_values[b] = values[1];
+    D->ymom_boundary_values[b] = values[2];
+    break;
+  case BOUNDARY_TRANSMISSIVE_N_MOMENTUM_ZERO_T_MOMENTUM_SET_STAGE:
+    transmissive_n_momentum_boundary_edge(D, b, ki, n1, n2, values[0]);
+    break;
+  case BOUNDARY_TIME_STAGE_ZERO_MOMENTUM:
+    D->stage_boundary_values[b] = values[0];
+    D->xmom_boundary_values[b] = 0.0;
+    D->ymom_boundary_values[b] = 0.0;
+    break;
+  case BOUNDARY_CHARACTERISTIC_STAGE:
+    characteristic_stage_boundary_edge(D, b, ki, n1, n2, values[0]);
+    break;
+  case BOUNDARY_FLATHER_EXTERNAL_STAGE_ZERO_VELOCITY:
+    flather_boundary_edge(D, b, k, ki, n1, n2, values[0]);
+    break;
+  }
+}
+
+// Evaluate the boundary values of all the boundary segments handled by
+// a native kernel in one pass. Segment i is boundary edge ids[i] on edge
+// edge_ids[i] of triangle vol_ids[i] with outward normal normals[2i:2i+2].
+// It belongs to boundary object segment_boundary[i] which uses kernel
+// boundary_kernel[b] and the (up to 3) outside values boundary_values[3b:3b+3]
+void _openmp_evaluate_boundary_segments(struct domain *D, const anuga_int N,
+                                        const anuga_int *__restrict ids,
+                                        const anuga_int *__restrict vol_ids,
+                                        const anuga_int *__restrict edge_ids,
+                                        const double *__restrict normals,
+                                        const anuga_int *__restrict segment_boundary,
+                                        const anuga_int *__restrict boundary_kernel,
+                                        const double *__restrict boundary_values)
+{
+#pragma omp parallel for schedule(static)
+  for (anuga_int i = 0; i < N; i++)
+  {
+    evaluate_boundary_segment_i(D, i, ids, vol_ids, edge_ids, normals,
+                                segment_boundary, boundary_kernel, boundary_values);
+  }
+}
+
+// Gather the centroid values of nq quantities for the triangles tri_ids
+// into the rows of buffer (row i holds triangle tri_ids[i], stride doubles per row)
+void _openmp_pack_ghost_buffer(double **centroid_values, const anuga_int nq,
+                               const anuga_int *__restrict tri_ids, const anuga_int n,
+                               double *__restrict buffer, const anuga_int stride)
+{
+#pragma omp parallel for schedule(static)
+  for (anuga_int i = 0; i < n; i++)
+  {
+    const anuga_int k = tri_ids[i];
+    for (anuga_int q = 0; q < nq; q++)
+    {
+      buffer[i * stride + q] = centroid_values[q][k];
+    }
+  }
+}
+
+// Scatter the rows of buffer into the centroid values of nq quantities
+// for the triangles tri_ids (inverse of _openmp_pack_ghost_buffer)
+void _openmp_unpack_ghost_buffer(double **centroid_values, const anuga_int nq,
+                                 const anuga_int *__restrict tri_ids, const anuga_int n,
+                                 const double *__restrict buffer, const anuga_int stride)
+{
+#pragma omp parallel for schedule(static)
+  for (anuga_int i = 0; i < n; i++)
+  {
+    const anuga_int k = tri_ids[i];
+    for (anuga_int q = 0; q < nq; q++)
+    {
+      centroid_values[q][k] = buffer[i * stride + q];
+    }
+  }
+}
 
-      double q1 = D->xmom_edge_values[3 * vid + edge_id];
-      double q2 = D->ymom_edge_values[3 * vid + edge_id];
+// Fused RK2 stepping engine.
+//
+// One stage of Domain.evolve_one_rk2_step in a single parallel region,
+// the phases are separated by the implicit barriers of the worksharing
+// loops.
+//
+// stage 0: backup, protect, extrapolate (edge and vertex values),
+//          boundary values, fluxes and friction
+// stage 1: update with timestep, protect, extrapolate, boundary values,
+//          fluxes, friction, update with timestep and combine with the
+//          backup (saxpy 0.5, 0.5)
+//
+// The boundary values are evaluated for the number_of_segments segments
+// handled by a native kernel (see _openmp_evaluate_boundary_segments).
+// Returns the flux timestep as _openmp_compute_fluxes_central does, the
+// mass added by the protection in mass_error and the number of cells with
+// negative depth set to zero in num_negative_cells.
+
+#define FRICTION_NONE 0
+#define FRICTION_FLAT 1
+#define FRICTION_SLOPED 2
+
+double _openmp_evolve_one_rk2_stage(struct domain *__restrict D,
+                                    const anuga_int stage,
+                                    const double timestep,
+                                    const anuga_int friction_method,
+                                    const anuga_int number_of_segments,
+                                    const anuga_int *__restrict ids,
+                                    const anuga_int *__restrict vol_ids,
+                                    const anuga_int *__restrict edge_ids,
+                                    const double *__restrict normals,
+                                    const anuga_int *__restrict segment_boundary,
+                                    const anuga_int *__restrict boundary_kernel,
+                                    const double *__restrict boundary_values,
+                                    double *mass_error,
+                                    anuga_int *num_negative_cells)
+{
+  const anuga_int number_of_elements = D->number_of_elements;
+  const double minimum_allowed_height = D->minimum_allowed_height;
+  const anuga_int extrapolate_velocity_second_order = D->extrapolate_velocity_second_order;
 
-      double r1 = -q1*n1 - q2*n2;
-      double r2 = -q1*n2 + q2*n1;
+  const anuga_int low_froude = D->low_froude;
+  const double g = D->g;
+  const double epsilon = D->epsilon;
+  const anuga_int ncol_riverwall_hydraulic_properties = D->ncol_riverwall_hydraulic_properties;
 
-      double x_mom_boundary_value = n1*r1 - n2*r2;
-      double y_mom_boundary_value = n2*r1 + n1*r2;
+  const double one_third = 1.0 / 3.0;
+  const double seven_thirds = 7.0 / 3.0;
 
-      D->xmom_boundary_values[edge_segment_id] = x_mom_boundary_value;
-      D->ymom_boundary_values[edge_segment_id] = y_mom_boundary_value;
+  double c_tmp, d_tmp;
+  get_hfactor_parameters(&c_tmp, &d_tmp);
 
-      q1 = D->xvelocity_edge_values[3 * vid + edge_id];
-      q2 = D->yvelocity_edge_values[3 * vid + edge_id];
+  // Which substep of the timestepping method are we on?
+  const anuga_int substep_count = get_flux_substep_count(D);
 
-      r1 = q1*n1 + q2*n2;
-      r2 = q1*n2 - q2*n1;
+  double local_timestep = 1.0e+100;
+  double boundary_flux_sum_substep = 0.0;
+  double mass = 0.0;
+  anuga_int negative = 0;
 
-      double x_vel_boundary_value = n1*r1 - n2*r2;
-      double y_vel_boundary_value = n2*r1 + n1*r2;
+#pragma omp parallel
+  {
+    // Centroid values: update (stage 1), protect and convert to velocities
+#pragma omp for schedule(static) reduction(+ : mass, negative)
+    for (anuga_int k = 0; k < number_of_elements; k++)
+    {
+      if (stage == 0)
+      {
+        D->stage_backup_values[k] = D->stage_centroid_values[k];
+        D->xmom_backup_values[k] = D->xmom_centroid_values[k];
+        D->ymom_backup_values[k] = D->ymom_centroid_values[k];
+      }
+      else
+      {
+        update_conserved_quantities_k(D, k, timestep);
+        negative += fix_negative_cell_k(D, k);
+      }
+      mass += protect_k(D, k, minimum_allowed_height);
+      update_centroid_value_k(D, k, minimum_allowed_height, extrapolate_velocity_second_order);
+    }
 
-      D->xvelocity_boundary_values[edge_segment_id] = x_vel_boundary_value;
-      D->yvelocity_boundary_values[edge_segment_id] = y_vel_boundary_value;
+    // Edge values, reading the centroid values of the neighbours
+#pragma omp for schedule(static)
+    for (anuga_int k = 0; k < number_of_elements; k++)
+    {
+      extrapolate_second_order_edge_k(D, k, minimum_allowed_height, c_tmp, d_tmp);
+    }
 
-     }
+    // Back to momenta and vertex values
+#pragma omp for schedule(static)
+    for (anuga_int k = 0; k < number_of_elements; k++)
+    {
+      if (extrapolate_velocity_second_order == 1)
+      {
+        D->xmom_centroid_values[k] = D->x_centroid_work[k];
+        D->ymom_centroid_values[k] = D->y_centroid_work[k];
+      }
+      distribute_edges_to_vertices_k(D, k);
+    }
+
+#pragma omp for schedule(static)
+    for (anuga_int i = 0; i < number_of_segments; i++)
+    {
+      evaluate_boundary_segment_i(D, i, ids, vol_ids, edge_ids, normals,
+                                  segment_boundary, boundary_kernel, boundary_values);
+    }
+
+    // Fluxes and friction
+#pragma omp for schedule(static) reduction(min : local_timestep) reduction(+ : boundary_flux_sum_substep)
+    for (anuga_int k = 0; k < number_of_elements; k++)
+    {
+      double timestep_k, boundary_flux_k;
+
+      compute_fluxes_central_k(D, k, substep_count, ncol_riverwall_hydraulic_properties,
+                               epsilon, g, low_froude, &timestep_k, &boundary_flux_k);
+
+      local_timestep = fmin(local_timestep, timestep_k);
+      boundary_flux_sum_substep += boundary_flux_k;
+
+      if (friction_method == FRICTION_FLAT)
+      {
+        manning_friction_flat_semi_implicit_k(D, k, minimum_allowed_height, g, seven_thirds);
+      }
+      else if (friction_method == FRICTION_SLOPED)
+      {
+        manning_friction_sloped_semi_implicit_edge_based_k(D, k, minimum_allowed_height, g,
+                                                           one_third, seven_thirds);
+      }
+    }
+
+    if (stage == 1)
+    {
+#pragma omp for schedule(static) reduction(+ : negative)
+      for (anuga_int k = 0; k < number_of_elements; k++)
+      {
+        update_conserved_quantities_k(D, k, timestep);
+        negative += fix_negative_cell_k(D, k);
+
+        D->stage_centroid_values[k] = 0.5 * D->stage_centroid_values[k] + 0.5 * D->stage_backup_values[k];
+        D->xmom_centroid_values[k] = 0.5 * D->xmom_centroid_values[k] + 0.5 * D->xmom_backup_values[k];
+        D->ymom_centroid_values[k] = 0.5 * D->ymom_centroid_values[k] + 0.5 * D->ymom_backup_values[k];
+      }
+    }
+  }
 
-}
\ No newline at end of file
+  D->boundary_flux_sum[substep_count] = boundary_flux_sum_substep;
+
+  *mass_error = mass;
+  *num_negative_cells = negative;
+
+  // Ensure we only update the timestep on the first call within each rk2/rk3 step
+  if (substep_count == 0)
+  {
+    return local_timestep;
+  }
+
+  return D->evolve_max_timestep;
+}
@@ -2,6 +2,7 @@
 
 import cython
 from libc.stdint cimport int64_t
+from libc.stdlib cimport malloc, free
 
 # import both numpy and the Cython declarations for numpy
 import numpy as np
@@ -100,25 +101,43 @@ cdef extern from "sw_domain_openmp.c" nogil:
 		double* xmom_backup_values
 		double* ymom_backup_values
 
-
-
 	struct edge:
 		pass
 
 	int64_t __rotate(double *q, double n1, double n2)
 	void _openmp_set_omp_num_threads(int64_t num_threads)
+	void _openmp_reset_flux_substep_count()
 	double _openmp_compute_fluxes_central(domain* D, double timestep)
+	double _openmp_compute_fluxes_central_edge_based(domain* D, double timestep, int64_t* edge_ids, int64_t number_of_edges)
+	double _openmp_compute_fluxes_central_active(domain* D, double timestep, int64_t* tri_ids, int64_t n)
+	double _openmp_compute_fluxes_central_edge_based_active(domain* D, double timestep, int64_t* edge_ids, int64_t number_of_edges, int64_t* tri_ids, int64_t n)
 	double _openmp_protect(domain* D)
+	double _openmp_protect_active(domain* D, int64_t* tri_ids, int64_t n)
+	int64_t _openmp_update_active_cells(domain* D, int64_t* active_flag, int64_t* old_flag, int64_t fringe, int64_t* tri_ids, int64_t* edge_ids, int64_t* number_of_edges)
+	void _openmp_extrapolate_second_order_edge_sw_active(domain* D, int64_t* tri_ids, int64_t n)
+	void _openmp_distribute_edges_to_vertices_active(domain* D, int64_t* tri_ids, int64_t n)
+	void _openmp_extrapolate_second_order_edge_sw_local(domain* D)
+	void _openmp_compute_flux_update_frequency(domain* D, double flux_timestep)
+	int64_t _openmp_update_conserved_quantities_local(domain* D, double timestep, int64_t step, int64_t flush, double* accumulator, double* elapsed)
+	int64_t _openmp_get_flux_update_edges(domain* D, int64_t* edge_ids)
 	void _openmp_extrapolate_second_order_sw(domain* D)
 	void _openmp_extrapolate_second_order_edge_sw(domain* D)
+	void _openmp_update_centroid_values_subset(domain* D, int64_t* tri_ids, int64_t n)
+	void _openmp_extrapolate_second_order_edge_sw_subset(domain* D, int64_t* tri_ids, int64_t n)
+	void _openmp_finish_extrapolate_second_order_edge_sw(domain* D)
 	int64_t _openmp_fix_negative_cells(domain* D)
 	int64_t _openmp_gravity(domain *D)
 	int64_t _openmp_gravity_wb(domain *D) 
+	int64_t _openmp_fix_negative_cells_active(domain* D, int64_t* tri_ids, int64_t n)
 	int64_t _openmp_update_conserved_quantities(domain* D, double timestep)
+	int64_t _openmp_update_conserved_quantities_active(domain* D, double timestep, int64_t* tri_ids, int64_t n)
 	void _openmp_manning_friction_flat_semi_implicit(domain *D)
+	void _openmp_manning_friction_flat_semi_implicit_active(domain *D, int64_t* tri_ids, int64_t n)
 	void _openmp_manning_friction_sloped_semi_implicit(domain *D)
 	void _openmp_manning_friction_sloped_semi_implicit_edge_based(domain *D)
+	void _openmp_manning_friction_sloped_semi_implicit_edge_based_active(domain *D, int64_t* tri_ids, int64_t n)
 	int64_t _openmp_saxpy_conserved_quantities(domain *D, double a, double b, double c)
+	int64_t _openmp_saxpy_conserved_quantities_active(domain *D, double a, double b, double c, int64_t* tri_ids, int64_t n)
 	int64_t _openmp_backup_conserved_quantities(domain *D)
 	void _openmp_distribute_edges_to_vertices(domain *D)
 	# FIXME SR: Change over to domain* D argument ?
@@ -126,6 +145,10 @@ cdef extern from "sw_domain_openmp.c" nogil:
 	void _openmp_manning_friction_sloped(double g, double eps, int64_t N, double* x, double* w, double* zv, double* uh, double* vh, double* eta, double* xmom_update, double* ymom_update)
 	void _openmp_manning_friction_sloped_edge_based(double g, double eps, int64_t N, double* x, double* w, double* zv, double* uh, double* vh, double* eta, double* xmom_update, double* ymom_update)
 	void _openmp_evaluate_reflective_segment(domain *D, int64_t N, int64_t *edge_ptr, int64_t *vol_ids_ptr, int64_t *edge_ids_ptr)
+	void _openmp_evaluate_boundary_segments(domain *D, int64_t N, int64_t* ids, int64_t* vol_ids, int64_t* edge_ids, double* normals, int64_t* segment_boundary, int64_t* boundary_kernel, double* boundary_values)
+	double _openmp_evolve_one_rk2_stage(domain* D, int64_t stage, double timestep, int64_t friction_method, int64_t number_of_segments, int64_t* ids, int64_t* vol_ids, int64_t* edge_ids, double* normals, int64_t* segment_boundary, int64_t* boundary_kernel, double* boundary_values, double* mass_error, int64_t* num_negative_cells)
+	void _openmp_pack_ghost_buffer(double** centroid_values, int64_t nq, int64_t* tri_ids, int64_t n, double* buffer, int64_t stride)
+	void _openmp_unpack_ghost_buffer(double** centroid_values, int64_t nq, int64_t* tri_ids, int64_t n, double* buffer, int64_t stride)
 	int64_t __flux_function_central(double* ql, double* qr, double h_left,
 	double h_right, double hle, double hre, double n1, double n2,
 	double epsilon, double ze, double g,
@@ -370,7 +393,6 @@ cdef inline get_python_domain_pointers(domain *D, object domain_object):
 	vertex_values = height.vertex_values
 	D.height_vertex_values = &vertex_values[0,0]
 
-
 	#------------------------------------------------------
 	# Boundary values
 	#------------------------------------------------------
@@ -418,8 +440,6 @@ cdef inline get_python_domain_pointers(domain *D, object domain_object):
 	semi_implicit_update = ymomentum.semi_implicit_update
 	D.ymom_semi_implicit_update = &semi_implicit_update[0]
 
-
-
 	#------------------------------------------------------
 	# Riverwall structures
 	# 
@@ -450,6 +470,94 @@ cdef inline get_python_domain_pointers(domain *D, object domain_object):
 	D.ncol_riverwall_hydraulic_properties = riverwallData.ncol_hydraulic_properties
 
 
+cdef class Native_domain:
+	"""
+	The domain struct used by the kernels, built once from a domain
+	object and kept as domain_object.native_domain, so the array pointers
+	are not gathered on every kernel call.
+
+	The arrays the pointers refer to are referenced by the handle so they
+	stay alive. If any of them is reallocated call
+	domain_object.invalidate_native_domain() and the handle is rebuilt on
+	the next kernel call. The stage and momentum centroid and edge values,
+	the arrays most often replaced, are checked on every call and the
+	handle is rebuilt if one of them is not the array in use.
+	"""
+
+	cdef domain D
+	cdef object arrays
+
+	def __cinit__(self, object domain_object):
+
+		get_python_domain_parameters(&self.D, domain_object)
+		get_python_domain_pointers(&self.D, domain_object)
+
+		# Handles are built between timesteps (start of evolve, yields,
+		# invalidation), so the next flux calculation is the first substep
+		_openmp_reset_flux_substep_count()
+
+		self.arrays = (dict(vars(domain_object)),
+					   [dict(vars(q)) for q in domain_object.quantities.values()],
+					   dict(vars(domain_object.riverwallData)))
+
+	def __reduce__(self):
+		# The pointers are meaningless in another process (e.g. a pickled
+		# checkpoint), the restored domain builds its own handle
+		return (_no_native_domain, ())
+
+
+def _no_native_domain():
+	return None
+
+
+cdef inline bint native_domain_is_current(Native_domain handle, object domain_object):
+
+	cdef np.ndarray array
+
+	quantities = domain_object.quantities
+	stage = quantities["stage"]
+	xmomentum = quantities["xmomentum"]
+	ymomentum = quantities["ymomentum"]
+
+	array = stage.centroid_values
+	if <double*> np.PyArray_DATA(array) != handle.D.stage_centroid_values:
+		return False
+	array = xmomentum.centroid_values
+	if <double*> np.PyArray_DATA(array) != handle.D.xmom_centroid_values:
+		return False
+	array = ymomentum.centroid_values
+	if <double*> np.PyArray_DATA(array) != handle.D.ymom_centroid_values:
+		return False
+
+	array = stage.edge_values
+	if <double*> np.PyArray_DATA(array) != handle.D.stage_edge_values:
+		return False
+	array = xmomentum.edge_values
+	if <double*> np.PyArray_DATA(array) != handle.D.xmom_edge_values:
+		return False
+	array = ymomentum.edge_values
+	if <double*> np.PyArray_DATA(array) != handle.D.ymom_edge_values:
+		return False
+
+	return True
+
+
+cdef inline Native_domain get_native_domain(object domain_object):
+
+	cdef Native_domain handle
+
+	handle = getattr(domain_object, "native_domain", None)
+	if handle is None or not native_domain_is_current(handle, domain_object):
+		handle = Native_domain(domain_object)
+		domain_object.native_domain = handle
+	else:
+		# scalar parameters are cheap to refresh and may be changed
+		# between kernel calls (e.g. set_beta, set_minimum_allowed_height)
+		get_python_domain_parameters(&handle.D, domain_object)
+
+	return handle
+
+
 
 
 #===============================================================================
@@ -463,108 +571,280 @@ def set_omp_num_threads(int64_t num_threads):
 	
 def compute_fluxes_ext_central(object domain_object, double timestep):
 
-	cdef domain D
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
+
+	with nogil:
+		timestep =  _openmp_compute_fluxes_central(D, timestep)
+
+	return timestep
+
+def compute_fluxes_ext_central_edge_based(object domain_object, double timestep, np.ndarray[np.int64_t, ndim=1, mode="c"] edge_ids not None):
+
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
+	cdef int64_t n
+	n = edge_ids.shape[0]
+
+	with nogil:
+		timestep =  _openmp_compute_fluxes_central_edge_based(D, timestep, &edge_ids[0], n)
+
+	return timestep
 
+def compute_fluxes_ext_central_active(object domain_object, double timestep, np.ndarray[np.int64_t, ndim=1, mode="c"] tri_ids not None):
 
-	get_python_domain_parameters(&D, domain_object)
-	get_python_domain_pointers(&D, domain_object)
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
+	cdef int64_t n
+	n = tri_ids.shape[0]
 
 	with nogil:
-		timestep =  _openmp_compute_fluxes_central(&D, timestep)
+		timestep =  _openmp_compute_fluxes_central_active(D, timestep, &tri_ids[0], n)
 
 	return timestep
 
+def compute_fluxes_ext_central_edge_based_active(object domain_object, double timestep, np.ndarray[np.int64_t, ndim=1, mode="c"] edge_ids not None, np.ndarray[np.int64_t, ndim=1, mode="c"] tri_ids not None):
+
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
+	cdef int64_t ne
+	cdef int64_t n
+	ne = edge_ids.shape[0]
+	n = tri_ids.shape[0]
+
+	with nogil:
+		timestep =  _openmp_compute_fluxes_central_edge_based_active(D, timestep, &edge_ids[0], ne, &tri_ids[0], n)
+
+	return timestep
+
+def update_active_cells(object domain_object,
+						np.ndarray[np.int64_t, ndim=1, mode="c"] active_flag not None,
+						np.ndarray[np.int64_t, ndim=1, mode="c"] old_flag not None,
+						int64_t fringe,
+						np.ndarray[np.int64_t, ndim=1, mode="c"] tri_ids not None,
+						np.ndarray[np.int64_t, ndim=1, mode="c"] edge_ids not None):
+	"""
+	Flag the active triangles and list them in tri_ids, and their edges
+	in edge_ids. Returns the number of active triangles and edges.
+	"""
+
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
+	cdef int64_t n
+	cdef int64_t number_of_edges
+
+	with nogil:
+		n = _openmp_update_active_cells(D, &active_flag[0], &old_flag[0], fringe, &tri_ids[0], &edge_ids[0], &number_of_edges)
+
+	return n, number_of_edges
+
 def extrapolate_second_order_sw(object domain_object):
 
-	cdef domain D
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
 	cdef int64_t e
 
-	get_python_domain_parameters(&D, domain_object)
-	get_python_domain_pointers(&D, domain_object)
-
 	with nogil:
-		_openmp_extrapolate_second_order_sw(&D)
+		_openmp_extrapolate_second_order_sw(D)
 
 
 def distribute_edges_to_vertices(object domain_object):
 
-	cdef domain D
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
 	cdef int64_t e
 
-	get_python_domain_parameters(&D, domain_object)
-	get_python_domain_pointers(&D, domain_object)
-
 	with nogil:
-		_openmp_distribute_edges_to_vertices(&D)
+		_openmp_distribute_edges_to_vertices(D)
 
 	
 
 def extrapolate_second_order_edge_sw(object domain_object, distribute_to_vertices=True):
 
-	cdef domain D
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
 	cdef int64_t e
 
-	get_python_domain_parameters(&D, domain_object)
-	get_python_domain_pointers(&D, domain_object)
+	with nogil:
+		_openmp_extrapolate_second_order_edge_sw(D)
+
+	if distribute_to_vertices:
+		with nogil:
+			_openmp_distribute_edges_to_vertices(D)
+
+
 
+def extrapolate_second_order_edge_sw_active(object domain_object, np.ndarray[np.int64_t, ndim=1, mode="c"] tri_ids not None, distribute_to_vertices=True):
+
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
+	cdef int64_t n
+	n = tri_ids.shape[0]
 
 	with nogil:
-		_openmp_extrapolate_second_order_edge_sw(&D)
+		_openmp_extrapolate_second_order_edge_sw_active(D, &tri_ids[0], n)
 
 	if distribute_to_vertices:
 		with nogil:
-			_openmp_distribute_edges_to_vertices(&D)
+			_openmp_distribute_edges_to_vertices_active(D, &tri_ids[0], n)
+
+
+def update_centroid_values_subset(object domain_object, np.ndarray[np.int64_t, ndim=1, mode="c"] tri_ids not None):
 
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
+	cdef int64_t n
+	n = tri_ids.shape[0]
+
+	if n == 0:
+		return
+
+	with nogil:
+		_openmp_update_centroid_values_subset(D, &tri_ids[0], n)
+
+
+def extrapolate_second_order_edge_sw_subset(object domain_object, np.ndarray[np.int64_t, ndim=1, mode="c"] tri_ids not None):
+
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
+	cdef int64_t n
+	n = tri_ids.shape[0]
+
+	if n == 0:
+		return
+
+	with nogil:
+		_openmp_extrapolate_second_order_edge_sw_subset(D, &tri_ids[0], n)
+
+
+def finish_extrapolate_second_order_edge_sw(object domain_object, distribute_to_vertices=True):
+
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
+
+	with nogil:
+		_openmp_finish_extrapolate_second_order_edge_sw(D)
+
+	if distribute_to_vertices:
+		with nogil:
+			_openmp_distribute_edges_to_vertices(D)
 
 
 def protect_new(object domain_object):
 
-	cdef domain D
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
 
 	cdef double mass_error
 
-	get_python_domain_parameters(&D, domain_object)
-	get_python_domain_pointers(&D, domain_object)
-
 	with nogil:
-		mass_error = _openmp_protect(&D)
+		mass_error = _openmp_protect(D)
+
+	return mass_error
+
+def protect_new_active(object domain_object, np.ndarray[np.int64_t, ndim=1, mode="c"] tri_ids not None):
+
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
+	cdef int64_t n
+	cdef double mass_error
+	n = tri_ids.shape[0]
 
+	with nogil:
+		mass_error = _openmp_protect_active(D, &tri_ids[0], n)
 
 	return mass_error
 
-def compute_flux_update_frequency(object domain_object, double timestep):
+def compute_flux_update_frequency(object domain_object, double flux_timestep):
+
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
+
+	with nogil:
+		_openmp_compute_flux_update_frequency(D, flux_timestep)
+
+def extrapolate_second_order_edge_sw_local(object domain_object):
+
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
+
+	with nogil:
+		_openmp_extrapolate_second_order_edge_sw_local(D)
+
+def update_conserved_quantities_local(object domain_object, double timestep, int64_t step, int64_t flush,
+									  np.ndarray[double, ndim=1, mode="c"] accumulator not None,
+									  np.ndarray[double, ndim=1, mode="c"] elapsed not None):
+	"""
+	Accumulate the flux integrals and update the triangles due at the end of
+	timestep step of the local timestepping cycle. Returns the number of
+	negative cells and whether the next timestep starts a new cycle.
+	"""
+
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
+	cdef int64_t restart
+	cdef int64_t num_negative_cells
+
+	with nogil:
+		restart = _openmp_update_conserved_quantities_local(D, timestep, step, flush, &accumulator[0], &elapsed[0])
+		num_negative_cells = _openmp_fix_negative_cells(D)
+
+	return num_negative_cells, restart == 1
+
+def get_flux_update_edges(object domain_object, np.ndarray[np.int64_t, ndim=1, mode="c"] edge_ids not None):
 
-	pass
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
+	cdef int64_t n
+
+	with nogil:
+		n = _openmp_get_flux_update_edges(D, &edge_ids[0])
+
+	return n
 
 def manning_friction_flat_semi_implicit(object domain_object):
 	
-	cdef domain D
-
-	get_python_domain_parameters(&D, domain_object)
-	get_python_domain_pointers(&D, domain_object)
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
 
 	with nogil:
-		_openmp_manning_friction_flat_semi_implicit(&D)
+		_openmp_manning_friction_flat_semi_implicit(D)
 
 def manning_friction_sloped_semi_implicit(object domain_object):
 	
-	cdef domain D
-
-	get_python_domain_parameters(&D, domain_object)
-	get_python_domain_pointers(&D, domain_object)
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
 
 	with nogil:
-		_openmp_manning_friction_sloped_semi_implicit(&D)
+		_openmp_manning_friction_sloped_semi_implicit(D)
 
 def manning_friction_sloped_semi_implicit_edge_based(object domain_object):
 	
-	cdef domain D
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
+
+	with nogil:
+		_openmp_manning_friction_sloped_semi_implicit_edge_based(D)
+
+def manning_friction_flat_semi_implicit_active(object domain_object, np.ndarray[np.int64_t, ndim=1, mode="c"] tri_ids not None):
+	
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
+	cdef int64_t n
+	n = tri_ids.shape[0]
 
-	get_python_domain_parameters(&D, domain_object)
-	get_python_domain_pointers(&D, domain_object)
+	with nogil:
+		_openmp_manning_friction_flat_semi_implicit_active(D, &tri_ids[0], n)
+
+def manning_friction_sloped_semi_implicit_edge_based_active(object domain_object, np.ndarray[np.int64_t, ndim=1, mode="c"] tri_ids not None):
+	
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
+	cdef int64_t n
+	n = tri_ids.shape[0]
 
 	with nogil:
-		_openmp_manning_friction_sloped_semi_implicit_edge_based(&D)
+		_openmp_manning_friction_sloped_semi_implicit_edge_based_active(D, &tri_ids[0], n)
 
 # FIXME SR: Why is the order of arguments different from the C function?
 def manning_friction_flat(double g, double eps,
@@ -616,67 +896,230 @@ def manning_friction_sloped_edge_based(double g, double eps,
 
 def fix_negative_cells(object domain_object):
 
-	cdef domain D
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
 	cdef int64_t num_negative_cells
 
-	get_python_domain_parameters(&D, domain_object)
-	get_python_domain_pointers(&D, domain_object)
-
 	with nogil:
-		num_negative_cells = _openmp_fix_negative_cells(&D)
+		num_negative_cells = _openmp_fix_negative_cells(D)
 
 	return num_negative_cells
 
 def update_conserved_quantities(object domain_object, double timestep):
 
-	cdef domain D
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
 	cdef int64_t num_negative_cells
 
-
-	get_python_domain_parameters(&D, domain_object)
-	get_python_domain_pointers(&D, domain_object)
-
 	with nogil:
-		_openmp_update_conserved_quantities(&D, timestep)
-		num_negative_cells = _openmp_fix_negative_cells(&D)
+		_openmp_update_conserved_quantities(D, timestep)
+		num_negative_cells = _openmp_fix_negative_cells(D)
 
 	return num_negative_cells
 
 def saxpy_conserved_quantities(object domain_object, double a, double b, double c):
 
-	cdef domain D
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
+
+	with nogil:
+		_openmp_saxpy_conserved_quantities(D, a, b, c)
+
 
+def backup_conserved_quantities(object domain_object):
 
-	get_python_domain_parameters(&D, domain_object)
-	get_python_domain_pointers(&D, domain_object)
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
 
 	with nogil:
-		_openmp_saxpy_conserved_quantities(&D, a, b, c)
+		_openmp_backup_conserved_quantities(D)	
 
+def update_conserved_quantities_active(object domain_object, double timestep, np.ndarray[np.int64_t, ndim=1, mode="c"] tri_ids not None):
 
-def backup_conserved_quantities(object domain_object):
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
+	cdef int64_t n
+	cdef int64_t num_negative_cells
+	n = tri_ids.shape[0]
 
-	cdef domain D
+	with nogil:
+		_openmp_update_conserved_quantities_active(D, timestep, &tri_ids[0], n)
+		num_negative_cells = _openmp_fix_negative_cells_active(D, &tri_ids[0], n)
 
+	return num_negative_cells
 
-	get_python_domain_parameters(&D, domain_object)
-	get_python_domain_pointers(&D, domain_object)
+def saxpy_conserved_quantities_active(object domain_object, double a, double b, double c, np.ndarray[np.int64_t, ndim=1, mode="c"] tri_ids not None):
+
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
+	cdef int64_t n
+	n = tri_ids.shape[0]
 
 	with nogil:
-		_openmp_backup_conserved_quantities(&D)	
+		_openmp_saxpy_conserved_quantities_active(D, a, b, c, &tri_ids[0], n)
 
 def evaluate_reflective_segment(object domain_object, np.ndarray[np.int64_t, ndim=1, mode="c"] segment_edges not None, np.ndarray[np.int64_t, ndim=1, mode="c"] vol_ids not None, np.ndarray[np.int64_t, ndim=1, mode="c"] edge_ids not None): 
-	cdef domain D
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
 	cdef int64_t N
 	N = segment_edges.shape[0]
 
-	get_python_domain_parameters(&D, domain_object)
-	get_python_domain_pointers(&D, domain_object)
+	with nogil:
+		_openmp_evaluate_reflective_segment(D, N, &segment_edges[0], &vol_ids[0], &edge_ids[0])
+
+
+# Codes of the native boundary kernels, must match the BOUNDARY_* defines
+# in sw_domain_openmp.c
+BOUNDARY_KERNELS = {'reflective' : 0,
+					'dirichlet' : 1,
+					'transmissive_n_momentum_zero_t_momentum_set_stage' : 2,
+					'time_stage_zero_momentum' : 3,
+					'characteristic_stage' : 4,
+					'flather_external_stage_zero_velocity' : 5}
+
+def evaluate_boundary_segments(object domain_object,
+							   np.ndarray[np.int64_t, ndim=1, mode="c"] ids not None,
+							   np.ndarray[np.int64_t, ndim=1, mode="c"] vol_ids not None,
+							   np.ndarray[np.int64_t, ndim=1, mode="c"] edge_ids not None,
+							   np.ndarray[double, ndim=2, mode="c"] normals not None,
+							   np.ndarray[np.int64_t, ndim=1, mode="c"] segment_boundary not None,
+							   np.ndarray[np.int64_t, ndim=1, mode="c"] boundary_kernel not None,
+							   np.ndarray[double, ndim=2, mode="c"] boundary_values not None):
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
+	cdef int64_t N
+	N = ids.shape[0]
+
+	if N == 0:
+		return
+
+	with nogil:
+		_openmp_evaluate_boundary_segments(D, N, &ids[0], &vol_ids[0], &edge_ids[0], &normals[0,0],
+										   &segment_boundary[0], &boundary_kernel[0], &boundary_values[0,0])
+
+
+FRICTION_METHODS = {'none' : 0,
+					'flat' : 1,
+					'sloped' : 2}
+
+def evolve_one_rk2_stage(object domain_object,
+						 int64_t stage,
+						 double timestep,
+						 int64_t friction_method,
+						 np.ndarray[np.int64_t, ndim=1, mode="c"] ids not None,
+						 np.ndarray[np.int64_t, ndim=1, mode="c"] vol_ids not None,
+						 np.ndarray[np.int64_t, ndim=1, mode="c"] edge_ids not None,
+						 np.ndarray[double, ndim=2, mode="c"] normals not None,
+						 np.ndarray[np.int64_t, ndim=1, mode="c"] segment_boundary not None,
+						 np.ndarray[np.int64_t, ndim=1, mode="c"] boundary_kernel not None,
+						 np.ndarray[double, ndim=2, mode="c"] boundary_values not None):
+	"""
+	Stage 0 or 1 of an RK2 step in a single parallel region, with the
+	boundary segments of a batch (see Domain.get_boundary_segment_batch).
+	Returns the flux timestep, the mass added by the protection and the
+	number of negative cells set to zero depth.
+	"""
 
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
+	cdef int64_t N = ids.shape[0]
+	cdef int64_t* ids_ptr = NULL
+	cdef int64_t* vol_ids_ptr = NULL
+	cdef int64_t* edge_ids_ptr = NULL
+	cdef double* normals_ptr = NULL
+	cdef int64_t* segment_boundary_ptr = NULL
+	cdef int64_t* boundary_kernel_ptr = NULL
+	cdef double* boundary_values_ptr = NULL
+	cdef double flux_timestep
+	cdef double mass_error
+	cdef int64_t num_negative_cells
 
+	if N > 0:
+		ids_ptr = &ids[0]
+		vol_ids_ptr = &vol_ids[0]
+		edge_ids_ptr = &edge_ids[0]
+		normals_ptr = &normals[0,0]
+		segment_boundary_ptr = &segment_boundary[0]
+		boundary_kernel_ptr = &boundary_kernel[0]
+		boundary_values_ptr = &boundary_values[0,0]
 
 	with nogil:
-		_openmp_evaluate_reflective_segment(&D, N, &segment_edges[0], &vol_ids[0], &edge_ids[0])
+		flux_timestep = _openmp_evolve_one_rk2_stage(D, stage, timestep, friction_method, N,
+													 ids_ptr, vol_ids_ptr, edge_ids_ptr, normals_ptr,
+													 segment_boundary_ptr, boundary_kernel_ptr, boundary_values_ptr,
+													 &mass_error, &num_negative_cells)
+
+	return flux_timestep, mass_error, num_negative_cells
+
+
+cdef double** get_centroid_value_pointers(list centroid_values, int64_t stride) except NULL:
+
+	cdef int64_t nq = len(centroid_values)
+	cdef int64_t i
+	cdef double** ptrs
+	cdef np.ndarray[double, ndim=1, mode="c"] q
+
+	assert nq <= stride, "More quantities than buffer columns"
+
+	ptrs = <double**> malloc(max(nq, 1) * sizeof(double*))
+	if ptrs == NULL:
+		raise MemoryError()
+
+	try:
+		for i in range(nq):
+			q = centroid_values[i]
+			ptrs[i] = &q[0]
+	except:
+		free(ptrs)
+		raise
+
+	return ptrs
+
+
+def pack_ghost_buffer(list centroid_values, np.ndarray[np.int64_t, ndim=1, mode="c"] tri_ids not None, np.ndarray[double, ndim=2, mode="c"] buffer not None):
+	"""
+	Gather centroid_values[q][tri_ids[i]] into buffer[i,q] in a single pass.
+	"""
+
+	cdef int64_t nq = len(centroid_values)
+	cdef int64_t n = tri_ids.shape[0]
+	cdef int64_t stride = buffer.shape[1]
+	cdef double** ptrs
+
+	if n == 0 or nq == 0:
+		return
+
+	assert buffer.shape[0] == n, "Buffer and triangle ids have different lengths"
+
+	ptrs = get_centroid_value_pointers(centroid_values, stride)
+
+	with nogil:
+		_openmp_pack_ghost_buffer(ptrs, nq, &tri_ids[0], n, &buffer[0,0], stride)
+
+	free(ptrs)
+
+
+def unpack_ghost_buffer(list centroid_values, np.ndarray[np.int64_t, ndim=1, mode="c"] tri_ids not None, np.ndarray[double, ndim=2, mode="c"] buffer not None):
+	"""
+	Scatter buffer[i,q] into centroid_values[q][tri_ids[i]] in a single pass.
+	"""
+
+	cdef int64_t nq = len(centroid_values)
+	cdef int64_t n = tri_ids.shape[0]
+	cdef int64_t stride = buffer.shape[1]
+	cdef double** ptrs
+
+	if n == 0 or nq == 0:
+		return
+
+	assert buffer.shape[0] == n, "Buffer and triangle ids have different lengths"
+
+	ptrs = get_centroid_value_pointers(centroid_values, stride)
+
+	with nogil:
+		_openmp_unpack_ghost_buffer(ptrs, nq, &tri_ids[0], n, &buffer[0,0], stride)
+
+	free(ptrs)
 
 
 def rotate(np.ndarray[double, ndim=1, mode="c"] q not None, np.ndarray[double, ndim=1, mode="c"] normal not None, int64_t direction):
@@ -730,20 +1173,18 @@ def flux_function_central(
 	return max_speed, pressure_flux
 
 def gravity(object domain_object):
-	cdef domain D
-
-	get_python_domain_parameters(&D, domain_object)
-	get_python_domain_pointers(&D, domain_object)
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
 
-	err = _openmp_gravity(&D)
+	err = _openmp_gravity(D)
 	if err == -1:
 		return None
 
 def gravity_wb(object domain_object):
-	cdef domain D
-	get_python_domain_parameters(&D, domain_object)
-	get_python_domain_pointers(&D, domain_object)
-	err = _openmp_gravity_wb(&D)
+	cdef Native_domain handle = get_native_domain(domain_object)
+	cdef domain* D = &handle.D
+
+	err = _openmp_gravity_wb(D)
 	if err == -1:
 		return None
 
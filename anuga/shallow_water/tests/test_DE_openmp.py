@@ -329,6 +329,488 @@ class Test_DE_openmp(unittest.TestCase):
         #         print(k,i, domain2.neighbours[k,i], edge_timestep_diff[ki], edge_flux_diff[ki3],edge_flux_diff[ki3+1],edge_flux_diff[ki3+2])
   
 
+
+    def test_overlap_ghost_exchange_openmp(self):
+        """Check the split phase ghost exchange gives the same
+        result as update_ghosts followed by distribute_to_vertices_and_edges
+        """
+
+        def create_domain(overlap):
+            points, vertices, boundary = anuga.rectangular_cross(6, 6, len1=1., len2=1.)
+
+            # Make the first few triangles ghosts of triangles in
+            # the middle of the domain
+            ghost_ids = num.arange(4)
+            full_ids = num.arange(60, 64)
+            full_send_dict = {0: [full_ids, full_ids]}
+            ghost_recv_dict = {0: [ghost_ids, ghost_ids]}
+
+            domain = Domain(points, vertices, boundary,
+                            full_send_dict=full_send_dict,
+                            ghost_recv_dict=ghost_recv_dict)
+
+            domain.set_flow_algorithm('DE1')
+            domain.set_multiprocessor_mode(1)
+            domain.set_store(False)
+            domain.set_overlap_ghost_exchange(overlap)
+
+            domain.set_quantity('elevation', lambda x, y: -x/2.0)
+            domain.set_quantity('friction', 0.03)
+            domain.set_quantity('stage', lambda x, y: -0.2 + 0.1*(x < 0.5))
+
+            Br = anuga.Reflective_boundary(domain)
+            domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+            return domain
+
+        domain = create_domain(True)
+
+        interior_ids, halo_ids, full_ids, ghost_ids = domain.get_halo_partition()
+
+        assert num.all(ghost_ids == num.arange(4))
+        assert len(interior_ids) + len(halo_ids) == len(domain)
+        assert len(full_ids) + len(ghost_ids) == len(domain)
+        assert num.all(domain.tri_full_flag[interior_ids] == 1)
+        assert num.all(domain.tri_full_flag[domain.surrogate_neighbours[interior_ids]] == 1)
+        assert num.all(num.isin(ghost_ids, halo_ids))
+
+        domain_ref = create_domain(False)
+
+        for t in domain.evolve(yieldstep=0.1, finaltime=0.5):
+            pass
+
+        for t in domain_ref.evolve(yieldstep=0.1, finaltime=0.5):
+            pass
+
+        for name in ['stage', 'xmomentum', 'ymomentum']:
+            Q = domain.quantities[name]
+            Q_ref = domain_ref.quantities[name]
+            assert num.allclose(Q.centroid_values, Q_ref.centroid_values)
+            assert num.allclose(Q.edge_values, Q_ref.edge_values)
+
+    def test_edge_based_fluxes_openmp(self):
+        """Check the DE_edge fluxes (computed once per edge) agree with
+        the DE fluxes, including across riverwalls
+        """
+
+        def create_domain(method):
+
+            bounding_polygon = [[0.0, 0.0], [20.0, 0.0], [20.0, 10.0], [0.0, 10.0]]
+            boundary_tags = {'bottom': [0], 'right': [1], 'top': [2], 'left': [3]}
+
+            riverWalls = {'wall1': [[5.0, 0.0, 0.5], [5.0, 4.0, 0.5]],
+                          'wall3': [[10.0, 10.0, 0.0], [10.0, 6.0, 0.0]]}
+
+            domain = anuga.create_domain_from_regions(bounding_polygon,
+                                                      boundary_tags,
+                                                      maximum_triangle_area=0.4,
+                                                      breaklines=riverWalls.values())
+
+            domain.set_flow_algorithm('DE1')
+            domain.set_multiprocessor_mode(1)
+            domain.set_store(False)
+            domain.set_compute_fluxes_method(method)
+
+            domain.set_quantity('elevation', lambda x, y: -x/10, location='centroids')
+            domain.set_quantity('friction', 0.01, location='centroids')
+            domain.set_quantity('stage', lambda x, y: num.maximum(-x/10, -0.5 + 0.5*(x < 3.0)),
+                                location='centroids')
+
+            Bi = anuga.Dirichlet_boundary([0.4, 0, 0])
+            Br = anuga.Reflective_boundary(domain)
+            domain.set_boundary({'left': Bi, 'right': Br, 'top': Br, 'bottom': Br})
+
+            domain.riverwallData.create_riverwalls(riverWalls, verbose=False)
+
+            return domain
+
+        domain1 = create_domain('DE')
+        domain2 = create_domain('DE_edge')
+
+        assert domain2.get_compute_fluxes_method() == 'DE_edge'
+
+        # Each edge listed once
+        edges = domain2.get_unique_edges()
+        neighbours = domain2.neighbours.ravel()
+        interior = num.sum(neighbours >= 0)
+        assert len(edges) == interior//2 + num.sum(neighbours < 0)
+
+        for t in domain1.evolve(yieldstep=0.5, finaltime=1.0):
+            pass
+
+        for t in domain2.evolve(yieldstep=0.5, finaltime=1.0):
+            pass
+
+        for name in ['stage', 'xmomentum', 'ymomentum']:
+            Q1 = domain1.quantities[name]
+            Q2 = domain2.quantities[name]
+            assert num.allclose(Q1.centroid_values, Q2.centroid_values)
+
+        assert num.allclose(domain1.get_water_volume(), domain2.get_water_volume())
+        assert num.allclose(domain1.get_boundary_flux_integral(),
+                            domain2.get_boundary_flux_integral())
+
+        # Same explicit updates and timestep from the same state. The flux
+        # calculation counts rk2 substeps, so call it twice on each domain.
+        for name in ['stage', 'xmomentum', 'ymomentum']:
+            domain2.quantities[name].centroid_values[:] = domain1.quantities[name].centroid_values
+
+        flux_timesteps = []
+        for domain in [domain1, domain2]:
+            domain.distribute_to_vertices_and_edges()
+            domain.update_boundary()
+            domain.compute_fluxes()
+            flux_timesteps.append(domain.flux_timestep)
+            domain.compute_fluxes()
+
+        assert num.allclose(flux_timesteps[0], flux_timesteps[1])
+        assert num.allclose(domain1.max_speed, domain2.max_speed)
+        for name in ['stage', 'xmomentum', 'ymomentum']:
+            assert num.allclose(domain1.quantities[name].explicit_update,
+                                domain2.quantities[name].explicit_update)
+
+        # The edge based fluxes conserve mass to rounding error
+        areas = domain2.areas
+        total_flux = num.sum(domain2.quantities['stage'].explicit_update*areas)
+        assert num.allclose(total_flux, domain2.boundary_flux_sum[0], atol=1.0e-10)
+
+    def test_active_cells_openmp(self):
+        """Check restricting the kernels to the active (wet and fringe)
+        triangles gives the same result as updating all the triangles,
+        including when an operator wets a dry region
+        """
+
+        def create_domain(method, timestepping_method, use_active_cells):
+
+            # Long enough for a dry region beyond the fringe of the rk3 steps
+            domain = rectangular_cross_domain(40, 20, len1=40.0, len2=20.0)
+
+            domain.set_flow_algorithm('DE1')
+            domain.set_timestepping_method(timestepping_method)
+            domain.set_multiprocessor_mode(1)
+            domain.set_store(False)
+            domain.set_compute_fluxes_method(method)
+            domain.set_use_active_cells(use_active_cells)
+
+            # The water stays in the lower half of the domain
+            def pond(x, y):
+                z = x/20.0
+                return num.where((x - 5.0)**2 + (y - 10.0)**2 < 4.0, 0.5, z)
+
+            domain.set_quantity('elevation', lambda x, y: x/20.0, location='centroids')
+            domain.set_quantity('friction', 0.03, location='centroids')
+            domain.set_quantity('stage', pond, location='centroids')
+
+            Br = anuga.Reflective_boundary(domain)
+            domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+            anuga.Rate_operator(domain, rate=0.05, center=(15.0, 10.0), radius=1.5)
+
+            return domain
+
+        for method, timestepping_method in [('DE', 'euler'), ('DE', 'rk2'),
+                                            ('DE_edge', 'rk2'), ('DE', 'rk3')]:
+
+            domain1 = create_domain(method, timestepping_method, False)
+            domain2 = create_domain(method, timestepping_method, True)
+
+            assert domain2.get_use_active_cells()
+
+            for t in domain1.evolve(yieldstep=0.5, finaltime=2.0):
+                pass
+
+            for t in domain2.evolve(yieldstep=0.5, finaltime=2.0):
+                pass
+
+            for name in ['stage', 'xmomentum', 'ymomentum']:
+                Q1 = domain1.quantities[name]
+                Q2 = domain2.quantities[name]
+                assert num.allclose(Q1.centroid_values, Q2.centroid_values)
+                assert num.allclose(Q1.vertex_values, Q2.vertex_values)
+
+            assert num.allclose(domain1.get_water_volume(), domain2.get_water_volume())
+
+            # The list is only used within a timestep
+            assert domain2.active_cells is None
+
+            domain2.update_active_cells()
+            active = domain2.active_cells
+            assert 0 < len(active) < domain2.number_of_elements
+            assert num.all(domain2.active_cell_flag[active] > 0)
+
+            height = domain2.quantities['height'].centroid_values
+            inactive = domain2.active_cell_flag == 0
+            assert num.all(height[inactive] == 0.0)
+            assert num.all(domain2.number_of_boundaries[inactive] == 0)
+
+            # Each edge of an active triangle listed once
+            edges = domain2.active_edges
+            assert len(num.unique(edges)) == len(edges)
+            assert num.all(domain2.active_cell_flag[edges//3] > 0)
+            domain2.active_cells = None
+
+    def test_active_cells_forcing_terms(self):
+        """Forcing terms other than Manning friction are not applied to
+        the inactive triangles, so they can not be used with active cells
+        """
+
+        domain = rectangular_cross_domain(4, 4)
+        domain.set_multiprocessor_mode(1)
+
+        # Manning friction is allowed
+        domain.set_use_active_cells(True)
+
+        def forcing_term(domain):
+            pass
+
+        domain.forcing_terms.append(forcing_term)
+
+        try:
+            domain.update_active_cells()
+        except Exception:
+            pass
+        else:
+            raise Exception('Forcing term with active cells should raise an exception')
+
+        domain.set_use_active_cells(False)
+
+        try:
+            domain.set_use_active_cells(True)
+        except Exception:
+            pass
+        else:
+            raise Exception('Forcing term with active cells should raise an exception')
+
+    def test_fused_rk2_step_openmp(self):
+        """Check the fused rk2 stepping engine gives the same result as the
+        usual rk2 step, including with a time dependent boundary
+        """
+
+        def create_domain(use_fused_rk2_step, sloped):
+
+            domain = rectangular_cross_domain(20, 10, len1=20.0, len2=10.0)
+
+            domain.set_flow_algorithm('DE1')
+            domain.set_timestepping_method('rk2')
+            domain.set_multiprocessor_mode(1)
+            domain.set_store(False)
+            domain.set_sloped_mannings_function(sloped)
+            domain.set_use_fused_rk2_step(use_fused_rk2_step)
+
+            domain.set_quantity('elevation', lambda x, y: -x/20.0 + 0.05*num.sin(y), location='centroids')
+            domain.set_quantity('friction', 0.03, location='centroids')
+            domain.set_quantity('stage', lambda x, y: num.maximum(-x/20.0, -0.5), location='centroids')
+
+            Br = anuga.Reflective_boundary(domain)
+            Bt = anuga.Time_stage_zero_momentum_boundary(domain, function=lambda t: -0.3 + 0.1*t)
+            domain.set_boundary({'left': Br, 'right': Bt, 'top': Br, 'bottom': Br})
+
+            anuga.Rate_operator(domain, rate=0.05, center=(5.0, 5.0), radius=1.5)
+
+            return domain
+
+        for sloped in [False, True]:
+
+            domain1 = create_domain(False, sloped)
+            domain2 = create_domain(True, sloped)
+
+            assert domain2.get_use_fused_rk2_step()
+            assert domain2.get_fused_rk2_friction_method() is not None
+
+            # Count the steps taken by the fused engine
+            fused_steps = []
+            def counted(domain, evolve_one_fused_rk2_step):
+                def step(*args):
+                    fused_steps.append(domain)
+                    evolve_one_fused_rk2_step(*args)
+                return step
+            for domain in [domain1, domain2]:
+                domain.evolve_one_fused_rk2_step = counted(domain, domain.evolve_one_fused_rk2_step)
+
+            stage0 = domain1.quantities['stage'].centroid_values.copy()
+
+            for t in domain1.evolve(yieldstep=0.5, finaltime=2.0):
+                pass
+
+            for t in domain2.evolve(yieldstep=0.5, finaltime=2.0):
+                pass
+
+            assert domain1 not in fused_steps
+            assert len(fused_steps) > 0
+            assert all(domain is domain2 for domain in fused_steps)
+
+            # The flow has evolved, so the comparison is not trivial
+            assert not num.allclose(domain1.quantities['stage'].centroid_values, stage0)
+            assert not num.allclose(domain1.quantities['xmomentum'].centroid_values, 0.0)
+
+            assert num.allclose(domain1.get_time(), domain2.get_time())
+            assert domain1.number_of_steps == domain2.number_of_steps
+
+            for name in ['stage', 'xmomentum', 'ymomentum']:
+                Q1 = domain1.quantities[name]
+                Q2 = domain2.quantities[name]
+                assert num.allclose(Q1.centroid_values, Q2.centroid_values)
+                assert num.allclose(Q1.vertex_values, Q2.vertex_values)
+
+            assert num.allclose(domain1.max_speed, domain2.max_speed)
+            assert num.allclose(domain1.boundary_flux_sum, domain2.boundary_flux_sum)
+
+        # Falls back to the usual step with a boundary without native kernel
+        domain = create_domain(True, False)
+        Bts = anuga.Transmissive_stage_zero_momentum_boundary(domain)
+        domain.set_boundary({'right': Bts})
+        assert domain.get_fused_rk2_friction_method() is None
+
+    def test_native_domain_handle(self):
+        """Check the native domain is built once, kept between kernel calls
+        and rebuilt after arrays are reallocated
+        """
+
+        import pickle
+        from anuga.shallow_water.sw_domain_openmp_ext import Native_domain
+
+        domain = rectangular_cross_domain(10, 5, len1=10.0, len2=5.0)
+
+        domain.set_flow_algorithm('DE1')
+        domain.set_multiprocessor_mode(1)
+        domain.set_store(False)
+
+        domain.set_quantity('elevation', lambda x, y: -x/10.0)
+        domain.set_quantity('friction', 0.03)
+        domain.set_quantity('stage', expression='elevation + 0.1')
+
+        Br = anuga.Reflective_boundary(domain)
+        domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+        for t in domain.evolve(yieldstep=0.5, finaltime=0.5):
+            pass
+
+        handle = domain.native_domain
+        assert isinstance(handle, Native_domain)
+
+        domain.distribute_to_vertices_and_edges()
+        domain.compute_fluxes()
+        assert domain.native_domain is handle
+
+        # Reallocate an array used by the kernels
+        stage = domain.quantities['stage']
+        stage.centroid_values = stage.centroid_values + 0.1
+        domain.invalidate_native_domain()
+        assert domain.native_domain is None
+
+        domain.distribute_to_vertices_and_edges()
+        assert domain.native_domain is not handle
+        assert num.allclose(stage.edge_values.mean(axis=1), stage.centroid_values)
+
+        # A replaced stage, xmomentum or ymomentum array is detected
+        # without invalidate_native_domain
+        handle = domain.native_domain
+        xmomentum = domain.quantities['xmomentum']
+        xmomentum.edge_values = xmomentum.edge_values.copy()
+        domain.compute_fluxes()
+        assert domain.native_domain is not handle
+
+        handle = domain.native_domain
+        domain.compute_fluxes()
+        assert domain.native_domain is handle
+
+        # A pickled domain does not carry the handle
+        domain2 = pickle.loads(pickle.dumps(domain))
+        assert domain2.native_domain is None
+
+    def test_pack_unpack_ghost_buffer(self):
+
+        from anuga.shallow_water.sw_domain_openmp_ext import pack_ghost_buffer
+        from anuga.shallow_water.sw_domain_openmp_ext import unpack_ghost_buffer
+
+        stage = num.arange(10.0)
+        xmom = 10.0 + num.arange(10.0)
+        ymom = 20.0 + num.arange(10.0)
+
+        send_ids = num.array([7, 2, 5], num.int64)
+        buffer = num.zeros((3, 3))
+
+        pack_ghost_buffer([stage, xmom, ymom], send_ids, buffer)
+
+        assert num.allclose(buffer[:,0], stage[send_ids])
+        assert num.allclose(buffer[:,1], xmom[send_ids])
+        assert num.allclose(buffer[:,2], ymom[send_ids])
+
+        # Fewer quantities than buffer columns
+        buffer[:] = -1.0
+        pack_ghost_buffer([stage], send_ids, buffer)
+        assert num.allclose(buffer[:,0], stage[send_ids])
+        assert num.allclose(buffer[:,1:], -1.0)
+
+        recv_ids = num.array([0, 9, 4], num.int64)
+        buffer = num.array([[100.0, 200.0, 300.0],
+                            [101.0, 201.0, 301.0],
+                            [102.0, 202.0, 302.0]])
+
+        unpack_ghost_buffer([stage, xmom, ymom], recv_ids, buffer)
+
+        assert num.allclose(stage[recv_ids], buffer[:,0])
+        assert num.allclose(xmom[recv_ids], buffer[:,1])
+        assert num.allclose(ymom[recv_ids], buffer[:,2])
+        assert num.allclose(stage[[1, 2, 3, 5, 6, 7, 8]], [1, 2, 3, 5, 6, 7, 8])
+
+    def test_native_boundary_segments(self):
+
+        def evaluate_boundaries(domain, native):
+            names = ['stage', 'xmomentum', 'ymomentum', 'elevation',
+                     'height', 'xvelocity', 'yvelocity']
+            for name in names:
+                domain.quantities[name].boundary_values[:] = -99.0
+
+            if not native:
+                domain.segment_kernels = {}
+            domain.boundary_segment_batch = None
+            domain.update_boundary()
+
+            return [domain.quantities[name].boundary_values.copy() for name in names]
+
+        def create_domain():
+            domain = rectangular_cross_domain(6, 6, len1=6.0, len2=6.0)
+            domain.set_flow_algorithm('DE1')
+            domain.set_multiprocessor_mode(1)
+            domain.set_quantity('elevation', lambda x, y: -x/3.0 + 0.1*y)
+            domain.set_quantity('stage', lambda x, y: num.maximum(-x/3.0 + 0.1*y, -1.0 + 0.05*y))
+            domain.set_quantity('xmomentum', lambda x, y: 0.1 + 0.01*x)
+            domain.set_quantity('ymomentum', lambda x, y: -0.05 + 0.02*y)
+            domain.distribute_to_vertices_and_edges()
+            return domain
+
+        waveform = lambda t: -0.5 + 0.1*t
+
+        boundary_sets = [
+            lambda domain: {'left': anuga.Reflective_boundary(domain),
+                            'right': anuga.Dirichlet_boundary([-0.2, 0.1, 0.3]),
+                            'top': anuga.Flather_external_stage_zero_velocity_boundary(domain, waveform),
+                            'bottom': anuga.Characteristic_stage_boundary(domain, waveform)},
+            lambda domain: {'left': anuga.Transmissive_n_momentum_zero_t_momentum_set_stage_boundary(domain, waveform),
+                            'right': anuga.Time_stage_zero_momentum_boundary(domain, waveform),
+                            'top': anuga.Reflective_boundary(domain),
+                            'bottom': anuga.Transmissive_boundary(domain)}]
+
+        for boundaries in boundary_sets:
+            domain = create_domain()
+            domain.set_boundary(boundaries(domain))
+            native = evaluate_boundaries(domain, True)
+
+            batch = domain.boundary_segment_batch
+            assert len(batch['ids']) > 0
+
+            domain = create_domain()
+            domain.set_boundary(boundaries(domain))
+            python = evaluate_boundaries(domain, False)
+
+            for q_native, q_python in zip(native, python):
+                assert num.allclose(q_native, q_python)
+
+        # Only the Transmissive_boundary is evaluated with evaluate_segment
+        assert batch['fallback_tags'] == ['bottom']
+
+
 if __name__ == "__main__":
     suite = unittest.TestLoader().loadTestsFromTestCase(Test_DE_openmp)
     runner = unittest.TextTestRunner(verbosity=1)
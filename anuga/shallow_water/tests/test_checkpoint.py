@@ -0,0 +1,157 @@
+"""Test checkpointing of shallow water domain
+"""
+
+import unittest
+import os
+import shutil
+import numpy as num
+
+import anuga
+from anuga import load_checkpoint_file
+
+verbose = False
+
+
+class Test_checkpoint(unittest.TestCase):
+    def setUp(self):
+        self.checkpoint_dir = 'CHECKPOINTS_test'
+
+    def tearDown(self):
+        shutil.rmtree(self.checkpoint_dir, ignore_errors=True)
+        for file in ['checkpoint_domain.sww', 'checkpoint_reference.sww']:
+            try:
+                os.remove(file)
+            except:
+                pass
+
+    def create_domain(self, name):
+
+        domain = anuga.rectangular_cross_domain(10, 5, len1=10.0, len2=5.0)
+        domain.set_name(name)
+
+        domain.set_quantity('elevation', lambda x, y: -x/10.0)
+        domain.set_quantity('friction', 0.03)
+        domain.set_quantity('stage', expression='elevation + 0.2')
+
+        Br = anuga.Reflective_boundary(domain)
+        Bd = anuga.Dirichlet_boundary([0.5, 0., 0.])
+        domain.set_boundary({'left': Bd, 'right': Br, 'top': Br, 'bottom': Br})
+
+        return domain
+
+    def test_restart_checkpoint(self):
+
+        # Reference run without restart
+        reference = self.create_domain('checkpoint_reference')
+        for t in reference.evolve(yieldstep=0.5, finaltime=2.0):
+            pass
+
+        # Run with restart checkpoints, stopping half way
+        domain = self.create_domain('checkpoint_domain')
+        domain.set_checkpointing(checkpoint_dir=self.checkpoint_dir,
+                                 checkpoint_step=2,
+                                 checkpoint_format='restart')
+        for t in domain.evolve(yieldstep=0.5, finaltime=1.0):
+            pass
+
+        restart_name = os.path.join(self.checkpoint_dir, 'checkpoint_domain_1.0.restart')
+        assert os.path.exists(os.path.join(restart_name, 'manifest.json'))
+        assert not os.path.exists(os.path.join(self.checkpoint_dir, 'checkpoint_domain_1.0.pickle'))
+
+        # Set up a fresh domain and read in the restart files
+        domain = self.create_domain('checkpoint_domain')
+        domain = load_checkpoint_file(domain_name='checkpoint_domain',
+                                      checkpoint_dir=self.checkpoint_dir,
+                                      domain=domain)
+
+        assert num.allclose(domain.get_time(), 1.0)
+
+        for t in domain.evolve(yieldstep=0.5, finaltime=2.0):
+            pass
+
+        for name in ['stage', 'xmomentum', 'ymomentum']:
+            assert num.allclose(domain.quantities[name].centroid_values,
+                                reference.quantities[name].centroid_values)
+
+    def test_restart_operator_state(self):
+
+        domain = self.create_domain('checkpoint_domain')
+        rate = anuga.Rate_operator(domain, rate=0.1, center=(5.0, 2.5), radius=1.0)
+        domain.set_checkpointing(checkpoint_dir=self.checkpoint_dir,
+                                 checkpoint_step=2,
+                                 checkpoint_format='restart')
+        for t in domain.evolve(yieldstep=0.5, finaltime=1.0):
+            pass
+
+        influx = rate.cumulative_influx
+        flux_integral = domain.get_boundary_flux_integral()
+        assert influx > 0.0
+
+        # Accumulated values are restored, settings of the new script kept
+        domain = self.create_domain('checkpoint_domain')
+        rate = anuga.Rate_operator(domain, rate=0.1, center=(5.0, 2.5), radius=1.0,
+                                   label='restarted_rate')
+        label = rate.label
+        domain = load_checkpoint_file(domain_name='checkpoint_domain',
+                                      checkpoint_dir=self.checkpoint_dir,
+                                      domain=domain)
+
+        assert num.allclose(rate.cumulative_influx, influx)
+        assert num.allclose(domain.get_boundary_flux_integral(), flux_integral)
+        assert rate.label == label
+
+    def test_asynchronous_checkpoint_retention(self):
+
+        for checkpoint_format in ['restart', 'pickle']:
+            domain = self.create_domain('checkpoint_domain')
+            domain.set_checkpointing(checkpoint_dir=self.checkpoint_dir,
+                                     checkpoint_step=1,
+                                     checkpoint_format=checkpoint_format,
+                                     keep_checkpoints=2,
+                                     asynchronous=True)
+            for t in domain.evolve(yieldstep=0.5, finaltime=2.0):
+                pass
+
+            filenames = sorted(os.listdir(self.checkpoint_dir))
+            assert filenames == ['checkpoint_domain_1.5.'+checkpoint_format,
+                                 'checkpoint_domain_2.0.'+checkpoint_format], filenames
+
+            shutil.rmtree(self.checkpoint_dir)
+
+        # Pickled domain can be read back
+        domain = self.create_domain('checkpoint_domain')
+        domain.set_checkpointing(checkpoint_dir=self.checkpoint_dir,
+                                 checkpoint_step=1,
+                                 keep_checkpoints=1,
+                                 asynchronous=True)
+        for t in domain.evolve(yieldstep=0.5, finaltime=1.0):
+            pass
+
+        domain = load_checkpoint_file(domain_name='checkpoint_domain',
+                                      checkpoint_dir=self.checkpoint_dir)
+        assert num.allclose(domain.get_time(), 1.0)
+
+    def test_restart_checkpoint_wrong_mesh(self):
+
+        domain = self.create_domain('checkpoint_domain')
+        domain.set_checkpointing(checkpoint_dir=self.checkpoint_dir,
+                                 checkpoint_step=1,
+                                 checkpoint_format='restart')
+        for t in domain.evolve(yieldstep=0.5, finaltime=0.5):
+            pass
+
+        other = anuga.rectangular_cross_domain(5, 5)
+        try:
+            load_checkpoint_file(domain_name='checkpoint_domain',
+                                 checkpoint_dir=self.checkpoint_dir,
+                                 domain=other)
+        except Exception:
+            pass
+        else:
+            raise Exception('Should have raised exception')
+
+
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(Test_checkpoint)
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
@@ -107,10 +107,97 @@ class Test_local_extrapolation_and_flux_updating(unittest.TestCase):
 
         return
 
+    def test_local_timestepping_mixed_resolution(self):
+        """
+
+        Fine triangles in part of the domain, the large triangles should have
+        their fluxes updated less often. Check water is conserved (closed
+        domain) and the results are close to the global timestepping results
+
+        """
+
+        def create_domain():
+            interior = [[[40., 40.], [40., 60.], [60., 60.], [60., 40.]], 2.]
+            anuga.create_mesh_from_regions(boundaryPolygon,
+                                           boundary_tags={'left': [0],
+                                                          'top': [1],
+                                                          'right': [2],
+                                                          'bottom': [3]},
+                                           maximum_triangle_area=100.,
+                                           interior_regions=[interior],
+                                           filename='test_boundaryfluxintegral.msh',
+                                           use_cache=False,
+                                           verbose=verbose)
+
+            domain = anuga.create_domain_from_file('test_boundaryfluxintegral.msh')
+            domain.set_flow_algorithm('DE0')
+            domain.set_multiprocessor_mode(1)
+            domain.set_store(False)
+
+            domain.set_quantity('elevation', lambda x, y: -x/150., location='centroids')
+            domain.set_quantity('friction', 0.03)
+            domain.set_quantity('stage', lambda x, y: numpy.where(x < 30., 0.5, -x/150.),
+                                location='centroids')
+
+            Br = anuga.Reflective_boundary(domain)
+            domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+            return domain
+
+        domain = create_domain()
+        vol0 = domain.get_water_volume()
+        for t in domain.evolve(yieldstep=1.0, finaltime=10.0):
+            pass
+
+        domain2 = create_domain()
+        domain2.set_local_extrapolation_and_flux_updating(nlevels=3)
+        for t in domain2.evolve(yieldstep=1.0, finaltime=10.0):
+            pass
+
+        # Every triangle brought up to date at the yield times
+        assert numpy.all(domain2.flux_update_accumulator == 0.0)
+        assert numpy.all(domain2.flux_update_elapsed == 0.0)
+
+        frequency = domain2.flux_update_frequency
+        assert numpy.all(numpy.isin(frequency, [1, 2, 4, 8]))
+        assert frequency.max() > 1
+
+        assert numpy.allclose(domain.get_water_volume(), vol0)
+        assert numpy.allclose(domain2.get_water_volume(), vol0)
+        assert numpy.all(abs(domain.quantities['stage'].centroid_values -
+                             domain2.quantities['stage'].centroid_values) < 0.05)
+
+    def test_local_timestepping_active_cells(self):
+        """Local timestepping and active cells can not be used together
+        """
+
+        domain = anuga.rectangular_cross_domain(4, 4)
+        domain.set_flow_algorithm('DE0')
+        domain.set_multiprocessor_mode(1)
+
+        domain.set_use_active_cells(True)
+        try:
+            domain.set_local_extrapolation_and_flux_updating(nlevels=3)
+        except Exception:
+            pass
+        else:
+            raise Exception('Local timestepping with active cells should raise an exception')
+
+        domain.set_use_active_cells(False)
+        domain.set_local_extrapolation_and_flux_updating(nlevels=3)
+        try:
+            domain.set_use_active_cells(True)
+        except Exception:
+            pass
+        else:
+            raise Exception('Active cells with local timestepping should raise an exception')
+
 if __name__ == "__main__":
     suite = unittest.TestSuite([
         Test_local_extrapolation_and_flux_updating('test_local_extrapolation_and_flux_updating_DE0'),
-        Test_local_extrapolation_and_flux_updating('test_local_extrapolation_and_flux_updating_DE1')])
+        Test_local_extrapolation_and_flux_updating('test_local_extrapolation_and_flux_updating_DE1'),
+        Test_local_extrapolation_and_flux_updating('test_local_timestepping_mixed_resolution'),
+        Test_local_extrapolation_and_flux_updating('test_local_timestepping_active_cells')])
     runner = unittest.TextTestRunner(verbosity=1)
     runner.run(suite)
 
@@ -9,6 +9,87 @@ import math
 
 import numpy as num
 
+
+def compute_level_stage(stages, areas, volume,
+                        reduce_sum=None, reduce_max=None,
+                        bins=16, max_iterations=20):
+    """Return the level stage at which volume of water, added to cells
+    with the given stages and areas, lies flat.
+
+    The volume below level h, V(h) = sum(areas*max(h - stages, 0)), is
+    piecewise linear and increasing in h. Bracketing intervals are split
+    into bins, and V and the number of stages at each bin edge are
+    computed from a local sort and cumulative sums. Once no stage lies
+    inside the bin containing volume, V is linear there and the level
+    is exact.
+
+    Only sums and maxima over the cells are used, so the cells can be
+    spread over processors by passing reduce_sum and reduce_max, which
+    combine arrays over all processors (defaults are sequential).
+    """
+
+    if reduce_sum is None:
+        reduce_sum = lambda values: values
+    if reduce_max is None:
+        reduce_max = lambda values: values
+
+    stages = num.asarray(stages, float)
+    areas = num.asarray(areas, float)
+    volume = float(num.squeeze(volume))
+
+    order = num.argsort(stages)
+    sorted_stages = stages[order]
+    sorted_areas = areas[order]
+
+    # Bracket the level between the minimum and maximum stage
+    if len(sorted_stages) > 0:
+        extremes = num.array([-sorted_stages[0], sorted_stages[-1]])
+    else:
+        extremes = num.array([-num.inf, -num.inf])
+    extremes = reduce_max(extremes)
+
+    base = -extremes[0]
+    lo = 0.0
+    hi = extremes[1] - base
+
+    # Work relative to the minimum stage to avoid cancellation
+    sorted_stages = sorted_stages - base
+    summed_areas = num.zeros(len(sorted_stages)+1)
+    summed_areas[1:] = num.cumsum(sorted_areas)
+    summed_moments = num.zeros(len(sorted_stages)+1)
+    summed_moments[1:] = num.cumsum(sorted_areas*sorted_stages)
+
+    for iteration in range(max_iterations):
+        levels = num.linspace(lo, hi, bins+1)
+
+        # Area and area weighted stage of cells with stage <= level,
+        # and the number of cells with stage <= and < level
+        upper = num.searchsorted(sorted_stages, levels, side='right')
+        lower = num.searchsorted(sorted_stages, levels, side='left')
+        sums = num.concatenate((summed_areas[upper], summed_moments[upper],
+                                upper, lower))
+        sums = reduce_sum(sums).reshape(4, bins+1)
+
+        A = sums[0]
+        V = levels*A - sums[1]
+
+        if V[-1] <= volume:
+            # All cells are covered
+            j = bins
+            break
+
+        j = max(num.searchsorted(V, volume, side='right') - 1, 0)
+
+        if sums[3, j+1] - sums[2, j] == 0:
+            # No stages inside the bin so V is linear
+            break
+
+        lo = levels[j]
+        hi = levels[j+1]
+
+    return base + levels[j] + (volume - V[j])/A[j]
+
+
 class Inlet(object):
     """Contains information associated with each inlet
     """
@@ -198,35 +279,14 @@ class Inlet(object):
 
         areas = self.get_areas()
         stages = self.get_stages()
-        depths = self.get_depths()
-
-        elevations = self.get_elevations()
 
-        #print('elevation')
-        #print(elevations)
+        new_stage = compute_level_stage(stages, areas, volume)
 
-        stages_order = stages.argsort()
+        stages[stages < new_stage] = new_stage
 
-        # accumulate areas of cells ordered by stage
-        summed_areas = num.cumsum(areas[stages_order])
-        
-        # accumulate the volume need to fill cells
-        summed_volume = num.zeros_like(areas)       
-        summed_volume[1:] = num.cumsum(summed_areas[:-1]*num.diff(stages[stages_order]))
-
-        index = num.nonzero(summed_volume<=volume)[0][-1]
-
-        # calculate stage needed to fill chosen cells with given volume of water
-        depth = (volume - summed_volume[index])/summed_areas[index]
-        stages[stages_order[0:index+1]] = stages[stages_order[index]]+depth
-
-        #print('stages')
-        #print(stages)
         self.set_stages(stages)
 
 
-
-
     def set_depths_evenly(self,volume):
         """ Distribute volume over all exchange
         cells with equal depth of water
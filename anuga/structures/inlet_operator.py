@@ -298,3 +298,15 @@ class Inlet_operator(anuga.Operator):
     def get_total_applied_volume(self):
 
         return self.total_applied_volume
+
+    def get_restart_state(self):
+        """Return the state kept by restart checkpoints
+        """
+
+        return {'total_applied_volume': float(self.total_applied_volume),
+                'total_requested_volume': float(self.total_requested_volume)}
+
+    def set_restart_state(self, state):
+
+        self.total_applied_volume = state['total_applied_volume']
+        self.total_requested_volume = state['total_requested_volume']
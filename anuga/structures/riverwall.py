@@ -467,6 +467,7 @@ class RiverWall(object):
        
         # Define the hydraulic properties 
         self.hydraulic_properties=hydraulicTmp
+        domain.invalidate_native_domain()
       
         # Check for riverwall 'connectedness' errors (e.g. theoretically possible
         # to miss an edge due to round-off)
@@ -0,0 +1,759 @@
+"""
+Structure bank - evaluate many structures of the same type in one pass.
+
+Each Boyd_box_operator, Boyd_pipe_operator or Weir_orifice_trapezoid_operator
+is a fractional step operator in its own right. With thousands of culverts
+the python overhead of calling each one (enquiry lookups, the discharge
+function and the inlet updates) dominates the run time. A Structure_bank
+takes over a set of structures of the same type, stores their parameters
+and state in arrays and computes the discharges and inlet updates of all
+of them with numpy.
+"""
+
+import math
+
+import numpy as num
+
+import anuga
+from anuga.config import velocity_protection, g
+from anuga.structures.boyd_box_operator import Boyd_box_operator
+from anuga.structures.boyd_pipe_operator import Boyd_pipe_operator
+from anuga.structures.weir_orifice_trapezoid_operator import Weir_orifice_trapezoid_operator
+
+
+class Structure_bank(anuga.Operator):
+    """Structure Bank - apply a set of structures of the same type together.
+
+    The structures are removed from the fractional step operators of the
+    domain and applied by the bank, which computes the discharges of all
+    structures from the state at the start of the step and then updates
+    all the inlets in one scatter. This is the same as applying the
+    structures one after the other as long as no inlet of one structure
+    overlaps an inlet or enquiry point of another structure, so such
+    structures are rejected.
+
+    The statistics and logging methods of the individual structures are
+    still available. The attributes of the structures (discharge, velocity,
+    case etc) are updated from the bank when the bank statistics are
+    printed or logged, or when update_structures is called.
+
+    Input: domain, structures (list of Boyd_box_operator, Boyd_pipe_operator
+    or Weir_orifice_trapezoid_operator, all of the same type)
+    """
+
+    def __init__(self,
+                 domain,
+                 structures,
+                 description = None,
+                 label = None,
+                 logging = False,
+                 verbose = False):
+
+        anuga.Operator.__init__(self, domain, description, label, logging, verbose)
+
+        structures = list(structures)
+
+        if len(structures) == 0:
+            raise Exception('Structure bank needs at least one structure')
+
+        structure_class = type(structures[0])
+        if structure_class not in discharge_functions:
+            msg = 'Structure bank does not support structures of type %s' % structure_class.__name__
+            raise Exception(msg)
+
+        for structure in structures:
+            if type(structure) is not structure_class:
+                msg = 'All structures in a structure bank must be of the same type'
+                raise Exception(msg)
+            if structure.domain is not domain:
+                msg = 'All structures in a structure bank must belong to the domain of the bank'
+                raise Exception(msg)
+
+        self.structures = structures
+        self.structure_class = structure_class
+        self.discharge_function = discharge_functions[structure_class]
+
+        self.setup_parameters()
+        self.setup_inlets()
+        self.setup_state()
+
+        # The bank applies the structures
+        for structure in structures:
+            if structure in domain.fractional_step_operators:
+                domain.fractional_step_operators.remove(structure)
+
+        self.structures_updated = True
+
+
+    def setup_parameters(self):
+        """Store the parameters of the structures as arrays
+        """
+
+        structures = self.structures
+
+        def get(name, default=0.0):
+            return num.array([getattr(s, name, default) for s in structures], float)
+
+        self.culvert_width = get('culvert_width')
+        self.culvert_height = get('culvert_height')
+        self.culvert_diameter = get('culvert_diameter')
+        self.culvert_length = get('culvert_length')
+        self.culvert_blockage = get('culvert_blockage')
+        self.culvert_barrels = get('culvert_barrels')
+        self.culvert_z1 = get('culvert_z1')
+        self.culvert_z2 = get('culvert_z2')
+        self.sum_loss = get('sum_loss')
+        self.manning = get('manning')
+        self.max_velocity = get('max_velocity')
+        self.smoothing_timescale = get('smoothing_timescale')
+
+        def get_flag(name):
+            return num.array([bool(getattr(s, name)) for s in structures])
+
+        self.use_velocity_head = get_flag('use_velocity_head')
+        self.use_momentum_jet = get_flag('use_momentum_jet')
+        self.zero_outflow_momentum = get_flag('zero_outflow_momentum')
+        self.use_old_momentum_method = get_flag('use_old_momentum_method')
+        self.always_use_Q_wetdry_adjustment = get_flag('always_use_Q_wetdry_adjustment')
+
+        # A culvert with no opening is closed
+        if self.structure_class is Boyd_pipe_operator:
+            self.blocked = self.culvert_diameter <= 0.0
+        else:
+            self.blocked = self.culvert_height <= 0.0
+
+
+    def setup_inlets(self):
+        """Store the enquiry points and inlet triangles of the structures
+        as arrays. Inlet j of structure k is segment 2*k + j.
+        """
+
+        structures = self.structures
+        n = len(structures)
+
+        self.enquiry_indices = num.zeros((n, 2), int)
+        self.invert_elevations = num.full((n, 2), num.nan)
+        self.outward_vectors = num.zeros((n, 2, 2), float)
+        self.inlet_areas = num.zeros((n, 2), float)
+
+        triangles = []
+        segments = []
+        for k, structure in enumerate(structures):
+            for j, inlet in enumerate(structure.inlets):
+                self.enquiry_indices[k, j] = inlet.enquiry_index
+                if inlet.invert_elevation is not None:
+                    self.invert_elevations[k, j] = inlet.invert_elevation
+                self.outward_vectors[k, j] = inlet.outward_culvert_vector
+                self.inlet_areas[k, j] = inlet.area
+
+                triangles.append(num.asarray(inlet.triangle_indices, int))
+                segments.append(num.full(len(inlet.triangle_indices), 2*k + j, int))
+
+        self.inlet_triangles = num.concatenate(triangles)
+        self.inlet_segments = num.concatenate(segments)
+        self.inlet_triangle_areas = self.domain.areas[self.inlet_triangles]
+
+        if len(num.unique(self.inlet_triangles)) < len(self.inlet_triangles):
+            msg = 'Inlets of the structures in a structure bank must not overlap'
+            raise Exception(msg)
+
+        # The discharges of all structures are computed before any inlet
+        # is updated, so no structure may look at the inlet of another
+        inlet_structures = num.full(self.domain.number_of_elements, -1, int)
+        inlet_structures[self.inlet_triangles] = self.inlet_segments // 2
+        enquiry_structures = inlet_structures[self.enquiry_indices]
+        others = (enquiry_structures >= 0) & (enquiry_structures != num.arange(n)[:, num.newaxis])
+        if num.any(others):
+            msg = 'Enquiry points of the structures in a structure bank must not lie in the inlets of other structures'
+            raise Exception(msg)
+
+
+    def setup_state(self):
+        """Copy the current state and statistics of the structures
+        """
+
+        structures = self.structures
+
+        def get(name):
+            return num.array([getattr(s, name) for s in structures], float)
+
+        self.smooth_delta_total_energy = get('smooth_delta_total_energy')
+        self.smooth_Q = get('smooth_Q')
+        self.delta_total_energy = get('delta_total_energy')
+        self.driving_energy = get('driving_energy')
+
+        self.accumulated_flow = get('accumulated_flow')
+        self.discharge = get('discharge')
+        self.discharge_abs_timemean = get('discharge_abs_timemean')
+        self.velocity = get('velocity')
+        self.outlet_depth = get('outlet_depth')
+
+        self.case = num.array([s.case for s in structures], dtype=object)
+        self.inflow_index = num.zeros(len(structures), int)
+
+
+    def get_enquiry_values(self):
+        """Return the enquiry depth, stage, specific energy and total
+        energy of both inlets of all structures, as (n,2) arrays.
+        """
+
+        ids = self.enquiry_indices
+
+        stage = self.stage_c[ids]
+        elevation = self.elev_c[ids]
+        xmom = self.xmom_c[ids]
+        ymom = self.ymom_c[ids]
+
+        invert_elevation = num.where(num.isnan(self.invert_elevations),
+                                     elevation, self.invert_elevations)
+
+        depth = num.maximum(stage - invert_elevation, 0.0)
+        water_depth = stage - elevation
+
+        u = water_depth*xmom/(water_depth**2 + velocity_protection)
+        v = water_depth*ymom/(water_depth**2 + velocity_protection)
+
+        if self.domain.use_new_velocity_head:
+            normal_speed = num.minimum(u*self.outward_vectors[:,:,0] +
+                                       v*self.outward_vectors[:,:,1], 0.0)
+            velocity_head = 0.5*normal_speed**2/g
+        else:
+            velocity_head = 0.5*(u**2 + v**2)/g
+
+        return depth, stage, velocity_head + depth, velocity_head + stage
+
+
+    def get_inlet_averages(self):
+        """Return the average depth, xmomentum and ymomentum of both
+        inlets of all structures, as (n,2) arrays.
+        """
+
+        ids = self.inlet_triangles
+        areas = self.inlet_triangle_areas
+        segments = self.inlet_segments
+        n = len(self.structures)
+
+        def average(values):
+            sums = num.bincount(segments, weights=values*areas, minlength=2*n)
+            return sums.reshape(n, 2)/self.inlet_areas
+
+        depth = average(self.stage_c[ids] - self.elev_c[ids])
+        xmom = average(self.xmom_c[ids])
+        ymom = average(self.ymom_c[ids])
+
+        return depth, xmom, ymom
+
+
+    def discharge_routine(self):
+        """Determine the inflow inlets and the discharge of all structures.
+        Returns arrays Q, barrel_velocity, outlet_culvert_depth.
+        """
+
+        n = len(self.structures)
+        timestep = self.domain.timestep
+        blocked = self.blocked
+        unblocked = ~blocked
+
+        enquiry_depth, enquiry_stage, specific_energy, total_energy = self.get_enquiry_values()
+
+        # delta_total_energy determines which inlet is inflow
+        delta_total_energy = num.where(self.use_velocity_head,
+                                       total_energy[:,0] - total_energy[:,1],
+                                       enquiry_stage[:,0] - enquiry_stage[:,1])
+
+        # Forward euler smoothing (see boyd_box_operator.total_energy)
+        if timestep > 0.0:
+            ts = timestep/num.maximum(num.maximum(timestep, self.smoothing_timescale), 1.0e-06)
+        else:
+            ts = num.ones(n)
+
+        smooth = self.smooth_delta_total_energy + ts*(delta_total_energy - self.smooth_delta_total_energy)
+        self.smooth_delta_total_energy = num.where(unblocked, smooth, self.smooth_delta_total_energy)
+        self.delta_total_energy = num.where(unblocked, num.abs(smooth), self.delta_total_energy)
+
+        inflow = num.where(unblocked & (smooth < 0.0), 1, 0)
+        outflow = 1 - inflow
+        self.inflow_index = inflow
+
+        structure_ids = num.arange(n)
+
+        Q = num.zeros(n)
+        barrel_velocity = num.zeros(n)
+        outlet_culvert_depth = num.zeros(n)
+        flow_area = num.zeros(n)
+        case = num.full(n, 'Inlet dry', dtype=object)
+        case[blocked] = 'Culvert blocked'
+
+        # Only calculate flow if there is some water at the inflow inlet
+        wet = unblocked & (enquiry_depth[structure_ids, inflow] > 0.01)
+        ids = num.flatnonzero(wet)
+
+        if len(ids) > 0:
+            driving_energy = num.where(self.use_velocity_head[ids],
+                                       specific_energy[ids, inflow[ids]],
+                                       enquiry_depth[ids, inflow[ids]])
+            self.driving_energy[ids] = driving_energy
+
+            Q_w, velocity_w, depth_w, area_w, case_w = \
+                self.discharge_function(self, ids,
+                                        driving_energy,
+                                        self.delta_total_energy[ids],
+                                        enquiry_depth[ids, inflow[ids]],
+                                        enquiry_depth[ids, outflow[ids]])
+
+            # Time smoothed discharge (see boyd_box_operator.smooth_discharge)
+            Qsign = num.sign(self.smooth_delta_total_energy[ids])
+            smooth_Q = self.smooth_Q[ids] + ts[ids]*(Q_w*Qsign - self.smooth_Q[ids])
+            self.smooth_Q[ids] = smooth_Q
+
+            Q_w = num.where(num.sign(smooth_Q) != Qsign, 0.0,
+                            num.minimum(num.abs(smooth_Q), Q_w))
+            with num.errstate(divide='ignore', invalid='ignore'):
+                velocity_w = num.where(area_w == 0.0, 0.0, Q_w/area_w)
+
+            Q[ids] = Q_w
+            barrel_velocity[ids] = velocity_w
+            outlet_culvert_depth[ids] = depth_w
+            flow_area[ids] = area_w
+            case[ids] = case_w
+
+        self.case = case
+
+        # Temporary flow limit
+        fast = barrel_velocity > self.max_velocity
+        barrel_velocity[fast] = self.max_velocity[fast]
+        Q[fast] = flow_area[fast]*barrel_velocity[fast]
+
+        return Q, barrel_velocity, outlet_culvert_depth
+
+
+    def __call__(self):
+
+        timestep = self.domain.get_timestep()
+        n = len(self.structures)
+        structure_ids = num.arange(n)
+
+        Q, barrel_velocity, outlet_depth = self.discharge_routine()
+
+        inflow = self.inflow_index
+        outflow = 1 - inflow
+
+        depth, xmom, ymom = self.get_inlet_averages()
+
+        inflow_area = self.inlet_areas[structure_ids, inflow]
+        outflow_area = self.inlet_areas[structure_ids, outflow]
+
+        old_inflow_depth = depth[structure_ids, inflow]
+        old_inflow_xmom = xmom[structure_ids, inflow]
+        old_inflow_ymom = ymom[structure_ids, inflow]
+
+        # Semi-implicit update of the inflow (see Structure_operator.__call__)
+        wet = old_inflow_depth > 0.0
+        safe_depth = num.where(wet, old_inflow_depth, 1.0)
+
+        dt_Q_on_d = num.where(wet, timestep*Q/safe_depth, 0.0)
+
+        use_Q_wetdry_adjustment = self.always_use_Q_wetdry_adjustment | \
+            (old_inflow_depth*inflow_area <= Q*timestep)
+
+        factor = 1.0/(1.0 + dt_Q_on_d/inflow_area)
+
+        new_inflow_depth = num.where(use_Q_wetdry_adjustment,
+                                     old_inflow_depth*factor,
+                                     old_inflow_depth - timestep*Q/inflow_area)
+
+        timestep_star = num.where(use_Q_wetdry_adjustment,
+                                  num.where(wet, timestep*new_inflow_depth/safe_depth, 0.0),
+                                  timestep)
+
+        factor2 = num.where(use_Q_wetdry_adjustment,
+                            1.0/(1.0 + dt_Q_on_d*new_inflow_depth/(safe_depth*inflow_area)),
+                            1.0/(1.0 + timestep*Q/(safe_depth*inflow_area)))
+        factor2 = num.where(wet, factor2, 0.0)
+
+        momentum_factor = num.where(self.use_old_momentum_method, factor, factor2)
+
+        new_inflow_xmom = old_inflow_xmom*momentum_factor
+        new_inflow_ymom = old_inflow_ymom*momentum_factor
+
+        xmom_loss = (old_inflow_xmom - new_inflow_xmom)*inflow_area
+        ymom_loss = (old_inflow_ymom - new_inflow_ymom)*inflow_area
+
+        # Outflow
+        gain = Q*timestep_star
+        new_outflow_depth = depth[structure_ids, outflow] + gain/outflow_area
+
+        outflow_direction = - self.outward_vectors[structure_ids, outflow]
+
+        new_outflow_xmom = num.where(self.use_momentum_jet,
+                                     barrel_velocity*new_outflow_depth*outflow_direction[:,0],
+                                     num.where(self.zero_outflow_momentum, 0.0,
+                                               xmom[structure_ids, outflow] + xmom_loss/outflow_area))
+        new_outflow_ymom = num.where(self.use_momentum_jet,
+                                     barrel_velocity*new_outflow_depth*outflow_direction[:,1],
+                                     num.where(self.zero_outflow_momentum, 0.0,
+                                               ymom[structure_ids, outflow] + ymom_loss/outflow_area))
+
+        # Stats
+        self.accumulated_flow += gain
+        self.discharge = Q*timestep_star/timestep
+        self.discharge_abs_timemean += gain/self.domain.yieldstep
+        self.velocity = barrel_velocity
+        self.outlet_depth = outlet_depth
+
+        # Scatter the new inlet values to the inlet triangles
+        depth[structure_ids, inflow] = new_inflow_depth
+        depth[structure_ids, outflow] = new_outflow_depth
+        xmom[structure_ids, inflow] = new_inflow_xmom
+        xmom[structure_ids, outflow] = new_outflow_xmom
+        ymom[structure_ids, inflow] = new_inflow_ymom
+        ymom[structure_ids, outflow] = new_outflow_ymom
+
+        ids = self.inlet_triangles
+        segments = self.inlet_segments
+
+        self.stage_c[ids] = self.elev_c[ids] + depth.ravel()[segments]
+        self.xmom_c[ids] = xmom.ravel()[segments]
+        self.ymom_c[ids] = ymom.ravel()[segments]
+
+        self.structures_updated = False
+
+
+    def update_structures(self):
+        """Copy the state and statistics of the bank to the structures
+        """
+
+        if self.structures_updated:
+            return
+
+        for k, structure in enumerate(self.structures):
+            structure.smooth_delta_total_energy = self.smooth_delta_total_energy[k]
+            structure.smooth_Q = self.smooth_Q[k]
+            structure.delta_total_energy = self.delta_total_energy[k]
+            structure.driving_energy = self.driving_energy[k]
+
+            structure.accumulated_flow = self.accumulated_flow[k]
+            structure.discharge = self.discharge[k]
+            structure.discharge_abs_timemean = self.discharge_abs_timemean[k]
+            structure.velocity = self.velocity[k]
+            structure.outlet_depth = self.outlet_depth[k]
+            structure.case = self.case[k]
+
+            structure.inflow = structure.inlets[self.inflow_index[k]]
+            structure.outflow = structure.inlets[1 - self.inflow_index[k]]
+
+        self.structures_updated = True
+
+
+    def get_structures(self):
+
+        return self.structures
+
+
+    def statistics(self):
+
+        self.update_structures()
+
+        message  = '=====================================\n'
+        message += 'Structure Bank: %s\n' % self.label
+        message += '=====================================\n'
+        message += 'Structure Type: %s\n' % self.structure_class.__name__
+        message += 'Number of structures: %g\n' % len(self.structures)
+        message += '\n'
+
+        for structure in self.structures:
+            message += structure.statistics()
+
+        return message
+
+
+    def timestepping_statistics(self):
+
+        self.update_structures()
+
+        message  = '---------------------------\n'
+        message += 'Structure bank report for %s:\n' % self.label
+        message += '--------------------------\n'
+        message += 'Number of structures: %g\n' % len(self.structures)
+        message += 'Total discharge [m^3/s]: %.2f\n' % num.sum(self.discharge)
+        message += 'Total accumulated flow [m^3]: %.2f\n' % num.sum(self.accumulated_flow)
+
+        return message
+
+
+    def print_timestepping_statistics(self):
+
+        self.update_structures()
+
+        for structure in self.structures:
+            structure.print_timestepping_statistics()
+
+
+    def log_timestepping_statistics(self):
+
+        self.update_structures()
+
+        for structure in self.structures:
+            structure.log_timestepping_statistics()
+
+        # Logging resets the time mean discharge of the structures
+        self.discharge_abs_timemean[:] = [s.discharge_abs_timemean for s in self.structures]
+
+
+    def get_restart_state(self):
+        """Return the state of the structures kept by restart checkpoints
+        """
+
+        self.update_structures()
+
+        return {'structures': [s.get_restart_state() for s in self.structures]}
+
+    def set_restart_state(self, state):
+
+        for structure, structure_state in zip(self.structures, state['structures']):
+            structure.set_restart_state(structure_state)
+
+        self.setup_state()
+        self.structures_updated = True
+
+
+#=============================================================================
+# Discharge functions of a subset ids of the structures of a bank, vectorized
+# versions of boyd_box_function, boyd_pipe_function and
+# weir_orifice_trapezoid_function
+#=============================================================================
+def boyd_box_discharges(bank, ids, driving_energy, delta_total_energy,
+                        inflow_enquiry_depth, outlet_enquiry_depth):
+
+    width = bank.culvert_width[ids]
+    depth = bank.culvert_height[ids]
+    blockage = bank.culvert_blockage[ids]
+    barrels = bank.culvert_barrels[ids]
+    length = bank.culvert_length[ids]
+    sum_loss = bank.sum_loss[ids]
+    manning = bank.manning[ids]
+
+    with num.errstate(divide='ignore', invalid='ignore'):
+        bf = 1 - blockage
+        open_width = bf*width*barrels
+
+        Q_inlet_unsubmerged = 0.544*g**0.5*open_width*driving_energy**1.50
+        Q_inlet_submerged = 0.702*g**0.5*open_width*depth**0.89*driving_energy**0.61
+        Q = num.where(Q_inlet_unsubmerged < Q_inlet_submerged,
+                      Q_inlet_unsubmerged, Q_inlet_submerged)
+
+        dcrit = (Q**2/g/open_width**2)**0.333333
+
+        full = dcrit > depth
+        outlet_culvert_depth = num.where(full, depth, dcrit)
+        flow_area = open_width*outlet_culvert_depth
+        perimeter = num.where(full, 2.0*(open_width + depth), open_width + 2.0*outlet_culvert_depth)
+        case = num.where(full, 'Inlet CTRL Outlet unsubmerged PIPE PART FULL',
+                         'INLET CTRL Culvert is open channel flow we will for now assume critical depth').astype(object)
+
+        # Outlet control
+        outlet = delta_total_energy < driving_energy
+        submerged = outlet & (outlet_enquiry_depth > depth)
+
+        outlet_culvert_depth = num.where(submerged, depth, outlet_culvert_depth)
+        flow_area = num.where(submerged, open_width*depth, flow_area)
+        perimeter = num.where(submerged, 2.0*(open_width + depth), perimeter)
+
+        case[submerged] = 'Outlet submerged'
+        case[outlet & ~submerged & full] = 'Outlet is Flowing Full'
+        case[outlet & ~submerged & ~full] = 'Outlet is open channel flow'
+
+        hyd_rad = flow_area/perimeter
+        culvert_velocity = num.sqrt(delta_total_energy/((sum_loss/2/g) + (manning**2*length)/hyd_rad**1.33333))
+        Q_outlet_tailwater = flow_area*culvert_velocity
+
+        Q = num.where(outlet, num.minimum(Q, Q_outlet_tailwater), Q)
+
+        barrel_velocity = Q/(flow_area + velocity_protection/flow_area)
+
+    blocked = blockage >= 1.0
+    Q[blocked] = 0.0
+    barrel_velocity[blocked] = 0.0
+    outlet_culvert_depth[blocked] = 0.0
+    flow_area[blocked] = 0.00001
+    case[blocked] = '100 blocked culvert'
+
+    return Q, barrel_velocity, outlet_culvert_depth, flow_area, case
+
+
+def boyd_pipe_discharges(bank, ids, driving_energy, delta_total_energy,
+                         inflow_enquiry_depth, outlet_enquiry_depth):
+
+    diameter = bank.culvert_diameter[ids]
+    blockage = bank.culvert_blockage[ids]
+    barrels = bank.culvert_barrels[ids]
+    length = bank.culvert_length[ids]
+    sum_loss = bank.sum_loss[ids]
+    manning = bank.manning[ids]
+
+    with num.errstate(divide='ignore', invalid='ignore'):
+        bf = num.where(blockage > 0.9, 3.333 - 3.333*blockage,
+                       1.0 - 0.4012316798*blockage - 0.3768350138*(blockage**2))
+        open_diameter = bf*diameter
+
+        Q_inlet_unsubmerged = barrels*(0.421*g**0.5*(open_diameter**0.87)*driving_energy**1.63)
+        Q_inlet_submerged = barrels*(0.530*g**0.5*(open_diameter**1.87)*driving_energy**0.63)
+        Q = num.where(Q_inlet_submerged < Q_inlet_unsubmerged,
+                      Q_inlet_submerged, Q_inlet_unsubmerged)
+
+        dcrit1 = open_diameter/1.26*(Q/g**0.5*(open_diameter**2.5))**(1/3.75)
+        dcrit2 = open_diameter/0.95*(Q/g**0.5*open_diameter**2.5)**(1/1.95)
+        dcrit = num.where(dcrit1/open_diameter > 0.85, dcrit2, dcrit1)
+
+        full = dcrit >= open_diameter
+        case = num.where(full, 'Inlet CTRL Outlet submerged Circular PIPE FULL',
+                         'INLET CTRL Culvert is open channel flow we will for now assume critical depth').astype(object)
+
+        # Outlet control
+        outlet = delta_total_energy < driving_energy
+        submerged = outlet & (outlet_enquiry_depth > open_diameter)
+
+        full = num.where(outlet, dcrit > open_diameter, full) | submerged
+
+        case[submerged] = 'Outlet submerged'
+        case[outlet & ~submerged & full] = 'Outlet unsubmerged PIPE FULL'
+        case[outlet & ~submerged & ~full] = 'Outlet is open channel flow we will for now assume critical depth'
+
+        outlet_culvert_depth = num.where(full, open_diameter, dcrit)
+
+        alpha = num.arccos(num.clip(1 - 2*outlet_culvert_depth/open_diameter, -1.0, 1.0))*2
+        flow_area = num.where(full, barrels*(open_diameter/2)**2*math.pi,
+                              barrels*open_diameter**2/8*(alpha - num.sin(alpha)))
+        perimeter = num.where(full, barrels*open_diameter*math.pi,
+                              barrels*(alpha*open_diameter/2.0))
+
+        hyd_rad = flow_area/perimeter
+        culvert_velocity = num.sqrt(delta_total_energy/((sum_loss/2/g) + (manning**2*length)/hyd_rad**1.33333))
+        Q_outlet_tailwater = flow_area*culvert_velocity
+
+        Q = num.where(Q_outlet_tailwater < Q, Q_outlet_tailwater, Q)
+
+        barrel_velocity = Q/(flow_area + velocity_protection/flow_area)
+
+    blocked = blockage >= 1.0
+    Q[blocked] = 0.0
+    barrel_velocity[blocked] = 0.0
+    outlet_culvert_depth[blocked] = 0.0
+    flow_area[blocked] = 0.00001
+    case[blocked] = '100 blocked culvert'
+
+    return Q, barrel_velocity, outlet_culvert_depth, flow_area, case
+
+
+def trapezoid_critical_depths(Q, open_width, z1, z2):
+    """Newton iteration for the critical depth of trapezoidal channels,
+    as in weir_orifice_trapezoid_function, with each channel iterated
+    until its own update is small.
+    """
+
+    dcrit = num.full(len(Q), 0.00001)
+    dyc = num.full(len(Q), 0.001)
+
+    active = num.abs(dyc) > 0.00001
+    while num.any(active):
+        d = dcrit[active]
+        w = open_width[active]
+        z = z1[active] + z2[active]
+
+        Tc = w + z*d
+        Ac = 0.5*d*(w + Tc)
+        fc = Ac**1.5*Tc**-0.5 - Q[active]/(9.81**0.5)
+        ffc = Ac**1.5*-0.5*Tc**-1.5*z + Tc**-0.5*1.5*Ac**0.5*Tc
+
+        dyc[active] = -fc/ffc
+        dcrit[active] = d + dyc[active]
+
+        active = num.abs(dyc) > 0.00001
+
+    return dcrit
+
+
+def weir_orifice_trapezoid_discharges(bank, ids, driving_energy, delta_total_energy,
+                                      inflow_enquiry_depth, outlet_enquiry_depth):
+
+    width = bank.culvert_width[ids]
+    depth = bank.culvert_height[ids]
+    blockage = bank.culvert_blockage[ids]
+    barrels = bank.culvert_barrels[ids]
+    z1 = bank.culvert_z1[ids]
+    z2 = bank.culvert_z2[ids]
+    length = bank.culvert_length[ids]
+    sum_loss = bank.sum_loss[ids]
+    manning = bank.manning[ids]
+
+    def trapezoid_area(d):
+        return open_width*d + 0.5*(z1 + z2)*d**2
+
+    def trapezoid_sides(d):
+        return (d**2 + (z1*d)**2)**0.5 + (d**2 + (z2*d)**2)**0.5
+
+    with num.errstate(divide='ignore', invalid='ignore'):
+        bf = 1 - blockage
+        open_width = bf*barrels*width
+
+        Q_inlet_unsubmerged = 1.7*bf*barrels*((2*width + depth*(z1 + z2))/2)*driving_energy**1.50
+        Q_inlet_submerged = 0.8*bf*barrels*g**0.5*(0.5*depth*(2*width + depth*(z1 + z2)))*driving_energy**0.5
+        Q = num.where(Q_inlet_unsubmerged < Q_inlet_submerged,
+                      Q_inlet_unsubmerged, Q_inlet_submerged)
+
+        dcrit = trapezoid_critical_depths(Q, open_width, z1, z2)
+
+        full = dcrit > depth
+        outlet_culvert_depth = num.where(full, depth, dcrit)
+        flow_area = trapezoid_area(outlet_culvert_depth)
+        perimeter = 2.0*open_width + (z1 + z2)*outlet_culvert_depth + trapezoid_sides(outlet_culvert_depth)
+        case = num.where(full, 'Inlet CTRL Outlet unsubmerged PIPE PART FULL',
+                         'INLET CTRL Culvert is open channel flow we will for now assume critical depth').astype(object)
+
+        hyd_rad = flow_area/perimeter
+        culvert_velocity = num.sqrt(delta_total_energy/((sum_loss/2/g) + (manning**2*length)/hyd_rad**1.33333))
+        Q_outlet_tailwater = flow_area*culvert_velocity
+
+        # Outlet control
+        outlet = delta_total_energy < driving_energy
+        submerged = outlet & (outlet_enquiry_depth > depth)
+        unsubmerged = outlet & ~submerged
+
+        Q = num.where(unsubmerged, num.minimum(Q, Q_outlet_tailwater), Q)
+
+        unsubmerged_ids = num.flatnonzero(unsubmerged)
+        dcrit = outlet_culvert_depth.copy()
+        dcrit[unsubmerged_ids] = trapezoid_critical_depths(Q[unsubmerged_ids], open_width[unsubmerged_ids],
+                                                           z1[unsubmerged_ids], z2[unsubmerged_ids])
+        outlet_full = submerged | (unsubmerged & (dcrit > depth))
+
+        outlet_culvert_depth = num.where(outlet_full, depth,
+                                         num.where(unsubmerged, dcrit, outlet_culvert_depth))
+        flow_area = num.where(outlet, trapezoid_area(outlet_culvert_depth), flow_area)
+        perimeter = num.where(outlet, open_width + trapezoid_sides(outlet_culvert_depth), perimeter)
+
+        case[submerged] = 'Outlet submerged'
+        case[unsubmerged & outlet_full] = 'Outlet is Flowing Full'
+        case[unsubmerged & ~outlet_full] = 'Outlet is open channel flow'
+
+        hyd_rad = flow_area/perimeter
+        culvert_velocity = num.sqrt(delta_total_energy/((sum_loss/2/g) + (manning**2*length)/hyd_rad**1.33333))
+        Q_outlet_tailwater = flow_area*culvert_velocity
+
+        Q = num.where(outlet, num.minimum(Q, Q_outlet_tailwater), Q)
+
+        barrel_velocity = Q/(flow_area + velocity_protection/flow_area)
+
+    blocked = blockage >= 1.0
+    Q[blocked] = 0.0
+    barrel_velocity[blocked] = 0.0
+    outlet_culvert_depth[blocked] = 0.0
+    flow_area[blocked] = 0.00001
+    case[blocked] = '100% blocked culvert'
+
+    return Q, barrel_velocity, outlet_culvert_depth, flow_area, case
+
+
+discharge_functions = {Boyd_box_operator: boyd_box_discharges,
+                       Boyd_pipe_operator: boyd_pipe_discharges,
+                       Weir_orifice_trapezoid_operator: weir_orifice_trapezoid_discharges}
@@ -636,6 +636,31 @@ class Structure_operator(anuga.Operator):
         return message
 
 
+    # Statistics and smoothed values changing during a run, kept by
+    # restart checkpoints
+    restart_attributes = ['accumulated_flow', 'discharge', 'discharge_abs_timemean',
+                          'velocity', 'outlet_depth', 'delta_total_energy',
+                          'driving_energy', 'smooth_delta_total_energy', 'smooth_Q',
+                          'case']
+
+    def get_restart_state(self):
+        """Return the state kept by restart checkpoints
+        """
+
+        state = {}
+        for name in self.restart_attributes:
+            if hasattr(self, name):
+                value = getattr(self, name)
+                state[name] = value if isinstance(value, str) else float(value)
+
+        return state
+
+    def set_restart_state(self, state):
+
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
     def get_inlets(self):
         
         return self.inlets
@@ -88,6 +88,33 @@ class Test_inlet_operator(unittest.TestCase):
         
         return domain
 
+    def test_compute_level_stage(self):
+        """test_compute_level_stage
+
+        This tests that the level stage holds the given volume of water
+        """
+
+        from anuga.structures.inlet import compute_level_stage
+
+        numpy.random.seed(17)
+        stages = numpy.random.uniform(10.0, 12.0, 200)
+        stages[50:60] = stages[0]
+        areas = numpy.random.uniform(1.0, 5.0, 200)
+
+        for volume in [0.0, 1.0e-3, 10.0, 150.0, 1.0e4]:
+            level = compute_level_stage(stages, areas, volume)
+
+            filled = numpy.sum(areas*numpy.maximum(level - stages, 0.0))
+            assert numpy.allclose(filled, volume, rtol=1.0e-10, atol=1.0e-10)
+
+        # All cells at the same stage
+        level = compute_level_stage(numpy.ones(4), numpy.ones(4), 2.0)
+        assert numpy.allclose(level, 1.5)
+
+        # Volume given as a one element array
+        level = compute_level_stage(stages, areas, numpy.array([150.0]))
+        assert numpy.allclose(level, compute_level_stage(stages, areas, 150.0))
+
     def test_inlet_constant_Q(self):
         """test_inlet_Q
         
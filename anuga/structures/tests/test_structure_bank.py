@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+
+import unittest
+
+import numpy
+import anuga
+
+from anuga.abstract_2d_finite_volumes.mesh_factory import rectangular_cross
+from anuga.shallow_water.shallow_water_domain import Domain
+
+from anuga.structures.boyd_box_operator import Boyd_box_operator
+from anuga.structures.boyd_pipe_operator import Boyd_pipe_operator
+from anuga.structures.weir_orifice_trapezoid_operator import Weir_orifice_trapezoid_operator
+from anuga.structures.structure_bank import Structure_bank
+
+verbose = False
+
+
+class Test_structure_bank(unittest.TestCase):
+    """
+    Test that a structure bank gives the same results as the individual structures
+    """
+
+    def setUp(self):
+        pass
+
+    def tearDown(self):
+        pass
+
+
+    def _create_domain(self):
+
+        points, vertices, boundary = rectangular_cross(40, 20, len1=40.0, len2=20.0)
+        domain = Domain(points, vertices, boundary)
+        domain.set_name('Test_structure_bank')
+        domain.set_store(False)
+
+        domain.set_quantity('elevation', 10.0)
+        domain.set_quantity('stage', lambda x, y: numpy.where(x < 20.0, 12.0, 10.5))
+
+        Br = anuga.Reflective_boundary(domain)
+        domain.set_boundary({'left': Br, 'right': Br, 'top': Br, 'bottom': Br})
+
+        return domain
+
+
+    def _create_structures(self, domain, structure_type):
+
+        structures = []
+        for y in [5.0, 15.0]:
+            end_points = [[15.0, y], [25.0, y]]
+            if structure_type == 'boyd_box':
+                structures.append(Boyd_box_operator(domain, losses=1.5, width=1.0, height=0.8,
+                                                    end_points=end_points, apron=0.5,
+                                                    enquiry_gap=1.0))
+            elif structure_type == 'boyd_pipe':
+                structures.append(Boyd_pipe_operator(domain, losses=1.5, diameter=1.0,
+                                                     end_points=end_points, apron=0.5,
+                                                     enquiry_gap=1.0))
+            else:
+                structures.append(Weir_orifice_trapezoid_operator(domain, losses=1.5, width=1.0,
+                                                                  height=0.8, z1=1.0, z2=1.0,
+                                                                  end_points=end_points, apron=0.5,
+                                                                  enquiry_gap=1.0))
+
+        return structures
+
+
+    def _compare(self, structure_type):
+
+        domain1 = self._create_domain()
+        structures1 = self._create_structures(domain1, structure_type)
+
+        domain2 = self._create_domain()
+        structures2 = self._create_structures(domain2, structure_type)
+        bank = Structure_bank(domain2, structures2)
+
+        for structure in structures2:
+            assert structure not in domain2.fractional_step_operators
+        assert domain2.fractional_step_operators[-1] is bank
+
+        for t in domain1.evolve(yieldstep=0.5, finaltime=2.0):
+            pass
+
+        for t in domain2.evolve(yieldstep=0.5, finaltime=2.0):
+            pass
+
+        bank.update_structures()
+
+        for s1, s2 in zip(structures1, structures2):
+            if verbose: print(s1.discharge, s2.discharge, s1.case, s2.case)
+            assert numpy.allclose(s1.discharge, s2.discharge)
+            assert numpy.allclose(s1.accumulated_flow, s2.accumulated_flow)
+            assert numpy.allclose(s1.velocity, s2.velocity)
+            assert s1.case == s2.case
+
+        for name in ['stage', 'xmomentum', 'ymomentum']:
+            assert numpy.allclose(domain1.quantities[name].centroid_values,
+                                  domain2.quantities[name].centroid_values)
+
+
+    def test_boyd_box_bank(self):
+
+        self._compare('boyd_box')
+
+
+    def test_boyd_pipe_bank(self):
+
+        self._compare('boyd_pipe')
+
+
+    def test_weir_orifice_trapezoid_bank(self):
+
+        self._compare('weir_orifice_trapezoid')
+
+
+    def test_overlapping_inlets(self):
+
+        domain = self._create_domain()
+
+        structures = [Boyd_box_operator(domain, losses=1.5, width=1.0,
+                                        end_points=[[15.0, 10.0], [25.0, 10.0]], apron=0.5),
+                      Boyd_box_operator(domain, losses=1.5, width=1.0,
+                                        end_points=[[15.0, 10.5], [25.0, 10.5]], apron=0.5)]
+
+        try:
+            Structure_bank(domain, structures)
+        except Exception:
+            pass
+        else:
+            raise Exception('Overlapping inlets should raise an exception')
+
+
+    def test_enquiry_point_in_other_inlet(self):
+
+        domain = self._create_domain()
+
+        # The upper inlet of the second culvert covers the enquiry point
+        # of the first culvert, the inlets do not overlap
+        structures = [Boyd_box_operator(domain, losses=1.5, width=1.0,
+                                        end_points=[[15.0, 10.0], [25.0, 10.0]], apron=0.5,
+                                        enquiry_gap=1.0),
+                      Boyd_box_operator(domain, losses=1.5, width=0.5,
+                                        end_points=[[13.0, 3.0], [13.0, 9.0]], apron=1.5,
+                                        enquiry_gap=1.0)]
+
+        assert structures[0].inlets[0].enquiry_index in structures[1].inlets[1].triangle_indices
+
+        try:
+            Structure_bank(domain, structures)
+        except Exception:
+            pass
+        else:
+            raise Exception('Enquiry point in the inlet of another structure should raise an exception')
+
+
+# =========================================================================
+if __name__ == "__main__":
+    suite = unittest.TestLoader().loadTestsFromTestCase(Test_structure_bank)
+    runner = unittest.TextTestRunner()
+    runner.run(suite)
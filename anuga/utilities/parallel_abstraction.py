@@ -73,6 +73,12 @@ except:
   def send_recv_via_dicts(*args, **kwargs):
       pass
 
+  def create_comm(procs):
+      return None
+
+  def free_comms():
+      pass
+
   MIN = None
 
   pypar_available = False
@@ -83,7 +89,11 @@ else:
   pypar_available = True
   comm = MPI.COMM_WORLD
   get_processor_name = MPI.Get_processor_name
-  finalize = MPI.Finalize
+
+  def finalize():
+    free_comms()
+    MPI.Finalize()
+
   barrier = comm.barrier
   default_tag = 1
   MAX = MPI.MAX
@@ -242,6 +252,33 @@ else:
   def size():
     return comm.size
 
+  # Communicators already created, keyed by their (sorted) processors
+  created_comms = {}
+
+  def create_comm(procs):
+    """ Create a communicator for the processors in procs (ranks are
+        ordered by processor number). Must be called by all the processors
+        in procs, and only by them.
+
+        One communicator is shared by all the callers with the same set
+        of processors, so repeated calls (e.g. one per inlet) do not use
+        up the MPI communicator handles.
+    """
+    key = tuple(sorted(procs))
+    if key not in created_comms:
+      group = comm.group.Incl(list(key))
+      created_comms[key] = comm.Create_group(group)
+      group.Free()
+    return created_comms[key]
+
+  def free_comms():
+    """ Free the communicators made by create_comm. Must be called by all
+        the processors.
+    """
+    for new_comm in created_comms.values():
+      new_comm.Free()
+    created_comms.clear()
+
   def send_recv_via_dicts(sendDict, recvDict):
     """ This wrap uses Irecv and Isend for exchanging numpy arrays stored
         in dicts.
@@ -54,6 +54,9 @@ void delete_triangle_list(triangle * T);
 // a pointer to malloc'ed memory of a double array.
 double * calculate_sigma(triangle * T,double x,double y);
 
+// as calculate_sigma but stores the 3 values in sigma (no allocation)
+void calculate_sigma_inplace(triangle * T, double x, double y, double * sigma);
+
 // Tests to see if a triangle contains a given point,
 // returns a anuga_int value 0 false, 1 true.
 anuga_int triangle_contains_point(triangle * T,double pointx,double pointy);
@@ -71,6 +71,10 @@ parser.add_argument('-sn', '--sqrtN', type=int, default=sqrtN,
                     help='Size of grid: 500 -> 1_000_000 triangles')
 parser.add_argument('-gl', '--ghost_layer', type=int, default=2,
                     help='Size of ghost layer')
+parser.add_argument('-dh', '--deep_halo', action='store_true',
+                    help='use a ghost layer deep enough to update ghosts once per timestep')
+parser.add_argument('-fa', '--flow_algorithm', type=str, default='DE0',
+                    help='flow algorithm, eg DE0 (euler), DE1 (rk2)')
 
 parser.add_argument('-fdt', '--fixed_dt', type=float, default=fixed_flux_timestep,
                     help='Set a fixed flux timestep')
@@ -98,6 +102,7 @@ test_allreduce = args.test_allreduce
 
 dist_params = {}
 dist_params['ghost_layer_width'] = args.ghost_layer
+dist_params['deep_halo'] = args.deep_halo
 
 if fixed_flux_timestep == 0.0:
     fixed_flux_timestep = None
@@ -125,7 +130,7 @@ if myid == 0:
     domain.set_store(True)
     domain.set_quantity('elevation', lambda x,y : -1.0-x )
     domain.set_quantity('stage', 1.0)
-    domain.set_flow_algorithm('DE0')
+    domain.set_flow_algorithm(args.flow_algorithm)
     domain.set_name('sw_rectangle')
 
     domain.set_multiprocessor_mode(multi_processor_mode)
@@ -246,8 +251,9 @@ if domain.number_of_global_triangles < 10:
 
 if myid == 0:
     print(80*'=')
-    print('np,ntri,ctime,dtime,etime')
-    msg = "%d,%d,%f,%f,%f"% (numprocs, domain.number_of_global_triangles, creation_time, distribute_time, evolve_time)
+    print('np,ntri,ctime,dtime,etime,ghost_layer_width,ghost_updates,comm_time')
+    msg = "%d,%d,%f,%f,%f,%d,%d,%f"% (numprocs, domain.number_of_global_triangles, creation_time, distribute_time, evolve_time,
+                                      domain.ghost_layer_width, getattr(domain, 'calls_to_update_ghosts', 0), domain.communication_time)
     print(msg)
 
 finalize()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+# This script compares the standard ghost layer with the deep halo mode
+# (distribute parameter 'deep_halo') for a range of numbers of MPI processes.
+#
+# For each number of processes the rectangular parallel example is run twice,
+# once updating the ghosts at every stage of the timestep and once with a
+# ghost layer deep enough to update the ghosts once per timestep. The evolve
+# times are written to a csv file and the smallest number of processes
+# at which the deep halo is faster (the crossover point) is reported.
+
+import os
+import csv
+import subprocess
+
+from time import localtime, strftime
+
+import argparse
+
+from anuga.parallel.parallel_api import mpi_extra_options
+
+time = strftime('%Y%m%d_%H%M', localtime())
+
+default_script = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              '..', 'examples', 'parallel', 'run_parallel_rectangular.py')
+
+parser = argparse.ArgumentParser(
+    description="Compare the standard and deep halo ghost layers for different numbers of processes."
+)
+parser.add_argument('script_file', type=str, nargs='?', default=default_script,
+                    help='The parallel script to run (default: run_parallel_rectangular.py)')
+parser.add_argument('-np', '--numprocs', type=int, nargs='+', default=[2, 4, 8, 16],
+                    help='Numbers of processes to run (default: 2 4 8 16)')
+parser.add_argument('-sn', '--sqrtN', type=int, default=200,
+                    help='Size of grid')
+parser.add_argument('-fa', '--flow_algorithm', type=str, default='DE1',
+                    help='Flow algorithm, must use rk2 or rk3 timestepping (default: DE1)')
+parser.add_argument('-ft', '--finaltime', type=float, default=0.05,
+                    help='finaltime')
+
+args = parser.parse_args()
+
+extra_options = mpi_extra_options()
+
+def run(numprocs, deep_halo):
+
+    cmd = ['mpiexec', '-np', str(numprocs)] + extra_options.split() + \
+          ['python', '-u', args.script_file,
+           '-sn', str(args.sqrtN),
+           '-fa', args.flow_algorithm,
+           '-ft', str(args.finaltime)]
+
+    if deep_halo:
+        cmd.append('--deep_halo')
+
+    print('')
+    print(80 * '=')
+    print(f'Running command: {" ".join(cmd)}')
+    print(80 * '=')
+
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(result.stdout)
+        print(result.stderr)
+        raise Exception(f'Run with {numprocs} processes failed')
+
+    # The script finishes with a csv timing summary (header and values)
+    lines = result.stdout.strip().split('\n')
+    index = max(i for i, line in enumerate(lines) if line.startswith('np,ntri'))
+    header = lines[index].split(',')
+    values = lines[index+1].split(',')
+
+    summary = dict(zip(header, values))
+    print(summary)
+
+    return summary
+
+
+rows = []
+crossover = None
+
+for numprocs in args.numprocs:
+    standard = run(numprocs, deep_halo=False)
+    deep = run(numprocs, deep_halo=True)
+
+    standard_time = float(standard['etime'])
+    deep_time = float(deep['etime'])
+
+    rows.append([numprocs, standard['ntri'],
+                 standard['ghost_layer_width'], standard_time, standard['ghost_updates'], standard['comm_time'],
+                 deep['ghost_layer_width'], deep_time, deep['ghost_updates'], deep['comm_time'],
+                 standard_time / deep_time])
+
+    if crossover is None and deep_time < standard_time:
+        crossover = numprocs
+
+
+csv_file = f'benchmark_deep_halo_{args.flow_algorithm}_{args.sqrtN}_{time}.csv'
+
+with open(csv_file, 'w', newline='') as fid:
+    writer = csv.writer(fid)
+    writer.writerow(['np', 'ntri',
+                     'standard_width', 'standard_etime', 'standard_ghost_updates', 'standard_comm_time',
+                     'deep_width', 'deep_etime', 'deep_ghost_updates', 'deep_comm_time',
+                     'speedup'])
+    writer.writerows(rows)
+
+print('')
+print(80 * '=')
+print(f'{"np":>6} {"standard":>12} {"deep halo":>12} {"speedup":>10}')
+for row in rows:
+    print(f'{row[0]:>6} {row[3]:>12.3f} {row[7]:>12.3f} {row[10]:>10.3f}')
+print(80 * '=')
+
+if crossover is None:
+    print('Deep halo was not faster for any of the numbers of processes run')
+else:
+    print(f'Deep halo is faster from {crossover} processes')
+
+print(f'Timings written to {csv_file}')